@@ -8,7 +8,19 @@ from Cython.Build import cythonize
 
 from raytracer.core import config
 
-compile_args = ["-march=native", "-O3", "-msse", "-msse2", "-mfma", "-mfpmath=sse"]
+compile_args = [
+    "-march=native",
+    "-O3",
+    "-msse",
+    "-msse2",
+    "-mfma",
+    "-mfpmath=sse",
+    # Keep multiplies and adds separate so the kernels round as Python does
+    "-ffp-contract=off",
+    # GCC 12 drops the rounding of vectors to single precision when it vectorizes
+    # the kernels, so they would no longer match the Python objects they mirror
+    "-fno-tree-vectorize",
+]
 link_args = []
 include_dirs = []
 libraries = ["m"]
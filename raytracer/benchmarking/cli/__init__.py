@@ -0,0 +1,6 @@
+import click
+
+from raytracer.benchmarking.cli.compare import compare_results
+from raytracer.benchmarking.cli.run import run
+
+cli = click.Group("bench", commands=[run, compare_results])
@@ -0,0 +1,42 @@
+import click
+
+from raytracer.benchmarking.comparison import DEFAULT_THRESHOLD, compare
+from raytracer.benchmarking.runner import load_results
+
+
+@click.command("compare")
+@click.argument("baseline", type=click.Path(exists=True, dir_okay=False))
+@click.argument("current", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-t",
+    "--threshold",
+    default=DEFAULT_THRESHOLD,
+    type=click.FloatRange(min=0),
+    help="How much worse a metric may get, as a fraction of the baseline.",
+)
+def compare_results(baseline: str, current: str, threshold: float) -> None:
+    """
+    Compares results against a saved baseline, exiting with an error if any case
+    regressed.
+    """
+    comparison = compare(
+        baseline=load_results(baseline),
+        current=load_results(current),
+        threshold=threshold,
+    )
+    for change in comparison.changes:
+        flag = "REGRESSION" if change.is_regression else "ok"
+        click.echo(
+            f"{change.key} {change.metric}: {change.baseline:.3f} -> "
+            f"{change.current:.3f} ({change.relative:+.1%}) {flag}"
+        )
+    for key in comparison.missing:
+        click.echo(f"{key}: not in the current results")
+    for key in comparison.added:
+        click.echo(f"{key}: not in the baseline")
+
+    regressions = comparison.regressions
+    if regressions:
+        click.echo(f"{len(regressions)} regression(s) beyond {threshold:.0%}")
+        raise SystemExit(1)
+    click.echo("No regressions")
@@ -0,0 +1,117 @@
+import os
+import time
+from typing import Optional
+
+import click
+
+from raytracer.benchmarking.runner import (
+    ENGINES,
+    BenchmarkResult,
+    build_cases,
+    run_isolated,
+    save_results,
+)
+from raytracer.benchmarking.workloads import WORKLOADS
+from raytracer.core import config
+
+DEFAULT_RESOLUTIONS = ("160x100", "320x200")
+DEFAULT_PROCESSES = (1, 4)
+
+
+def _parse_resolution(
+    ctx: click.Context, param: click.Parameter, values: tuple[str, ...]
+) -> list[tuple[int, int]]:
+    resolutions = []
+    for value in values:
+        width, _, height = value.lower().partition("x")
+        if not (width.isdigit() and height.isdigit()):
+            raise click.BadParameter(f"'{value}' is not WIDTHxHEIGHT")
+        resolutions.append((int(width), int(height)))
+    return resolutions
+
+
+@click.command
+@click.option(
+    "-w",
+    "--workload",
+    "workloads",
+    multiple=True,
+    default=WORKLOADS,
+    type=click.Choice(WORKLOADS),
+    help="A workload to run, may be repeated.  Runs every workload by default.",
+)
+@click.option(
+    "-r",
+    "--resolution",
+    "resolutions",
+    multiple=True,
+    default=DEFAULT_RESOLUTIONS,
+    callback=_parse_resolution,
+    help="An image size as WIDTHxHEIGHT, may be repeated.",
+)
+@click.option(
+    "-p",
+    "--processes",
+    multiple=True,
+    default=DEFAULT_PROCESSES,
+    type=int,
+    help="A number of concurrent processes to render with, may be repeated.",
+)
+@click.option(
+    "-e",
+    "--engine",
+    "engines",
+    multiple=True,
+    default=tuple(ENGINES),
+    type=click.Choice(tuple(ENGINES)),
+    help="A render engine to use, may be repeated.  Uses every engine by default.",
+)
+@click.option(
+    "--repeat",
+    default=1,
+    type=click.IntRange(min=1),
+    help="How many times to run each case, keeping the fastest.",
+)
+@click.option(
+    "-o",
+    "--output",
+    required=False,
+    type=str,
+    help="The JSON file to write results to, by default in the out directory.",
+)
+def run(
+    workloads: tuple[str, ...],
+    resolutions: list[tuple[int, int]],
+    processes: tuple[int, ...],
+    engines: tuple[str, ...],
+    repeat: int,
+    output: Optional[str] = None,
+) -> None:
+    """Runs the standard workloads, each in a fresh process."""
+    output = output or os.path.join(
+        config.OUT_DIR, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    cases = build_cases(
+        workloads=workloads,
+        resolutions=resolutions,
+        processes=processes,
+        engines=engines,
+    )
+    results: list[BenchmarkResult] = []
+    for case in cases:
+        result = run_isolated(case=case, repeat=repeat)
+        results.append(result)
+        # Save as we go so a long run that is interrupted keeps what it measured
+        save_results(filepath=output, results=results)
+        click.echo(_describe(result))
+    click.echo(f"Saved results: {output}")
+
+
+def _describe(result: BenchmarkResult) -> str:
+    return (
+        f"{result.case.key}: {result.wall_time:.3f}s, "
+        f"{result.rays_per_sec:.0f} rays/sec, "
+        f"{result.pixels_per_sec:.0f} pixels/sec, "
+        f"peak RSS {result.peak_rss_mb:.1f} MB, "
+        f"largest worker {result.peak_worker_rss_mb:.1f} MB"
+    )
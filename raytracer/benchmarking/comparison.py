@@ -0,0 +1,80 @@
+from dataclasses import dataclass, field
+from typing import Sequence
+
+from raytracer.benchmarking.runner import BenchmarkResult
+
+# Each metric compared between runs, and whether a higher value is better
+METRICS = {
+    "wall_time": False,
+    "rays_per_sec": True,
+    "pixels_per_sec": True,
+    "peak_rss_mb": False,
+    "peak_worker_rss_mb": False,
+}
+# How much worse a metric can get, relative to the baseline, before it is flagged
+DEFAULT_THRESHOLD = 0.1
+
+
+@dataclass
+class Change:
+    key: str
+    metric: str
+    baseline: float
+    current: float
+    threshold: float
+
+    @property
+    def relative(self) -> float:
+        """How far the metric moved from the baseline, as a fraction of it"""
+        return (self.current - self.baseline) / self.baseline
+
+    @property
+    def is_regression(self) -> bool:
+        worse = -self.relative if METRICS[self.metric] else self.relative
+        return worse > self.threshold
+
+
+@dataclass
+class Comparison:
+    changes: list[Change] = field(default_factory=list)
+    # Cases only in one of the two runs
+    missing: list[str] = field(default_factory=list)
+    added: list[str] = field(default_factory=list)
+
+    @property
+    def regressions(self) -> list[Change]:
+        return [change for change in self.changes if change.is_regression]
+
+
+def compare(
+    baseline: Sequence[BenchmarkResult],
+    current: Sequence[BenchmarkResult],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> Comparison:
+    """
+    Compares each metric of the cases found in both runs.  Metrics which were zero
+    in the baseline, such as the rays traced saving an image, are skipped.
+    """
+    baseline_by_key = {result.case.key: result for result in baseline}
+    current_by_key = {result.case.key: result for result in current}
+    comparison = Comparison(
+        missing=[key for key in baseline_by_key if key not in current_by_key],
+        added=[key for key in current_by_key if key not in baseline_by_key],
+    )
+    for key, result in current_by_key.items():
+        if key not in baseline_by_key:
+            continue
+        for metric in METRICS:
+            before = getattr(baseline_by_key[key], metric)
+            if not before:
+                continue
+            comparison.changes.append(
+                Change(
+                    key=key,
+                    metric=metric,
+                    baseline=before,
+                    current=getattr(result, metric),
+                    threshold=threshold,
+                )
+            )
+    return comparison
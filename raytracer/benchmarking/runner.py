@@ -0,0 +1,275 @@
+import itertools
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime, timezone
+from multiprocessing.connection import Connection
+from typing import Optional, Sequence
+
+from raytracer.benchmarking.workloads import IMAGE_SAVE, SCENES, image
+from raytracer.core.types.entities import Scene
+from raytracer.core.types.imaging import ImageFormat
+from raytracer.imaging.service import ImageService
+from raytracer.rendering.engine import RenderEngine
+from raytracer.rendering.framebuffer import Framebuffer
+from raytracer.rendering.shading import Shader
+from raytracer.rendering.tiles import split_tiles
+from raytracer.rendering.wavefront import WavefrontRenderEngine
+
+ENGINES: dict[str, type[RenderEngine]] = {
+    "scalar": RenderEngine,
+    "wavefront": WavefrontRenderEngine,
+}
+# The formats the image save workload writes, one file each
+SAVE_FORMATS = (ImageFormat.PNG, ImageFormat.PPM)
+# getrusage reports peak RSS in bytes on macOS and kilobytes everywhere else
+RSS_PER_MB = 1024 * 1024 if sys.platform == "darwin" else 1024
+
+
+@dataclass(frozen=True)
+class BenchmarkCase:
+    workload: str
+    width: int
+    height: int
+    processes: int = 1
+    # Saving an image renders nothing, so has no engine
+    engine: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        """Identifies the same case across runs"""
+        return (
+            f"{self.workload}/{self.engine or '-'}/{self.width}x{self.height}"
+            f"/{self.processes}"
+        )
+
+
+@dataclass
+class BenchmarkResult:
+    case: BenchmarkCase
+    # The fastest of the repeated runs, in seconds
+    wall_time: float
+    # The first run, which also starts the worker pool and publishes the scene
+    first_wall_time: float
+    # Camera, reflection and shadow rays traced in a single run
+    rays: int
+    # Peak resident set size of the benchmark process and its largest worker
+    peak_rss_mb: float
+    peak_worker_rss_mb: float
+
+    @property
+    def pixels(self) -> int:
+        return self.case.width * self.case.height
+
+    @property
+    def rays_per_sec(self) -> float:
+        return self.rays / self.wall_time if self.wall_time else 0.0
+
+    @property
+    def pixels_per_sec(self) -> float:
+        return self.pixels / self.wall_time if self.wall_time else 0.0
+
+    def to_object(self) -> dict:
+        data = asdict(self)
+        return {
+            **data.pop("case"),
+            **data,
+            "pixels": self.pixels,
+            "rays_per_sec": self.rays_per_sec,
+            "pixels_per_sec": self.pixels_per_sec,
+        }
+
+    @classmethod
+    def from_object(cls, data: dict) -> "BenchmarkResult":
+        case = BenchmarkCase(
+            **{field.name: data[field.name] for field in fields(BenchmarkCase)}
+        )
+        return cls(
+            case=case,
+            **{
+                field.name: data[field.name]
+                for field in fields(cls)
+                if field.name != "case"
+            },
+        )
+
+
+def build_cases(
+    workloads: Sequence[str],
+    resolutions: Sequence[tuple[int, int]],
+    processes: Sequence[int],
+    engines: Sequence[str],
+) -> list[BenchmarkCase]:
+    """
+    Every combination of the options for each workload.  Saving an image only
+    varies by resolution.
+    """
+    cases = []
+    for workload in workloads:
+        for width, height in resolutions:
+            if workload == IMAGE_SAVE:
+                cases.append(
+                    BenchmarkCase(workload=workload, width=width, height=height)
+                )
+                continue
+            for engine, process_count in itertools.product(engines, processes):
+                cases.append(
+                    BenchmarkCase(
+                        workload=workload,
+                        width=width,
+                        height=height,
+                        processes=process_count,
+                        engine=engine,
+                    )
+                )
+    return cases
+
+
+def run_case(case: BenchmarkCase, repeat: int = 1) -> BenchmarkResult:
+    """
+    Runs the case `repeat` times in this process.  Peak RSS covers everything this
+    process has done so far, see `run_isolated`.
+    """
+    if case.workload == IMAGE_SAVE:
+        timings = _time_save(case=case, repeat=repeat)
+        rays = 0
+    elif case.workload in SCENES:
+        if case.engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{case.engine}'")
+        timings, rays = _time_render(
+            case=case, engine_cls=ENGINES[case.engine], repeat=repeat
+        )
+    else:
+        raise ValueError(f"Unknown workload '{case.workload}'")
+
+    return BenchmarkResult(
+        case=case,
+        wall_time=min(timings),
+        first_wall_time=timings[0],
+        rays=rays,
+        peak_rss_mb=_peak_rss_mb(resource.RUSAGE_SELF),
+        peak_worker_rss_mb=_peak_rss_mb(resource.RUSAGE_CHILDREN),
+    )
+
+
+def run_isolated(case: BenchmarkCase, repeat: int = 1) -> BenchmarkResult:
+    """
+    Runs the case in a fresh process so its peak RSS isn't inflated by the cases
+    run before it.
+    """
+    receiver, sender = mp.Pipe(duplex=False)
+    process = mp.Process(target=_run_isolated_case, args=(case, repeat, sender))
+    process.start()
+    # Only the child holds the sending end, so receiving fails if the child dies
+    sender.close()
+    try:
+        reply = receiver.recv()
+    finally:
+        receiver.close()
+        process.join()
+    if isinstance(reply, Exception):
+        raise reply
+    return BenchmarkResult.from_object(reply)
+
+
+def save_results(filepath: str, results: Sequence[BenchmarkResult]) -> None:
+    """Writes results to a JSON file, along with details of the machine they ran on"""
+    with open(filepath, "w") as f:
+        json.dump(
+            {
+                "machine": _describe_machine(),
+                "results": [result.to_object() for result in results],
+            },
+            f,
+            indent=2,
+        )
+
+
+def load_results(filepath: str) -> list[BenchmarkResult]:
+    with open(filepath, "r") as f:
+        data = json.load(f)
+    return [BenchmarkResult.from_object(result) for result in data["results"]]
+
+
+def _describe_machine() -> dict:
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _run_isolated_case(case: BenchmarkCase, repeat: int, sender: Connection) -> None:
+    try:
+        sender.send(run_case(case=case, repeat=repeat).to_object())
+    except Exception as error:
+        sender.send(error)
+    finally:
+        sender.close()
+
+
+def _time_render(
+    case: BenchmarkCase, engine_cls: type[RenderEngine], repeat: int
+) -> tuple[list[float], int]:
+    """Returns the time each run took and the rays a run traced"""
+    scene = SCENES[case.workload](case.width, case.height)
+    timings = []
+    with (
+        Framebuffer(width=case.width, height=case.height) as framebuffer,
+        engine_cls(Shader()) as engine,
+    ):
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in engine.render(
+                scene=scene, framebuffer=framebuffer, processes=case.processes
+            ):
+                pass
+            timings.append(time.perf_counter() - started)
+    return timings, _count_rays(scene=scene, engine_cls=engine_cls)
+
+
+def _count_rays(scene: Scene, engine_cls: type[RenderEngine]) -> int:
+    """
+    Returns the camera, reflection and shadow rays traced rendering the scene.
+
+    The tiles are rendered in this process, where the engine keeps its counts.
+    Workers only send theirs back when collecting stats, which times every ray
+    and so keeps the compiled kernels from tracing them.
+    """
+    with (
+        Framebuffer(width=scene.width, height=scene.height) as framebuffer,
+        engine_cls(Shader()) as engine,
+    ):
+        for tile in split_tiles(width=scene.width, height=scene.height):
+            engine._render_tile(scene=scene, tile=tile, framebuffer=framebuffer)
+        trace = engine.trace_stats
+        return (
+            trace.primary_rays + trace.reflection_rays + engine.shader.shadow_stats.rays
+        )
+
+
+def _time_save(case: BenchmarkCase, repeat: int) -> list[float]:
+    canvas = image(width=case.width, height=case.height)
+    service = ImageService()
+    timings = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for image_format in SAVE_FORMATS:
+                service.save(
+                    canvas=canvas,
+                    filepath=os.path.join(directory, f"image{image_format.value}"),
+                )
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+def _peak_rss_mb(who: int) -> float:
+    return resource.getrusage(who).ru_maxrss / RSS_PER_MB
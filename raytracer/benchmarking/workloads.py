@@ -0,0 +1,116 @@
+import itertools
+import json
+import os
+import random
+from typing import Callable
+
+from raytracer.core import config
+from raytracer.core.types.entities import (
+    ChequeredMaterial,
+    Light,
+    Material,
+    Primitive,
+    Scene,
+    Sphere,
+)
+from raytracer.core.types.geometry import Point
+from raytracer.core.types.imaging import CHANNELS, Canvas, Colour
+
+SCENE_1 = "scene_1"
+MANY_SPHERES = "many_spheres"
+DEEP_REFLECTION = "deep_reflection"
+# Saves an already rendered image, without rendering anything
+IMAGE_SAVE = "image_save"
+
+MANY_SPHERES_COUNT = 500
+# The same scene is built every time so results can be compared between runs
+MANY_SPHERES_SEED = 1
+
+CAMERA = Point(0, -0.35, -1)
+LIGHTS = [
+    Light(position=Point(1.5, -0.5, -10), colour=Colour(255, 255, 255)),
+    Light(position=Point(-0.5, -10.5, 0), colour=Colour(230, 230, 230)),
+]
+
+
+def load_scene_1(width: int, height: int) -> Scene:
+    """The scene rendered by default, from the scenes directory"""
+    with open(os.path.join(config.SCENE_DIR, f"{SCENE_1}.json"), "r") as f:
+        data = json.load(f)
+    return Scene.from_object(data=data, width=width, height=height)
+
+
+def many_spheres(width: int, height: int) -> Scene:
+    """
+    Hundreds of small spheres scattered in front of the camera, where finding the
+    nearest object dominates.
+    """
+    rnd = random.Random(MANY_SPHERES_SEED)
+    objects: list[Primitive] = [
+        Sphere(
+            name=f"Sphere {index}",
+            centre=Point(rnd.uniform(-3, 3), rnd.uniform(-2, 0.4), rnd.uniform(1, 8)),
+            radius=rnd.uniform(0.05, 0.2),
+            material=Material(
+                colour=Colour(rnd.randint(0, 255), rnd.randint(0, 255), 255),
+                reflection=0.5,
+            ),
+        )
+        for index in range(MANY_SPHERES_COUNT)
+    ]
+    objects.append(_ground())
+    return Scene(
+        camera=CAMERA, objects=objects, lights=LIGHTS, width=width, height=height
+    )
+
+
+def deep_reflection(width: int, height: int) -> Scene:
+    """
+    A lattice of dark mirrors over a reflective floor, where most rays bounce
+    several times before they stop changing the pixel.
+    """
+    objects: list[Primitive] = [
+        Sphere(
+            name=f"Mirror {index}",
+            centre=Point(x, y, z),
+            radius=0.48,
+            material=Material(colour=Colour(40, 40, 60), ambient=0.05, reflection=0.95),
+        )
+        for index, (x, y, z) in enumerate(
+            itertools.product((-1.5, -0.5, 0.5, 1.5), (-1.0, 0.0), (1.0, 2.0, 3.0, 4.0))
+        )
+    ]
+    objects.append(_ground(reflection=0.8))
+    return Scene(
+        camera=CAMERA, objects=objects, lights=LIGHTS, width=width, height=height
+    )
+
+
+def image(width: int, height: int) -> Canvas:
+    """An image to save, with enough detail that it doesn't compress to nothing"""
+    size = width * height * CHANNELS
+    pattern = bytes(range(251))
+    data = (pattern * (size // len(pattern) + 1))[:size]
+    return Canvas(width=width, height=height, buffer=bytearray(data))
+
+
+def _ground(reflection: float = 0.2) -> Sphere:
+    return Sphere(
+        name="Ground",
+        centre=Point(0, 10000.5, 1),
+        radius=10000.0,
+        material=ChequeredMaterial(
+            colour_1=Colour(66, 5, 0),
+            colour_2=Colour(230, 184, 125),
+            ambient=0.2,
+            reflection=reflection,
+        ),
+    )
+
+
+SCENES: dict[str, Callable[[int, int], Scene]] = {
+    SCENE_1: load_scene_1,
+    MANY_SPHERES: many_spheres,
+    DEEP_REFLECTION: deep_reflection,
+}
+WORKLOADS = (*SCENES, IMAGE_SAVE)
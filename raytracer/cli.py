@@ -2,7 +2,9 @@ import logging
 
 import click
 
+from raytracer.benchmarking.cli import cli as bench_cli
 from raytracer.rendering.cli import cli as rendering_cli
+from raytracer.serving.cli import serve
 
 logging.basicConfig(
     filename="output.log",
@@ -12,7 +14,7 @@ logging.basicConfig(
     level=logging.DEBUG,
 )
 
-cli = click.Group(commands=[rendering_cli])
+cli = click.Group(commands=[rendering_cli, bench_cli, serve])
 
 if __name__ == "__main__":
     cli()
@@ -4,3 +4,6 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 OUT_DIR = os.path.join(BASE_DIR, "out")
 SCENE_DIR = os.path.join(BASE_DIR, "scenes")
 MAX_REFLECTION_DEPTH = 6
+CACHE_DIR = os.path.join(OUT_DIR, "cache")
+# Bytes of finished images kept in the render cache before the oldest are removed
+CACHE_SIZE = 512 * 1024 * 1024
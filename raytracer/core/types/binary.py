@@ -0,0 +1,553 @@
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from typing import Iterator, Optional, Sequence, Union, cast, overload
+
+import numpy as np
+
+from raytracer.core.types.bvh import BVH, BoundingBox, Vector3
+from raytracer.core.types.compiled import CompiledScene, compile_scene
+from raytracer.core.types.entities import (
+    BaseMaterial,
+    ChequeredMaterial,
+    Light,
+    Material,
+    Scene,
+    Sphere,
+)
+from raytracer.core.types.geometry import Point
+from raytracer.core.types.imaging import Colour
+
+# Extension of binary scene files
+BINARY_EXTENSION = ".scene"
+MAGIC = b"RTSCENE\0"
+VERSION = 1
+# Magic number, format version, counts of lights, spheres, materials and hierarchy
+# nodes, the size of the string table, the camera and a SHA-256 digest of
+# everything after the header
+HEADER = struct.Struct("<8sIIQQQQ3d32s")
+# Each section starts on a multiple of this many bytes
+ALIGNMENT = 8
+# Numpy types of the sections, all little endian, by their typecode
+DTYPES = {"d": "<f8", "q": "<i8", "b": "i1", "B": "u1"}
+# Colour of spheres imported without one
+DEFAULT_SPHERE_COLOUR = (255.0, 255.0, 255.0)
+
+
+class MappedSpheres(Sequence[Sphere]):
+    """
+    The spheres of a binary scene, created from its arrays as they are asked for
+    rather than all at once when it is loaded.
+    """
+
+    def __init__(
+        self, compiled: CompiledScene, radii: array, names: array, strings: array
+    ) -> None:
+        self._compiled = compiled
+        self._radii = radii
+        self._names = names
+        self._strings = strings
+        # Materials created so far, so spheres sharing one in the file share it here
+        self._materials: dict[int, BaseMaterial] = {}
+
+    def __len__(self) -> int:
+        return len(self._radii)
+
+    @overload
+    def __getitem__(self, index: int) -> Sphere:
+        ...  # pragma: nocover
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Sphere]:
+        ...  # pragma: nocover
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Sphere, list[Sphere]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("sphere index out of range")
+        centres = self._compiled.centres
+        start, end = self._names[index], self._names[index + 1]
+        return Sphere(
+            name=bytes(self._strings[start:end]).decode(),
+            centre=Point(
+                centres[index * 3], centres[index * 3 + 1], centres[index * 3 + 2]
+            ),
+            radius=self._radii[index],
+            material=self._material(self._compiled.materials[index]),
+        )
+
+    def __iter__(self) -> Iterator[Sphere]:
+        return (self[index] for index in range(len(self)))
+
+    def _material(self, index: int) -> BaseMaterial:
+        if index not in self._materials:
+            compiled = self._compiled
+            params = {
+                "ambient": compiled.ambient[index],
+                "diffuse": compiled.diffuse[index],
+                "specular": compiled.specular[index],
+                "reflection": compiled.reflection[index],
+            }
+            self._materials[index] = (
+                ChequeredMaterial(
+                    colour_1=_colour(compiled.colour_1, index),
+                    colour_2=_colour(compiled.colour_2, index),
+                    **params,
+                )
+                if compiled.chequered[index]
+                else Material(colour=_colour(compiled.colour_1, index), **params)
+            )
+        return self._materials[index]
+
+
+class MappedScene(Scene):
+    """
+    A scene loaded from a binary file, whose arrays are views of the file mapped
+    into memory.  It pickles as the path of the file, so the workers rendering it
+    map the same pages rather than each being sent a copy.
+
+    Given the `digest` the file was saved with, raises ValueError if it has been
+    saved again since.  Without it the file is checked against the digest in its
+    header instead.  Given its `contents`, they are read rather than the file and
+    pickled with the scene, as by `detach`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        width: int,
+        height: int,
+        digest: Optional[bytes] = None,
+        contents: Optional[bytes] = None,
+    ) -> None:
+        # A copy of the contents, as the kernels only take writable buffers
+        buffer = _map(path) if contents is None else bytearray(contents)
+        views, camera, found = _read(
+            buffer, path=path, verify=digest is None or contents is not None
+        )
+        if digest is not None and found != digest:
+            raise ValueError(f"'{path}' has changed since the scene was loaded")
+        compiled = CompiledScene(
+            camera=camera,
+            centres=views["centres"],
+            radii_squared=views["radii_squared"],
+            materials=views["materials"],
+            colour_1=views["colour_1"],
+            colour_2=views["colour_2"],
+            chequered=views["chequered"],
+            ambient=views["ambient"],
+            diffuse=views["diffuse"],
+            specular=views["specular"],
+            reflection=views["reflection"],
+            light_positions=views["light_positions"],
+            light_colours=views["light_colours"],
+            bvh=BVH(
+                lower=views["lower"],
+                upper=views["upper"],
+                offsets=views["offsets"],
+                counts=views["counts"],
+                axes=views["axes"],
+                indices=views["indices"],
+            ),
+        )
+        positions = views["light_positions"]
+        super().__init__(
+            camera=Point(*camera),
+            objects=MappedSpheres(
+                compiled=compiled,
+                radii=views["radii"],
+                names=views["names"],
+                strings=views["strings"],
+            ),
+            lights=[
+                Light(
+                    position=Point(
+                        positions[index * 3],
+                        positions[index * 3 + 1],
+                        positions[index * 3 + 2],
+                    ),
+                    colour=_colour(views["light_colours"], index),
+                )
+                for index in range(compiled.light_count)
+            ],
+            width=width,
+            height=height,
+        )
+        self.bvh = compiled.bvh
+        self.compiled = compiled
+        self.path = path
+        self.digest = found
+        self.contents = contents
+        self._buffer = buffer
+
+    def __post_init__(self) -> None:
+        # The hierarchy is mapped from the file rather than built
+        pass
+
+    def __reduce__(self) -> tuple:
+        return (
+            MappedScene,
+            (self.path, self.width, self.height, self.digest, self.contents),
+        )
+
+    def detach(self) -> "MappedScene":
+        """
+        Returns a copy of the scene holding the contents of its file, which
+        pickles with them rather than as the path, for machines without the file.
+        """
+        return MappedScene(
+            path=self.path,
+            width=self.width,
+            height=self.height,
+            digest=self.digest,
+            contents=bytes(self._buffer),
+        )
+
+
+def save_scene(path: str, scene: Scene, spheres: Sequence[np.ndarray] = ()) -> int:
+    """
+    Writes the scene to a binary file at `path`, returning how many spheres it
+    holds.
+
+    The spheres in each of `spheres` are added to it: arrays with a row for each
+    sphere of its centre and radius, optionally followed by its red, green and
+    blue.  They are named "" and given the default material, with one material
+    shared by all those of each colour.
+    """
+    imported = [_check_spheres(values) for values in spheres]
+    compiled = compile_scene(scene)
+    own = [obj for obj in scene.objects if isinstance(obj, Sphere)]
+    centres = np.concatenate(
+        [np.asarray(compiled.centres, dtype=np.float64).reshape(-1, 3)]
+        # Rounded to single precision, as the centre of a `Sphere` is
+        + [values[:, :3].astype(np.float32) for values in imported]
+    )
+    radii = np.concatenate(
+        [np.array([obj.radius for obj in own], dtype=np.float64)]
+        + [values[:, 3].astype(np.float64) for values in imported]
+    )
+    sections = {
+        "centres": centres,
+        "radii": radii,
+        "radii_squared": radii * radii,
+        "materials": np.asarray(compiled.materials),
+        "colour_1": np.asarray(compiled.colour_1),
+        "colour_2": np.asarray(compiled.colour_2),
+        "chequered": np.asarray(compiled.chequered),
+        "ambient": np.asarray(compiled.ambient),
+        "diffuse": np.asarray(compiled.diffuse),
+        "specular": np.asarray(compiled.specular),
+        "reflection": np.asarray(compiled.reflection),
+        "light_positions": np.asarray(compiled.light_positions),
+        "light_colours": np.asarray(compiled.light_colours),
+    }
+    bvh = compiled.bvh
+    if imported:
+        _add_materials(sections=sections, imported=imported)
+        bvh = BVH.build(
+            [
+                BoundingBox(
+                    lower=(x - radius, y - radius, z - radius),
+                    upper=(x + radius, y + radius, z + radius),
+                )
+                for (x, y, z), radius in zip(centres.tolist(), radii.tolist())
+            ]
+        )
+    names = [obj.name.encode() for obj in own]
+    lengths = np.zeros(len(radii), dtype=np.int64)
+    lengths[: len(names)] = [len(name) for name in names]
+    strings = b"".join(names)
+    sections.update(
+        names=np.concatenate([[0], np.cumsum(lengths)]),
+        lower=np.asarray(bvh.lower),
+        upper=np.asarray(bvh.upper),
+        offsets=np.asarray(bvh.offsets),
+        counts=np.asarray(bvh.counts),
+        axes=np.asarray(bvh.axes),
+        indices=np.asarray(bvh.indices),
+        strings=np.frombuffer(strings, dtype=np.uint8),
+    )
+
+    digest = hashlib.sha256()
+    # Written aside and moved into place, as truncating a file which is mapped
+    # would fault any scene reading it
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(os.path.abspath(path)), delete=False
+    ) as f:
+        # Written again with the digest once the sections are
+        f.write(bytes(HEADER.size))
+        for name, typecode, _ in _layout(
+            spheres=len(radii),
+            materials=len(sections["ambient"]),
+            lights=compiled.light_count,
+            nodes=len(bvh),
+            strings=len(strings),
+        ):
+            data = np.ascontiguousarray(sections[name], dtype=DTYPES[typecode])
+            chunk = data.tobytes() + bytes(_padding(data.nbytes))
+            digest.update(chunk)
+            f.write(chunk)
+        f.seek(0)
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                compiled.light_count,
+                len(radii),
+                len(sections["ambient"]),
+                len(bvh),
+                len(strings),
+                *compiled.camera,
+                digest.digest(),
+            )
+        )
+    os.replace(f.name, path)
+    return len(radii)
+
+
+def load_scene(path: str, width: int, height: int) -> MappedScene:
+    """
+    Loads a scene from a binary file by mapping it into memory.  Its spheres,
+    materials and hierarchy are read from the mapped arrays rather than parsed
+    into objects, so loading only has to check them against the file's digest and
+    that each index in them is in range.
+
+    The mapping is copy on write, so the file itself is never changed.  Raises
+    ValueError if the file is not a binary scene or is corrupt.
+    """
+    return MappedScene(path=os.path.abspath(path), width=width, height=height)
+
+
+def changed_spheres(old: MappedScene, new: MappedScene) -> list[int]:
+    """
+    Returns the indices of the spheres which may render differently in two binary
+    scenes, comparing their arrays rather than every sphere made from them.  None
+    do if their files have the same digest, and spheres only renamed don't.
+    """
+    if old.digest == new.digest:
+        return []
+    before, after = _sphere_rows(old), _sphere_rows(new)
+    common = min(len(before), len(after))
+    changed = np.flatnonzero(np.any(before[:common] != after[:common], axis=1))
+    return changed.tolist() + list(range(common, max(len(before), len(after))))
+
+
+def load_spheres(path: str) -> np.ndarray:
+    """
+    Loads an array of spheres saved by NumPy, as taken by `save_scene`, mapping it
+    into memory rather than reading it.
+    """
+    return _check_spheres(np.load(path, mmap_mode="r"), name=f"'{path}'")
+
+
+def _map(path: str) -> mmap.mmap:
+    """Maps a binary scene file into memory, copy on write"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            raise ValueError(f"'{path}' is not a binary scene")
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+
+def _read(
+    buffer: Union[mmap.mmap, bytearray], path: str, verify: bool = False
+) -> tuple[dict[str, array], Vector3, bytes]:
+    """
+    Returns a view of each section of the binary scene in `buffer` by name, its
+    camera and its digest.  With `verify`, raises ValueError unless the sections
+    match the digest.
+    """
+    size = len(buffer)
+    (
+        magic,
+        version,
+        lights,
+        spheres,
+        materials,
+        nodes,
+        strings,
+        x,
+        y,
+        z,
+        digest,
+    ) = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f"'{path}' is not a binary scene")
+    if version != VERSION:
+        raise ValueError(
+            f"'{path}' is version {version} of the binary scene format, expected "
+            f"{VERSION}"
+        )
+    views: dict[str, array] = {}
+    offset = HEADER.size
+    for name, typecode, count in _layout(
+        spheres=spheres,
+        materials=materials,
+        lights=lights,
+        nodes=nodes,
+        strings=strings,
+    ):
+        end = offset + count * np.dtype(DTYPES[typecode]).itemsize
+        if end > size:
+            raise ValueError(f"'{path}' is truncated")
+        # Memory views index, slice and expose their buffer as the arrays of a
+        # compiled scene do, which is all that is asked of them once it is built
+        view = memoryview(buffer)[offset:end].cast(typecode)  # type: ignore
+        views[name] = cast(array, view)
+        offset = end + _padding(end)
+    start = HEADER.size
+    if verify and hashlib.sha256(memoryview(buffer)[start:offset]).digest() != digest:
+        raise ValueError(f"'{path}' is corrupt, it doesn't match its digest")
+    _check_indices(views=views, materials=materials, strings=strings, path=path)
+    return views, (x, y, z), digest
+
+
+def _check_indices(
+    views: dict[str, array], materials: int, strings: int, path: str
+) -> None:
+    """
+    Raises ValueError unless every index in the sections is within what it
+    indexes, as the kernels follow them without checking.  The children of each
+    node of the hierarchy must also come after it, so searching it ends.
+    """
+    spheres = len(views["radii"])
+    sphere_materials = np.asarray(views["materials"])
+    names = np.asarray(views["names"])
+    indices = np.asarray(views["indices"])
+    offsets = np.asarray(views["offsets"])
+    counts = np.asarray(views["counts"])
+    axes = np.asarray(views["axes"])
+    leaves = counts > 0
+    nodes = np.arange(len(counts))[~leaves]
+    children = offsets[~leaves]
+    checks = {
+        "a sphere's material": np.all(
+            (sphere_materials >= 0) & (sphere_materials < materials)
+        ),
+        "a sphere's name": (
+            names[0] >= 0 and names[-1] <= strings and np.all(np.diff(names) >= 0)
+        ),
+        "a sphere in the hierarchy": np.all((indices >= 0) & (indices < spheres)),
+        "the spheres of a leaf": (
+            np.all(counts >= 0)
+            and np.all(offsets[leaves] >= 0)
+            and np.all(offsets[leaves] + counts[leaves] <= len(indices))
+        ),
+        "a child of a node": np.all(
+            (nodes + 1 < len(counts)) & (children > nodes) & (children < len(counts))
+        ),
+        "the axis of a node": np.all((axes >= 0) & (axes < 3)),
+    }
+    for name, valid in checks.items():
+        if not valid:
+            raise ValueError(f"'{path}' is corrupt, {name} is out of range")
+
+
+def _sphere_rows(scene: MappedScene) -> np.ndarray:
+    """A row for each sphere of a binary scene of its centre, radius and material"""
+    compiled = cast(CompiledScene, scene.compiled)
+    materials = np.asarray(compiled.materials)
+    return np.column_stack(
+        [
+            np.asarray(compiled.centres).reshape(-1, 3),
+            np.asarray(compiled.radii_squared),
+            np.asarray(compiled.colour_1).reshape(-1, 3)[materials],
+            np.asarray(compiled.colour_2).reshape(-1, 3)[materials],
+        ]
+        + [
+            np.asarray(getattr(compiled, name))[materials]
+            for name in ("chequered", "ambient", "diffuse", "specular", "reflection")
+        ]
+    )
+
+
+def _check_spheres(values: np.ndarray, name: str = "Spheres") -> np.ndarray:
+    if values.ndim != 2 or values.shape[1] not in (4, 7):
+        raise ValueError(
+            f"{name} must have a row for each sphere of x, y, z and radius, "
+            f"optionally followed by red, green and blue, not shape {values.shape}"
+        )
+    if not np.issubdtype(values.dtype, np.number):
+        raise ValueError(f"{name} must be numbers, not {values.dtype}")
+    return values
+
+
+def _add_materials(sections: dict[str, np.ndarray], imported: list[np.ndarray]) -> None:
+    """
+    Adds a material to the sections for each colour of the imported spheres, and
+    gives each sphere the index of its colour's material.
+    """
+    colours = np.concatenate(
+        [
+            (
+                values[:, 4:7]
+                if values.shape[1] == 7
+                else np.full((len(values), 3), DEFAULT_SPHERE_COLOUR)
+            )
+            for values in imported
+        ]
+    )
+    # Rounded and clamped as a `Colour` would be
+    colours = np.clip(np.rint(colours.astype(np.float64)), 0, 255)
+    unique, inverse = np.unique(colours, axis=0, return_inverse=True)
+    first = len(sections["ambient"])
+    material = BaseMaterial()
+    sections["materials"] = np.concatenate(
+        [sections["materials"], first + inverse.reshape(-1)]
+    )
+    for name in ("colour_1", "colour_2"):
+        sections[name] = np.concatenate([sections[name], unique.reshape(-1)])
+    sections["chequered"] = np.concatenate(
+        [sections["chequered"], np.zeros(len(unique), dtype=np.int8)]
+    )
+    for name in ("ambient", "diffuse", "specular", "reflection"):
+        sections[name] = np.concatenate(
+            [sections[name], np.full(len(unique), getattr(material, name))]
+        )
+
+
+def _layout(
+    spheres: int, materials: int, lights: int, nodes: int, strings: int
+) -> list[tuple[str, str, int]]:
+    """
+    Returns the name, typecode and length of each section of a binary scene, in
+    the order they are written.  Vectors and colours take three entries, and
+    `names` holds where the name of each sphere starts in `strings`, followed by
+    where the last one ends.
+    """
+    return [
+        ("centres", "d", spheres * 3),
+        ("radii", "d", spheres),
+        ("radii_squared", "d", spheres),
+        ("materials", "q", spheres),
+        ("names", "q", spheres + 1),
+        ("colour_1", "d", materials * 3),
+        ("colour_2", "d", materials * 3),
+        ("chequered", "b", materials),
+        ("ambient", "d", materials),
+        ("diffuse", "d", materials),
+        ("specular", "d", materials),
+        ("reflection", "d", materials),
+        ("light_positions", "d", lights * 3),
+        ("light_colours", "d", lights * 3),
+        ("lower", "d", nodes * 3),
+        ("upper", "d", nodes * 3),
+        ("offsets", "q", nodes),
+        ("counts", "q", nodes),
+        ("axes", "b", nodes),
+        ("indices", "q", spheres),
+        ("strings", "B", strings),
+    ]
+
+
+def _padding(size: int) -> int:
+    return -size % ALIGNMENT
+
+
+def _colour(values: array, index: int) -> Colour:
+    return Colour(values[index * 3], values[index * 3 + 1], values[index * 3 + 2])
@@ -0,0 +1,350 @@
+import math
+import threading
+from array import array
+from dataclasses import dataclass, field
+from typing import Callable, Optional, Sequence
+
+# Most primitives a leaf may hold before it is always split.
+MAX_LEAF_SIZE = 4
+# Number of buckets centroids are binned into when searching for the cheapest split.
+SAH_BINS = 12
+# Cost of visiting a node relative to the cost of one intersection test.
+TRAVERSAL_COST = 1.0
+# Bounds are grown by this fraction so single precision rays grazing an object are
+# not culled by the slab test.
+BOUNDS_PADDING = 1e-6
+# Stands in for 1 / 0 when a ray direction has no component along an axis.  Keeping
+# it finite avoids 0 * inf when the origin sits exactly on a slab.
+INFINITE_SLOPE = 1e30
+
+Vector3 = tuple[float, float, float]
+# Returns the distance along the ray being searched to the primitive with the given
+# index, or `None` if the ray misses it
+Intersector = Callable[[int], Optional[float]]
+
+
+@dataclass(frozen=True)
+class BoundingBox:
+    """An axis aligned box from `lower` to `upper`"""
+
+    lower: tuple[float, float, float]
+    upper: tuple[float, float, float]
+
+    @property
+    def centroid(self) -> tuple[float, float, float]:
+        return (
+            (self.lower[0] + self.upper[0]) / 2,
+            (self.lower[1] + self.upper[1]) / 2,
+            (self.lower[2] + self.upper[2]) / 2,
+        )
+
+    @property
+    def surface_area(self) -> float:
+        dx = self.upper[0] - self.lower[0]
+        dy = self.upper[1] - self.lower[1]
+        dz = self.upper[2] - self.lower[2]
+        return 2 * (dx * dy + dy * dz + dz * dx)
+
+    def union(self, other: "BoundingBox") -> "BoundingBox":
+        return BoundingBox(
+            lower=(
+                min(self.lower[0], other.lower[0]),
+                min(self.lower[1], other.lower[1]),
+                min(self.lower[2], other.lower[2]),
+            ),
+            upper=(
+                max(self.upper[0], other.upper[0]),
+                max(self.upper[1], other.upper[1]),
+                max(self.upper[2], other.upper[2]),
+            ),
+        )
+
+    @staticmethod
+    def enclosing(boxes: Sequence["BoundingBox"]) -> "BoundingBox":
+        return BoundingBox(
+            lower=(
+                min(box.lower[0] for box in boxes),
+                min(box.lower[1] for box in boxes),
+                min(box.lower[2] for box in boxes),
+            ),
+            upper=(
+                max(box.upper[0] for box in boxes),
+                max(box.upper[1] for box in boxes),
+                max(box.upper[2] for box in boxes),
+            ),
+        )
+
+
+@dataclass
+class BVH:
+    """
+    A bounding volume hierarchy over the primitives of a scene, split using the
+    surface area heuristic.
+
+    Nodes are flattened into typed arrays in depth first order, so the hierarchy
+    pickles as a handful of buffers.  The left child of an interior node always
+    directly follows it and `offsets` holds the index of the right child.  For a
+    leaf, `offsets` holds the position of its first primitive in `indices` and
+    `counts` how many primitives it holds.
+    """
+
+    lower: array = field(default_factory=lambda: array("d"))
+    upper: array = field(default_factory=lambda: array("d"))
+    offsets: array = field(default_factory=lambda: array("l"))
+    counts: array = field(default_factory=lambda: array("l"))
+    axes: array = field(default_factory=lambda: array("b"))
+    indices: array = field(default_factory=lambda: array("l"))
+    # Intersection tests made by searches of the hierarchy in each thread, so threads
+    # rendering the same scene can each measure their own, for profiling
+    _counts: threading.local = field(
+        default_factory=threading.local, init=False, compare=False, repr=False
+    )
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def __getstate__(self) -> dict:
+        # Counted per thread, and leaving it out keeps the same scene pickling the
+        # same however much it has been searched
+        state = self.__dict__.copy()
+        del state["_counts"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._counts = threading.local()
+
+    @property
+    def tests(self) -> int:
+        """Intersection tests made by searches in this thread"""
+        return getattr(self._counts, "tests", 0)
+
+    @tests.setter
+    def tests(self, tests: int) -> None:
+        self._counts.tests = tests
+
+    @classmethod
+    def build(cls, bounds: Sequence[BoundingBox]) -> "BVH":
+        """
+        Builds the hierarchy for primitives with the given bounds, which are
+        referred to by their position in `bounds`.
+        """
+        bvh = cls()
+        if not bounds:
+            return bvh
+        centroids = [box.centroid for box in bounds]
+        # Each entry is the primitives for a node still to be created, and the node
+        # whose right child it is (if any).
+        stack: list[tuple[list[int], Optional[int]]] = [
+            (list(range(len(bounds))), None)
+        ]
+        while stack:
+            items, parent = stack.pop()
+            node = bvh._add_node(BoundingBox.enclosing([bounds[i] for i in items]))
+            if parent is not None:
+                bvh.offsets[parent] = node
+            split = _find_split(items=items, bounds=bounds, centroids=centroids)
+            if split is None:
+                bvh.offsets[node] = len(bvh.indices)
+                bvh.counts[node] = len(items)
+                bvh.indices.extend(sorted(items))
+                continue
+            axis, left, right = split
+            bvh.axes[node] = axis
+            stack.append((right, node))
+            stack.append((left, None))
+        return bvh
+
+    def find_nearest(
+        self, origin: Vector3, direction: Vector3, intersect: Intersector
+    ) -> tuple[Optional[float], Optional[int]]:
+        """
+        Returns the distance to, and the index of the nearest primitive hit by the
+        ray from `origin` along `direction`, as found by `intersect`.
+
+        Nodes are visited nearest child first and skipped using a slab test against
+        their bounds once they are further away than the nearest hit so far.
+        """
+        if not len(self):
+            return None, None
+
+        dist_min: Optional[float] = None
+        index_hit = -1
+        tests = 0
+        inverse = tuple(1 / d if d else INFINITE_SLOPE for d in direction)
+        lower, upper = self.lower, self.upper
+        counts, offsets = self.counts, self.offsets
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            t_near = 0.0
+            t_far = math.inf if dist_min is None else dist_min
+            for axis in range(3):
+                t_1 = (lower[node * 3 + axis] - origin[axis]) * inverse[axis]
+                t_2 = (upper[node * 3 + axis] - origin[axis]) * inverse[axis]
+                if t_1 > t_2:
+                    t_1, t_2 = t_2, t_1
+                t_near = max(t_near, t_1)
+                t_far = min(t_far, t_2)
+            if t_near > t_far:
+                continue
+
+            count = counts[node]
+            if not count:
+                left, right = node + 1, offsets[node]
+                if direction[self.axes[node]] < 0:
+                    left, right = right, left
+                stack.append(right)
+                stack.append(left)
+                continue
+            first = offsets[node]
+            last = first + count
+            tests += count
+            for index in self.indices[first:last]:
+                dist = intersect(index)
+                if dist is None:
+                    continue
+                if dist_min is None or dist < dist_min:
+                    dist_min, index_hit = dist, index
+                elif dist == dist_min and index < index_hit:
+                    # Match the linear scan, which keeps the first of equal hits
+                    index_hit = index
+        self.tests += tests
+        return dist_min, None if dist_min is None else index_hit
+
+    def find_any(
+        self,
+        origin: Vector3,
+        direction: Vector3,
+        max_distance: float,
+        intersect: Intersector,
+    ) -> Optional[int]:
+        """
+        Returns the index of any primitive hit by the ray from `origin` along
+        `direction` closer than `max_distance`, or `None` if nothing is.
+
+        Unlike `find_nearest` this stops at the first hit, which is all a shadow
+        ray needs to know.
+        """
+        if not len(self):
+            return None
+
+        tests = 0
+        inverse = tuple(1 / d if d else INFINITE_SLOPE for d in direction)
+        lower, upper = self.lower, self.upper
+        counts, offsets = self.counts, self.offsets
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            t_near = 0.0
+            t_far = max_distance
+            for axis in range(3):
+                t_1 = (lower[node * 3 + axis] - origin[axis]) * inverse[axis]
+                t_2 = (upper[node * 3 + axis] - origin[axis]) * inverse[axis]
+                if t_1 > t_2:
+                    t_1, t_2 = t_2, t_1
+                t_near = max(t_near, t_1)
+                t_far = min(t_far, t_2)
+            if t_near > t_far:
+                continue
+
+            count = counts[node]
+            if not count:
+                stack.append(offsets[node])
+                stack.append(node + 1)
+                continue
+            first = offsets[node]
+            last = first + count
+            for index in self.indices[first:last]:
+                tests += 1
+                dist = intersect(index)
+                if dist is not None and dist < max_distance:
+                    self.tests += tests
+                    return int(index)
+        self.tests += tests
+        return None
+
+    def _add_node(self, box: BoundingBox) -> int:
+        for axis in range(3):
+            self.lower.append(_pad(box.lower[axis], -1))
+        for axis in range(3):
+            self.upper.append(_pad(box.upper[axis], 1))
+        self.offsets.append(0)
+        self.counts.append(0)
+        self.axes.append(0)
+        return len(self.counts) - 1
+
+
+def _pad(value: float, sign: int) -> float:
+    return value + sign * BOUNDS_PADDING * max(1.0, abs(value))
+
+
+def _find_split(
+    items: list[int],
+    bounds: Sequence[BoundingBox],
+    centroids: list[tuple[float, float, float]],
+) -> Optional[tuple[int, list[int], list[int]]]:
+    """
+    Returns the axis and the two halves of the cheapest split of `items` according
+    to the surface area heuristic, or `None` if they are cheaper left as a leaf.
+    """
+    if len(items) == 1:
+        return None
+
+    parent_area = BoundingBox.enclosing([bounds[i] for i in items]).surface_area
+    best: Optional[tuple[float, int, int, list[list[int]]]] = None
+    for axis in range(3):
+        low = min(centroids[i][axis] for i in items)
+        high = max(centroids[i][axis] for i in items)
+        if high <= low:
+            continue
+        scale = SAH_BINS / (high - low)
+        bins: list[list[int]] = [[] for _ in range(SAH_BINS)]
+        for i in items:
+            bins[min(int((centroids[i][axis] - low) * scale), SAH_BINS - 1)].append(i)
+        boxes = [
+            BoundingBox.enclosing([bounds[i] for i in contents]) if contents else None
+            for contents in bins
+        ]
+
+        # Sweep from each end so every split position is costed in linear time
+        left_costs = _sweep_costs(bins=bins, boxes=boxes)
+        right_costs = _sweep_costs(bins=bins[::-1], boxes=boxes[::-1])[::-1]
+        for split in range(1, SAH_BINS):
+            cost = left_costs[split - 1] + right_costs[split]
+            if best is None or cost < best[0]:
+                best = (cost, axis, split, bins)
+
+    if best is None:
+        # Every centroid is in the same place, so any split is as good as another
+        if len(items) <= MAX_LEAF_SIZE:
+            return None
+        middle = len(items) // 2
+        return 0, items[:middle], items[middle:]
+
+    cost, axis, split, bins = best
+    leaf_cost = float(len(items))
+    split_cost = TRAVERSAL_COST + cost / parent_area if parent_area else leaf_cost
+    if split_cost >= leaf_cost and len(items) <= MAX_LEAF_SIZE:
+        return None
+    left = [i for contents in bins[:split] for i in contents]
+    right = [i for contents in bins[split:] for i in contents]
+    return axis, left, right
+
+
+def _sweep_costs(
+    bins: list[list[int]], boxes: list[Optional[BoundingBox]]
+) -> list[float]:
+    """
+    Returns the area times primitive count of the boxes enclosing the first one,
+    two, three... bins.  Empty prefixes cost nothing.
+    """
+    costs = []
+    enclosing: Optional[BoundingBox] = None
+    count = 0
+    for contents, box in zip(bins, boxes):
+        if box is not None:
+            enclosing = box if enclosing is None else enclosing.union(box)
+        count += len(contents)
+        costs.append(enclosing.surface_area * count if enclosing is not None else 0.0)
+    return costs
@@ -0,0 +1,242 @@
+import math
+import struct
+from array import array
+from dataclasses import dataclass
+from typing import Optional
+
+from raytracer.core.types.bvh import BVH, Intersector, Vector3
+from raytracer.core.types.entities import (
+    BaseMaterial,
+    ChequeredMaterial,
+    Material,
+    Scene,
+    Sphere,
+)
+from raytracer.core.types.geometry import Point
+from raytracer.core.types.imaging import Colour
+
+# Three floats at the single precision `BaseVector` stores its components in
+_SINGLE = struct.Struct("3f")
+
+
+@dataclass
+class CompiledScene:
+    """
+    The spheres, materials and lights of a scene frozen into flat typed arrays, so
+    intersection and shading read numbers from arrays rather than attributes of
+    objects.
+
+    Vectors and colours take three consecutive entries, so the centre of sphere `i`
+    is `centres[i * 3:i * 3 + 3]`.  Each distinct material is stored once and
+    `materials` holds the index of the material of each sphere.  Solid materials
+    have the same colour for both squares of the chequer.  The scene's hierarchy is
+    kept alongside, so the whole scene pickles as a handful of buffers.
+    """
+
+    camera: Vector3
+    centres: array
+    radii_squared: array
+    materials: array
+    colour_1: array
+    colour_2: array
+    chequered: array
+    ambient: array
+    diffuse: array
+    specular: array
+    reflection: array
+    light_positions: array
+    light_colours: array
+    bvh: BVH
+
+    def __len__(self) -> int:
+        return len(self.radii_squared)
+
+    @property
+    def light_count(self) -> int:
+        return len(self.light_colours) // 3
+
+    @classmethod
+    def from_scene(cls, scene: Scene) -> "CompiledScene":
+        compiled = cls(
+            camera=vector(scene.camera),
+            centres=array("d"),
+            radii_squared=array("d"),
+            materials=array("l"),
+            colour_1=array("d"),
+            colour_2=array("d"),
+            chequered=array("b"),
+            ambient=array("d"),
+            diffuse=array("d"),
+            specular=array("d"),
+            reflection=array("d"),
+            light_positions=array("d"),
+            light_colours=array("d"),
+            bvh=scene.bvh,
+        )
+        # Index of each material compiled so far, by its id
+        compiled_materials: dict[int, int] = {}
+        for obj in scene.objects:
+            if not isinstance(obj, Sphere):
+                raise ValueError(
+                    f"'{type(obj).__name__}' is not supported by the compiled scene"
+                )
+            compiled.centres.extend(vector(obj.centre))
+            compiled.radii_squared.append(obj.radius * obj.radius)
+            material = obj.material
+            if id(material) not in compiled_materials:
+                compiled_materials[id(material)] = len(compiled.ambient)
+                compiled._add_material(material)
+            compiled.materials.append(compiled_materials[id(material)])
+        for light in scene.lights:
+            compiled.light_positions.extend(vector(light.position))
+            compiled.light_colours.extend(_colour_to_tuple(light.colour))
+        return compiled
+
+    def intersect(
+        self, index: int, origin: Vector3, direction: Vector3
+    ) -> Optional[float]:
+        """
+        Returns the distance along the ray to sphere `index`, or `None` if the ray
+        misses it.  Mirrors `Sphere.intersects`.
+        """
+        return self.intersector(origin=origin, direction=direction)(index)
+
+    def intersector(self, origin: Vector3, direction: Vector3) -> Intersector:
+        """
+        Returns a function intersecting the ray from `origin` along `direction`
+        with the sphere of a given index, for searching many spheres with one ray.
+        """
+        centres, radii_squared = self.centres, self.radii_squared
+        origin_x, origin_y, origin_z = origin
+        direction_x, direction_y, direction_z = direction
+        sqrt, pack, unpack = math.sqrt, _SINGLE.pack, _SINGLE.unpack
+
+        def intersect(index: int) -> Optional[float]:
+            offset = index * 3
+            x, y, z = unpack(
+                pack(
+                    origin_x - centres[offset],
+                    origin_y - centres[offset + 1],
+                    origin_z - centres[offset + 2],
+                )
+            )
+            b = 2 * (direction_x * x + direction_y * y + direction_z * z)
+            c = x * x + y * y + z * z - radii_squared[index]
+            discriminent = b * b - 4 * c
+            if discriminent >= 0:
+                distance: float = (-b - sqrt(discriminent)) / 2
+                if distance > 0:
+                    return distance
+            return None
+
+        return intersect
+
+    def find_nearest(
+        self, origin: Vector3, direction: Vector3, use_bvh: bool = True
+    ) -> tuple[Optional[float], Optional[int]]:
+        """
+        Returns the distance to, and the index of the nearest sphere hit by the ray,
+        searching the hierarchy unless told to test every sphere.
+        """
+        intersect = self.intersector(origin=origin, direction=direction)
+        if use_bvh:
+            return self.bvh.find_nearest(
+                origin=origin, direction=direction, intersect=intersect
+            )
+        dist_min: Optional[float] = None
+        index_hit: Optional[int] = None
+        for index in range(len(self)):
+            dist = intersect(index)
+            if dist is not None and (dist_min is None or dist < dist_min):
+                dist_min, index_hit = dist, index
+        return dist_min, index_hit
+
+    def find_any(
+        self, origin: Vector3, direction: Vector3, max_distance: float
+    ) -> Optional[int]:
+        """
+        Returns the index of any sphere hit by the ray closer than `max_distance`,
+        or `None` if nothing is.
+        """
+        return self.bvh.find_any(
+            origin=origin,
+            direction=direction,
+            max_distance=max_distance,
+            intersect=self.intersector(origin=origin, direction=direction),
+        )
+
+    def normal(self, index: int, position: Vector3) -> Vector3:
+        """Returns the normal of sphere `index` at a point on its surface"""
+        centres = self.centres
+        offset = index * 3
+        return normalize(
+            *single(
+                position[0] - centres[offset],
+                position[1] - centres[offset + 1],
+                position[2] - centres[offset + 2],
+            )
+        )
+
+    def colour_at(self, material: int, position: Vector3) -> Vector3:
+        """
+        Returns the colour of a material at a position.  Mirrors
+        `ChequeredMaterial.colour_at` for chequered materials.
+        """
+        offset = material * 3
+        colours = self.colour_1
+        if self.chequered[material]:
+            size = 1.0  # smaller number is larger square
+            delta = 5.0
+            if int((position[0] + delta) * size) % 2 == int(position[2] * size) % 2:
+                colours = self.colour_2
+        return (colours[offset], colours[offset + 1], colours[offset + 2])
+
+    def _add_material(self, material: BaseMaterial) -> None:
+        if isinstance(material, ChequeredMaterial):
+            self.colour_1.extend(_colour_to_tuple(material.colour_1))
+            self.colour_2.extend(_colour_to_tuple(material.colour_2))
+            self.chequered.append(True)
+        elif isinstance(material, Material):
+            self.colour_1.extend(_colour_to_tuple(material.colour))
+            self.colour_2.extend(_colour_to_tuple(material.colour))
+            self.chequered.append(False)
+        else:
+            raise ValueError(
+                f"'{type(material).__name__}' is not supported by the compiled scene"
+            )
+        self.ambient.append(material.ambient)
+        self.diffuse.append(material.diffuse)
+        self.specular.append(material.specular)
+        self.reflection.append(material.reflection)
+
+
+def compile_scene(scene: Scene) -> CompiledScene:
+    """
+    Returns the scene compiled for the render kernels, compiling it the first time
+    it is asked for.  Scenes should be replaced rather than changed once compiled.
+    """
+    if scene.compiled is None:
+        scene.compiled = CompiledScene.from_scene(scene)
+    return scene.compiled
+
+
+def vector(point: Point) -> Vector3:
+    return (point.x, point.y, point.z)
+
+
+def single(x: float, y: float, z: float) -> Vector3:
+    """
+    Rounds to single precision, mirroring the storage of `BaseVector`, so the
+    kernels find the same hits and colours as the objects they were compiled from.
+    """
+    rounded: Vector3 = _SINGLE.unpack(_SINGLE.pack(x, y, z))
+    return rounded
+
+
+def normalize(x: float, y: float, z: float) -> Vector3:
+    magnitude = math.sqrt(x * x + y * y + z * z)
+    return single(x / magnitude, y / magnitude, z / magnitude)
+
+
+def _colour_to_tuple(colour: Colour) -> Vector3:
+    return (float(colour.r), float(colour.g), float(colour.b))
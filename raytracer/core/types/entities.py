@@ -1,12 +1,16 @@
 import math
 from dataclasses import dataclass, field
-from typing import Optional, Self, Sequence
+from typing import TYPE_CHECKING, Optional, Self, Sequence
 
 from raytracer.core.types.base import Loadable
+from raytracer.core.types.bvh import BVH, BoundingBox
 from raytracer.core.types.geometry import Point
 from raytracer.core.types.imaging import Colour
 from raytracer.rendering.constants import SCENE_ABSOLUTE_BOTTOM, SCENE_ABSOLUTE_TOP
 
+if TYPE_CHECKING:  # pragma: nocover
+    from raytracer.core.types.compiled import CompiledScene
+
 
 @dataclass
 class Ray:
@@ -26,6 +30,14 @@ class Scene:
     lights: Sequence["Light"]
     width: int
     height: int
+    bvh: BVH = field(init=False, repr=False, compare=False)
+    # Set by `compile_scene` the first time the scene is rendered
+    compiled: Optional["CompiledScene"] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self) -> None:
+        self.bvh = BVH.build([obj.bounds() for obj in self.objects])
 
     @property
     def aspect_ratio(self) -> float:
@@ -141,6 +153,9 @@ class Primitive(Loadable):
     def intersects(self, ray: "Ray") -> Optional[float]:
         raise NotImplementedError  # pragma: nocover
 
+    def bounds(self) -> BoundingBox:
+        raise NotImplementedError  # pragma: nocover
+
     def normal(self, surface_point: Point) -> Point:
         return (surface_point - self.centre).normalize()
 
@@ -165,6 +180,20 @@ class Sphere(Primitive):
                 return distance
         return None
 
+    def bounds(self) -> BoundingBox:
+        return BoundingBox(
+            lower=(
+                self.centre.x - self.radius,
+                self.centre.y - self.radius,
+                self.centre.z - self.radius,
+            ),
+            upper=(
+                self.centre.x + self.radius,
+                self.centre.y + self.radius,
+                self.centre.z + self.radius,
+            ),
+        )
+
     @classmethod
     def from_object(cls, data: dict) -> "Sphere":
         import sys
@@ -1,9 +1,17 @@
 import enum
-from dataclasses import dataclass
+from dataclasses import InitVar, dataclass, field
+from typing import Optional, Sequence, Union
 
 from raytracer.core.constants import MIN_COLOUR
 from raytracer.core.types.colour import Colour  # type: ignore
 
+# Bytes per pixel: one each for red, green and blue
+CHANNELS = 3
+
+WritableBuffer = Union[bytearray, memoryview]
+# Red, green and blue light on the scale of a `Colour`, but neither rounded nor clamped
+Radiance = tuple[float, float, float]
+
 
 class ImageFormat(enum.Enum):
     BMP = ".bmp"
@@ -14,24 +22,100 @@ class ImageFormat(enum.Enum):
 
 @dataclass
 class Canvas:
+    """
+    An RGB image stored as packed bytes, three per pixel, one row after another.
+
+    By default the canvas allocates its own black pixels.  An existing writable
+    buffer of the right size, such as shared memory, can be wrapped instead by
+    passing it as `buffer`.
+    """
+
     width: int
     height: int
+    buffer: InitVar[Optional[WritableBuffer]] = None
+    _data: memoryview = field(init=False, repr=False)
+
+    def __post_init__(self, buffer: Optional[WritableBuffer]) -> None:
+        size = self.width * self.height * CHANNELS
+        if buffer is None:
+            buffer = bytearray(size)
+        data = memoryview(buffer).cast("B")
+        if len(data) != size:
+            raise ValueError(
+                f"A {self.width}x{self.height} canvas needs {size} bytes, "
+                f"not {len(data)}"
+            )
+        self._data = data
 
     @property
-    def pixels(self) -> list[list[Colour]]:
-        return self._pixels
+    def data(self) -> memoryview:
+        """
+        The packed RGB bytes of every row, top to bottom.  Supports the buffer
+        protocol, so it can be handed to image libraries without copying.
+        """
+        return self._data
 
-    def __post_init__(self) -> None:
-        # Create canvas for the pixels based on the given width and height
-        self._pixels: list[list[Colour]] = [
-            [DEFAULT_PIXEL for _ in range(self.width)] for _ in range(self.height)
+    @property
+    def pixels(self) -> list[list[Colour]]:
+        """A copy of the canvas as rows of colours"""
+        return [
+            [
+                Colour(r=data[x], g=data[x + 1], b=data[x + 2])
+                for x in range(0, len(data), CHANNELS)
+            ]
+            for data in (self.row(index) for index in range(self.height))
         ]
 
+    def row(self, index: int) -> memoryview:
+        """The packed RGB bytes of a single row"""
+        return self.rows(start=index, stop=index + 1)
+
+    def rows(self, start: int, stop: int) -> memoryview:
+        """The packed RGB bytes of the rows from `start` up to `stop`"""
+        stride = self.width * CHANNELS
+        first, last = start * stride, stop * stride
+        return self._data[first:last]
+
     def paint(self, x: int, y: int, pixel: Colour) -> None:
-        self._pixels[y][x] = pixel
+        start = (y * self.width + x) * CHANNELS
+        self._data[start] = pixel.r
+        self._data[start + 1] = pixel.g
+        self._data[start + 2] = pixel.b
 
-    def set_row(self, index: int, row: list[Colour]) -> None:
-        self._pixels[index] = row
+    def set_row(
+        self, index: int, row: Sequence[Colour], start: int = 0, step: int = 1
+    ) -> None:
+        """
+        Sets the pixels of a row, or of part of it from column `start`.  With a
+        `step`, the pixels are set in every `step`th column.
+        """
+        data = self.row(index)
+        if step == 1:
+            first, last = start * CHANNELS, (start + len(row)) * CHANNELS
+            data[first:last] = bytes(
+                [channel for pixel in row for channel in (pixel.r, pixel.g, pixel.b)]
+            )
+            return
+        last = (start + (len(row) - 1) * step + 1) * CHANNELS
+        stride = step * CHANNELS
+        channels = ([p.r for p in row], [p.g for p in row], [p.b for p in row])
+        for channel, values in enumerate(channels):
+            first = start * CHANNELS + channel
+            data[first:last:stride] = bytes(values)
+
+    def copy(self) -> "Canvas":
+        return Canvas(
+            width=self.width, height=self.height, buffer=bytearray(self._data)
+        )
 
 
 DEFAULT_PIXEL = Colour(r=MIN_COLOUR, g=MIN_COLOUR, b=MIN_COLOUR)
+
+
+def quantize(radiance: Radiance) -> Colour:
+    """
+    Returns the colour a canvas stores for the radiance, each channel rounded to the
+    nearest level and clamped once.
+    """
+    r, g, b = radiance
+    return Colour(r=r, g=g, b=b)
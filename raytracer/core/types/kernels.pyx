@@ -0,0 +1,814 @@
+# cython: boundscheck=False, wraparound=False, initializedcheck=False, cdivision=True
+"""
+Typed kernels tracing rays through a `CompiledScene` in C.
+
+They follow the pure Python kernels step for step, rounding to single precision
+wherever `BaseVector` stores a vector and truncating and clamping wherever `Colour`
+does, so both render exactly the same image.
+"""
+from array import array
+
+from libc.math cimport INFINITY, pow, sqrt
+from libc.stdlib cimport calloc, free, malloc, realloc
+
+from raytracer.core.constants import MAX_COLOUR, MIN_COLOUR
+from raytracer.core.types.bvh import INFINITE_SLOPE
+
+
+# Returned by `_intersect` when the ray misses, as hits are always ahead of the ray
+cdef double MISS = -1.0
+# Index returned when nothing is hit
+cdef long NOTHING = -1
+
+cdef long _MIN_COLOUR = MIN_COLOUR
+cdef long _MAX_COLOUR = MAX_COLOUR
+cdef double _INFINITE_SLOPE = INFINITE_SLOPE
+# Origin, direction and length of each recorded ray segment, as `TileDependencies`
+# flattens them
+cdef long SEGMENT_SIZE = 7
+
+
+cdef struct Vector:
+    # Single precision, as `BaseVector` stores its components
+    float x
+    float y
+    float z
+
+
+cdef struct Counts:
+    # Counted as by `TraceStats`
+    long intersection_tests
+    long reflection_rays
+    long terminated
+    long shades
+    # Counted as by `ShadowStats`
+    long rays
+    long occluded
+    long cache_hits
+    long back_facing
+    long tests
+
+
+cdef struct SceneData:
+    Vector camera
+    long count
+    double *centres
+    double *radii_squared
+    long *materials
+    double *colour_1
+    double *colour_2
+    signed char *chequered
+    double *diffuse
+    double *specular
+    double *reflection
+    long light_count
+    double *light_positions
+    double *light_colours
+    long node_count
+    double *lower
+    double *upper
+    long *offsets
+    long *counts
+    signed char *axes
+    long *indices
+
+
+cdef struct Settings:
+    long max_depth
+    bint use_bvh
+    double reflection_delta
+    double phong_coefficient
+    long *occluders
+    # Scratch space for searching the hierarchy and for the colours and
+    # reflections along a path
+    long *stack
+    long *path_colours
+    double *path_scales
+    # What the rays traced depend on, recorded as `TileDependencies` records it:
+    # the segments of the rays nothing blocked, a flag for each object hit or
+    # blocking a shadow ray, and whether anything was shaded
+    bint recording
+    double *segments
+    long segment_count
+    long segment_capacity
+    signed char *objects
+    bint shaded
+    bint out_of_memory
+
+
+cdef class SceneKernels:
+    """
+    The kernels over one compiled scene, holding on to its arrays while they are
+    read from C.
+    """
+
+    cdef object compiled
+    cdef double[::1] _centres, _radii_squared, _colour_1, _colour_2
+    cdef double[::1] _diffuse, _specular, _reflection
+    cdef double[::1] _light_positions, _light_colours, _lower, _upper
+    cdef long[::1] _materials, _offsets, _counts, _indices
+    cdef signed char[::1] _chequered, _axes
+    cdef SceneData scene
+
+    def __init__(self, compiled):
+        self.compiled = compiled
+        self._centres = compiled.centres
+        self._radii_squared = compiled.radii_squared
+        self._materials = compiled.materials
+        self._colour_1 = compiled.colour_1
+        self._colour_2 = compiled.colour_2
+        self._chequered = compiled.chequered
+        self._diffuse = compiled.diffuse
+        self._specular = compiled.specular
+        self._reflection = compiled.reflection
+        self._light_positions = compiled.light_positions
+        self._light_colours = compiled.light_colours
+        self._lower = compiled.bvh.lower
+        self._upper = compiled.bvh.upper
+        self._offsets = compiled.bvh.offsets
+        self._counts = compiled.bvh.counts
+        self._axes = compiled.bvh.axes
+        self._indices = compiled.bvh.indices
+
+        camera = compiled.camera
+        self.scene.camera = _vector(camera)
+        self.scene.count = self._radii_squared.shape[0]
+        self.scene.centres = _doubles(self._centres)
+        self.scene.radii_squared = _doubles(self._radii_squared)
+        self.scene.materials = _longs(self._materials)
+        self.scene.colour_1 = _doubles(self._colour_1)
+        self.scene.colour_2 = _doubles(self._colour_2)
+        self.scene.chequered = _chars(self._chequered)
+        self.scene.diffuse = _doubles(self._diffuse)
+        self.scene.specular = _doubles(self._specular)
+        self.scene.reflection = _doubles(self._reflection)
+        self.scene.light_count = self._light_colours.shape[0] // 3
+        self.scene.light_positions = _doubles(self._light_positions)
+        self.scene.light_colours = _doubles(self._light_colours)
+        self.scene.node_count = self._counts.shape[0]
+        self.scene.lower = _doubles(self._lower)
+        self.scene.upper = _doubles(self._upper)
+        self.scene.offsets = _longs(self._offsets)
+        self.scene.counts = _longs(self._counts)
+        self.scene.axes = _chars(self._axes)
+        self.scene.indices = _longs(self._indices)
+
+    cpdef object intersect(self, long index, tuple origin, tuple direction):
+        """
+        Returns the distance along the ray to sphere `index`, or `None` if the ray
+        misses it.
+        """
+        cdef double distance = _intersect(
+            &self.scene, index, _vector(origin), _vector(direction)
+        )
+        return None if distance == MISS else distance
+
+    cpdef tuple find_nearest(self, tuple origin, tuple direction, bint use_bvh=True):
+        """
+        Returns the distance to and the index of the nearest sphere hit by the ray,
+        or `None` for both, along with how many spheres were tested.
+        """
+        cdef Settings settings = _settings(self.scene, use_bvh=use_bvh)
+        cdef long tests = 0
+        cdef double distance = MISS
+        cdef long index
+        try:
+            index = _find_nearest(
+                &self.scene,
+                &settings,
+                _vector(origin),
+                _vector(direction),
+                &distance,
+                &tests,
+            )
+        finally:
+            _free_settings(&settings)
+        if index == NOTHING:
+            return (None, None, tests)
+        return (distance, index, tests)
+
+    cpdef tuple find_any(self, tuple origin, tuple direction, double max_distance):
+        """
+        Returns the index of any sphere hit by the ray closer than `max_distance`,
+        or `None`, along with how many spheres were tested.
+        """
+        cdef Settings settings = _settings(self.scene, use_bvh=True)
+        cdef long tests = 0
+        cdef long index
+        try:
+            index = _find_any(
+                &self.scene,
+                &settings,
+                _vector(origin),
+                _vector(direction),
+                max_distance,
+                &tests,
+            )
+        finally:
+            _free_settings(&settings)
+        return (None if index == NOTHING else index, tests)
+
+    cpdef tuple render_row(
+        self,
+        double y,
+        double left,
+        double step,
+        long start,
+        long stop,
+        long stride,
+        long max_depth,
+        bint use_bvh,
+        long[::1] occluders,
+        double reflection_delta,
+        double phong_coefficient,
+        object dependencies=None,
+    ):
+        """
+        Traces every `stride`th pixel of a row from column `start` up to `stop`,
+        following reflections as `RenderEngine._render_pixel` does without Russian
+        roulette.  The row's `y` and the `left` edge and `step` between columns are
+        in scene coordinates.
+
+        Returns the packed RGB bytes of the pixels, the index of the object each
+        pixel hit or -1, and the counts of the rays traced by the engine and the
+        shader.  `occluders` is the shader's cache of the last object to block each
+        light, which is updated in place.  What the row depends on is added to
+        `dependencies` if given, a `TileDependencies`, as the engine and shader
+        record it in Python.  The GIL is released while tracing.
+        """
+        cdef long width = len(range(start, stop, stride))
+        cdef bytearray pixels = bytearray(width * 3)
+        cdef unsigned char[::1] pixel_view = pixels
+        primaries = array("l", [NOTHING]) * width
+        cdef long[::1] primary_view = primaries
+        cdef Settings settings = _settings(self.scene, use_bvh=use_bvh)
+        cdef Counts counts = Counts(0, 0, 0, 0, 0, 0, 0, 0, 0)
+        cdef long column, channel, index
+        cdef long colour[3]
+        cdef Vector origin = self.scene.camera
+        cdef Vector target
+
+        settings.max_depth = max_depth
+        settings.reflection_delta = reflection_delta
+        settings.phong_coefficient = phong_coefficient
+        settings.occluders = &occluders[0] if occluders.shape[0] else NULL
+        settings.path_colours = <long *>malloc((max_depth + 2) * 3 * sizeof(long))
+        settings.path_scales = <double *>malloc((max_depth + 2) * sizeof(double))
+        if dependencies is not None:
+            settings.recording = True
+            settings.objects = <signed char *>calloc(self.scene.count + 1, 1)
+        try:
+            if settings.path_colours == NULL or settings.path_scales == NULL:
+                raise MemoryError()
+            if settings.recording and settings.objects == NULL:
+                raise MemoryError()
+            with nogil:
+                for column in range(width):
+                    target = _single(
+                        <float>(left + (start + column * stride) * step) - origin.x,
+                        <float>y - origin.y,
+                        0 - origin.z,
+                    )
+                    _trace(
+                        &self.scene,
+                        &settings,
+                        origin,
+                        _normalize(target),
+                        0,
+                        colour,
+                        &primary_view[column],
+                        &counts,
+                    )
+                    for channel in range(3):
+                        pixel_view[column * 3 + channel] = colour[channel]
+            if settings.recording:
+                if settings.out_of_memory:
+                    raise MemoryError()
+                if settings.segment_count:
+                    dependencies.segments.frombytes(
+                        (<char *>settings.segments)[
+                            : settings.segment_count * sizeof(double)
+                        ]
+                    )
+                for index in range(self.scene.count):
+                    if settings.objects[index]:
+                        dependencies.objects.add(index)
+                if settings.shaded:
+                    dependencies.shaded = True
+        finally:
+            free(settings.path_colours)
+            free(settings.path_scales)
+            free(settings.segments)
+            free(settings.objects)
+            _free_settings(&settings)
+        return (
+            bytes(pixels),
+            primaries.tolist(),
+            {
+                "intersection_tests": counts.intersection_tests,
+                "reflection_rays": counts.reflection_rays,
+                "terminated": counts.terminated,
+                "shades": counts.shades,
+            },
+            {
+                "rays": counts.rays,
+                "occluded": counts.occluded,
+                "cache_hits": counts.cache_hits,
+                "back_facing": counts.back_facing,
+                "tests": counts.tests,
+            },
+        )
+
+
+cdef double *_doubles(double[::1] values):
+    return &values[0] if values.shape[0] else NULL
+
+
+cdef long *_longs(long[::1] values):
+    return &values[0] if values.shape[0] else NULL
+
+
+cdef signed char *_chars(signed char[::1] values):
+    return &values[0] if values.shape[0] else NULL
+
+
+cdef Vector _vector(tuple values):
+    return _single(values[0], values[1], values[2])
+
+
+cdef Settings _settings(SceneData scene, bint use_bvh) except *:
+    cdef Settings settings
+    settings.max_depth = 0
+    settings.use_bvh = use_bvh
+    settings.reflection_delta = 0
+    settings.phong_coefficient = 0
+    settings.occluders = NULL
+    settings.path_colours = NULL
+    settings.path_scales = NULL
+    settings.recording = False
+    settings.segments = NULL
+    settings.segment_count = 0
+    settings.segment_capacity = 0
+    settings.objects = NULL
+    settings.shaded = False
+    settings.out_of_memory = False
+    # Nodes left to visit never outnumber the depth of the hierarchy
+    settings.stack = <long *>malloc((scene.node_count + 1) * sizeof(long))
+    if settings.stack == NULL:
+        raise MemoryError()
+    return settings
+
+
+cdef void _free_settings(Settings *settings):
+    free(settings.stack)
+    settings.stack = NULL
+
+
+cdef void _record_segment(
+    Settings *settings, Vector origin, Vector direction, double length
+) nogil:
+    """Mirrors `TileDependencies.add_segment`, growing the segments as needed"""
+    cdef long capacity
+    cdef double *grown
+    cdef double *segment
+    if settings.segment_count + SEGMENT_SIZE > settings.segment_capacity:
+        capacity = settings.segment_capacity * 2 + SEGMENT_SIZE * 64
+        grown = <double *>realloc(settings.segments, capacity * sizeof(double))
+        if grown == NULL:
+            settings.out_of_memory = True
+            return
+        settings.segments = grown
+        settings.segment_capacity = capacity
+    segment = settings.segments + settings.segment_count
+    segment[0] = origin.x
+    segment[1] = origin.y
+    segment[2] = origin.z
+    segment[3] = direction.x
+    segment[4] = direction.y
+    segment[5] = direction.z
+    segment[6] = length
+    settings.segment_count += SEGMENT_SIZE
+
+
+cdef inline Vector _single(double x, double y, double z) nogil:
+    """Rounds to single precision, mirroring the storage of `BaseVector`"""
+    cdef Vector vector
+    vector.x = <float>x
+    vector.y = <float>y
+    vector.z = <float>z
+    return vector
+
+
+cdef inline double _dot(Vector a, Vector b) nogil:
+    # In double precision, as `BaseVector.dot_product` is
+    return <double>a.x * b.x + <double>a.y * b.y + <double>a.z * b.z
+
+
+cdef inline Vector _normalize(Vector vector) nogil:
+    cdef double magnitude = sqrt(_dot(vector, vector))
+    return _single(vector.x / magnitude, vector.y / magnitude, vector.z / magnitude)
+
+
+cdef inline long _clamp(long value) nogil:
+    if value < _MIN_COLOUR:
+        return _MIN_COLOUR
+    return _MAX_COLOUR if value > _MAX_COLOUR else value
+
+
+cdef inline long _scale(double value) nogil:
+    """Truncates and then clamps a channel, as `Colour.__mul__` does"""
+    if value >= _MAX_COLOUR:
+        return _MAX_COLOUR
+    if value <= _MIN_COLOUR:
+        return _MIN_COLOUR
+    return <long>value
+
+
+cdef inline double _intersect(
+    SceneData *scene, long index, Vector origin, Vector direction
+) nogil:
+    cdef long offset = index * 3
+    cdef Vector to_ray = _single(
+        origin.x - scene.centres[offset],
+        origin.y - scene.centres[offset + 1],
+        origin.z - scene.centres[offset + 2],
+    )
+    cdef double b = 2 * _dot(direction, to_ray)
+    cdef double c = _dot(to_ray, to_ray) - scene.radii_squared[index]
+    cdef double discriminent = b * b - 4 * c
+    cdef double distance
+    if discriminent >= 0:
+        distance = (-b - sqrt(discriminent)) / 2
+        if distance > 0:
+            return distance
+    return MISS
+
+
+cdef inline bint _misses_node(
+    SceneData *scene,
+    long node,
+    Vector origin,
+    double *inverse,
+    double t_far,
+) nogil:
+    """The slab test of `BVH.find_nearest` against the bounds of a node"""
+    cdef double t_near = 0.0
+    cdef double t_1, t_2
+    cdef long axis
+    cdef double origins[3]
+    origins[0] = origin.x
+    origins[1] = origin.y
+    origins[2] = origin.z
+    for axis in range(3):
+        t_1 = (scene.lower[node * 3 + axis] - origins[axis]) * inverse[axis]
+        t_2 = (scene.upper[node * 3 + axis] - origins[axis]) * inverse[axis]
+        if t_1 > t_2:
+            t_1, t_2 = t_2, t_1
+        if t_1 > t_near:
+            t_near = t_1
+        if t_2 < t_far:
+            t_far = t_2
+    return t_near > t_far
+
+
+cdef inline void _inverse(Vector direction, double *inverse) nogil:
+    inverse[0] = 1.0 / direction.x if direction.x != 0 else _INFINITE_SLOPE
+    inverse[1] = 1.0 / direction.y if direction.y != 0 else _INFINITE_SLOPE
+    inverse[2] = 1.0 / direction.z if direction.z != 0 else _INFINITE_SLOPE
+
+
+cdef long _find_nearest(
+    SceneData *scene,
+    Settings *settings,
+    Vector origin,
+    Vector direction,
+    double *distance,
+    long *tests,
+) nogil:
+    """
+    Returns the index of the nearest sphere hit, or `NOTHING`, setting `distance`
+    to how far along the ray it is.  Mirrors `CompiledScene.find_nearest`.
+    """
+    cdef long index_hit = NOTHING
+    cdef double dist_min = MISS
+    cdef double dist
+    cdef long index, node, count, first, item, left, right, top
+    cdef double along_axis
+    cdef double inverse[3]
+
+    if not settings.use_bvh:
+        tests[0] += scene.count
+        for index in range(scene.count):
+            dist = _intersect(scene, index, origin, direction)
+            if dist != MISS and (index_hit == NOTHING or dist < dist_min):
+                dist_min, index_hit = dist, index
+        distance[0] = dist_min
+        return index_hit
+
+    if not scene.node_count:
+        return NOTHING
+    _inverse(direction, inverse)
+    settings.stack[0] = 0
+    top = 1
+    while top:
+        top -= 1
+        node = settings.stack[top]
+        if _misses_node(
+            scene, node, origin, inverse, INFINITY if index_hit == NOTHING else dist_min
+        ):
+            continue
+
+        count = scene.counts[node]
+        if not count:
+            left, right = node + 1, scene.offsets[node]
+            if scene.axes[node] == 0:
+                along_axis = direction.x
+            elif scene.axes[node] == 1:
+                along_axis = direction.y
+            else:
+                along_axis = direction.z
+            if along_axis < 0:
+                left, right = right, left
+            settings.stack[top] = right
+            settings.stack[top + 1] = left
+            top += 2
+            continue
+        first = scene.offsets[node]
+        tests[0] += count
+        for item in range(first, first + count):
+            index = scene.indices[item]
+            dist = _intersect(scene, index, origin, direction)
+            if dist == MISS:
+                continue
+            if index_hit == NOTHING or dist < dist_min:
+                dist_min, index_hit = dist, index
+            elif dist == dist_min and index < index_hit:
+                # Match the linear scan, which keeps the first of equal hits
+                index_hit = index
+    distance[0] = dist_min
+    return index_hit
+
+
+cdef long _find_any(
+    SceneData *scene,
+    Settings *settings,
+    Vector origin,
+    Vector direction,
+    double max_distance,
+    long *tests,
+) nogil:
+    """
+    Returns the index of any sphere hit closer than `max_distance`, or `NOTHING`.
+    Mirrors `BVH.find_any`.
+    """
+    cdef long node, count, first, item, index, top
+    cdef double dist
+    cdef double inverse[3]
+    if not scene.node_count:
+        return NOTHING
+    _inverse(direction, inverse)
+    settings.stack[0] = 0
+    top = 1
+    while top:
+        top -= 1
+        node = settings.stack[top]
+        if _misses_node(scene, node, origin, inverse, max_distance):
+            continue
+
+        count = scene.counts[node]
+        if not count:
+            settings.stack[top] = scene.offsets[node]
+            settings.stack[top + 1] = node + 1
+            top += 2
+            continue
+        first = scene.offsets[node]
+        for item in range(first, first + count):
+            index = scene.indices[item]
+            tests[0] += 1
+            dist = _intersect(scene, index, origin, direction)
+            if dist != MISS and dist < max_distance:
+                return index
+    return NOTHING
+
+
+cdef inline Vector _towards(SceneData *scene, long light, Vector position) nogil:
+    """Returns the unnormalised offset from the position to the light"""
+    cdef long offset = light * 3
+    return _single(
+        scene.light_positions[offset] - position.x,
+        scene.light_positions[offset + 1] - position.y,
+        scene.light_positions[offset + 2] - position.z,
+    )
+
+
+cdef bint _occluded(
+    SceneData *scene,
+    Settings *settings,
+    long light,
+    Vector position,
+    Vector normal,
+    Vector to_light,
+    Counts *counts,
+) nogil:
+    """Mirrors `Shader._occluded`"""
+    cdef Vector nudge, origin, offset, direction
+    cdef double distance, dist
+    cdef long cached, occluder
+    if _dot(normal, to_light) <= 0:
+        counts.back_facing += 1
+        return True
+
+    nudge = _single(
+        normal.x * settings.reflection_delta,
+        normal.y * settings.reflection_delta,
+        normal.z * settings.reflection_delta,
+    )
+    origin = _single(position.x + nudge.x, position.y + nudge.y, position.z + nudge.z)
+    offset = _towards(scene, light, origin)
+    distance = sqrt(_dot(offset, offset))
+    direction = _single(offset.x / distance, offset.y / distance, offset.z / distance)
+    counts.rays += 1
+
+    cached = settings.occluders[light]
+    if cached != NOTHING:
+        counts.tests += 1
+        dist = _intersect(scene, cached, origin, direction)
+        if dist != MISS and dist < distance:
+            counts.occluded += 1
+            counts.cache_hits += 1
+            if settings.recording:
+                settings.objects[cached] = 1
+            return True
+
+    occluder = _find_any(scene, settings, origin, direction, distance, &counts.tests)
+    if occluder == NOTHING:
+        if settings.recording:
+            _record_segment(settings, origin, direction, distance)
+        return False
+    if settings.recording:
+        settings.objects[occluder] = 1
+    settings.occluders[light] = occluder
+    counts.occluded += 1
+    return True
+
+
+cdef void _shade(
+    SceneData *scene,
+    Settings *settings,
+    long index,
+    Vector position,
+    Vector normal,
+    long *colour,
+    Counts *counts,
+) nogil:
+    """Mirrors `Shader.shade`, Lambert diffuse and Blinn-Phong specular shading"""
+    cdef long material = scene.materials[index]
+    cdef long offset = material * 3
+    cdef double *base = scene.colour_1
+    cdef Vector to_cam = _single(
+        scene.camera.x - position.x,
+        scene.camera.y - position.y,
+        scene.camera.z - position.z,
+    )
+    cdef Vector to_light, half_vector
+    cdef double lambert, phong
+    cdef long light, channel, diffused, reflected
+    if scene.chequered[material]:
+        if (<long>((position.x + 5.0) * 1.0) & 1) == (<long>(position.z * 1.0) & 1):
+            base = scene.colour_2
+
+    colour[0] = colour[1] = colour[2] = _MIN_COLOUR
+    for light in range(scene.light_count):
+        to_light = _normalize(_towards(scene, light, position))
+        if _occluded(scene, settings, light, position, normal, to_light, counts):
+            continue
+        lambert = _dot(normal, to_light)
+        if lambert < 0:
+            lambert = 0
+        half_vector = _normalize(
+            _single(
+                to_light.x + to_cam.x, to_light.y + to_cam.y, to_light.z + to_cam.z
+            )
+        )
+        phong = _dot(normal, half_vector)
+        if phong < 0:
+            phong = 0
+        phong = pow(phong, settings.phong_coefficient)
+        for channel in range(3):
+            diffused = _scale(
+                _scale(base[offset + channel] * scene.diffuse[material]) * lambert
+            )
+            reflected = _scale(
+                _scale(
+                    scene.light_colours[light * 3 + channel] * scene.specular[material]
+                )
+                * phong
+            )
+            colour[channel] = _clamp(_clamp(colour[channel] + diffused) + reflected)
+
+
+cdef bint _settled(long *colours, double *scales, long length) nogil:
+    """Mirrors `_is_settled` for the colours and reflections along a path"""
+    cdef long channel, item, darkest, brightest
+    for channel in range(3):
+        darkest, brightest = _MIN_COLOUR, _MAX_COLOUR
+        for item in range(length - 1, -1, -1):
+            darkest = _fold(colours[item * 3 + channel], darkest * scales[item])
+            brightest = _fold(colours[item * 3 + channel], brightest * scales[item])
+        if darkest != brightest:
+            return False
+    return True
+
+
+cdef inline long _fold(long value, double reflected) nogil:
+    cdef long truncated = _MAX_COLOUR if reflected >= _MAX_COLOUR else <long>reflected
+    value += truncated
+    return _MAX_COLOUR if value > _MAX_COLOUR else value
+
+
+cdef void _trace(
+    SceneData *scene,
+    Settings *settings,
+    Vector origin,
+    Vector direction,
+    long depth,
+    long *pixel,
+    long *primary,
+    Counts *counts,
+) nogil:
+    """Mirrors `RenderEngine._render_pixel` without Russian roulette"""
+    cdef double distance = MISS
+    cdef long index, channel
+    cdef Vector position, normal, nudge, mirrored
+    cdef double scale, twice_along
+    cdef long reflected[3]
+
+    pixel[0] = pixel[1] = pixel[2] = _MIN_COLOUR
+    index = _find_nearest(
+        scene, settings, origin, direction, &distance, &counts.intersection_tests
+    )
+    if not depth:
+        primary[0] = index
+    if settings.recording:
+        _record_segment(
+            settings, origin, direction, INFINITY if index == NOTHING else distance
+        )
+        if index != NOTHING:
+            settings.objects[index] = 1
+    if index == NOTHING:
+        return
+    position = _single(
+        direction.x * distance, direction.y * distance, direction.z * distance
+    )
+    position = _single(
+        origin.x + position.x, origin.y + position.y, origin.z + position.z
+    )
+    normal = _normalize(
+        _single(
+            position.x - scene.centres[index * 3],
+            position.y - scene.centres[index * 3 + 1],
+            position.z - scene.centres[index * 3 + 2],
+        )
+    )
+    _shade(scene, settings, index, position, normal, pixel, counts)
+    counts.shades += 1
+    settings.shaded = True
+    if depth > settings.max_depth:
+        return
+
+    scale = scene.reflection[scene.materials[index]]
+    for channel in range(3):
+        settings.path_colours[depth * 3 + channel] = pixel[channel]
+    settings.path_scales[depth] = scale
+    if _settled(settings.path_colours, settings.path_scales, depth + 1):
+        counts.terminated += 1
+        return
+
+    nudge = _single(
+        normal.x * settings.reflection_delta,
+        normal.y * settings.reflection_delta,
+        normal.z * settings.reflection_delta,
+    )
+    twice_along = 2 * _dot(direction, normal)
+    mirrored = _single(
+        normal.x * twice_along, normal.y * twice_along, normal.z * twice_along
+    )
+    counts.reflection_rays += 1
+    _trace(
+        scene,
+        settings,
+        _single(position.x + nudge.x, position.y + nudge.y, position.z + nudge.z),
+        _normalize(
+            _single(
+                direction.x - mirrored.x,
+                direction.y - mirrored.y,
+                direction.z - mirrored.z,
+            )
+        ),
+        depth + 1,
+        reflected,
+        primary,
+        counts,
+    )
+    for channel in range(3):
+        pixel[channel] = _clamp(pixel[channel] + _scale(reflected[channel] * scale))
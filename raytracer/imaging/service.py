@@ -1,50 +1,86 @@
 import os
-import shutil
-import tempfile
-from typing import Callable, Optional, TextIO
+import time
+from typing import BinaryIO, Callable, Optional
 
 from PIL import Image
 
-from raytracer.core.constants import MAX_COLOUR
 from raytracer.core.types.imaging import Canvas, ImageFormat
+from raytracer.imaging.stream import (
+    ImageStats,
+    PNGStreamWriter,
+    PPMStreamWriter,
+    StreamWriter,
+)
+
+STREAM_WRITERS: dict[ImageFormat, type[StreamWriter]] = {
+    ImageFormat.PNG: PNGStreamWriter,
+    ImageFormat.PPM: PPMStreamWriter,
+}
 
 
 class ImageService:
+    def __init__(self) -> None:
+        # Everything saved or streamed by this service
+        self.stats = ImageStats()
+
     def save(
         self,
         canvas: Canvas,
         filepath: str,
         update_func: Optional[Callable[[int], None]] = None,
     ) -> str:
+        """
+        Saves the canvas in the format given by the file extension.
+
+        PPM files are written directly as binary rows.  Other formats are encoded
+        by PIL from an image sharing the canvas's bytes.
+        """
         _, extension = os.path.splitext(filepath.lower())
         image_format = ImageFormat(extension)
-        with tempfile.NamedTemporaryFile(
-            suffix=ImageFormat.PPM.value, delete=False
-        ) as tmp_img:
-            tmp_img.close()
-            with open(tmp_img.name, "w") as image_file:
+        if image_format == ImageFormat.PPM:
+            with open(filepath, "wb") as image_file:
                 self._render(
                     canvas=canvas, image_file=image_file, update_func=update_func
                 )
-
-            if image_format == ImageFormat.PPM:
-                shutil.copy(tmp_img.name, filepath)
-                return filepath
-            Image.open(tmp_img.name).save(filepath)
             return filepath
 
+        started = time.perf_counter()
+        image = Image.frombuffer(
+            "RGB", (canvas.width, canvas.height), canvas.data, "raw", "RGB", 0, 1
+        )
+        image.save(filepath)
+        self.stats.encode_time += time.perf_counter() - started
+        self.stats.images += 1
+        self.stats.rows += canvas.height
+        if update_func:
+            update_func(canvas.height)
+        return filepath
+
+    def stream(
+        self, image_file: BinaryIO, image_format: ImageFormat, width: int, height: int
+    ) -> StreamWriter:
+        """
+        Returns a writer which encodes rows to `image_file` as they are rendered.
+        """
+        if image_format not in STREAM_WRITERS:
+            raise ValueError(f"'{image_format.value}' images can't be streamed")
+        return STREAM_WRITERS[image_format](
+            image_file=image_file, width=width, height=height, stats=self.stats
+        )
+
     def _render(
         self,
         canvas: Canvas,
-        image_file: TextIO,
+        image_file: BinaryIO,
         update_func: Optional[Callable[[int], None]] = None,
     ) -> None:
-        image_file.write(self._generate_header(canvas))
-        for row in canvas.pixels:
-            line = " ".join([f"{pixel.r} {pixel.g}  {pixel.b}" for pixel in row])
-            image_file.write(f"{line}\n")
-            if update_func:
-                update_func(1)
-
-    def _generate_header(self, canvas: Canvas) -> str:
-        return f"P3 {canvas.width} {canvas.height}\n{MAX_COLOUR}\n"
+        with PPMStreamWriter(
+            image_file=image_file,
+            width=canvas.width,
+            height=canvas.height,
+            stats=self.stats,
+        ) as writer:
+            for index in range(canvas.height):
+                writer.add_row(index=index, canvas=canvas)
+                if update_func:
+                    update_func(1)
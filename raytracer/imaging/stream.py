@@ -0,0 +1,167 @@
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Optional
+
+from raytracer.core.constants import MAX_COLOUR
+from raytracer.core.types.imaging import Canvas
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Bit depth, colour type (truecolour), compression, filter and interlace methods
+PNG_HEADER_FORMAT = ">IIBBBBB"
+PNG_COLOUR_DEPTH = 8
+PNG_TRUECOLOUR = 2
+# Each PNG scanline starts with the filter applied to it, and we apply none
+PNG_FILTER_NONE = b"\x00"
+
+
+@dataclass
+class ImageStats:
+    """Counts of the images encoded, and the time spent encoding them"""
+
+    images: int = 0
+    rows: int = 0
+    # Seconds spent encoding and writing headers, rows and trailers
+    encode_time: float = 0.0
+
+
+class StreamWriter:
+    """
+    Encodes an image to a file while it is being rendered.
+
+    Rows may be finished in any order, but are written as soon as every row above
+    them is finished too, so the file always holds a complete prefix of the image.
+    """
+
+    def __init__(
+        self,
+        image_file: BinaryIO,
+        width: int,
+        height: int,
+        stats: Optional[ImageStats] = None,
+    ) -> None:
+        self.image_file = image_file
+        self.width = width
+        self.height = height
+        self.stats = stats or ImageStats()
+        # Rows which are finished but still wait on a row above them
+        self._finished: set[int] = set()
+        self._next_row = 0
+
+    def __enter__(self) -> "StreamWriter":
+        started = time.perf_counter()
+        self._write_header()
+        self.stats.encode_time += time.perf_counter() - started
+        return self
+
+    def __exit__(self, exc_type: Optional[type], *args: Any) -> None:
+        if exc_type is None:
+            self.finish()
+
+    @property
+    def rows_written(self) -> int:
+        return self._next_row
+
+    def add_row(self, index: int, canvas: Canvas) -> None:
+        """
+        Marks row `index` of `canvas` as finished, writing it along with any rows
+        after it which were waiting on it.
+        """
+        self._finished.add(index)
+        start = self._next_row
+        while self._next_row in self._finished:
+            self._finished.remove(self._next_row)
+            self._next_row += 1
+        if self._next_row > start:
+            started = time.perf_counter()
+            self._write_rows(canvas=canvas, start=start, stop=self._next_row)
+            self.stats.encode_time += time.perf_counter() - started
+            self.stats.rows += self._next_row - start
+
+    def finish(self) -> None:
+        if self._next_row != self.height:
+            raise ValueError(
+                f"Only {self._next_row} of {self.height} rows have been written"
+            )
+        started = time.perf_counter()
+        self._write_trailer()
+        self.image_file.flush()
+        self.stats.encode_time += time.perf_counter() - started
+        self.stats.images += 1
+
+    def _write_header(self) -> None:
+        raise NotImplementedError()  # pragma: nocover
+
+    def _write_rows(self, canvas: Canvas, start: int, stop: int) -> None:
+        raise NotImplementedError()  # pragma: nocover
+
+    def _write_trailer(self) -> None:
+        raise NotImplementedError()  # pragma: nocover
+
+
+class PPMStreamWriter(StreamWriter):
+    """Writes a binary (P6) PPM"""
+
+    def _write_header(self) -> None:
+        self.image_file.write(
+            f"P6 {self.width} {self.height}\n{MAX_COLOUR}\n".encode("ascii")
+        )
+
+    def _write_rows(self, canvas: Canvas, start: int, stop: int) -> None:
+        self.image_file.write(canvas.rows(start=start, stop=stop))
+
+    def _write_trailer(self) -> None:
+        pass
+
+
+class PNGStreamWriter(StreamWriter):
+    """
+    Writes an 8 bit RGB PNG, compressing rows into a single deflate stream which is
+    split across IDAT chunks as the compressor produces output.
+    """
+
+    def __init__(
+        self,
+        image_file: BinaryIO,
+        width: int,
+        height: int,
+        stats: Optional[ImageStats] = None,
+    ) -> None:
+        super().__init__(image_file=image_file, width=width, height=height, stats=stats)
+        self._compressor = zlib.compressobj()
+
+    def _write_header(self) -> None:
+        self.image_file.write(PNG_SIGNATURE)
+        self._write_chunk(
+            b"IHDR",
+            struct.pack(
+                PNG_HEADER_FORMAT,
+                self.width,
+                self.height,
+                PNG_COLOUR_DEPTH,
+                PNG_TRUECOLOUR,
+                0,
+                0,
+                0,
+            ),
+        )
+
+    def _write_rows(self, canvas: Canvas, start: int, stop: int) -> None:
+        data = b"".join(
+            PNG_FILTER_NONE + canvas.row(index) for index in range(start, stop)
+        )
+        self._write_chunk(b"IDAT", self._compressor.compress(data))
+
+    def _write_trailer(self) -> None:
+        self._write_chunk(b"IDAT", self._compressor.flush())
+        self._write_chunk(b"IEND", b"")
+
+    def _write_chunk(self, chunk_type: bytes, data: bytes) -> None:
+        if chunk_type == b"IDAT" and not data:
+            # The compressor is still buffering, so there is nothing to write yet
+            return
+        self.image_file.write(struct.pack(">I", len(data)))
+        self.image_file.write(chunk_type)
+        self.image_file.write(data)
+        self.image_file.write(struct.pack(">I", zlib.crc32(chunk_type + data)))
@@ -0,0 +1,74 @@
+from raytracer.core.types.imaging import CHANNELS
+from raytracer.rendering.framebuffer import Framebuffer
+from raytracer.rendering.tiles import Tile
+
+# How far a channel of a pixel may differ from its neighbours before the pixel is
+# anti-aliased
+EDGE_THRESHOLD = 32
+# The object id of pixels whose primary ray hits nothing
+NO_OBJECT = -1
+
+
+def sample_offsets(count: int) -> list[tuple[float, float]]:
+    """
+    Returns `count` points within a pixel, as fractions of its width and height,
+    from the Halton sequence in bases 2 and 3.
+
+    The sequence is shifted by half a pixel so its first point is the centre,
+    where the pixel's primary ray was already traced, and each later point falls
+    in the largest gap left by those before it.
+    """
+    return [
+        ((_radical_inverse(index, 2) + 0.5) % 1, (_radical_inverse(index, 3) + 0.5) % 1)
+        for index in range(count)
+    ]
+
+
+def find_edges(
+    framebuffer: Framebuffer, tile: Tile, threshold: int
+) -> list[tuple[int, int]]:
+    """
+    Returns the pixels of the tile, as (x, y), which hit a different object to one
+    of the four pixels beside them or differ from it by more than `threshold` in
+    any channel.
+    """
+    width, height = framebuffer.width, framebuffer.height
+    pixels, ids = framebuffer.buffer, framebuffer.ids
+    if ids is None:
+        raise ValueError("Finding edges needs a framebuffer with object ids")
+    edges = []
+    for scene_y in tile.rows:
+        for scene_x in range(tile.left, tile.right):
+            index = scene_y * width + scene_x
+            neighbours = []
+            if scene_x:
+                neighbours.append(index - 1)
+            if scene_x < width - 1:
+                neighbours.append(index + 1)
+            if scene_y:
+                neighbours.append(index - width)
+            if scene_y < height - 1:
+                neighbours.append(index + width)
+            for neighbour in neighbours:
+                if ids[neighbour] != ids[index] or _differs(
+                    pixels, index * CHANNELS, neighbour * CHANNELS, threshold
+                ):
+                    edges.append((scene_x, scene_y))
+                    break
+    return edges
+
+
+def _differs(pixels: memoryview, first: int, second: int, threshold: int) -> bool:
+    return any(
+        abs(pixels[first + channel] - pixels[second + channel]) > threshold
+        for channel in range(CHANNELS)
+    )
+
+
+def _radical_inverse(index: int, base: int) -> float:
+    result, fraction = 0.0, 1.0 / base
+    while index:
+        index, digit = divmod(index, base)
+        result += digit * fraction
+        fraction /= base
+    return result
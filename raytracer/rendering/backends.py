@@ -0,0 +1,76 @@
+import multiprocessing as mp
+from multiprocessing import resource_tracker
+from multiprocessing.pool import Pool, ThreadPool
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar, Union
+
+# Renders every task in turn in the calling thread
+SERIAL = "serial"
+# Renders tasks across threads of this process, which share the scene and
+# framebuffer.  Only faster than serial while the work releases the GIL, as the
+# compiled kernels do, or on a free-threaded build of Python.
+THREAD = "thread"
+# Renders tasks across worker processes, each loading its own copy of the scene
+PROCESS = "process"
+BACKENDS = (SERIAL, THREAD, PROCESS)
+# Backends whose workers run in the process handing out the tasks
+IN_PROCESS_BACKENDS = (SERIAL, THREAD)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class SerialPool:
+    """
+    Stands in for a pool of workers, doing each task as it is handed out.  Results
+    are given back in order, and to callbacks before `apply_async` returns.
+    """
+
+    def imap_unordered(
+        self, func: Callable[[T], R], iterable: Iterable[T]
+    ) -> Iterator[R]:
+        return map(func, iterable)
+
+    def apply_async(
+        self,
+        func: Callable[..., Any],
+        args: tuple = (),
+        callback: Optional[Callable[[Any], None]] = None,
+        error_callback: Optional[Callable[[BaseException], None]] = None,
+    ) -> None:
+        try:
+            result = func(*args)
+        except Exception as error:
+            if error_callback is None:
+                raise
+            error_callback(error)
+        else:
+            if callback is not None:
+                callback(result)
+
+    def terminate(self) -> None:
+        pass
+
+    def join(self) -> None:
+        pass
+
+
+WorkerPool = Union[Pool, SerialPool]
+
+
+def start_pool(
+    backend: str, workers: int, start_method: Optional[str] = None
+) -> WorkerPool:
+    """
+    Starts a pool of `workers` on the given backend.  The serial backend always has
+    one, and `start_method` only matters to the process backend.
+    """
+    if backend == SERIAL:
+        return SerialPool()
+    if backend == THREAD:
+        return ThreadPool(processes=workers)
+    if backend == PROCESS:
+        # Workers must share our resource tracker, otherwise their own would
+        # unlink the shared memory they attach to when they exit.
+        resource_tracker.ensure_running()
+        return mp.get_context(start_method).Pool(processes=workers)
+    raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
@@ -0,0 +1,118 @@
+import copy
+import functools
+import itertools
+import json
+import os
+from dataclasses import dataclass, field, replace
+from typing import Any, Iterable
+
+from raytracer.rendering.constants import MIN_RESOLUTION
+
+# What every line of a manifest must give
+MANIFEST_KEYS = ("scene", "width", "height", "output")
+
+
+@dataclass
+class BatchJob:
+    """A render of a batch, of a scene with some of its values replaced"""
+
+    # The name of a scene in the scenes directory, excluding extension
+    scene: str
+    width: int
+    height: int
+    # The name of the file to create in the out directory
+    output: str
+    # Values to set in the scene's JSON, by their path, such as "lights.0.colour"
+    overrides: dict[str, Any] = field(default_factory=dict)
+
+
+def read_manifest(lines: Iterable[str]) -> list[BatchJob]:
+    """
+    Reads the jobs of a manifest holding a JSON object on each line, skipping blank
+    lines.  Each gives the `scene`, `width`, `height` and `output` of a render.
+
+    A line may also give a `sweep`, mapping paths into the scene's JSON to lists of
+    values.  It is then rendered once for every combination of those values, each
+    output numbered from 1 ahead of its extension.
+
+    Raises a ValueError naming the line of anything which can't be read.
+    """
+    jobs = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            jobs.extend(_read_line(json.loads(line)))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Line {number} of the manifest: {e}") from e
+    return jobs
+
+
+def apply_overrides(data: dict, overrides: dict[str, Any]) -> dict:
+    """
+    Returns a copy of a scene's JSON with the value at each path replaced.  Paths
+    are keys separated by dots, indexing lists by number, and must lead to a value
+    the scene already has.
+    """
+    data = copy.deepcopy(data)
+    for path, value in overrides.items():
+        *parents, last = path.split(".")
+        try:
+            parent = functools.reduce(
+                lambda node, key: node[_index(node, key)], parents, data
+            )
+            index = _index(parent, last)
+            parent[index]
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise ValueError(f"The scene has no {path}") from None
+        parent[index] = value
+    return data
+
+
+def _read_line(entry: Any) -> list[BatchJob]:
+    if not isinstance(entry, dict):
+        raise ValueError("expected an object")
+    missing = [key for key in MANIFEST_KEYS if key not in entry]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    job = BatchJob(
+        scene=str(entry["scene"]),
+        width=_resolution(entry, "width"),
+        height=_resolution(entry, "height"),
+        output=str(entry["output"]),
+    )
+    sweep = entry.get("sweep")
+    if sweep is None:
+        return [job]
+    if not (
+        isinstance(sweep, dict)
+        and sweep
+        and all(isinstance(values, list) and values for values in sweep.values())
+    ):
+        raise ValueError("a sweep must map paths to lists of values")
+
+    combinations = list(itertools.product(*sweep.values()))
+    stem, extension = os.path.splitext(job.output)
+    # Pad the numbers so the outputs sort in order
+    digits = len(str(len(combinations)))
+    return [
+        replace(
+            job,
+            output=f"{stem}_{number:0{digits}d}{extension}",
+            overrides=dict(zip(sweep, values)),
+        )
+        for number, values in enumerate(combinations, start=1)
+    ]
+
+
+def _resolution(entry: dict, key: str) -> int:
+    """The width or height of a job, which must be a whole number of pixels"""
+    value = entry[key]
+    if type(value) is not int or value < MIN_RESOLUTION:
+        raise ValueError(f"{key} must be a whole number of at least {MIN_RESOLUTION}")
+    return value
+
+
+def _index(node: Any, key: str) -> Any:
+    """The key of an object, or the index of a list, named by part of a path"""
+    return int(key) if isinstance(node, list) else key
@@ -0,0 +1,172 @@
+import functools
+import hashlib
+import json
+import os
+import struct
+import tempfile
+from dataclasses import fields, is_dataclass
+from typing import Any, Optional, Sequence
+
+import raytracer
+from raytracer.core.types.binary import MappedScene
+from raytracer.core.types.entities import Scene
+from raytracer.core.types.geometry import Point
+from raytracer.core.types.imaging import CHANNELS, Canvas, Colour
+
+# Extension of the files holding cached images
+ENTRY_EXTENSION = ".frame"
+# Width and height of the image, ahead of its pixels
+HEADER = struct.Struct("<II")
+# Source files whose contents decide the code version
+SOURCE_EXTENSIONS = (".py", ".pyx")
+
+
+def render_key(scene: Scene, settings: dict[str, Any]) -> str:
+    """
+    Returns a digest of everything which decides how a scene renders: the parsed
+    scene, including its resolution, the settings of the engine rendering it and
+    the version of the code.
+
+    The scene is hashed as parsed rather than as written, so files differing only
+    in layout or key order share a key.  A binary scene is hashed as the digest of
+    its file instead, which covers its spheres and lights.
+    """
+    return _digest({"scene": _scene_content(scene), "settings": settings})
+
+
+def geometry_key(scene: Scene, max_depth: int) -> str:
+    """
+    Returns a digest of everything which decides the hits kept in a G-buffer: the
+    camera, resolution and objects of the scene other than their materials, how
+    many reflections are followed and the version of the code.
+
+    The digest of a binary scene's file covers its lights and materials too, so
+    changing either changes its key.
+    """
+    geometry = _scene_content(scene)
+    if not isinstance(scene, MappedScene):
+        del geometry["lights"]
+        for obj in geometry["objects"]:
+            del obj["material"]
+    return _digest({"scene": geometry, "max_depth": max_depth})
+
+
+@functools.cache
+def code_version() -> str:
+    """A digest of the package's source, which changes whenever any of it does"""
+    package_dir = os.path.dirname(raytracer.__file__)
+    paths = sorted(
+        os.path.relpath(os.path.join(directory, filename), package_dir)
+        for directory, _, filenames in os.walk(package_dir)
+        for filename in filenames
+        if filename.endswith(SOURCE_EXTENSIONS)
+    )
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.encode())
+        with open(os.path.join(package_dir, path), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """
+    Finished images stored in a directory by their `render_key`.
+
+    Once the entries grow beyond `max_size` bytes, those used least recently are
+    removed.  Reading an entry marks it as used by touching the file.
+    """
+
+    def __init__(self, directory: str, max_size: int) -> None:
+        self.directory = directory
+        self.max_size = max_size
+
+    def get(self, key: str) -> Optional[Canvas]:
+        """Returns the image stored under the key, or None if there isn't one"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                header = f.read(HEADER.size)
+                buffer = bytearray(f.read())
+        except FileNotFoundError:
+            return None
+        width, height = HEADER.unpack(header) if len(header) == HEADER.size else (0, 0)
+        if not buffer or len(buffer) != width * height * CHANNELS:
+            # Cut short, so it can't be trusted
+            os.remove(path)
+            return None
+        os.utime(path)
+        return Canvas(width=width, height=height, buffer=buffer)
+
+    def put(self, key: str, canvas: Canvas) -> None:
+        """
+        Stores the image under the key, then removes the entries used least
+        recently until the cache fits.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        # Written aside and moved into place so a reader never sees half an entry
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as f:
+            f.write(HEADER.pack(canvas.width, canvas.height))
+            f.write(canvas.data)
+        os.replace(f.name, self._path(key))
+        self._evict()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{ENTRY_EXTENSION}")
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(ENTRY_EXTENSION):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            os.remove(path)
+            total -= size
+
+
+def _digest(content: dict[str, Any]) -> str:
+    """Hashes the content as canonical JSON, along with the version of the code"""
+    dumped = json.dumps(
+        {**content, "code": code_version()}, sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(dumped.encode()).hexdigest()
+
+
+def _scene_content(scene: Scene) -> Any:
+    """
+    The scene as plain values, or for a binary scene, the digest of its file and
+    the view it is rendered with rather than every sphere made from the file
+    """
+    if not isinstance(scene, MappedScene):
+        return _canonical(scene)
+    return {
+        "type": type(scene).__name__,
+        "digest": scene.digest.hex(),
+        "camera": _canonical(scene.camera),
+        "width": scene.width,
+        "height": scene.height,
+    }
+
+
+def _canonical(value: Any) -> Any:
+    """Converts parsed scene data into plain values which can be hashed as JSON"""
+    if isinstance(value, Point):
+        return [value.x, value.y, value.z]
+    if isinstance(value, Colour):
+        return [value.r, value.g, value.b]
+    if is_dataclass(value):
+        return {
+            "type": type(value).__name__,
+            **{
+                field.name: _canonical(getattr(value, field.name))
+                for field in fields(value)
+                if field.compare
+            },
+        }
+    if isinstance(value, Sequence) and not isinstance(value, str):
+        return [_canonical(item) for item in value]
+    return value
@@ -1,5 +1,10 @@
 import click
 
+from raytracer.rendering.cli.convert_scene import convert_scene
+from raytracer.rendering.cli.render_batch import render_batch
 from raytracer.rendering.cli.render_scene import render_scene
+from raytracer.rendering.cli.render_worker import render_worker
 
-cli = click.Group("rendering", commands=[render_scene])
+cli = click.Group(
+    "rendering", commands=[render_scene, render_batch, render_worker, convert_scene]
+)
@@ -0,0 +1,182 @@
+import json
+import os
+import time
+from typing import Iterator, TextIO
+
+import click
+
+from raytracer.core import config
+from raytracer.core.types.entities import Scene
+from raytracer.imaging.service import ImageService
+from raytracer.rendering.antialiasing import EDGE_THRESHOLD
+from raytracer.rendering.batch import BatchJob, apply_overrides, read_manifest
+from raytracer.rendering.cli.render_scene import (
+    ENGINES,
+    RenderOptions,
+    _create_engine,
+    _format_stats,
+    _scene_file,
+)
+from raytracer.rendering.framebuffer import Framebuffer
+
+
+@click.command
+@click.argument("manifest", type=click.File("r"))
+@click.option(
+    "-p",
+    "--processes",
+    default=4,
+    required=False,
+    type=int,
+    help="The number of concurrent processes to use when rendering the scenes.",
+)
+@click.option(
+    "-e",
+    "--engine",
+    default="scalar",
+    required=False,
+    type=click.Choice(ENGINES),
+    help="The render engine to use, tracing one pixel or a whole tile at a time.",
+)
+@click.option(
+    "--bvh/--no-bvh",
+    default=True,
+    help="Find the nearest object using the scene's BVH rather than a linear scan.",
+)
+@click.option(
+    "--russian-roulette",
+    "roulette",
+    is_flag=True,
+    default=False,
+    help=(
+        "Randomly stop following reflections which add little to a pixel, trading "
+        "a little noise for speed."
+    ),
+)
+@click.option(
+    "--max-samples",
+    default=1,
+    type=click.IntRange(min=1),
+    help=(
+        "Anti-alias edges by tracing up to this many rays for each pixel on them. "
+        "One traces a single ray for every pixel."
+    ),
+)
+@click.option(
+    "--edge-threshold",
+    default=EDGE_THRESHOLD,
+    type=click.IntRange(min=0, max=255),
+    help=(
+        "How far a channel of a pixel may differ from its neighbours before it is "
+        "anti-aliased.  Pixels hitting a different object are always anti-aliased."
+    ),
+)
+@click.option(
+    "--stats",
+    is_flag=True,
+    default=False,
+    help="Print counts of the rays traced across every job once the batch finishes.",
+)
+def render_batch(
+    manifest: TextIO,
+    processes: int,
+    engine: str,
+    bvh: bool,
+    roulette: bool,
+    max_samples: int,
+    edge_threshold: int,
+    stats: bool,
+) -> None:
+    """
+    Renders every job of a MANIFEST, a JSON object on each line giving the scene,
+    width, height and output of a render, across one pool of workers.  Each image is
+    saved as soon as it is finished.
+    """
+    try:
+        jobs = read_manifest(manifest)
+        scenes = _load_scenes(jobs)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="MANIFEST")
+
+    image_service = ImageService()
+    started = time.perf_counter()
+    framebuffers: dict[int, Framebuffer] = {}
+
+    def start_jobs() -> Iterator[tuple[Scene, Framebuffer]]:
+        # Framebuffers are only opened as the engine starts each job
+        for index, (job, scene) in enumerate(zip(jobs, scenes)):
+            framebuffers[index] = Framebuffer(
+                width=job.width, height=job.height, ids=max_samples > 1
+            )
+            yield scene, framebuffers[index]
+
+    try:
+        options = RenderOptions(
+            engine=engine,
+            bvh=bvh,
+            roulette=roulette,
+            max_samples=max_samples,
+            edge_threshold=edge_threshold,
+            stats=stats,
+        )
+        with _create_engine(options) as render_engine:
+            for index in render_engine.render_batch(
+                jobs=start_jobs(), processes=processes
+            ):
+                framebuffer = framebuffers.pop(index)
+                canvas = framebuffer.to_canvas()
+                framebuffer.close()
+                saved_file = image_service.save(
+                    canvas=canvas,
+                    filepath=os.path.join(config.OUT_DIR, jobs[index].output),
+                )
+                click.echo(f"Generated file: {saved_file}{_describe(jobs[index])}")
+            render_stats = render_engine.stats
+    finally:
+        for framebuffer in framebuffers.values():
+            framebuffer.close()
+
+    elapsed = time.perf_counter() - started
+    rays = sum(job.width * job.height for job in jobs)
+    click.echo(
+        f"Rendered {len(jobs)} jobs, {rays} primary rays, with the {engine} engine in "
+        f"{elapsed:.2f}s ({rays / elapsed:.0f} rays/sec)"
+    )
+    if stats:
+        for line in _format_stats(
+            render_stats=render_stats, image_stats=image_service.stats
+        ):
+            click.echo(line)
+
+
+def _load_scenes(jobs: list[BatchJob]) -> list[Scene]:
+    """
+    Returns each job's scene with its overrides applied, reading each scene file
+    once.  Every scene is built before any is rendered, so a job which can't be
+    rendered stops the batch before it writes anything.
+    """
+    files: dict[str, dict] = {}
+    scenes = []
+    for job in jobs:
+        if job.scene not in files:
+            try:
+                with open(_scene_file(job.scene), "r") as f:
+                    files[job.scene] = json.load(f)
+            except OSError as e:
+                raise ValueError(f"Couldn't read the scene {job.scene}: {e}") from e
+        data = apply_overrides(data=files[job.scene], overrides=job.overrides)
+        try:
+            scene = Scene.from_object(data=data, width=job.width, height=job.height)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError(
+                f"The scene of {job.output}{_describe(job)} is invalid: {e!r}"
+            ) from e
+        scenes.append(scene)
+    return scenes
+
+
+def _describe(job: BatchJob) -> str:
+    if not job.overrides:
+        return ""
+    values = ", ".join(f"{path}={value!r}" for path, value in job.overrides.items())
+    return f" ({values})"
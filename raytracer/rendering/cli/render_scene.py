@@ -1,16 +1,64 @@
+import contextlib
 import json
 import os
-from typing import Callable, Optional
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterable, Iterator, Optional
 from uuid import uuid4
 
 import click
 
 from raytracer.core import config
+from raytracer.core.types.binary import BINARY_EXTENSION, load_scene
 from raytracer.core.types.entities import Scene
-from raytracer.core.types.imaging import Canvas
-from raytracer.imaging.service import ImageService
-from raytracer.rendering.engine import RenderEngine
+from raytracer.core.types.imaging import Canvas, ImageFormat
+from raytracer.imaging.service import STREAM_WRITERS, ImageService
+from raytracer.imaging.stream import ImageStats, StreamWriter
+from raytracer.rendering.antialiasing import EDGE_THRESHOLD
+from raytracer.rendering.backends import BACKENDS, PROCESS
+from raytracer.rendering.cache import RenderCache, geometry_key, render_key
+from raytracer.rendering.distributed import DEFAULT_PORT, Coordinator, parse_address
+from raytracer.rendering.engine import RenderEngine, RenderStats
+from raytracer.rendering.framebuffer import Framebuffer
+from raytracer.rendering.gbuffer import load_gbuffer, save_gbuffer
+from raytracer.rendering.progressive import PASSES
 from raytracer.rendering.shading import Shader
+from raytracer.rendering.tiles import split_tiles
+from raytracer.rendering.wavefront import WavefrontRenderEngine
+
+ENGINES = ("scalar", "wavefront")
+# Streams the image to standard output rather than to a file in the out directory
+STDOUT_FILENAME = "-"
+# Seconds between checks of a watched scene file for changes
+WATCH_INTERVAL = 0.5
+
+
+@dataclass(frozen=True)
+class RenderOptions:
+    """What to render and how, as given to render-scene"""
+
+    scene_name: str = "scene_1"
+    width: int = 320
+    height: int = 200
+    processes: int = 4
+    backend: str = PROCESS
+    engine: str = "scalar"
+    bvh: bool = True
+    roulette: bool = False
+    linear: bool = False
+    max_samples: int = 1
+    edge_threshold: int = EDGE_THRESHOLD
+    # The file to keep the G-buffer in
+    gbuffer: Optional[str] = None
+    # The host and port to listen on for workers, rather than using local ones
+    distributed: Optional[tuple[str, int]] = None
+    stats: bool = False
+    stats_json: Optional[str] = None
+
+    @property
+    def collect_stats(self) -> bool:
+        return self.stats or self.stats_json is not None
 
 
 @click.command
@@ -49,56 +97,691 @@ from raytracer.rendering.shading import Shader
 @click.option(
     "-p",
     "--processes",
+    "--workers",
+    "processes",
     default=4,
     required=False,
     type=int,
-    help="The number of concurrent processes to use when rendering the scene.",
+    help="The number of workers to render the scene with, on the chosen backend.",
+)
+@click.option(
+    "--backend",
+    default=PROCESS,
+    required=False,
+    type=click.Choice(BACKENDS),
+    help=(
+        "Render tiles one at a time, across threads sharing the scene, or across "
+        "processes."
+    ),
+)
+@click.option(
+    "-e",
+    "--engine",
+    default="scalar",
+    required=False,
+    type=click.Choice(ENGINES),
+    help="The render engine to use, tracing one pixel or a whole tile at a time.",
+)
+@click.option(
+    "--bvh/--no-bvh",
+    default=True,
+    help="Find the nearest object using the scene's BVH rather than a linear scan.",
+)
+@click.option(
+    "--russian-roulette",
+    "roulette",
+    is_flag=True,
+    default=False,
+    help=(
+        "Randomly stop following reflections which add little to a pixel, trading "
+        "a little noise for speed."
+    ),
+)
+@click.option(
+    "--linear",
+    is_flag=True,
+    default=False,
+    help=(
+        "Shade in linear light, keeping each pixel unrounded and unclamped until "
+        "it is written to the image."
+    ),
+)
+@click.option(
+    "--max-samples",
+    default=1,
+    type=click.IntRange(min=1),
+    help=(
+        "Anti-alias edges by tracing up to this many rays for each pixel on them. "
+        "One traces a single ray for every pixel."
+    ),
+)
+@click.option(
+    "--edge-threshold",
+    default=EDGE_THRESHOLD,
+    type=click.IntRange(min=0, max=255),
+    help=(
+        "How far a channel of a pixel may differ from its neighbours before it is "
+        "anti-aliased.  Pixels hitting a different object are always anti-aliased."
+    ),
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    default=False,
+    help=(
+        "Write the image as rows are rendered rather than once rendering finishes. "
+        "Only PPM and PNG files can be streamed; a filename of '-' streams a PPM to "
+        "standard output."
+    ),
+)
+@click.option(
+    "--progressive",
+    is_flag=True,
+    default=False,
+    help=(
+        "Render in passes from coarse to fine, saving a preview of the image after "
+        "each pass."
+    ),
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    default=False,
+    help=(
+        "Keep running after the render, re-tracing only the tiles affected each "
+        "time the scene file changes."
+    ),
+)
+@click.option(
+    "--cache",
+    is_flag=True,
+    default=False,
+    help=(
+        "Reuse the image of an identical earlier render from the cache rather than "
+        "rendering it again, or cache this render for next time."
+    ),
+)
+@click.option(
+    "--gbuffer",
+    required=False,
+    type=str,
+    help=(
+        "Keep the G-buffer of the render in this file.  If it already holds one for "
+        "the same camera and objects, with only lights or materials changed, the "
+        "image is shaded from it without tracing rays."
+    ),
+)
+@click.option(
+    "--distributed",
+    is_flag=True,
+    default=False,
+    help=(
+        "Render across workers started on other machines with "
+        "`raytracer rendering render-worker`, rather than local processes."
+    ),
+)
+@click.option(
+    "--listen",
+    default=f"0.0.0.0:{DEFAULT_PORT}",
+    help="The host and port to listen on for workers with --distributed.",
+)
+@click.option(
+    "--stats",
+    is_flag=True,
+    default=False,
+    help=(
+        "Print counts of the rays traced and the time spent in each stage of "
+        "rendering, gathered from every worker."
+    ),
+)
+@click.option(
+    "--stats-json",
+    required=False,
+    type=str,
+    help="Write the stats to this JSON file.",
 )
 def render_scene(
     width: int,
     height: int,
     scene_name: str,
     processes: int,
+    backend: str,
+    engine: str,
+    bvh: bool,
+    roulette: bool,
+    max_samples: int,
+    edge_threshold: int,
+    stream: bool,
+    progressive: bool,
+    watch: bool,
+    cache: bool,
+    stats: bool,
+    distributed: bool = False,
+    listen: str = f"0.0.0.0:{DEFAULT_PORT}",
     filename: Optional[str] = None,
+    gbuffer: Optional[str] = None,
+    stats_json: Optional[str] = None,
+    linear: bool = False,
 ) -> None:
+    filename = filename or f"{uuid4()}.ppm"
+    if progressive and stream:
+        raise click.UsageError("--progressive can't be combined with --stream")
+    if watch and (stream or progressive or cache):
+        raise click.UsageError(
+            "--watch can't be combined with --stream, --progressive or --cache"
+        )
+    if gbuffer is not None and (
+        stream or progressive or watch or linear or max_samples > 1
+    ):
+        raise click.UsageError(
+            "--gbuffer can't be combined with --stream, --progressive, --watch, "
+            "--linear or --max-samples"
+        )
+    address = None
+    if distributed:
+        if progressive or watch or gbuffer is not None or max_samples > 1:
+            raise click.UsageError(
+                "--distributed can't be combined with --progressive, --watch, "
+                "--gbuffer or --max-samples"
+            )
+        try:
+            address = parse_address(listen)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--listen") from None
+        click.echo(
+            f"Listening for workers on {listen}", err=filename == STDOUT_FILENAME
+        )
+    options = RenderOptions(
+        scene_name=scene_name,
+        width=width,
+        height=height,
+        processes=processes,
+        backend=backend,
+        engine=engine,
+        bvh=bvh,
+        roulette=roulette,
+        linear=linear,
+        max_samples=max_samples,
+        edge_threshold=edge_threshold,
+        gbuffer=gbuffer,
+        distributed=address,
+        stats=stats,
+        stats_json=stats_json,
+    )
+    if watch:
+        _watch_scene(filename=filename, options=options)
+        return
+    key = None
+    if cache:
+        key = _render_key(options)
+        canvas = _render_cache().get(key)
+        if canvas is not None:
+            _save_cached(canvas=canvas, filename=filename)
+            return
+    if progressive:
+        _render_progressive(filename=filename, options=options, cache_key=key)
+        return
+    if stream:
+        _stream_to_file(filename=filename, options=options, cache_key=key)
+        return
+
+    started = time.perf_counter()
     with click.progressbar(length=height, label="Rendering scene") as bar:
-        canvas = _render_scene(
-            scene_name=scene_name,
-            width=width,
-            height=height,
-            processes=processes,
-            update_func=bar.update,
+        canvas, render_stats = _render_scene(
+            options=options, cache_key=key, update_func=bar.update
         )
+    _echo_timing(started=started, options=options)
 
-    filename = filename or f"{uuid4()}.ppm"
     filepath = os.path.join(config.OUT_DIR, filename)
+    image_service = ImageService()
     with click.progressbar(length=height, label="Saving file") as bar:
-        saved_file = ImageService().save(
+        saved_file = image_service.save(
             canvas=canvas, filepath=filepath, update_func=bar.update
         )
     click.echo(f"Generated file: {saved_file}")
+    _report_stats(
+        render_stats=render_stats, image_stats=image_service.stats, options=options
+    )
+
+
+def _stream_to_file(
+    filename: str, options: RenderOptions, cache_key: Optional[str] = None
+) -> None:
+    # Keep standard output clean for the image when streaming to it
+    to_stdout = filename == STDOUT_FILENAME
+    if to_stdout:
+        image_format = ImageFormat.PPM
+    else:
+        _, extension = os.path.splitext(filename.lower())
+        image_format = ImageFormat(extension)
+    if image_format not in STREAM_WRITERS:
+        raise click.BadParameter(
+            f"'{image_format.value}' images can't be streamed", param_hint="filename"
+        )
+
+    filepath = os.path.join(config.OUT_DIR, filename)
+    image_service = ImageService()
+    started = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        image_file = (
+            sys.stdout.buffer
+            if to_stdout
+            else stack.enter_context(open(filepath, "wb"))
+        )
+        bar = stack.enter_context(
+            click.progressbar(
+                length=options.height,
+                label="Rendering scene",
+                file=sys.stderr if to_stdout else None,
+            )
+        )
+        writer = stack.enter_context(
+            image_service.stream(
+                image_file=image_file,
+                image_format=image_format,
+                width=options.width,
+                height=options.height,
+            )
+        )
+        render_stats = _stream_scene(
+            writer=writer, options=options, cache_key=cache_key, update_func=bar.update
+        )
+    _echo_timing(started=started, options=options, err=to_stdout)
+    if not to_stdout:
+        click.echo(f"Generated file: {filepath}")
+    _report_stats(
+        render_stats=render_stats,
+        image_stats=image_service.stats,
+        options=options,
+        err=to_stdout,
+    )
+
+
+def _render_progressive(
+    filename: str, options: RenderOptions, cache_key: Optional[str] = None
+) -> None:
+    filepath = os.path.join(config.OUT_DIR, filename)
+    image_service = ImageService()
+    started = time.perf_counter()
+    with _render_rows(
+        options=options, cache_key=cache_key, progressive=True
+    ) as rendering:
+        framebuffer, passes, render_engine = rendering
+        for number, spacing in enumerate(passes, start=1):
+            # Each pass overwrites the preview saved by the last
+            saved_file = image_service.save(
+                canvas=framebuffer.to_canvas(), filepath=filepath
+            )
+            traced = (
+                "all pixels" if spacing == 1 else f"1/{spacing * spacing} of pixels"
+            )
+            click.echo(f"Pass {number} of {len(PASSES)}, {traced} traced: {saved_file}")
+        render_stats = render_engine.stats
+    _echo_timing(started=started, options=options)
+    click.echo(f"Generated file: {saved_file}")
+    _report_stats(
+        render_stats=render_stats, image_stats=image_service.stats, options=options
+    )
+
+
+def _watch_scene(filename: str, options: RenderOptions) -> None:
+    """
+    Renders the scene, then renders it again whenever its file changes until
+    interrupted.  The workers and framebuffer are kept between renders, so only
+    the tiles the change affects are traced again.
+    """
+    filepath = os.path.join(config.OUT_DIR, filename)
+    scene_file = _scene_path(options.scene_name)
+    modified = os.stat(scene_file).st_mtime_ns
+    scene = _load_scene(options)
+    image_service = ImageService()
+    try:
+        with (
+            Framebuffer(
+                width=options.width,
+                height=options.height,
+                ids=options.max_samples > 1,
+            ) as framebuffer,
+            _create_engine(options, record_dependencies=True) as render_engine,
+        ):
+            tiles = split_tiles(width=options.width, height=options.height)
+            count = len(tiles)
+            click.echo(f"Watching {scene_file} for changes, press Ctrl+C to stop")
+            while True:
+                started = time.perf_counter()
+                for _ in render_engine.render(
+                    scene=scene,
+                    framebuffer=framebuffer,
+                    processes=options.processes,
+                    tiles=tiles,
+                ):
+                    pass
+                elapsed = time.perf_counter() - started
+                saved_file = image_service.save(
+                    canvas=framebuffer.to_canvas(), filepath=filepath
+                )
+                click.echo(
+                    f"Traced {len(tiles)} of {count} tiles in {elapsed:.2f}s: "
+                    f"{saved_file}"
+                )
+                _report_stats(
+                    render_stats=render_engine.stats,
+                    image_stats=image_service.stats,
+                    options=options,
+                )
+                scene, modified = _wait_for_change(options=options, modified=modified)
+                tiles = render_engine.changed_tiles(scene)
+    except KeyboardInterrupt:
+        click.echo("Stopped watching")
+
+
+def _wait_for_change(options: RenderOptions, modified: int) -> tuple[Scene, int]:
+    """
+    Waits for the scene file to be modified after `modified`, returning the scene
+    and when it was modified once it loads.
+    """
+    scene_file = _scene_path(options.scene_name)
+    while True:
+        time.sleep(WATCH_INTERVAL)
+        try:
+            changed = os.stat(scene_file).st_mtime_ns
+        except OSError:
+            # Editors which save by renaming leave no file for a moment
+            continue
+        if changed == modified:
+            continue
+        modified = changed
+        try:
+            scene = _load_scene(options)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            # Most likely saved part way through an edit, so wait for the next save
+            click.echo(f"Couldn't load {scene_file}: {e!r}")
+            continue
+        return scene, modified
+
+
+def _echo_timing(started: float, options: RenderOptions, err: bool = False) -> None:
+    elapsed = time.perf_counter() - started
+    rays = options.width * options.height
+    search = "BVH" if options.bvh else "linear scan"
+    click.echo(
+        f"Traced {rays} primary rays with the {options.engine} engine and {search} in "
+        f"{elapsed:.2f}s ({rays / elapsed:.0f} rays/sec)",
+        err=err,
+    )
+
+
+def _report_stats(
+    render_stats: RenderStats,
+    image_stats: ImageStats,
+    options: RenderOptions,
+    err: bool = False,
+) -> None:
+    stats_json = options.stats_json
+    if stats_json is not None:
+        with open(stats_json, "w") as f:
+            json.dump(
+                {**render_stats.to_object(), "image": asdict(image_stats)},
+                f,
+                indent=2,
+            )
+        click.echo(f"Saved stats: {stats_json}", err=err)
+    if options.stats:
+        for line in _format_stats(render_stats=render_stats, image_stats=image_stats):
+            click.echo(line, err=err)
+
+
+def _format_stats(render_stats: RenderStats, image_stats: ImageStats) -> list[str]:
+    trace, shadows = render_stats.trace, render_stats.shadows
+    timings = render_stats.timings
+    lines = [
+        f"Primary rays: {trace.primary_rays}",
+        f"Reflection rays: {trace.reflection_rays} "
+        f"(average depth {trace.average_depth:.2f})",
+        f"Reflections stopped: {trace.terminated} settled, "
+        f"{trace.roulette_terminated} by Russian roulette",
+        f"Shadow rays: {shadows.rays} ({shadows.hit_rate:.1%} occluded, "
+        f"{shadows.cache_hit_rate:.1%} of those by the cached occluder)",
+        f"Intersection tests: {trace.intersection_tests} nearest hit, "
+        f"{shadows.tests} shadow",
+        f"Shade calls: {trace.shades}",
+        f"Anti-aliased pixels: {trace.refined_pixels}",
+        f"Tile cost estimate: {timings.estimate:.3f}s",
+        "Stage times, summed across workers:",
+        f"  load       {timings.load:.3f}s",
+        f"  trace      {timings.trace:.3f}s",
+        f"    intersect  {timings.intersect:.3f}s",
+        f"    shade      {timings.shade:.3f}s",
+        f"    reflect    {timings.reflect:.3f}s",
+        f"  write      {timings.write:.3f}s",
+        f"  encode     {image_stats.encode_time:.3f}s",
+        f"Workers, over {render_stats.wall_time:.3f}s:",
+    ]
+    idle = render_stats.idle
+    lines.extend(
+        f"  {pid}: busy {busy:.3f}s, idle {idle[pid]:.3f}s"
+        for pid, busy in sorted(render_stats.busy.items())
+    )
+    lines.append(
+        f"Scheduling efficiency: {render_stats.efficiency:.1%} "
+        f"of {render_stats.workers} worker(s)"
+    )
+    return lines
+
+
+def _scene_file(scene_name: str) -> str:
+    return os.path.join(config.SCENE_DIR, f"{scene_name}.json")
+
+
+def _binary_scene_file(scene_name: str) -> str:
+    return os.path.join(config.SCENE_DIR, f"{scene_name}{BINARY_EXTENSION}")
+
+
+def _scene_path(scene_name: str) -> str:
+    """The scene's JSON file, or its binary file if it has no JSON one"""
+    path = _scene_file(scene_name)
+    binary_path = _binary_scene_file(scene_name)
+    if not os.path.exists(path) and os.path.exists(binary_path):
+        return binary_path
+    return path
 
 
 def _load_scene_from_file(scene_name: str, width: int, height: int) -> Scene:
-    scene_file = os.path.join(config.SCENE_DIR, f"{scene_name}.json")
-    with open(scene_file, "r") as f:
+    path = _scene_path(scene_name)
+    if path.endswith(BINARY_EXTENSION):
+        return load_scene(path=path, width=width, height=height)
+    with open(path, "r") as f:
         data = json.load(f)
 
     return Scene.from_object(data=data, width=width, height=height)
 
 
+def _load_scene(options: RenderOptions) -> Scene:
+    return _load_scene_from_file(
+        scene_name=options.scene_name, width=options.width, height=options.height
+    )
+
+
+@contextlib.contextmanager
+def _render_rows(
+    options: RenderOptions,
+    cache_key: Optional[str] = None,
+    progressive: bool = False,
+) -> Iterator[tuple[Framebuffer, Iterable[int], RenderEngine]]:
+    """
+    Starts rendering the scene, giving the framebuffer being rendered into, the
+    index of each row as it is finished and the engine rendering them.  With
+    `progressive`, the spacing of each pass is given as it finishes instead.
+
+    Given a `gbuffer` file in the options, the scene is relit from it if it holds
+    the G-buffer of the same geometry, and the G-buffer is saved to it once the
+    render finishes.  The image is then cached under `cache_key` if given.
+
+    Given an address to listen on as `distributed`, the scene is rendered by the
+    workers which connect to it instead of local processes.
+    """
+    scene = _load_scene(options)
+    gbuffer, processes = options.gbuffer, options.processes
+    with _create_engine(options, gbuffer=gbuffer is not None) as render_engine:
+        with Framebuffer(
+            width=options.width,
+            height=options.height,
+            ids=options.max_samples > 1,
+            gbuffer_depth=render_engine.gbuffer_depth,
+        ) as framebuffer:
+            if progressive:
+                rows = render_engine.render_progressive(
+                    scene=scene, framebuffer=framebuffer, processes=processes
+                )
+            elif gbuffer is not None:
+                geometry = geometry_key(scene=scene, max_depth=render_engine.max_depth)
+                rows = _relight_or_render(
+                    path=gbuffer,
+                    geometry=geometry,
+                    scene=scene,
+                    framebuffer=framebuffer,
+                    render_engine=render_engine,
+                    processes=processes,
+                )
+            elif options.distributed is not None:
+                rows = _render_distributed(
+                    address=options.distributed,
+                    scene=scene,
+                    framebuffer=framebuffer,
+                    render_engine=render_engine,
+                )
+            else:
+                rows = render_engine.render(
+                    scene=scene, framebuffer=framebuffer, processes=processes
+                )
+            yield framebuffer, rows, render_engine
+            if gbuffer is not None:
+                save_gbuffer(
+                    path=gbuffer,
+                    framebuffer=framebuffer,
+                    geometry=geometry,
+                    lights=[light.position for light in scene.lights],
+                )
+                click.echo(f"Saved the G-buffer: {gbuffer}")
+            if cache_key is not None:
+                _render_cache().put(key=cache_key, canvas=framebuffer.to_canvas())
+
+
+def _relight_or_render(
+    path: str,
+    geometry: str,
+    scene: Scene,
+    framebuffer: Framebuffer,
+    render_engine: RenderEngine,
+    processes: int,
+) -> Iterable[int]:
+    """
+    Relights the G-buffer saved in the file if it was rendered from the same
+    geometry, reusing its shadows if the lights haven't moved, otherwise renders
+    the scene.
+    """
+    lights = load_gbuffer(path=path, framebuffer=framebuffer, geometry=geometry)
+    if lights is None:
+        return render_engine.render(
+            scene=scene, framebuffer=framebuffer, processes=processes
+        )
+    click.echo(f"Relighting the G-buffer in {path}")
+    return render_engine.relight(
+        scene=scene,
+        framebuffer=framebuffer,
+        processes=processes,
+        reuse_shadows=lights == [light.position for light in scene.lights],
+    )
+
+
+def _render_distributed(
+    address: tuple[str, int],
+    scene: Scene,
+    framebuffer: Framebuffer,
+    render_engine: RenderEngine,
+) -> Iterator[int]:
+    host, port = address
+    with Coordinator(engine=render_engine, host=host, port=port) as coordinator:
+        yield from coordinator.render(scene=scene, framebuffer=framebuffer)
+
+
+def _create_engine(
+    options: RenderOptions,
+    record_dependencies: bool = False,
+    gbuffer: bool = False,
+    start_method: Optional[str] = None,
+) -> RenderEngine:
+    engine_cls = (
+        WavefrontRenderEngine if options.engine == "wavefront" else RenderEngine
+    )
+    return engine_cls(
+        Shader(),
+        use_bvh=options.bvh,
+        russian_roulette=options.roulette,
+        max_samples=options.max_samples,
+        edge_threshold=options.edge_threshold,
+        collect_stats=options.collect_stats,
+        record_dependencies=record_dependencies,
+        gbuffer=gbuffer,
+        start_method=start_method,
+        backend=options.backend,
+        linear=options.linear,
+    )
+
+
+def _render_cache() -> RenderCache:
+    return RenderCache(directory=config.CACHE_DIR, max_size=config.CACHE_SIZE)
+
+
+def _render_key(options: RenderOptions) -> str:
+    scene = _load_scene(options)
+    return render_key(scene=scene, settings=_create_engine(options).settings)
+
+
+def _save_cached(canvas: Canvas, filename: str) -> None:
+    """Writes an image found in the cache as a finished render would have been"""
+    image_service = ImageService()
+    if filename == STDOUT_FILENAME:
+        with image_service.stream(
+            image_file=sys.stdout.buffer,
+            image_format=ImageFormat.PPM,
+            width=canvas.width,
+            height=canvas.height,
+        ) as writer:
+            for index in range(canvas.height):
+                writer.add_row(index=index, canvas=canvas)
+        click.echo("Found the image in the cache", err=True)
+        return
+    saved_file = image_service.save(
+        canvas=canvas, filepath=os.path.join(config.OUT_DIR, filename)
+    )
+    click.echo("Found the image in the cache")
+    click.echo(f"Generated file: {saved_file}")
+
+
 def _render_scene(
-    scene_name: str = "scene_1",
-    width: int = 320,
-    height: int = 240,
-    processes: int = 4,
+    options: RenderOptions,
+    cache_key: Optional[str] = None,
+    update_func: Optional[Callable[[int], None]] = None,
+) -> tuple[Canvas, RenderStats]:
+    with _render_rows(options=options, cache_key=cache_key) as rendering:
+        framebuffer, rows, render_engine = rendering
+        for _ in rows:
+            if update_func:
+                update_func(1)
+        return framebuffer.to_canvas(), render_engine.stats
+
+
+def _stream_scene(
+    writer: StreamWriter,
+    options: RenderOptions,
+    cache_key: Optional[str] = None,
     update_func: Optional[Callable[[int], None]] = None,
-) -> Canvas:
-    scene = _load_scene_from_file(scene_name=scene_name, width=width, height=height)
-    engine = RenderEngine(Shader())
-    canvas = Canvas(width=width, height=height)
-    for index, row in engine.render(scene=scene, processes=processes):
-        canvas.set_row(index=index, row=row)
-        if update_func:
-            update_func(1)
-    return canvas
+) -> RenderStats:
+    with _render_rows(options=options, cache_key=cache_key) as rendering:
+        framebuffer, rows, render_engine = rendering
+        for scene_y in rows:
+            writer.add_row(index=scene_y, canvas=framebuffer.canvas)
+            if update_func:
+                update_func(1)
+        return render_engine.stats
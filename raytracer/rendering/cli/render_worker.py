@@ -0,0 +1,51 @@
+import multiprocessing as mp
+
+import click
+
+from raytracer.rendering.distributed import parse_address, run_worker
+
+
+@click.command
+@click.argument("coordinator")
+@click.option(
+    "-p",
+    "--processes",
+    default=1,
+    type=click.IntRange(min=1),
+    help="The number of workers to start, each rendering a tile at a time.",
+)
+@click.option(
+    "--once",
+    is_flag=True,
+    default=False,
+    help="Stop after the coordinator's render rather than waiting for the next.",
+)
+def render_worker(coordinator: str, processes: int, once: bool) -> None:
+    """
+    Renders tiles for `render-scene --distributed` running at COORDINATOR, given as
+    HOST:PORT.
+    """
+    try:
+        host, port = parse_address(coordinator)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="COORDINATOR") from None
+    click.echo(f"Rendering tiles for {host}:{port}, press Ctrl+C to stop")
+    if processes == 1:
+        _run_worker(host=host, port=port, once=once)
+    else:
+        workers = [
+            mp.Process(target=_run_worker, args=(host, port, once))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    click.echo("Stopped rendering")
+
+
+def _run_worker(host: str, port: int, once: bool) -> None:
+    try:
+        run_worker(host=host, port=port, once=once)
+    except KeyboardInterrupt:
+        pass
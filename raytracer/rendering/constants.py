@@ -1,2 +1,8 @@
 SCENE_ABSOLUTE_TOP = -1.0
 SCENE_ABSOLUTE_BOTTOM = 1.0
+# We need a small number when calculating reflection to ensure we get a different point
+# otherwise we will likely end up reflecting off ourselves all the time.
+REFLECTION_DELTA = 0.0001
+# The smallest width or height of an image, as the steps between pixels are spread
+# across all but the first of them
+MIN_RESOLUTION = 2
@@ -0,0 +1,127 @@
+from array import array
+from dataclasses import dataclass, field
+from typing import Iterable
+
+import numpy as np
+
+from raytracer.core.types.binary import MappedScene, changed_spheres
+from raytracer.core.types.bvh import INFINITE_SLOPE, BoundingBox, Vector3
+from raytracer.core.types.entities import Scene
+
+# Origin, direction and length of each recorded ray segment
+SEGMENT_SIZE = 7
+# Bounds of changed objects are grown by this fraction, as recorded rays carry the
+# rounding of the single precision points they were traced with
+BOUNDS_PADDING = 1e-4
+
+
+@dataclass
+class TileDependencies:
+    """
+    What the image of a tile depended on, recorded while its rays were traced.
+
+    Rays which hit an object, or shadow rays an object blocked, depend on that
+    object.  Every other ray depends on nothing getting in its way, so its segment
+    is kept to test objects which later move into it.
+    """
+
+    # Indices of the objects hit by a ray or blocking a shadow ray
+    objects: set[int] = field(default_factory=set)
+    # Whether anything was shaded, which depends on every light
+    shaded: bool = False
+    # Segments of the rays which weren't blocked, flattened into origin, direction
+    # and length.  Rays which escaped the scene have an infinite length.
+    segments: array = field(default_factory=lambda: array("d"))
+
+    def add_segment(self, origin: Vector3, direction: Vector3, length: float) -> None:
+        self.segments.extend(origin)
+        self.segments.extend(direction)
+        self.segments.append(length)
+
+    def add_segments(
+        self, origins: np.ndarray, directions: np.ndarray, lengths: np.ndarray
+    ) -> None:
+        """Batched equivalent of `add_segment`, for (N, 3) and (N,) arrays"""
+        segments = np.concatenate([origins, directions, lengths[:, None]], axis=1)
+        self.segments.frombytes(segments.astype(np.float64).tobytes())
+
+    def crosses(self, bounds: BoundingBox) -> bool:
+        """Returns whether any recorded segment passes through the box"""
+        segments = np.frombuffer(self.segments, dtype=np.float64).reshape(
+            -1, SEGMENT_SIZE
+        )
+        origins, directions = segments[:, :3], segments[:, 3:6]
+        with np.errstate(divide="ignore"):
+            inverse = np.where(directions != 0, 1 / directions, INFINITE_SLOPE)
+        t_1 = (np.array(bounds.lower) - origins) * inverse
+        t_2 = (np.array(bounds.upper) - origins) * inverse
+        t_near = np.maximum(np.minimum(t_1, t_2).max(axis=1), 0)
+        t_far = np.minimum(np.maximum(t_1, t_2).min(axis=1), segments[:, 6])
+        return bool((t_near <= t_far).any())
+
+
+@dataclass
+class SceneChanges:
+    """How a scene differs from the one rendered before it"""
+
+    # Indices in the old scene of the objects changed or removed
+    removed: set[int] = field(default_factory=set)
+    # Bounds of the objects changed or added, as they are in the new scene
+    added: list[BoundingBox] = field(default_factory=list)
+    # Whether any light was changed, added or removed
+    lights: bool = False
+    # Whether the camera or resolution changed, which moves every ray
+    view: bool = False
+
+    @classmethod
+    def between(cls, old: Scene, new: Scene) -> "SceneChanges":
+        """
+        Compares the scenes object by object in order, so inserting an object
+        changes every one after it.  Binary scenes are compared as arrays first,
+        so only the spheres which differ there are made and compared.
+        """
+        changes = cls(
+            lights=list(old.lights) != list(new.lights),
+            view=(old.camera, old.width, old.height)
+            != (new.camera, new.width, new.height),
+        )
+        indices: Iterable[int] = range(max(len(old.objects), len(new.objects)))
+        if isinstance(old, MappedScene) and isinstance(new, MappedScene):
+            indices = changed_spheres(old, new)
+        for index in indices:
+            before = old.objects[index] if index < len(old.objects) else None
+            after = new.objects[index] if index < len(new.objects) else None
+            if before == after:
+                continue
+            if before is not None:
+                changes.removed.add(index)
+            if after is not None:
+                changes.added.append(_pad(after.bounds()))
+        return changes
+
+    def affects(self, dependencies: TileDependencies) -> bool:
+        """
+        Returns whether tracing the tile's rays again could give a different image:
+        if a light changed and the tile shaded anything, if an object it depended
+        on changed, or if a changed object now lies across one of its rays.
+        """
+        if self.view or (self.lights and dependencies.shaded):
+            return True
+        if not self.removed.isdisjoint(dependencies.objects):
+            return True
+        return any(dependencies.crosses(bounds) for bounds in self.added)
+
+
+def _pad(bounds: BoundingBox) -> BoundingBox:
+    return BoundingBox(
+        lower=(
+            bounds.lower[0] - BOUNDS_PADDING * max(1.0, abs(bounds.lower[0])),
+            bounds.lower[1] - BOUNDS_PADDING * max(1.0, abs(bounds.lower[1])),
+            bounds.lower[2] - BOUNDS_PADDING * max(1.0, abs(bounds.lower[2])),
+        ),
+        upper=(
+            bounds.upper[0] + BOUNDS_PADDING * max(1.0, abs(bounds.upper[0])),
+            bounds.upper[1] + BOUNDS_PADDING * max(1.0, abs(bounds.upper[1])),
+            bounds.upper[2] + BOUNDS_PADDING * max(1.0, abs(bounds.upper[2])),
+        ),
+    )
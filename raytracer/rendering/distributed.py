@@ -0,0 +1,468 @@
+import pickle
+import queue
+import socket
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Collection, Iterator, Optional, Sequence, Union
+
+from raytracer.core.types.binary import MappedScene
+from raytracer.core.types.entities import Scene
+from raytracer.core.types.imaging import CHANNELS
+from raytracer.rendering.engine import RenderEngine, _finished_rows
+from raytracer.rendering.framebuffer import Framebuffer
+from raytracer.rendering.tiles import Tile, schedule, split_tiles
+
+# The port a coordinator listens on for workers unless told otherwise
+DEFAULT_PORT = 7070
+# Tiles handed to a worker at once, so it can start the next while the pixels of
+# the last are on their way back
+TILES_IN_FLIGHT = 2
+# Seconds a worker may take to send back a tile before it is given up on
+WORKER_TIMEOUT = 60.0
+# Seconds between a worker's attempts to reach its coordinator, and between the
+# coordinator's checks for being closed while waiting for workers
+RETRY_INTERVAL = 0.5
+# The largest message accepted, well beyond the largest scene or tile
+MAX_MESSAGE_SIZE = 256 * 1024 * 1024
+# Tiles are compressed for speed over size, as most are sent over a local network
+COMPRESSION_LEVEL = 1
+
+# Each message is its kind and the size of the payload after it
+_HEADER = struct.Struct(">BI")
+# The index, left, top, right and bottom of a tile
+_TILE = struct.Struct(">5I")
+# The index of the tile at the start of a result
+_INDEX = struct.Struct(">I")
+
+
+class MessageKind(IntEnum):
+    # Sent to workers
+    JOB = 1  # The pickled engine and scene to render, compressed
+    TILE = 2  # A tile to render
+    DONE = 3  # Every tile is rendered
+    # Sent to the coordinator
+    RESULT = 4  # The index of a tile and its compressed pixels
+    ERROR = 5  # Why the worker couldn't render the scene
+
+
+class ProtocolError(ConnectionError):
+    """A message which breaks the protocol, after which the connection is dropped"""
+
+
+class WorkerError(Exception):
+    """A worker couldn't render the scene"""
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """Splits a `host:port` address, raising a ValueError if it is invalid"""
+    host, separator, port = address.rpartition(":")
+    if not (separator and host and port.isdigit() and int(port) < 65536):
+        raise ValueError(f"{address!r} isn't a host and port, like 0.0.0.0:7070")
+    return host, int(port)
+
+
+def send_message(
+    connection: socket.socket, kind: MessageKind, payload: bytes = b""
+) -> None:
+    connection.sendall(_HEADER.pack(kind, len(payload)) + payload)
+
+
+def receive_message(connection: socket.socket) -> tuple[MessageKind, bytes]:
+    """
+    Receives the next message, raising a ConnectionError if the connection closes
+    or the message breaks the protocol.
+    """
+    kind, size = _HEADER.unpack(_receive_exactly(connection, _HEADER.size))
+    if kind not in set(MessageKind) or size > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"Invalid message of kind {kind} and {size} bytes")
+    return MessageKind(kind), _receive_exactly(connection, size)
+
+
+def _receive_exactly(connection: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        received = connection.recv(size - len(data))
+        if not received:
+            raise ConnectionError("The connection was closed")
+        data += received
+    return bytes(data)
+
+
+class TileQueue:
+    """
+    The tiles of a render, handed out to workers as they ask for them.
+
+    Tiles are handed out in the order given.  Once none are left, a worker asking
+    for more steals a tile another is still rendering, so a slow or lost worker
+    doesn't hold up the end of the render; whichever sends it back first wins.
+    Each tile is only ever rendered by two workers at once.  Tiles held by a worker
+    which goes away are put back at the front of the queue.
+    """
+
+    def __init__(self, tiles: Sequence[Tile]) -> None:
+        self.tiles = {tile.index: tile for tile in tiles}
+        self._pending = deque(tiles)
+        # How many workers are rendering each tile handed out, by index
+        self._holders: dict[int, int] = {}
+        self._finished: set[int] = set()
+        self._cancelled = False
+        self._changed = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self._cancelled or len(self._finished) == len(self.tiles)
+
+    def take(self, held: Collection[int]) -> Optional[Tile]:
+        """
+        The next tile for a worker holding the tiles in `held`, or None if there is
+        nothing left it could render.
+        """
+        with self._changed:
+            if self.done:
+                return None
+            if self._pending:
+                tile = self._pending.popleft()
+            else:
+                stealable = [
+                    index
+                    for index, holders in self._holders.items()
+                    if holders == 1 and index not in held
+                ]
+                if not stealable:
+                    return None
+                tile = self.tiles[stealable[0]]
+            self._holders[tile.index] = self._holders.get(tile.index, 0) + 1
+            return tile
+
+    def wait(self) -> bool:
+        """
+        Waits for a tile to be free for a worker holding none, returning False if
+        the render finished first.
+        """
+        with self._changed:
+            self._changed.wait_for(
+                lambda: self.done or bool(self._pending) or 1 in self._holders.values()
+            )
+            return not self.done
+
+    def finish(self, index: int) -> bool:
+        """Marks a tile as rendered, returning False if it already was"""
+        with self._changed:
+            self._holders.pop(index, None)
+            if index in self._finished or self._cancelled:
+                return False
+            self._finished.add(index)
+            self._changed.notify_all()
+            return True
+
+    def release(self, indices: Collection[int]) -> None:
+        """Gives up the tiles a worker which has gone away was rendering"""
+        with self._changed:
+            for index in indices:
+                if index not in self._holders:
+                    continue
+                self._holders[index] -= 1
+                if not self._holders[index]:
+                    del self._holders[index]
+                    self._pending.appendleft(self.tiles[index])
+            self._changed.notify_all()
+
+    def cancel(self) -> None:
+        """Stops handing out tiles, as the render was abandoned"""
+        with self._changed:
+            self._cancelled = True
+            self._pending.clear()
+            self._changed.notify_all()
+
+
+@dataclass
+class _Job:
+    # The pickled engine and scene, compressed
+    payload: bytes
+    tiles: TileQueue
+    # Finished tiles with their pixels, or the error a worker sent
+    results: "queue.SimpleQueue[Union[tuple[Tile, bytes], WorkerError]]" = field(
+        default_factory=queue.SimpleQueue
+    )
+
+
+class Coordinator:
+    """
+    Renders scenes across workers which connect to it over TCP, as started by
+    `raytracer rendering render-worker`.
+
+    Each worker is sent the engine and scene once, then pulls tiles from a queue
+    shared by all of them, most expensive first, sending back the pixels of each
+    compressed.  They are copied into the framebuffer as they arrive.  Workers can
+    join part way through a render, and the tiles of any which disconnect, send
+    something invalid or take longer than `timeout` over a tile are handed out
+    again.  Workers wait for the next render once one finishes.
+
+    Workers unpickle the scenes they are sent, so they must only connect to a
+    coordinator they trust.
+    """
+
+    def __init__(
+        self,
+        engine: RenderEngine,
+        host: str = "0.0.0.0",
+        port: int = DEFAULT_PORT,
+        timeout: float = WORKER_TIMEOUT,
+    ) -> None:
+        if engine.anti_aliasing or engine.gbuffer or engine.record_dependencies:
+            raise ValueError(
+                "A distributed render can't anti-alias, keep a G-buffer or record "
+                "dependencies"
+            )
+        self.engine = engine
+        self.timeout = timeout
+        self._job: Optional[_Job] = None
+        self._job_changed = threading.Condition()
+        self._closed = False
+        self._connections: set[socket.socket] = set()
+        self._threads: list[threading.Thread] = []
+        self._listener = socket.create_server((host, port))
+        self._listener.settimeout(RETRY_INTERVAL)
+        self._accepting = threading.Thread(target=self._accept, daemon=True)
+        self._accepting.start()
+
+    def __enter__(self) -> "Coordinator":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    @property
+    def address(self) -> tuple[str, int]:
+        """The host and port workers connect to"""
+        host, port = self._listener.getsockname()[:2]
+        return host, port
+
+    def render(self, scene: Scene, framebuffer: Framebuffer) -> Iterator[int]:
+        """
+        Renders the scene into the framebuffer across the workers, yielding the
+        index of each row once every tile across it has come back.  Raises a
+        WorkerError if a worker fails to render the scene.
+        """
+        self.engine._check_framebuffer(framebuffer=framebuffer, scene=scene)
+        tiles = split_tiles(width=scene.width, height=scene.height)
+        tiles = schedule(tiles=tiles, costs=self.engine._estimate_costs(scene, tiles))
+        if isinstance(scene, MappedScene):
+            # Workers on other machines don't have the file it is mapped from
+            scene = scene.detach()
+        job = _Job(
+            payload=zlib.compress(pickle.dumps((self.engine, scene))),
+            tiles=TileQueue(tiles),
+        )
+        with self._job_changed:
+            self._job = job
+            self._job_changed.notify_all()
+        try:
+            yield from _finished_rows(
+                tiles=tiles,
+                finished=self._collect(job=job, framebuffer=framebuffer),
+                height=scene.height,
+            )
+        finally:
+            job.tiles.cancel()
+            with self._job_changed:
+                self._job = None
+
+    def close(self) -> None:
+        """Stops listening and disconnects the workers"""
+        with self._job_changed:
+            self._closed = True
+            self._job_changed.notify_all()
+        self._accepting.join()
+        self._listener.close()
+        for connection in list(self._connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:  # pragma: nocover
+                # Already disconnected
+                pass
+        for thread in self._threads:
+            thread.join()
+
+    def _collect(self, job: _Job, framebuffer: Framebuffer) -> Iterator[Tile]:
+        for _ in range(len(job.tiles.tiles)):
+            result = job.results.get()
+            if isinstance(result, WorkerError):
+                raise result
+            tile, pixels = result
+            _copy_tile(framebuffer=framebuffer, tile=tile, pixels=pixels)
+            yield tile
+
+    def _accept(self) -> None:
+        while not self._closed:
+            try:
+                connection, _ = self._listener.accept()
+            except socket.timeout:
+                continue
+            self._connections.add(connection)
+            thread = threading.Thread(
+                target=self._serve_worker, args=(connection,), daemon=True
+            )
+            self._threads.append(thread)
+            thread.start()
+
+    def _wait_for_job(self) -> Optional[_Job]:
+        """The render in progress, once there is one, or None if closed first"""
+        with self._job_changed:
+            self._job_changed.wait_for(lambda: self._closed or self._job is not None)
+            return None if self._closed else self._job
+
+    def _serve_worker(self, connection: socket.socket) -> None:
+        """Hands out tiles to a worker until its render finishes"""
+        job = self._wait_for_job()
+        # Tiles the worker is rendering, by index
+        held: dict[int, Tile] = {}
+        try:
+            if job is None:
+                return
+            connection.settimeout(self.timeout)
+            send_message(connection, MessageKind.JOB, job.payload)
+            while True:
+                while len(held) < TILES_IN_FLIGHT:
+                    tile = job.tiles.take(held=held)
+                    if tile is None:
+                        break
+                    held[tile.index] = tile
+                    send_message(
+                        connection, MessageKind.TILE, _TILE.pack(*_fields(tile))
+                    )
+                if not held:
+                    if job.tiles.wait():
+                        continue
+                    send_message(connection, MessageKind.DONE)
+                    return
+                kind, payload = receive_message(connection)
+                if kind == MessageKind.ERROR:
+                    job.results.put(WorkerError(payload.decode(errors="replace")))
+                    job.tiles.cancel()
+                    return
+                tile, pixels = _read_result(kind=kind, payload=payload, held=held)
+                del held[tile.index]
+                if job.tiles.finish(tile.index):
+                    job.results.put((tile, pixels))
+        except OSError:
+            # The worker has gone away or broken the protocol, so others render
+            # its tiles
+            pass
+        finally:
+            if job is not None:
+                job.tiles.release(held)
+            self._connections.discard(connection)
+            connection.close()
+
+
+def _fields(tile: Tile) -> tuple[int, int, int, int, int]:
+    return tile.index, tile.left, tile.top, tile.right, tile.bottom
+
+
+def _read_result(
+    kind: MessageKind, payload: bytes, held: dict[int, Tile]
+) -> tuple[Tile, bytes]:
+    """The tile a worker sent back and its pixels, checked against what it was sent"""
+    if kind != MessageKind.RESULT or len(payload) < _INDEX.size:
+        raise ProtocolError(f"Expected a tile, not a message of kind {kind}")
+    (index,) = _INDEX.unpack_from(payload)
+    if index not in held:
+        raise ProtocolError(f"Tile {index} wasn't handed to the worker")
+    tile = held[index]
+    size = tile.width * tile.height * CHANNELS
+    offset = _INDEX.size
+    compressed = payload[offset:]
+    decompressor = zlib.decompressobj()
+    try:
+        pixels = decompressor.decompress(compressed, size + 1)
+    except zlib.error as e:
+        raise ProtocolError(f"Tile {index} couldn't be decompressed: {e}") from None
+    if len(pixels) != size or not decompressor.eof:
+        raise ProtocolError(f"Tile {index} isn't {size} bytes")
+    return tile, pixels
+
+
+def _copy_tile(framebuffer: Framebuffer, tile: Tile, pixels: bytes) -> None:
+    """Copies the packed RGB pixels of a tile into the framebuffer"""
+    canvas = framebuffer.canvas
+    row_size = tile.width * CHANNELS
+    start = tile.left * CHANNELS
+    stop = tile.right * CHANNELS
+    for offset, scene_y in enumerate(tile.rows):
+        first = offset * row_size
+        last = first + row_size
+        canvas.row(scene_y)[start:stop] = pixels[first:last]
+
+
+def _tile_pixels(framebuffer: Framebuffer, tile: Tile) -> bytes:
+    """The packed RGB pixels of a tile, row by row"""
+    start = tile.left * CHANNELS
+    stop = tile.right * CHANNELS
+    return b"".join(framebuffer.row(scene_y)[start:stop] for scene_y in tile.rows)
+
+
+def run_worker(
+    host: str, port: int, once: bool = False, connect_timeout: Optional[float] = None
+) -> None:
+    """
+    Renders tiles for the coordinator at the address, then waits for its next
+    render, until interrupted.  With `once`, returns after the first render
+    instead.  Raises a ConnectionError if the coordinator can't be reached within
+    `connect_timeout` seconds, by default trying for ever.
+    """
+    while True:
+        with _connect(host=host, port=port, timeout=connect_timeout) as connection:
+            try:
+                _render_job(connection)
+            except ConnectionError:
+                # The coordinator finished or went away
+                pass
+        if once:
+            return
+
+
+def _connect(host: str, port: int, timeout: Optional[float]) -> socket.socket:
+    started = time.monotonic()
+    while True:
+        try:
+            return socket.create_connection((host, port))
+        except ConnectionError:
+            if timeout is not None and time.monotonic() - started >= timeout:
+                raise
+            time.sleep(RETRY_INTERVAL)
+
+
+def _render_job(connection: socket.socket) -> None:
+    """Renders the tiles of a job as the coordinator hands them out"""
+    kind, payload = receive_message(connection)
+    if kind != MessageKind.JOB:
+        raise ProtocolError(f"Expected a job, not a message of kind {kind}")
+    try:
+        engine, scene = pickle.loads(zlib.decompress(payload))
+        framebuffer = Framebuffer(width=scene.width, height=scene.height)
+    except Exception as e:
+        send_message(connection, MessageKind.ERROR, repr(e).encode())
+        return
+    with framebuffer:
+        while True:
+            kind, payload = receive_message(connection)
+            if kind != MessageKind.TILE:
+                return
+            tile = Tile(*_TILE.unpack(payload))
+            try:
+                engine._render_tile(scene=scene, tile=tile, framebuffer=framebuffer)
+            except Exception as e:
+                send_message(connection, MessageKind.ERROR, repr(e).encode())
+                return
+            pixels = zlib.compress(
+                _tile_pixels(framebuffer=framebuffer, tile=tile), COMPRESSION_LEVEL
+            )
+            send_message(
+                connection, MessageKind.RESULT, _INDEX.pack(tile.index) + pixels
+            )
@@ -1,84 +1,1528 @@
-import multiprocessing as mp
-from typing import Iterable, Optional
+import hashlib
+import math
+import pickle
+import queue
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass, field, fields
+from multiprocessing.shared_memory import SharedMemory
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    TypeVar,
+)
 
-from raytracer.core.types.entities import Primitive, Ray, Scene
+from raytracer.core.constants import MAX_COLOUR, MIN_COLOUR
+from raytracer.core.types.compiled import CompiledScene, compile_scene, vector
+from raytracer.core.types.entities import Ray, Scene
 from raytracer.core.types.geometry import Point
-from raytracer.core.types.imaging import Colour
-from raytracer.rendering.constants import SCENE_ABSOLUTE_TOP
-from raytracer.rendering.shading import Shader
+from raytracer.core.types.imaging import CHANNELS, Colour, Radiance, quantize
+from raytracer.rendering.antialiasing import (
+    EDGE_THRESHOLD,
+    NO_OBJECT,
+    find_edges,
+    sample_offsets,
+)
+from raytracer.rendering.backends import (
+    BACKENDS,
+    IN_PROCESS_BACKENDS,
+    PROCESS,
+    SERIAL,
+    WorkerPool,
+    start_pool,
+)
+from raytracer.rendering.constants import REFLECTION_DELTA, SCENE_ABSOLUTE_TOP
+from raytracer.rendering.dependencies import SceneChanges, TileDependencies
+from raytracer.rendering.framebuffer import (
+    GBUFFER_LIGHTS,
+    Framebuffer,
+    Hit,
+    shared_buffer,
+)
+from raytracer.rendering.progressive import PASSES, fill_gaps, pass_spans
+from raytracer.rendering.shading import PHONG_COEFFICENT, Shader, ShadowStats
+from raytracer.rendering.tiles import TILE_SIZE, Tile, schedule, split_tiles
 
-# We need a small number when calculating reflection to ensure we get a different point
-# otherwise we will likely end up reflecting off ourselves all the time.
-REFLECTION_DELTA = 0.0001
+try:
+    from raytracer.core.types import kernels  # type: ignore
+except ImportError:  # pragma: nocover
+    # Without the built extension every pixel is traced in Python
+    kernels = None
+
+# How many published scenes the engine, and each of its workers, hold on to.
+MAX_PUBLISHED_SCENES = 4
+# With Russian roulette, reflections weighted below this are traced at random with a
+# chance proportional to their weight, and scaled up to make up for the ones which
+# aren't.
+ROULETTE_THRESHOLD = 0.1
+# Tiles each worker is handed at once while rendering a batch, one to render and the
+# rest waiting, so no worker is left idle while the next job is started
+BATCH_TILES_PER_WORKER = 2
+# With `linear`, reflections are no longer followed once white would add less than
+# this to any channel of the pixel
+LINEAR_CUTOFF = 0.5
+
+# The published scene and framebuffer to render into, the tile to render, and the
+# spacing of the pass rendering it along with whether it is the first pass
+RenderTask = tuple[str, str, Tile, int, bool]
+# The published scene and framebuffer to relight, the tile to relight and whether to
+# reuse the shadows in the G-buffer
+RelightTask = tuple[str, str, Tile, bool]
+T = TypeVar("T")
+
+
+@dataclass
+class _BatchJob:
+    """A job of `render_batch` being rendered"""
+
+    # Its position in the batch
+    index: int
+    scene: Scene
+    framebuffer: Framebuffer
+    # The shared memory the engine and scene are published in
+    key: str
+    # Tasks handed to the workers which haven't come back
+    pending: int = 0
+    # Whether its edges are being anti-aliased, once every tile is rendered
+    refining: bool = False
+
+
+# A batch job, the work one of its tasks did and the result, or the error it raised
+_BatchResult = tuple[_BatchJob, Callable, Any]
+
+
+@dataclass
+class TraceStats:
+    """Counts of the rays traced by an engine"""
+
+    # Rays from the camera, one per pixel
+    primary_rays: int = 0
+    # Rays traced to find a reflection
+    reflection_rays: int = 0
+    # Reflections not traced because they couldn't change the pixel however bright
+    terminated: int = 0
+    # Reflections not traced because they lost at Russian roulette
+    roulette_terminated: int = 0
+    # Objects tested against rays while finding the nearest hit
+    intersection_tests: int = 0
+    # Hits passed to the shader
+    shades: int = 0
+    # Pixels on edges traced again with more rays to anti-alias them
+    refined_pixels: int = 0
+
+    @property
+    def average_depth(self) -> float:
+        """The average number of reflections traced for each pixel"""
+        return self.reflection_rays / self.primary_rays if self.primary_rays else 0.0
+
+
+@dataclass
+class StageTimings:
+    """
+    Seconds spent in each stage of rendering, summed across workers.  Only measured
+    by engines created with `collect_stats`, as timing every ray isn't free.
+    """
+
+    # Loading the published engine and scene in a worker
+    load: float = 0.0
+    # Tracing rows, which includes the next three stages
+    trace: float = 0.0
+    # Finding the nearest object each ray hits
+    intersect: float = 0.0
+    # Shading hits, including tracing their shadow rays
+    shade: float = 0.0
+    # Following reflections, including their own intersection and shading
+    reflect: float = 0.0
+    # Copying finished rows into the framebuffer
+    write: float = 0.0
+    # Estimating the cost of each tile before rendering, in the main process
+    estimate: float = 0.0
+
+
+@dataclass
+class RenderStats:
+    """What was measured while rendering a scene, gathered from every worker"""
+
+    trace: TraceStats = field(default_factory=TraceStats)
+    shadows: ShadowStats = field(default_factory=ShadowStats)
+    timings: StageTimings = field(default_factory=StageTimings)
+    # Seconds each worker process spent on tiles, by process id
+    busy: dict[int, float] = field(default_factory=dict)
+    # Seconds from starting the render until its last tile came back
+    wall_time: float = 0.0
+    # Worker processes rendering the scene
+    workers: int = 0
+
+    @property
+    def idle(self) -> dict[int, float]:
+        """
+        Seconds each worker spent not rendering, waiting on tiles to be handed out
+        and sent back, by process id
+        """
+        return {pid: max(self.wall_time - busy, 0.0) for pid, busy in self.busy.items()}
+
+    @property
+    def efficiency(self) -> float:
+        """
+        The fraction of the time the workers could have spent rendering that they
+        did, as busy time divided by wall time times workers
+        """
+        available = self.wall_time * self.workers
+        return sum(self.busy.values()) / available if available else 0.0
+
+    def add(self, other: "RenderStats") -> None:
+        """Adds the counters and timings of `other`, such as those of a single tile"""
+        _add_fields(self.trace, other.trace)
+        _add_fields(self.shadows, other.shadows)
+        _add_fields(self.timings, other.timings)
+        for pid, busy in other.busy.items():
+            self.busy[pid] = self.busy.get(pid, 0.0) + busy
+
+    def to_object(self) -> dict:
+        idle = self.idle
+        return {
+            "wall_time": self.wall_time,
+            "trace": {**asdict(self.trace), "average_depth": self.trace.average_depth},
+            "shadows": {
+                **asdict(self.shadows),
+                "hit_rate": self.shadows.hit_rate,
+                "cache_hit_rate": self.shadows.cache_hit_rate,
+            },
+            "timings": asdict(self.timings),
+            "efficiency": self.efficiency,
+            "workers": [
+                {"pid": pid, "busy": busy, "idle": idle[pid]}
+                for pid, busy in sorted(self.busy.items())
+            ],
+        }
 
 
 class RenderEngine:
-    def __init__(self, shader: Shader, max_depth: int = 6) -> None:
+    def __init__(
+        self,
+        shader: Shader,
+        max_depth: int = 6,
+        use_bvh: bool = True,
+        russian_roulette: bool = False,
+        collect_stats: bool = False,
+        max_samples: int = 1,
+        edge_threshold: int = EDGE_THRESHOLD,
+        record_dependencies: bool = False,
+        gbuffer: bool = False,
+        start_method: Optional[str] = None,
+        backend: str = PROCESS,
+        linear: bool = False,
+    ) -> None:
         self.shader = shader
         self.max_depth = max_depth
+        self.use_bvh = use_bvh
+        self.russian_roulette = russian_roulette
+        self.collect_stats = collect_stats
+        # Rays traced for pixels on edges, which are only anti-aliased above one
+        self.max_samples = max_samples
+        self.edge_threshold = edge_threshold
+        # Record what each tile depends on, so `changed_tiles` can tell which tiles
+        # an edit to the scene affects
+        self.record_dependencies = record_dependencies
+        # Keep the hits along every pixel's reflections in the framebuffer, so
+        # `relight` can shade them again
+        self.gbuffer = gbuffer
+        if gbuffer and self.anti_aliasing:
+            raise ValueError("A G-buffer can't be kept while anti-aliasing")
+        # Add up the light along each pixel's reflections in floating point and
+        # quantize it once, rather than rounding every step as `Colour` does
+        self.linear = linear
+        if gbuffer and linear:
+            raise ValueError("A G-buffer can't be kept while shading in linear light")
+        # How the workers are started, the platform's default if None.  A process
+        # holding sockets open should use "forkserver", so forked workers don't
+        # keep its connections open too.
+        self.start_method = start_method
+        # Whether tiles are rendered serially, across threads or across processes
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+        self.backend = backend
+        self.trace_stats = TraceStats()
+        self.timings = StageTimings() if collect_stats else None
+        # Gathered from the workers by `render` with `collect_stats`
+        self.stats = RenderStats()
+        self._random = random.Random()
+        self._pool: Optional[WorkerPool] = None
+        self._processes = 0
+        # Digest of each published job, mapped to the shared memory holding it
+        self._published: dict[str, SharedMemory] = {}
+        # The index of the object the last primary ray hit
+        self._primary: Optional[int] = None
+        # Where the tile being rendered records what it depends on
+        self._dependencies: Optional[TileDependencies] = None
+        # What each tile of the last scene rendered depends on, by tile index
+        self.dependencies: dict[int, TileDependencies] = {}
+        self._rendered: Optional[Scene] = None
+        # The compiled kernels over the last scene rendered with them
+        self._kernels: Optional[tuple[CompiledScene, Any]] = None
+
+    def __enter__(self) -> "RenderEngine":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __getstate__(self) -> dict:
+        # Workers get a copy of the engine without its pool
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        state["_published"] = {}
+        state["trace_stats"] = TraceStats()
+        state["timings"] = StageTimings() if self.collect_stats else None
+        state["stats"] = RenderStats()
+        state["_primary"] = None
+        state["_dependencies"] = None
+        state["dependencies"] = {}
+        state["_rendered"] = None
+        state["_kernels"] = None
+        return state
+
+    @property
+    def anti_aliasing(self) -> bool:
+        return self.max_samples > 1
+
+    @property
+    def gbuffer_depth(self) -> int:
+        """
+        The hits kept in the G-buffer for each pixel, as many as a pixel can shade,
+        or none without `gbuffer`
+        """
+        return self.max_depth + 2 if self.gbuffer else 0
+
+    @property
+    def settings(self) -> dict[str, Any]:
+        """
+        Everything about the engine which decides the image it renders.  How it
+        finds the nearest object, and the workers it uses, don't.
+        """
+        return {
+            "type": type(self).__name__,
+            "max_depth": self.max_depth,
+            "russian_roulette": self.russian_roulette,
+            "roulette_threshold": ROULETTE_THRESHOLD,
+            "max_samples": self.max_samples,
+            "edge_threshold": self.edge_threshold,
+            "linear": self.linear,
+            "shader": self.shader.settings,
+        }
 
     def render(
-        self, scene: Scene, processes: int = 4
-    ) -> Iterable[tuple[int, list[Colour]]]:
-        scene_top, _ = scene.get_aspect_boundries()
-        horizontal_step, vertical_step = scene.get_horizontal_and_vertical_steps()
+        self,
+        scene: Scene,
+        framebuffer: Framebuffer,
+        processes: int = 4,
+        tiles: Optional[Sequence[Tile]] = None,
+    ) -> Iterable[int]:
+        """
+        Renders the scene into the framebuffer a tile at a time across a pool of
+        `processes` workers on the engine's `backend`, yielding the index of each row
+        once every tile across it is written.  Rows are finished in no particular
+        order.
 
-        params = [
-            (
-                scene,
-                scene_y,
-                scene_top,
-                vertical_step,
-                horizontal_step,
+        With more than one worker, a few rays of each tile are traced first to
+        estimate its cost and tiles are handed out most expensive first.  Finished
+        tiles are collected in whatever order they come back, so no tile waits on a
+        slower one handed out before it.
+
+        The pool is started on first use and kept for later renders.  The engine and
+        scene are pickled once into shared memory, where each worker picks them up
+        the first time it is handed a tile, so tasks only carry the tile to render.
+        Workers write pixels straight into the framebuffer and send back only the
+        tile they finished.  With `collect_stats` they also send back what they
+        measured rendering it, which is gathered into `stats`.  Workers on the serial
+        or thread backends share the scene rather than loading it, but each thread
+        loads its own copy of the engine.
+
+        With anti-aliasing, rows are only yielded once the edges across them have
+        been refined, after every tile is rendered.  The framebuffer must keep
+        object ids to find them.
+
+        Given `tiles`, only those tiles are rendered, leaving the rest of the
+        framebuffer as it was, and only the rows across them are yielded.  With
+        `record_dependencies`, what each tile depends on is sent back with it.
+
+        With `gbuffer`, the hits along each pixel's reflections are kept in the
+        framebuffer.  Reflections are then followed as far as they go, whatever the
+        materials, so the render takes longer but a later one only changing lights
+        or materials can `relight` it.
+        """
+        self._check_framebuffer(framebuffer=framebuffer, scene=scene)
+        pool, processes = self._start(processes=processes)
+        key = self._publish(scene)
+        self.stats = RenderStats(workers=processes)
+        started = time.perf_counter()
+        if tiles is None:
+            self.dependencies = {}
+        self._rendered = None
+        tiles = self._schedule(
+            scene=scene, processes=processes, started=started, tiles=tiles
+        )
+        tasks = [(key, framebuffer.name, tile, 1, True) for tile in tiles]
+        finished = self._collect(pool=pool, tasks=tasks, started=started)
+        if self.anti_aliasing:
+            for _ in finished:
+                pass
+            finished = self._anti_alias(
+                pool=pool, key=key, framebuffer=framebuffer, started=started
+            )
+        yield from _finished_rows(tiles=tiles, finished=finished, height=scene.height)
+        if self.record_dependencies:
+            self._rendered = scene
+
+    def relight(
+        self,
+        scene: Scene,
+        framebuffer: Framebuffer,
+        processes: int = 4,
+        reuse_shadows: bool = False,
+    ) -> Iterable[int]:
+        """
+        Shades the image again from the G-buffer in the framebuffer, yielding the
+        index of each row as `render` does.
+
+        The G-buffer must have been rendered with `gbuffer` from a scene with the
+        same camera, resolution and objects as `scene`, other than their materials.
+        No rays are traced to find what each pixel sees: the shader colours the hits
+        along each pixel's reflections with the lights and materials of `scene`,
+        leaving the image `render` would.
+
+        With `reuse_shadows`, the lights are in the places the G-buffer's shadows
+        were found for, so no shadow rays are traced either.  Otherwise they are
+        traced again and the G-buffer updated with them.
+        """
+        self._check_framebuffer(framebuffer=framebuffer, scene=scene)
+        if not self.gbuffer:
+            raise ValueError("Relighting needs an engine which keeps a G-buffer")
+        pool, processes = self._start(processes=processes)
+        key = self._publish(scene)
+        self.stats = RenderStats(workers=processes)
+        started = time.perf_counter()
+        self._rendered = None
+        # Reshading costs about the same everywhere, so tiles aren't scheduled
+        tiles = split_tiles(width=scene.width, height=scene.height)
+        tasks = [(key, framebuffer.name, tile, reuse_shadows) for tile in tiles]
+        finished = self._collect_relit(pool=pool, tasks=tasks, started=started)
+        yield from _finished_rows(tiles=tiles, finished=finished, height=scene.height)
+
+    def changed_tiles(self, scene: Scene) -> list[Tile]:
+        """
+        Returns the tiles of the last scene rendered whose image `scene` could
+        change, judged by what each depended on as it was rendered.  Rendering just
+        those tiles into the same framebuffer leaves the image `render` would.
+
+        Every tile has changed if nothing was recorded for the last render, or with
+        anti-aliasing, as the edges refined in one tile depend on its neighbours.
+        """
+        tiles = split_tiles(width=scene.width, height=scene.height)
+        if self._rendered is None or self.anti_aliasing:
+            return tiles
+        changes = SceneChanges.between(old=self._rendered, new=scene)
+        return [
+            tile for tile in tiles if changes.affects(self.dependencies[tile.index])
+        ]
+
+    def render_progressive(
+        self, scene: Scene, framebuffer: Framebuffer, processes: int = 4
+    ) -> Iterable[int]:
+        """
+        Renders the scene into the framebuffer in passes from coarse to fine,
+        yielding the spacing between the pixels traced by each pass once it is
+        finished.
+
+        Each pass traces one pixel in every `spacing` by `spacing` square, skipping
+        those already traced by earlier passes, and then fills the gaps from the
+        nearest pixel traced so far.  The framebuffer holds a complete preview
+        after every pass and the last pass, with a spacing of one, leaves the same
+        image as `render`, having traced each pixel once.  Tiles are scheduled and
+        gathered as with `render`, but coarser passes use larger tiles so each still
+        traces about as many pixels.  With anti-aliasing, edges are refined before
+        the last pass is yielded.
+        """
+        self._check_framebuffer(framebuffer=framebuffer, scene=scene)
+        pool, processes = self._start(processes=processes)
+        key = self._publish(scene)
+        self.stats = RenderStats(workers=processes)
+        started = time.perf_counter()
+        # Passes don't record what tiles depend on
+        self._rendered = None
+        for number, spacing in enumerate(PASSES):
+            tiles = self._schedule(
+                scene=scene,
+                processes=processes,
+                started=time.perf_counter(),
+                size=TILE_SIZE * spacing,
+            )
+            tasks = [
+                (key, framebuffer.name, tile, spacing, number == 0) for tile in tiles
+            ]
+            for _ in self._collect(pool=pool, tasks=tasks, started=started):
+                pass
+            if spacing > 1:
+                fill_gaps(canvas=framebuffer.canvas, spacing=spacing)
+            elif self.anti_aliasing:
+                for _ in self._anti_alias(
+                    pool=pool, key=key, framebuffer=framebuffer, started=started
+                ):
+                    pass
+            yield spacing
+
+    def render_batch(
+        self, jobs: Iterable[tuple[Scene, Framebuffer]], processes: int = 4
+    ) -> Iterator[int]:
+        """
+        Renders each scene into its framebuffer across the same pool of workers,
+        yielding the index of each job once its image is finished.  Jobs finish
+        roughly in the order given.
+
+        Rendering the jobs one after another would leave workers idle at the end of
+        each, waiting on its last tiles.  Instead the tiles of later jobs are handed
+        out as those of earlier ones finish, keeping `BATCH_TILES_PER_WORKER` tiles
+        in hand for each worker.  Jobs are only taken from `jobs` as their tiles are
+        needed, so if it opens their framebuffers as it is iterated, few are open at
+        once.  Tiles of each job are scheduled as with `render`, and with
+        anti-aliasing its edges are refined once all of them are rendered.
+        """
+        pool, processes = self._start(processes=processes)
+        self.stats = RenderStats(workers=processes)
+        started = time.perf_counter()
+        self.dependencies = {}
+        self._rendered = None
+        results: queue.SimpleQueue[_BatchResult] = queue.SimpleQueue()
+        waiting = enumerate(jobs)
+        active: dict[int, _BatchJob] = {}
+        in_hand_limit = processes * BATCH_TILES_PER_WORKER
+        while True:
+            in_hand = sum(job.pending for job in active.values())
+            while in_hand < in_hand_limit:
+                index, (scene, framebuffer) = next(waiting, (-1, (None, None)))
+                if scene is None or framebuffer is None:
+                    break
+                self._check_framebuffer(framebuffer=framebuffer, scene=scene)
+                in_use = {job.key for job in active.values()}
+                job = _BatchJob(
+                    index=index,
+                    scene=scene,
+                    framebuffer=framebuffer,
+                    key=self._publish(scene, in_use=in_use),
+                )
+                active[index] = job
+                for tile in self._schedule(
+                    scene=scene, processes=processes, started=time.perf_counter()
+                ):
+                    self._submit(
+                        pool,
+                        results,
+                        job,
+                        _render_task,
+                        (job.key, framebuffer.name, tile, 1, True),
+                    )
+                in_hand += job.pending
+            if not active:
+                return
+
+            job, work, result = results.get()
+            if isinstance(result, BaseException):
+                raise result
+            job.pending -= 1
+            self._add_stats(stats=result[-1], started=started)
+            if work is _edges_task and result[1]:
+                tile, pixels, _ = result
+                self._submit(
+                    pool,
+                    results,
+                    job,
+                    _refine_task,
+                    (job.key, job.framebuffer.name, tile, pixels),
+                )
+            if job.pending:
+                continue
+            if self.anti_aliasing and not job.refining:
+                job.refining = True
+                for tile in split_tiles(width=job.scene.width, height=job.scene.height):
+                    self._submit(
+                        pool,
+                        results,
+                        job,
+                        _edges_task,
+                        (job.key, job.framebuffer.name, tile),
+                    )
+                continue
+            del active[job.index]
+            yield job.index
+
+    def close(self) -> None:
+        """
+        Stops the worker pool and releases the shared memory of published scenes.
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        for shared_memory in self._published.values():
+            _unpublish(shared_memory)
+        self._published.clear()
+
+    def _start(self, processes: int) -> tuple[WorkerPool, int]:
+        """
+        Returns the pool of workers, starting it if the last render used a different
+        number of them, along with how many it has.
+        """
+        if self.backend == SERIAL:
+            processes = 1
+        if self._pool is not None and self._processes != processes:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if self._pool is None:
+            self._pool = start_pool(
+                backend=self.backend, workers=processes, start_method=self.start_method
             )
-            for scene_y in range(scene.height)
+            self._processes = processes
+        return self._pool, processes
+
+    def _publish(self, scene: Scene, in_use: Collection[str] = ()) -> str:
+        """
+        Shares this engine and the scene with the workers, returning the name of the
+        shared memory they can be loaded from.
+
+        Publishing the same engine settings and scene again reuses the same block.
+        Scenes published under the names `in_use` are kept however many there are.
+        """
+        # Compiled first so the workers share the arrays rather than each compiling
+        # the scene, and the scene pickles the same before and after rendering
+        compile_scene(scene)
+        payload = pickle.dumps((self, scene), protocol=pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.sha256(payload).hexdigest()
+        if digest in self._published:
+            # Keep the most recently used scenes at the end
+            self._published[digest] = self._published.pop(digest)
+            return self._published[digest].name
+
+        if self.backend in IN_PROCESS_BACKENDS:
+            # Workers in this process share the scene, and only load their own copy
+            # of the engine to keep what they measure apart
+            payload = pickle.dumps((self, None), protocol=pickle.HIGHEST_PROTOCOL)
+        shared_memory = SharedMemory(create=True, size=len(payload))
+        shared_buffer(shared_memory)[: len(payload)] = payload
+        if self.backend in IN_PROCESS_BACKENDS:
+            _shared_scenes[shared_memory.name] = scene
+        self._published[digest] = shared_memory
+        excess = max(len(self._published) - MAX_PUBLISHED_SCENES, 0)
+        unused = [
+            published
+            for published, block in self._published.items()
+            if published != digest and block.name not in in_use
         ]
-        with mp.Pool(processes=processes) as pool:
-            yield from pool.imap(self._render_row, params)
+        for published in unused[:excess]:
+            _unpublish(self._published.pop(published))
+        return shared_memory.name
+
+    def _check_framebuffer(self, framebuffer: Framebuffer, scene: Scene) -> None:
+        if self.anti_aliasing and not framebuffer.has_ids:
+            raise ValueError("Anti-aliasing needs a framebuffer which keeps object ids")
+        if framebuffer.gbuffer_depth != self.gbuffer_depth:
+            raise ValueError(
+                f"The framebuffer must keep a G-buffer {self.gbuffer_depth} hits deep"
+            )
+        if self.gbuffer and len(scene.lights) > GBUFFER_LIGHTS:
+            raise ValueError(f"A G-buffer can't keep more than {GBUFFER_LIGHTS} lights")
+
+    def _anti_alias(
+        self, pool: WorkerPool, key: str, framebuffer: Framebuffer, started: float
+    ) -> Iterator[Tile]:
+        """
+        Finds the edges in every tile of the rendered image, then traces them again
+        with more rays, yielding each tile once its edges are refined.
+
+        Every edge is found before any is refined, so refining one tile can't
+        change the edges found in its neighbours.
+        """
+        tiles = split_tiles(width=framebuffer.width, height=framebuffer.height)
+        edges = []
+        for tile, pixels, stats in pool.imap_unordered(
+            _edges_task, [(key, framebuffer.name, tile) for tile in tiles]
+        ):
+            self._add_stats(stats=stats, started=started)
+            if pixels:
+                edges.append((key, framebuffer.name, tile, pixels))
+            else:
+                yield tile
+        for tile, stats in pool.imap_unordered(_refine_task, edges):
+            self._add_stats(stats=stats, started=started)
+            yield tile
+
+    def _schedule(
+        self,
+        scene: Scene,
+        processes: int,
+        started: float,
+        size: int = TILE_SIZE,
+        tiles: Optional[Sequence[Tile]] = None,
+    ) -> list[Tile]:
+        """
+        Splits the scene into tiles, unless given them, ordered most expensive
+        first when there is more than one worker to balance them across.
+        """
+        if tiles is None:
+            tiles = split_tiles(width=scene.width, height=scene.height, size=size)
+        tiles = list(tiles)
+        if processes > 1:
+            # A single worker renders every tile whatever the order
+            tiles = schedule(tiles=tiles, costs=self._estimate_costs(scene, tiles))
+            if self.collect_stats:
+                self.stats.timings.estimate += time.perf_counter() - started
+        return tiles
+
+    def _collect(
+        self, pool: WorkerPool, tasks: list[RenderTask], started: float
+    ) -> Iterator[Tile]:
+        """
+        Hands out the tasks to the workers, yielding each tile in whatever order
+        they finish and gathering their stats and dependencies.
+        """
+        for tile, dependencies, stats in pool.imap_unordered(_render_task, tasks):
+            self._add_stats(stats=stats, started=started)
+            if dependencies is not None:
+                self.dependencies[tile.index] = dependencies
+            yield tile
+
+    def _collect_relit(
+        self, pool: WorkerPool, tasks: list[RelightTask], started: float
+    ) -> Iterator[Tile]:
+        for tile, stats in pool.imap_unordered(_relight_task, tasks):
+            self._add_stats(stats=stats, started=started)
+            yield tile
+
+    @staticmethod
+    def _submit(
+        pool: WorkerPool,
+        results: "queue.SimpleQueue[_BatchResult]",
+        job: _BatchJob,
+        work: Callable[[Any], Any],
+        task: Any,
+    ) -> None:
+        """
+        Hands a task of a batch job to the workers.  Its result, or the error it
+        raised, is put on `results` along with the job and the work it did.
+        """
+        job.pending += 1
+        pool.apply_async(
+            work,
+            (task,),
+            callback=lambda result: results.put((job, work, result)),
+            error_callback=lambda error: results.put((job, work, error)),
+        )
+
+    def _add_stats(self, stats: Optional["RenderStats"], started: float) -> None:
+        if stats is not None:
+            self.stats.add(stats)
+            self.stats.wall_time = time.perf_counter() - started
+
+    def _estimate_costs(self, scene: Scene, tiles: Sequence[Tile]) -> list[int]:
+        """
+        Traces a few rays spread over each tile, returning how much work each took
+        as the intersection tests and shading they needed.
+
+        The rays are traced by a scalar engine with its own counters, whichever
+        engine is rendering, as only it can say what each ray cost.
+        """
+        estimator = RenderEngine(
+            shader=Shader(), max_depth=self.max_depth, use_bvh=self.use_bvh
+        )
+        trace, shadows = estimator.trace_stats, estimator.shader.shadow_stats
+        costs = []
+        for tile in tiles:
+            before = trace.intersection_tests + shadows.tests + trace.shades
+            for scene_x, scene_y in tile.samples:
+                estimator._render_row(
+                    estimator._row_params(scene=scene, scene_y=scene_y),
+                    start=scene_x,
+                    stop=scene_x + 1,
+                )
+            costs.append(
+                trace.intersection_tests + shadows.tests + trace.shades - before
+            )
+        return costs
+
+    def _render_tile(
+        self,
+        scene: Scene,
+        tile: Tile,
+        framebuffer: Framebuffer,
+        spacing: int = 1,
+        first: bool = True,
+    ) -> Optional[TileDependencies]:
+        """
+        Renders the pixels of the tile traced by a pass with the given spacing, by
+        default every pixel.  With `record_dependencies`, what a whole tile depends
+        on is returned.
+        """
+        started = time.perf_counter()
+        dependencies = self._record(whole_tile=spacing == 1 and first)
+        spans = pass_spans(tile=tile, spacing=spacing, first=first)
+        rows = []
+        for scene_y, span in spans:
+            ids: Optional[list[int]] = [] if framebuffer.has_ids else None
+            paths: Optional[list[list[Hit]]] = [] if self.gbuffer else None
+            _, row = self._render_row(
+                self._row_params(scene=scene, scene_y=scene_y),
+                start=span.start,
+                stop=span.stop,
+                step=span.step,
+                ids=ids,
+                paths=paths,
+            )
+            rows.append((scene_y, span, row, ids, paths))
+        traced = time.perf_counter()
+        for scene_y, span, row, ids, paths in rows:
+            framebuffer.set_row(
+                index=scene_y, row=row, start=span.start, step=span.step
+            )
+            if ids is not None:
+                framebuffer.set_ids(
+                    index=scene_y, ids=ids, start=span.start, step=span.step
+                )
+            if paths is not None:
+                framebuffer.set_hits(
+                    index=scene_y, paths=paths, start=span.start, step=span.step
+                )
+        self._time_tile(started=started, traced=traced)
+        self._dependencies = self.shader.dependencies = None
+        return dependencies
+
+    def _relight_tile(
+        self, scene: Scene, tile: Tile, framebuffer: Framebuffer, reuse_shadows: bool
+    ) -> None:
+        """
+        Shades the pixels of the tile again from the hits kept in the G-buffer,
+        finding their shadows again unless told to reuse them.
+        """
+        started = time.perf_counter()
+        rows = []
+        for scene_y in tile.rows:
+            paths = framebuffer.hits(index=scene_y, start=tile.left, stop=tile.right)
+            if not reuse_shadows:
+                paths = [
+                    [
+                        (
+                            obj,
+                            position,
+                            normal,
+                            self._shadow_mask(scene, position, normal),
+                        )
+                        for obj, position, normal, _ in path
+                    ]
+                    for path in paths
+                ]
+                framebuffer.set_hits(index=scene_y, paths=paths, start=tile.left)
+            # Seeded as `_render_row` is, so Russian roulette draws the same numbers
+            self._random.seed(scene_y * scene.width + tile.left)
+            rows.append(
+                (scene_y, [self._shade_path(scene=scene, path=path) for path in paths])
+            )
+        traced = time.perf_counter()
+        for scene_y, row in rows:
+            framebuffer.set_row(index=scene_y, row=row, start=tile.left)
+        self._time_tile(started=started, traced=traced)
+
+    def _record(self, whole_tile: bool) -> Optional[TileDependencies]:
+        """
+        Starts recording what the tile about to be rendered depends on, if the
+        engine records dependencies and the whole tile is being rendered.  Passes
+        render part of a tile, so record nothing.
+        """
+        dependencies = (
+            TileDependencies() if self.record_dependencies and whole_tile else None
+        )
+        self._dependencies = self.shader.dependencies = dependencies
+        return dependencies
+
+    def _find_edges(
+        self, framebuffer: Framebuffer, tile: Tile
+    ) -> list[tuple[int, int]]:
+        return find_edges(
+            framebuffer=framebuffer, tile=tile, threshold=self.edge_threshold
+        )
+
+    def _refine_pixels(
+        self, scene: Scene, pixels: list[tuple[int, int]], framebuffer: Framebuffer
+    ) -> None:
+        """
+        Anti-aliases each (x, y) pixel, averaging its colour with that of rays
+        traced through the other `max_samples` - 1 points of the sample pattern.
+
+        With `linear` the pixel's own ray is traced again, as the framebuffer only
+        holds its quantized colour, and the radiance of all the samples averaged.
+        """
+        started = time.perf_counter()
+        _, _, scene_top, vertical_step, horizontal_step = self._row_params(
+            scene=scene, scene_y=0
+        )
+        offsets = sample_offsets(self.max_samples)
+        if not self.linear:
+            offsets = offsets[1:]
+        data = framebuffer.buffer
+        refined = []
+        for scene_x, scene_y in pixels:
+            # Seed by the pixel so Russian roulette renders the same whichever
+            # worker it's on
+            self._random.seed(scene_y * scene.width + scene_x)
+            totals: Radiance = (0.0, 0.0, 0.0)
+            if not self.linear:
+                # The first sample is the pixel already in the framebuffer
+                first = (scene_y * scene.width + scene_x) * CHANNELS
+                totals = (data[first], data[first + 1], data[first + 2])
+            for u, v in offsets:
+                x = SCENE_ABSOLUTE_TOP + (scene_x + u - 0.5) * horizontal_step
+                y = scene_top + (scene_y + v - 0.5) * vertical_step
+                ray = Ray(scene.camera, Point(x=x, y=y, z=0) - scene.camera)
+                if self.linear:
+                    sample = self._render_radiance(ray=ray, scene=scene)
+                else:
+                    colour = self._render_pixel(ray=ray, scene=scene)
+                    sample = (colour.r, colour.g, colour.b)
+                totals = (
+                    totals[0] + sample[0],
+                    totals[1] + sample[1],
+                    totals[2] + sample[2],
+                )
+            refined.append(_average(totals, self.max_samples, linear=self.linear))
+        self.trace_stats.primary_rays += len(pixels) * len(offsets)
+        self.trace_stats.refined_pixels += len(pixels)
+        traced = time.perf_counter()
+        for (scene_x, scene_y), colour in zip(pixels, refined):
+            framebuffer.set_row(index=scene_y, row=[colour], start=scene_x)
+        self._time_tile(started=started, traced=traced)
+
+    def _time_tile(self, started: float, traced: float) -> None:
+        if self.timings is not None:
+            self.timings.trace += traced - started
+            self.timings.write += time.perf_counter() - traced
+
+    def _take_stats(self, load: float, busy: float) -> Optional[RenderStats]:
+        """
+        Returns what this engine measured since it was last asked and starts
+        afresh, or None without `collect_stats`.  Runs in the worker processes.
+        """
+        if self.timings is None:
+            return None
+        self.timings.load += load
+        stats = RenderStats(
+            trace=self.trace_stats,
+            shadows=self.shader.shadow_stats,
+            timings=self.timings,
+            # On Linux the main thread of a worker process has the process's id
+            busy={threading.get_native_id(): busy},
+        )
+        self.trace_stats = TraceStats()
+        self.shader.shadow_stats = ShadowStats()
+        self.timings = StageTimings()
+        return stats
+
+    def _row_params(
+        self, scene: Scene, scene_y: int
+    ) -> tuple[Scene, int, float, float, float]:
+        scene_top, _ = scene.get_aspect_boundries()
+        horizontal_step, vertical_step = scene.get_horizontal_and_vertical_steps()
+        return (scene, scene_y, scene_top, vertical_step, horizontal_step)
 
     def _render_row(
-        self, params: tuple[Scene, int, float, float, float]
+        self,
+        params: tuple[Scene, int, float, float, float],
+        start: int = 0,
+        stop: Optional[int] = None,
+        step: int = 1,
+        ids: Optional[list[int]] = None,
+        paths: Optional[list[list[Hit]]] = None,
     ) -> tuple[int, list[Colour]]:
+        """
+        Renders every `step`th pixel of a row from column `start` up to `stop`, by
+        default the whole row.  The id of the object each pixel hit is appended to
+        `ids` if given, and the hits along its reflections to `paths`.
+        """
         scene, scene_y, scene_top, vertical_step, horizontal_step = params
+        columns = range(start, scene.width if stop is None else stop, step)
         y = scene_top + scene_y * vertical_step
+        # Seed by the first pixel so Russian roulette renders the same whichever
+        # worker it's on
+        self._random.seed(scene_y * scene.width + start)
+        self.trace_stats.primary_rays += len(columns)
+        if paths is None and self._uses_kernels():
+            return (
+                scene_y,
+                self._render_row_compiled(scene, y, horizontal_step, columns, ids),
+            )
         row = []
-        for scene_x in range(scene.width):
+        for scene_x in columns:
             x = SCENE_ABSOLUTE_TOP + scene_x * horizontal_step
             ray = Ray(scene.camera, Point(x=x, y=y, z=0) - scene.camera)
-            row.append(self._render_pixel(ray=ray, scene=scene))
+            if self.linear:
+                row.append(quantize(self._render_radiance(ray=ray, scene=scene)))
+            elif paths is None:
+                row.append(self._render_pixel(ray=ray, scene=scene))
+            else:
+                path = self._trace_path(ray=ray, scene=scene)
+                row.append(self._shade_path(scene=scene, path=path))
+                paths.append(path)
+            if ids is not None:
+                ids.append(NO_OBJECT if self._primary is None else self._primary)
         return (scene_y, row)
 
-    def _render_pixel(self, ray: Ray, scene: Scene, depth: int = 0) -> Colour:
+    def _uses_kernels(self) -> bool:
+        """
+        Returns whether pixels can be traced by the compiled kernels, which shade as
+        `Shader` does but don't play Russian roulette, shade in linear light or time
+        stages.
+        """
+        return (
+            kernels is not None
+            and type(self.shader) is Shader
+            and not self.russian_roulette
+            and not self.linear
+            and self.timings is None
+        )
+
+    def _render_row_compiled(
+        self,
+        scene: Scene,
+        y: float,
+        horizontal_step: float,
+        columns: range,
+        ids: Optional[list[int]],
+    ) -> list[Colour]:
+        """
+        Renders the columns of a row with the compiled kernels, which trace and
+        shade exactly as `_render_pixel` does without holding the GIL, and record
+        the same dependencies.
+        """
+        compiled = compile_scene(scene)
+        if self._kernels is None or self._kernels[0] is not compiled:
+            self._kernels = (compiled, kernels.SceneKernels(compiled))
+        pixels, primaries, trace_counts, shadow_counts = self._kernels[1].render_row(
+            y=y,
+            left=SCENE_ABSOLUTE_TOP,
+            step=horizontal_step,
+            start=columns.start,
+            stop=columns.stop,
+            stride=columns.step,
+            max_depth=self.max_depth,
+            use_bvh=self.use_bvh,
+            occluders=self.shader.occluders(scene),
+            reflection_delta=REFLECTION_DELTA,
+            phong_coefficient=PHONG_COEFFICENT,
+            dependencies=self._dependencies,
+        )
+        _add_fields(self.trace_stats, TraceStats(**trace_counts))
+        _add_fields(self.shader.shadow_stats, ShadowStats(**shadow_counts))
+        if ids is not None:
+            ids.extend(primaries)
+        return [
+            Colour(r=pixels[offset], g=pixels[offset + 1], b=pixels[offset + 2])
+            for offset in range(0, len(pixels), CHANNELS)
+        ]
+
+    def _render_pixel(
+        self,
+        ray: Ray,
+        scene: Scene,
+        depth: int = 0,
+        throughput: float = 1.0,
+        path: tuple[tuple[Colour, float], ...] = (),
+    ) -> Colour:
+        """
+        Returns the colour seen along the ray, following its reflections.
+
+        `throughput` is the weight the pixel gives this ray, the product of the
+        reflection of every surface on the way, and `path` the colour and
+        reflection of each of those surfaces.  A reflection isn't traced once the
+        path shows it can't change the pixel.
+        """
         pixel = Colour(r=0, g=0, b=0)
-        distance, object = self._find_nearest(ray=ray, scene=scene)
-        if object is None or distance is None:
+        hit = self._hit(ray=ray, scene=scene, depth=depth)
+        if hit is None:
             # The ray isn't hitting at any object that needs rendering.
             # Return black (nothing)
             return pixel
+        index, position, normal = hit
+        pixel += self._shade(
+            self.shader.shade,
+            scene=scene,
+            index=index,
+            position=position,
+            normal=normal,
+        )
+        if depth > self.max_depth:
+            return pixel
+
+        compiled = compile_scene(scene)
+        scale = compiled.reflection[compiled.materials[index]]
+        if _is_settled(path + ((pixel, scale),)):
+            self.trace_stats.terminated += 1
+            return pixel
+        survived = self._roulette(scale=scale, weight=throughput * scale)
+        if survived is None:
+            return pixel
+        scale, weight = survived
+
+        reflection = self._reflect(ray=ray, position=position, normal=normal)
+        timings = self.timings
+        if timings is not None and not depth:
+            started = time.perf_counter()
+        pixel += (
+            self._render_pixel(
+                ray=reflection,
+                scene=scene,
+                depth=depth + 1,
+                throughput=weight,
+                path=path + ((pixel, scale),),
+            )
+            * scale
+        )
+        if timings is not None and not depth:
+            # Nested reflections are already included in the first one
+            timings.reflect += time.perf_counter() - started
+        return pixel
+
+    def _render_radiance(
+        self, ray: Ray, scene: Scene, depth: int = 0, throughput: float = 1.0
+    ) -> Radiance:
+        """
+        Returns the light seen along the ray with `linear`, following its
+        reflections as `_render_pixel` does but adding them up in floating point,
+        so the pixel is only quantized once.
+
+        A reflection isn't traced once so little of it reaches the pixel that even
+        white would add less than `LINEAR_CUTOFF` to any channel.
+        """
+        hit = self._hit(ray=ray, scene=scene, depth=depth)
+        if hit is None:
+            return (0.0, 0.0, 0.0)
+        index, position, normal = hit
+        radiance = self._shade(
+            self.shader.radiance,
+            scene=scene,
+            index=index,
+            position=position,
+            normal=normal,
+        )
+        if depth > self.max_depth:
+            return radiance
+
+        compiled = compile_scene(scene)
+        scale = compiled.reflection[compiled.materials[index]]
+        if throughput * scale * MAX_COLOUR < LINEAR_CUTOFF:
+            self.trace_stats.terminated += 1
+            return radiance
+        survived = self._roulette(scale=scale, weight=throughput * scale)
+        if survived is None:
+            return radiance
+        scale, weight = survived
+
+        reflection = self._reflect(ray=ray, position=position, normal=normal)
+        timings = self.timings
+        if timings is not None and not depth:
+            started = time.perf_counter()
+        r, g, b = self._render_radiance(
+            ray=reflection, scene=scene, depth=depth + 1, throughput=weight
+        )
+        if timings is not None and not depth:
+            timings.reflect += time.perf_counter() - started
+        return (
+            radiance[0] + r * scale,
+            radiance[1] + g * scale,
+            radiance[2] + b * scale,
+        )
+
+    def _hit(
+        self, ray: Ray, scene: Scene, depth: int
+    ) -> Optional[tuple[int, Point, Point]]:
+        """
+        Returns the index of the nearest object the ray hits, the position it hits
+        it and the normal there, or None if it hits nothing, recording it as the
+        primary hit of the pixel and as what the tile depends on.
+        """
+        # Stages are only timed with `collect_stats`
+        timings = self.timings
+        started = time.perf_counter() if timings is not None else 0.0
+        distance, index = self._find_nearest(ray=ray, scene=scene)
+        if timings is not None:
+            timings.intersect += time.perf_counter() - started
+        if not depth:
+            self._primary = index
+        dependencies = self._dependencies
+        if dependencies is not None:
+            dependencies.add_segment(
+                origin=vector(ray.origin),
+                direction=vector(ray.direction),
+                length=math.inf if distance is None else distance,
+            )
+            if index is not None:
+                dependencies.objects.add(index)
+        if index is None or distance is None:
+            return None
         position = ray.origin + ray.direction * distance
-        normal = object.normal(position)
-        pixel += self.shader.shade(scene=scene, obj_hit=object, hit_pos=position)
-        if depth <= self.max_depth:
-            # Calculate reflections
-            ray_position = position + normal * REFLECTION_DELTA
-            ray_direction = (
-                ray.direction - 2 * ray.direction.dot_product(normal) * normal
+        normal = Point(
+            *compile_scene(scene).normal(index=index, position=vector(position))
+        )
+        return index, position, normal
+
+    def _shade(
+        self,
+        shade: Callable[..., T],
+        scene: Scene,
+        index: int,
+        position: Point,
+        normal: Point,
+    ) -> T:
+        """Shades a hit with `shade`, the shader's colour or its radiance"""
+        timings = self.timings
+        started = time.perf_counter() if timings is not None else 0.0
+        shaded = shade(scene=scene, index=index, hit_pos=position, normal=normal)
+        self.trace_stats.shades += 1
+        if self._dependencies is not None:
+            self._dependencies.shaded = True
+        if timings is not None:
+            timings.shade += time.perf_counter() - started
+        return shaded
+
+    def _roulette(self, scale: float, weight: float) -> Optional[tuple[float, float]]:
+        """
+        Returns the scale and weight of a reflection after Russian roulette, scaled
+        up if it survived a game, or None if it didn't.
+        """
+        if self.russian_roulette and weight < ROULETTE_THRESHOLD:
+            survival = weight / ROULETTE_THRESHOLD
+            if self._random.random() >= survival:
+                self.trace_stats.roulette_terminated += 1
+                return None
+            return scale / survival, ROULETTE_THRESHOLD
+        return scale, weight
+
+    def _reflect(self, ray: Ray, position: Point, normal: Point) -> Ray:
+        self.trace_stats.reflection_rays += 1
+        return Ray(
+            origin=position + normal * REFLECTION_DELTA,
+            direction=ray.direction - 2 * ray.direction.dot_product(normal) * normal,
+        )
+
+    def _trace_path(self, ray: Ray, scene: Scene) -> list[Hit]:
+        """
+        Returns the hits along the ray's reflections, followed as deep as
+        `_render_pixel` could go whatever the materials, along with the lights
+        shadowed at each.
+        """
+        path: list[Hit] = []
+        timings = self.timings
+        dependencies = self._dependencies
+        while True:
+            started = time.perf_counter() if timings is not None else 0.0
+            distance, index = self._find_nearest(ray=ray, scene=scene)
+            if timings is not None:
+                timings.intersect += time.perf_counter() - started
+            if not path:
+                self._primary = index
+            if dependencies is not None:
+                dependencies.add_segment(
+                    origin=vector(ray.origin),
+                    direction=vector(ray.direction),
+                    length=math.inf if distance is None else distance,
+                )
+            if index is None or distance is None:
+                return path
+            position = ray.origin + ray.direction * distance
+            normal = Point(
+                *compile_scene(scene).normal(index=index, position=vector(position))
             )
-            reflection = Ray(origin=ray_position, direction=ray_direction)
-            pixel += (
-                self._render_pixel(ray=reflection, scene=scene, depth=depth + 1)
-                * object.material.reflection
+            path.append(
+                (index, position, normal, self._shadow_mask(scene, position, normal))
+            )
+            if dependencies is not None:
+                dependencies.objects.add(index)
+                dependencies.shaded = True
+            if len(path) == self.gbuffer_depth:
+                return path
+            ray = self._reflect(ray=ray, position=position, normal=normal)
+
+    def _shadow_mask(self, scene: Scene, position: Point, normal: Point) -> int:
+        timings = self.timings
+        started = time.perf_counter() if timings is not None else 0.0
+        mask = self.shader.shadow_mask(scene=scene, hit_pos=position, normal=normal)
+        if timings is not None:
+            timings.shade += time.perf_counter() - started
+        return mask
+
+    def _shade_path(
+        self,
+        scene: Scene,
+        path: Sequence[Hit],
+        depth: int = 0,
+        throughput: float = 1.0,
+        settled: tuple[tuple[Colour, float], ...] = (),
+    ) -> Colour:
+        """
+        Returns the colour of a pixel whose reflections hit `path`, shading and
+        stopping where `_render_pixel` would but without tracing any rays.
+        """
+        pixel = Colour(r=0, g=0, b=0)
+        if depth == len(path):
+            return pixel
+        index, position, normal, shadowed = path[depth]
+        timings = self.timings
+        started = time.perf_counter() if timings is not None else 0.0
+        pixel += self.shader.shade(
+            scene=scene,
+            index=index,
+            hit_pos=position,
+            normal=normal,
+            shadowed=shadowed,
+        )
+        self.trace_stats.shades += 1
+        if timings is not None:
+            timings.shade += time.perf_counter() - started
+        if depth > self.max_depth:
+            return pixel
+
+        compiled = compile_scene(scene)
+        scale = compiled.reflection[compiled.materials[index]]
+        if _is_settled(settled + ((pixel, scale),)):
+            self.trace_stats.terminated += 1
+            return pixel
+        survived = self._roulette(scale=scale, weight=throughput * scale)
+        if survived is None:
+            return pixel
+        scale, weight = survived
+        pixel += (
+            self._shade_path(
+                scene=scene,
+                path=path,
+                depth=depth + 1,
+                throughput=weight,
+                settled=settled + ((pixel, scale),),
             )
+            * scale
+        )
         return pixel
 
     def _find_nearest(
         self, ray: Ray, scene: Scene
-    ) -> tuple[Optional[float], Optional[Primitive]]:
-        dist_min = None
-        obj_hit = None
-        for obj in scene.objects:
-            dist = obj.intersects(ray)
-            if dist is not None and (obj_hit is None or dist < dist_min):
-                dist_min = dist
-                obj_hit = obj
-        return dist_min, obj_hit
+    ) -> tuple[Optional[float], Optional[int]]:
+        """Returns the distance to, and the index of the nearest object hit"""
+        compiled = compile_scene(scene)
+        tests = compiled.bvh.tests
+        nearest = compiled.find_nearest(
+            origin=vector(ray.origin),
+            direction=vector(ray.direction),
+            use_bvh=self.use_bvh,
+        )
+        if self.use_bvh:
+            self.trace_stats.intersection_tests += compiled.bvh.tests - tests
+        else:
+            self.trace_stats.intersection_tests += len(compiled)
+        return nearest
+
+
+def _is_settled(path: Sequence[tuple[Colour, float]]) -> bool:
+    """
+    Returns whether a pixel is the same however bright the next reflection along
+    `path` is.
+
+    Reflections are folded back into the pixel with the truncation and clamping of
+    `Colour`, so this folds both black and white up the path and compares the
+    results a channel at a time.
+    """
+    for channel in ("r", "g", "b"):
+        darkest, brightest = MIN_COLOUR, MAX_COLOUR
+        for colour, scale in reversed(path):
+            value = getattr(colour, channel)
+            darkest = min(value + min(int(darkest * scale), MAX_COLOUR), MAX_COLOUR)
+            brightest = min(value + min(int(brightest * scale), MAX_COLOUR), MAX_COLOUR)
+        if darkest != brightest:
+            return False
+    return True
+
+
+def _finished_rows(
+    tiles: Sequence[Tile], finished: Iterable[Tile], height: int
+) -> Iterator[int]:
+    """
+    Yields the index of each row across the tiles once every tile across it has
+    finished.
+    """
+    # Tiles still to come back across each row
+    remaining = [0] * height
+    for tile in tiles:
+        for scene_y in tile.rows:
+            remaining[scene_y] += 1
+    for tile in finished:
+        for scene_y in tile.rows:
+            remaining[scene_y] -= 1
+            if not remaining[scene_y]:
+                yield scene_y
+
+
+def _average(totals: Radiance, count: int, linear: bool = False) -> Colour:
+    """
+    The colour of `count` samples with the given channel totals, rounded.  With
+    `linear` the totals are radiance, quantized once they are averaged.
+    """
+    r, g, b = totals
+    if linear:
+        return quantize((r / count, g / count, b / count))
+    return Colour(
+        r=(r + count // 2) // count,
+        g=(g + count // 2) // count,
+        b=(b + count // 2) // count,
+    )
+
+
+def _add_fields(total: Any, other: Any) -> None:
+    for stat in fields(total):
+        setattr(total, stat.name, getattr(total, stat.name) + getattr(other, stat.name))
+
+
+# Scenes published for workers in this process, by the shared memory holding the
+# engine to render them with
+_shared_scenes: dict[str, Scene] = {}
+
+
+class _WorkerJobs(threading.local):
+    """The engines and scenes a worker has loaded, by the memory they came from"""
+
+    def __init__(self) -> None:
+        self.jobs: dict[str, tuple[RenderEngine, Scene]] = {}
+
+
+_worker_jobs = _WorkerJobs()
+
+
+def _unpublish(shared_memory: SharedMemory) -> None:
+    _shared_scenes.pop(shared_memory.name, None)
+    shared_memory.close()
+    shared_memory.unlink()
+
+
+def _load_job(key: str) -> tuple[RenderEngine, Scene]:
+    """
+    Returns the engine and scene published under `key`, loading them the first time
+    this worker is asked for them.  Each worker thread loads its own engine, while
+    threads of the process which published the scene share it.
+    """
+    jobs = _worker_jobs.jobs
+    if key not in jobs:
+        shared_memory = SharedMemory(name=key)
+        try:
+            engine, scene = pickle.loads(shared_buffer(shared_memory))
+        finally:
+            shared_memory.close()
+        jobs[key] = (engine, _shared_scenes[key] if scene is None else scene)
+        while len(jobs) > MAX_PUBLISHED_SCENES:
+            del jobs[next(iter(jobs))]
+    return jobs[key]
+
+
+def _render_task(
+    task: RenderTask,
+) -> tuple[Tile, Optional[TileDependencies], Optional[RenderStats]]:
+    """
+    Renders a tile of a published scene into the shared framebuffer, returning the
+    tile, what it depends on if the engine records that, and its stats if the
+    engine collects them.  Runs in the worker processes.
+    """
+    key, framebuffer_name, tile, spacing, first = task
+    dependencies, stats = _run_job(
+        key=key,
+        framebuffer_name=framebuffer_name,
+        work=lambda engine, scene, framebuffer: engine._render_tile(
+            scene=scene,
+            tile=tile,
+            framebuffer=framebuffer,
+            spacing=spacing,
+            first=first,
+        ),
+    )
+    return tile, dependencies, stats
+
+
+def _relight_task(task: RelightTask) -> tuple[Tile, Optional[RenderStats]]:
+    """Shades a tile again from the G-buffer.  Runs in the worker processes."""
+    key, framebuffer_name, tile, reuse_shadows = task
+    _, stats = _run_job(
+        key=key,
+        framebuffer_name=framebuffer_name,
+        work=lambda engine, scene, framebuffer: engine._relight_tile(
+            scene=scene,
+            tile=tile,
+            framebuffer=framebuffer,
+            reuse_shadows=reuse_shadows,
+        ),
+    )
+    return tile, stats
+
+
+def _edges_task(
+    task: tuple[str, str, Tile],
+) -> tuple[Tile, list[tuple[int, int]], Optional[RenderStats]]:
+    """Finds the pixels of a tile to anti-alias.  Runs in the worker processes."""
+    key, framebuffer_name, tile = task
+    edges, stats = _run_job(
+        key=key,
+        framebuffer_name=framebuffer_name,
+        work=lambda engine, scene, framebuffer: engine._find_edges(
+            framebuffer=framebuffer, tile=tile
+        ),
+    )
+    return tile, edges, stats
+
+
+def _refine_task(
+    task: tuple[str, str, Tile, list[tuple[int, int]]],
+) -> tuple[Tile, Optional[RenderStats]]:
+    """Anti-aliases pixels of a tile.  Runs in the worker processes."""
+    key, framebuffer_name, tile, pixels = task
+    _, stats = _run_job(
+        key=key,
+        framebuffer_name=framebuffer_name,
+        work=lambda engine, scene, framebuffer: engine._refine_pixels(
+            scene=scene, pixels=pixels, framebuffer=framebuffer
+        ),
+    )
+    return tile, stats
+
+
+def _run_job(
+    key: str,
+    framebuffer_name: str,
+    work: Callable[[RenderEngine, Scene, Framebuffer], T],
+) -> tuple[T, Optional[RenderStats]]:
+    """
+    Loads a published job and attaches to its framebuffer to do some work on it,
+    returning the result and, if the engine collects them, its stats.
+    """
+    started = time.perf_counter()
+    engine, scene = _load_job(key)
+    loaded = time.perf_counter()
+    framebuffer = Framebuffer(
+        width=scene.width,
+        height=scene.height,
+        name=framebuffer_name,
+        ids=engine.anti_aliasing,
+        gbuffer_depth=engine.gbuffer_depth,
+    )
+    try:
+        result = work(engine, scene, framebuffer)
+    finally:
+        framebuffer.close()
+    return result, engine._take_stats(
+        load=loaded - started, busy=time.perf_counter() - started
+    )
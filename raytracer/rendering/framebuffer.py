@@ -0,0 +1,189 @@
+from array import array
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Final, Optional, Sequence, cast
+
+import numpy as np
+
+from raytracer.core.types.geometry import Point
+from raytracer.core.types.imaging import CHANNELS, Canvas, Colour
+
+# Object ids are kept as C ints
+ID_FORMAT: Final = "i"
+ID_SIZE = array(ID_FORMAT).itemsize
+# A hit along the reflections of a pixel in the G-buffer: the index of the object hit,
+# where and with what normal, and a bit for each light shadowed there
+HIT = np.dtype(
+    [
+        ("object", "<i4"),
+        ("position", "<f4", (3,)),
+        ("normal", "<f4", (3,)),
+        ("shadowed", "<u8"),
+    ]
+)
+# The object of the hits after the last along a pixel's reflections
+NO_HIT = -1
+# Lights whose shadows a hit can hold
+GBUFFER_LIGHTS = HIT["shadowed"].itemsize * 8
+
+# The object index, position, normal and shadowed lights of a hit
+Hit = tuple[int, Point, Point, int]
+
+
+class Framebuffer:
+    """
+    An RGB image in shared memory, which render workers write pixels into directly
+    rather than sending them back to the parent process.
+
+    Created without a name, the framebuffer allocates the shared memory and releases
+    it when closed.  Created with the name of an existing framebuffer, it attaches
+    to that memory instead.
+
+    With `ids`, the index of the object each pixel's primary ray hit is kept after
+    the pixels, for finding the edges of objects.  With a `gbuffer_depth`, up to that
+    many hits along the reflections of each pixel are kept after those, so the image
+    can be shaded again without tracing its rays.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        name: Optional[str] = None,
+        ids: bool = False,
+        gbuffer_depth: int = 0,
+    ) -> None:
+        self.width = width
+        self.height = height
+        self.has_ids = ids
+        self.gbuffer_depth = gbuffer_depth
+        self._owner = name is None
+        size = width * height * CHANNELS
+        if ids:
+            size += width * height * ID_SIZE
+        size += width * height * gbuffer_depth * HIT.itemsize
+        self._shared_memory = SharedMemory(name=name, create=self._owner, size=size)
+
+    def __enter__(self) -> "Framebuffer":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    @property
+    def name(self) -> str:
+        return self._shared_memory.name
+
+    @property
+    def buffer(self) -> memoryview:
+        """The packed RGB bytes of every row, top to bottom"""
+        return shared_buffer(self._shared_memory)[: self.width * self.height * CHANNELS]
+
+    @property
+    def ids(self) -> Optional[memoryview]:
+        """The object id of every pixel, row by row, if the framebuffer keeps them"""
+        if not self.has_ids:
+            return None
+        first = self.width * self.height * CHANNELS
+        last = first + self.width * self.height * ID_SIZE
+        return shared_buffer(self._shared_memory)[first:last].cast(ID_FORMAT)
+
+    @property
+    def gbuffer(self) -> Optional[np.ndarray]:
+        """
+        The hits along the reflections of every pixel, by row, column and depth, if
+        the framebuffer keeps them.  It must be dropped before the framebuffer is
+        closed.
+        """
+        if not self.gbuffer_depth:
+            return None
+        first = self.width * self.height * (CHANNELS + (ID_SIZE if self.has_ids else 0))
+        return np.frombuffer(
+            shared_buffer(self._shared_memory),
+            dtype=HIT,
+            count=self.width * self.height * self.gbuffer_depth,
+            offset=first,
+        ).reshape(self.height, self.width, self.gbuffer_depth)
+
+    @property
+    def canvas(self) -> Canvas:
+        """
+        A canvas over the shared memory itself.  It must be dropped before the
+        framebuffer is closed.
+        """
+        return Canvas(width=self.width, height=self.height, buffer=self.buffer)
+
+    def row(self, index: int) -> memoryview:
+        """The packed RGB bytes of a single row"""
+        return self.canvas.row(index)
+
+    def set_row(
+        self, index: int, row: Sequence[Colour], start: int = 0, step: int = 1
+    ) -> None:
+        self.canvas.set_row(index=index, row=row, start=start, step=step)
+
+    def set_ids(
+        self, index: int, ids: Sequence[int], start: int = 0, step: int = 1
+    ) -> None:
+        """Sets the object ids of a row, like `set_row`"""
+        first = index * self.width + start
+        last = first + (len(ids) - 1) * step + 1
+        cast(memoryview, self.ids)[first:last:step] = array(ID_FORMAT, ids)
+
+    def set_hits(
+        self, index: int, paths: Sequence[Sequence[Hit]], start: int = 0, step: int = 1
+    ) -> None:
+        """
+        Sets the hits along the reflections of each pixel of a row, like `set_row`.
+        Paths shorter than the G-buffer are ended with `NO_HIT`.
+        """
+        hits = np.zeros((len(paths), self.gbuffer_depth), dtype=HIT)
+        hits["object"] = NO_HIT
+        for column, path in enumerate(paths):
+            for depth, (obj, position, normal, shadowed) in enumerate(path):
+                hits[column, depth] = (
+                    obj,
+                    (position.x, position.y, position.z),
+                    (normal.x, normal.y, normal.z),
+                    shadowed,
+                )
+        columns = slice(start, start + (len(paths) - 1) * step + 1, step)
+        cast(np.ndarray, self.gbuffer)[index, columns] = hits
+
+    def hits(
+        self, index: int, start: int = 0, stop: Optional[int] = None
+    ) -> list[list[Hit]]:
+        """The hits along the reflections of each pixel of a row from `start`"""
+        hits = cast(np.ndarray, self.gbuffer)[index, start:stop]
+        paths = []
+        for objects, positions, normals, shadowed in zip(
+            hits["object"].tolist(),
+            hits["position"].tolist(),
+            hits["normal"].tolist(),
+            hits["shadowed"].tolist(),
+        ):
+            path = []
+            for obj, position, normal, lights in zip(
+                objects, positions, normals, shadowed
+            ):
+                if obj == NO_HIT:
+                    break
+                path.append((obj, Point(*position), Point(*normal), lights))
+            paths.append(path)
+        return paths
+
+    def to_canvas(self) -> Canvas:
+        """A copy of the image which outlives the framebuffer"""
+        return self.canvas.copy()
+
+    def close(self) -> None:
+        """
+        Detaches from the shared memory, releasing it if this framebuffer created it.
+        """
+        self._shared_memory.close()
+        if self._owner:
+            self._shared_memory.unlink()
+
+
+def shared_buffer(shared_memory: SharedMemory) -> memoryview:
+    # `buf` is only ever None once the shared memory has been closed
+    return cast(memoryview, shared_memory.buf)
@@ -0,0 +1,76 @@
+import json
+import os
+import struct
+import tempfile
+from typing import Optional, Sequence, cast
+
+import numpy as np
+
+from raytracer.core.types.geometry import Point
+from raytracer.rendering.framebuffer import Framebuffer
+
+# Length of the description of the G-buffer, ahead of it and its hits
+HEADER = struct.Struct("<I")
+
+
+def save_gbuffer(
+    path: str, framebuffer: Framebuffer, geometry: str, lights: Sequence[Point]
+) -> None:
+    """
+    Saves the framebuffer's G-buffer to a file, along with the `geometry_key` of
+    the scene it was rendered from and the positions of the lights its shadows
+    were found for.
+    """
+    gbuffer = cast(np.ndarray, framebuffer.gbuffer)
+    description = json.dumps(
+        {
+            "geometry": geometry,
+            "width": framebuffer.width,
+            "height": framebuffer.height,
+            "depth": framebuffer.gbuffer_depth,
+            "lights": [[light.x, light.y, light.z] for light in lights],
+        }
+    ).encode()
+    # Written aside and moved into place so a reader never sees half a G-buffer
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as f:
+        f.write(HEADER.pack(len(description)))
+        f.write(description)
+        f.write(gbuffer.data)
+    os.replace(f.name, path)
+
+
+def load_gbuffer(
+    path: str, framebuffer: Framebuffer, geometry: str
+) -> Optional[list[Point]]:
+    """
+    Loads a G-buffer saved from a scene with the given `geometry_key` into the
+    framebuffer, returning the positions of the lights its shadows were found for.
+
+    Returns None, leaving the framebuffer's G-buffer in no particular state, if
+    there is no file, it holds a G-buffer of another scene or it was cut short.
+    """
+    expected = {
+        "geometry": geometry,
+        "width": framebuffer.width,
+        "height": framebuffer.height,
+        "depth": framebuffer.gbuffer_depth,
+    }
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) != HEADER.size:
+                return None
+            (length,) = HEADER.unpack(header)
+            try:
+                description = json.loads(f.read(length))
+            except ValueError:
+                return None
+            if {key: description.get(key) for key in expected} != expected:
+                return None
+            hits = cast(np.ndarray, framebuffer.gbuffer).reshape(-1).view(np.uint8).data
+            if f.readinto(hits) != len(hits) or f.read(1):
+                return None
+    except FileNotFoundError:
+        return None
+    return [Point(*position) for position in description["lights"]]
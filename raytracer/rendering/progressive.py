@@ -0,0 +1,43 @@
+from raytracer.core.types.imaging import CHANNELS, Canvas
+from raytracer.rendering.tiles import Tile
+
+# Spacing between the pixels traced by each pass of a progressive render, tracing
+# 1/64, 1/16 and 1/4 of the pixels before the rest.  Each spacing halves the last.
+PASSES = (8, 4, 2, 1)
+
+
+def pass_spans(tile: Tile, spacing: int, first: bool = True) -> list[tuple[int, range]]:
+    """
+    Returns the columns of each row of the tile traced by a pass, as (row, columns).
+
+    A pass traces the pixels whose row and column are both multiples of `spacing`,
+    except for those already traced by the pass before it, at twice the spacing,
+    unless it is the `first`.
+    """
+    spans = []
+    for scene_y in range(tile.top + -tile.top % spacing, tile.bottom, spacing):
+        if first or scene_y % (2 * spacing):
+            offset, step = 0, spacing
+        else:
+            # Every other column was traced by the previous pass
+            offset, step = spacing, 2 * spacing
+        start = tile.left + (offset - tile.left) % step
+        if start < tile.right:
+            spans.append((scene_y, range(start, tile.right, step)))
+    return spans
+
+
+def fill_gaps(canvas: Canvas, spacing: int) -> None:
+    """
+    Fills each `spacing` by `spacing` square of the canvas with the colour of the
+    pixel in its top left corner, the only one traced so far.
+    """
+    for top in range(0, canvas.height, spacing):
+        source = bytes(canvas.row(top))
+        pixels = []
+        for x in range(0, canvas.width, spacing):
+            first, last = x * CHANNELS, (x + 1) * CHANNELS
+            pixels.append(source[first:last] * min(spacing, canvas.width - x))
+        row = b"".join(pixels)
+        for scene_y in range(top, min(top + spacing, canvas.height)):
+            canvas.row(scene_y)[:] = row
@@ -1,74 +1,434 @@
-from raytracer.core.types.entities import BaseMaterial, Light, Primitive, Ray, Scene
+import math
+from array import array
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional
+
+from raytracer.core.constants import MAX_COLOUR, MIN_COLOUR
+from raytracer.core.types.bvh import Vector3
+from raytracer.core.types.compiled import (
+    CompiledScene,
+    compile_scene,
+    normalize,
+    single,
+    vector,
+)
+from raytracer.core.types.entities import Scene
 from raytracer.core.types.geometry import Point
-from raytracer.core.types.imaging import Colour
+from raytracer.core.types.imaging import Colour, Radiance
+from raytracer.rendering.constants import REFLECTION_DELTA
+from raytracer.rendering.dependencies import TileDependencies
 
 PHONG_COEFFICENT = 50
+# Stands in the occluder cache for a light nothing has blocked yet
+NO_OCCLUDER = -1
+
+# The red, green and blue of a colour as it is being shaded
+Pixel = tuple[int, int, int]
+
+
+@dataclass
+class ShadowStats:
+    """Counts of the shadow rays traced while shading"""
+
+    # Shadow rays traced towards a light
+    rays: int = 0
+    # Rays which found something between the surface and the light
+    occluded: int = 0
+    # Occluded rays answered by the object which last blocked that light
+    cache_hits: int = 0
+    # Lights behind the surface, which are in shadow without tracing a ray
+    back_facing: int = 0
+    # Intersection tests made by shadow rays, including those against the cache
+    tests: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of shadow rays which were occluded"""
+        return self.occluded / self.rays if self.rays else 0.0
+
+    @property
+    def cache_hit_rate(self) -> float:
+        """The fraction of occluded shadow rays answered by the occluder cache"""
+        return self.cache_hits / self.occluded if self.occluded else 0.0
 
 
 class Shader:
-    def shade(self, scene: Scene, obj_hit: Primitive, hit_pos: Point) -> Colour:
-        """
-        Returns a colour calculated on the light sources interacting with object.
-
-        Runs diffusion and phong shading.
-        """
-        material = obj_hit.material
-        normal = obj_hit.normal(hit_pos)
-        colour = material.ambient * Colour.from_hex("#000000")
-        to_cam = scene.camera - hit_pos
-        for light in scene.lights:
-            colour += self._diffuse(
-                light=light,
-                material=material,
-                hit_pos=hit_pos,
-                normal=normal,
+    def __init__(self) -> None:
+        self.shadow_stats = ShadowStats()
+        # Index of the object which last blocked each light, or `NO_OCCLUDER`, by
+        # index of the light.  Neighbouring pixels are usually shadowed by the same
+        # object, so it is tested before searching the whole scene.
+        self._occluders = array("l")
+        self._occluders_scene: Optional[Scene] = None
+        # Where shadow rays record what they depend on, set by the engine while it
+        # renders a tile recording dependencies
+        self.dependencies: Optional[TileDependencies] = None
+
+    def __getstate__(self) -> dict:
+        # Worker processes start with their own counters and cache
+        state = self.__dict__.copy()
+        state["shadow_stats"] = ShadowStats()
+        state["_occluders"] = array("l")
+        state["_occluders_scene"] = None
+        state["dependencies"] = None
+        return state
+
+    @property
+    def settings(self) -> dict[str, Any]:
+        """The constants which decide how this shader colours a hit"""
+        return {
+            "type": type(self).__name__,
+            "phong_coefficient": PHONG_COEFFICENT,
+            "reflection_delta": REFLECTION_DELTA,
+        }
+
+    def occluders(self, scene: Scene) -> array:
+        """
+        Returns the index of the object which last blocked each light of the scene,
+        starting afresh for a new scene.  The kernels update it in place.
+        """
+        if scene is not self._occluders_scene:
+            self._occluders = array("l", [NO_OCCLUDER]) * len(scene.lights)
+            self._occluders_scene = scene
+        return self._occluders
+
+    def shade(
+        self,
+        scene: Scene,
+        index: int,
+        hit_pos: Point,
+        normal: Optional[Point] = None,
+        shadowed: Optional[int] = None,
+    ) -> Colour:
+        """
+        Returns a colour calculated on the light sources interacting with object
+        `index` of the scene.
+
+        Runs diffusion and phong shading for each light which isn't blocked by
+        another object.  Given the `shadowed` lights, as from `shadow_mask`, no
+        shadow rays are traced.
+
+        Shading reads the scene's compiled arrays.  Each step truncates and clamps
+        as multiplying and adding `Colour`s would, so only the result is built as
+        one.
+        """
+        compiled, material, position, surface_normal, to_cam = self._surface(
+            scene=scene, index=index, hit_pos=hit_pos, normal=normal
+        )
+        # The ambient light is black, so every material starts from black
+        # whatever its ambient coefficient
+        colour = (MIN_COLOUR, MIN_COLOUR, MIN_COLOUR)
+        for light_index, to_light in self._lit(
+            scene=scene, position=position, normal=surface_normal, shadowed=shadowed
+        ):
+            colour = _add(
+                colour,
+                self._diffuse(
+                    compiled=compiled,
+                    material=material,
+                    position=position,
+                    normal=surface_normal,
+                    to_light=to_light,
+                ),
             )
-            colour += self._specular(
-                light=light,
-                material=material,
-                normal=normal,
-                hit_pos=hit_pos,
-                to_cam=to_cam,
+            colour = _add(
+                colour,
+                self._specular(
+                    compiled=compiled,
+                    light_index=light_index,
+                    material=material,
+                    normal=surface_normal,
+                    to_light=to_light,
+                    to_cam=to_cam,
+                ),
             )
-        return colour
+        return Colour(r=colour[0], g=colour[1], b=colour[2])
 
-    def _diffuse(
+    def radiance(
         self,
-        light: Light,
-        material: BaseMaterial,
+        scene: Scene,
+        index: int,
         hit_pos: Point,
-        normal: Point,
-    ) -> Colour:
+        normal: Optional[Point] = None,
+        shadowed: Optional[int] = None,
+    ) -> Radiance:
+        """
+        Returns the light reaching the camera from object `index` of the scene,
+        shaded as `shade` does but in floating point, without truncating or clamping
+        any step, so the pixel it adds to need only be quantized once.
+        """
+        compiled, material, position, surface_normal, to_cam = self._surface(
+            scene=scene, index=index, hit_pos=hit_pos, normal=normal
+        )
+        surface_r, surface_g, surface_b = compiled.colour_at(
+            material=material, position=position
+        )
+        diffuse, specular = compiled.diffuse[material], compiled.specular[material]
+        light_colours = compiled.light_colours
+        r = g = b = 0.0
+        for light_index, to_light in self._lit(
+            scene=scene, position=position, normal=surface_normal, shadowed=shadowed
+        ):
+            lambert = diffuse * max(_dot(surface_normal, to_light), 0)
+            phong = (
+                specular
+                * max(_dot(surface_normal, _half_vector(to_light, to_cam)), 0)
+                ** PHONG_COEFFICENT
+            )
+            offset = light_index * 3
+            r += surface_r * lambert + light_colours[offset] * phong
+            g += surface_g * lambert + light_colours[offset + 1] * phong
+            b += surface_b * lambert + light_colours[offset + 2] * phong
+        return (r, g, b)
+
+    def shadow_mask(self, scene: Scene, hit_pos: Point, normal: Point) -> int:
+        """
+        Returns the lights blocked from reaching the hit position, as a bit for each
+        light by its index.
+        """
+        mask = 0
+        for light_index in range(len(scene.lights)):
+            if self._in_shadow(
+                scene=scene, light_index=light_index, hit_pos=hit_pos, normal=normal
+            ):
+                mask |= 1 << light_index
+        return mask
+
+    def _surface(
+        self, scene: Scene, index: int, hit_pos: Point, normal: Optional[Point]
+    ) -> tuple[CompiledScene, int, Vector3, Vector3, Vector3]:
+        """
+        Returns the compiled scene, the material of object `index`, the hit position
+        and the normal there, and the direction from it to the camera.
+        """
+        compiled = compile_scene(scene)
+        position = vector(hit_pos)
+        surface_normal = (
+            compiled.normal(index=index, position=position)
+            if normal is None
+            else vector(normal)
+        )
+        camera = compiled.camera
+        to_cam = single(
+            camera[0] - position[0], camera[1] - position[1], camera[2] - position[2]
+        )
+        return compiled, compiled.materials[index], position, surface_normal, to_cam
+
+    def _lit(
+        self,
+        scene: Scene,
+        position: Vector3,
+        normal: Vector3,
+        shadowed: Optional[int],
+    ) -> Iterator[tuple[int, Vector3]]:
+        """
+        Yields the index of each light reaching the position, and the direction to
+        it, tracing shadow rays unless given the `shadowed` lights.
+        """
+        compiled = compile_scene(scene)
+        for light_index in range(compiled.light_count):
+            to_light = _to_light(compiled, light_index, position)
+            if (
+                shadowed >> light_index & 1
+                if shadowed is not None
+                else self._occluded(
+                    scene=scene,
+                    light_index=light_index,
+                    position=position,
+                    normal=normal,
+                    to_light=to_light,
+                )
+            ):
+                continue
+            yield light_index, to_light
+
+    def _diffuse(
+        self,
+        compiled: CompiledScene,
+        material: int,
+        position: Vector3,
+        normal: Vector3,
+        to_light: Vector3,
+    ) -> Pixel:
         """
         Handles diffuse shading for non-shiny surfaces
 
         Uses lambert shading
         """
-        to_light = Ray(origin=hit_pos, direction=light.position - hit_pos)
-        colour = (
-            material.colour_at(hit_pos)
-            * material.diffuse
-            * max(normal.dot_product(to_light.direction), 0)
+        return _scale(
+            _scale(
+                compiled.colour_at(material=material, position=position),
+                compiled.diffuse[material],
+            ),
+            max(_dot(normal, to_light), 0),
         )
-        return colour
 
     def _specular(
         self,
-        light: Light,
-        material: BaseMaterial,
-        normal: Point,
-        hit_pos: Point,
-        to_cam: Point,
-    ) -> Colour:
+        compiled: CompiledScene,
+        light_index: int,
+        material: int,
+        normal: Vector3,
+        to_light: Vector3,
+        to_cam: Vector3,
+    ) -> Pixel:
         """
         Handles specular shading for shiny surfaces
 
         Uses Blinn-Phong shading
         """
-        to_light = Ray(origin=hit_pos, direction=light.position - hit_pos)
-        half_vector = (to_light.direction + to_cam).normalize()
-        return (
-            light.colour
-            * material.specular
-            * max(normal.dot_product(half_vector), 0) ** PHONG_COEFFICENT
+        half_vector = _half_vector(to_light, to_cam)
+        light_colours = compiled.light_colours
+        offset = light_index * 3
+        return _scale(
+            _scale(
+                (
+                    light_colours[offset],
+                    light_colours[offset + 1],
+                    light_colours[offset + 2],
+                ),
+                compiled.specular[material],
+            ),
+            max(_dot(normal, half_vector), 0) ** PHONG_COEFFICENT,
+        )
+
+    def _in_shadow(
+        self, scene: Scene, light_index: int, hit_pos: Point, normal: Point
+    ) -> bool:
+        """Returns whether the light is blocked from reaching the hit position"""
+        compiled = compile_scene(scene)
+        position = vector(hit_pos)
+        return self._occluded(
+            scene=scene,
+            light_index=light_index,
+            position=position,
+            normal=vector(normal),
+            to_light=_to_light(compiled, light_index, position),
+        )
+
+    def _occluded(
+        self,
+        scene: Scene,
+        light_index: int,
+        position: Vector3,
+        normal: Vector3,
+        to_light: Vector3,
+    ) -> bool:
+        """
+        Returns whether the light in direction `to_light` is blocked from reaching
+        the position.
+
+        The shadow ray stops at the first object found between the surface and the
+        light, trying the object which last blocked this light before searching the
+        scene's hierarchy.
+        """
+        if _dot(normal, to_light) <= 0:
+            # The light is behind the surface, so the object shadows itself
+            self.shadow_stats.back_facing += 1
+            return True
+
+        occluders = self.occluders(scene)
+        compiled = compile_scene(scene)
+        nudge = single(
+            normal[0] * REFLECTION_DELTA,
+            normal[1] * REFLECTION_DELTA,
+            normal[2] * REFLECTION_DELTA,
+        )
+        origin = single(
+            position[0] + nudge[0], position[1] + nudge[1], position[2] + nudge[2]
+        )
+        light_positions = compiled.light_positions
+        offset = light_index * 3
+        to_light_x, to_light_y, to_light_z = single(
+            light_positions[offset] - origin[0],
+            light_positions[offset + 1] - origin[1],
+            light_positions[offset + 2] - origin[2],
+        )
+        distance = math.sqrt(
+            to_light_x * to_light_x + to_light_y * to_light_y + to_light_z * to_light_z
         )
+        direction = single(
+            to_light_x / distance, to_light_y / distance, to_light_z / distance
+        )
+        self.shadow_stats.rays += 1
+
+        cached = occluders[light_index]
+        if cached != NO_OCCLUDER:
+            self.shadow_stats.tests += 1
+            dist = compiled.intersect(index=cached, origin=origin, direction=direction)
+            if dist is not None and dist < distance:
+                self.shadow_stats.occluded += 1
+                self.shadow_stats.cache_hits += 1
+                if self.dependencies is not None:
+                    self.dependencies.objects.add(cached)
+                return True
+
+        tests = compiled.bvh.tests
+        occluder = compiled.find_any(
+            origin=origin, direction=direction, max_distance=distance
+        )
+        self.shadow_stats.tests += compiled.bvh.tests - tests
+        if occluder is None:
+            if self.dependencies is not None:
+                self.dependencies.add_segment(
+                    origin=origin, direction=direction, length=distance
+                )
+            return False
+        if self.dependencies is not None:
+            self.dependencies.objects.add(occluder)
+        occluders[light_index] = occluder
+        self.shadow_stats.occluded += 1
+        return True
+
+
+def _to_light(compiled: CompiledScene, light_index: int, position: Vector3) -> Vector3:
+    """Returns the direction from the position to the light"""
+    light_positions = compiled.light_positions
+    offset = light_index * 3
+    return normalize(
+        *single(
+            light_positions[offset] - position[0],
+            light_positions[offset + 1] - position[1],
+            light_positions[offset + 2] - position[2],
+        )
+    )
+
+
+def _half_vector(to_light: Vector3, to_cam: Vector3) -> Vector3:
+    """Returns the direction halfway between the light and the camera"""
+    return normalize(
+        *single(
+            to_light[0] + to_cam[0],
+            to_light[1] + to_cam[1],
+            to_light[2] + to_cam[2],
+        )
+    )
+
+
+def _dot(a: Vector3, b: Vector3) -> float:
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _scale(colour: tuple[float, float, float], factor: float) -> Pixel:
+    """Mirrors `Colour.__mul__`, which truncates each channel before clamping it"""
+    return (
+        _clamp(int(colour[0] * factor)),
+        _clamp(int(colour[1] * factor)),
+        _clamp(int(colour[2] * factor)),
+    )
+
+
+def _add(colour: Pixel, other: Pixel) -> Pixel:
+    """Mirrors `Colour.__add__`"""
+    return (
+        _clamp(colour[0] + other[0]),
+        _clamp(colour[1] + other[1]),
+        _clamp(colour[2] + other[2]),
+    )
+
+
+def _clamp(value: int) -> int:
+    # Cheaper than min() and max(), which shows with several calls per channel
+    if value < MIN_COLOUR:
+        return MIN_COLOUR
+    return MAX_COLOUR if value > MAX_COLOUR else value
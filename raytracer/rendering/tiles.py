@@ -0,0 +1,84 @@
+from dataclasses import dataclass
+from typing import Sequence
+
+# Width and height in pixels of the tiles an image is split into for rendering.
+TILE_SIZE = 32
+# Rays traced across each axis of a tile to estimate how much work it is.
+COST_SAMPLES = 2
+
+
+@dataclass(frozen=True)
+class Tile:
+    """
+    A rectangle of pixels rendered as a single unit of work, from `left` and `top`
+    up to but excluding `right` and `bottom`.
+    """
+
+    index: int
+    left: int
+    top: int
+    right: int
+    bottom: int
+
+    @property
+    def width(self) -> int:
+        return self.right - self.left
+
+    @property
+    def height(self) -> int:
+        return self.bottom - self.top
+
+    @property
+    def rows(self) -> range:
+        return range(self.top, self.bottom)
+
+    @property
+    def samples(self) -> list[tuple[int, int]]:
+        """
+        The pixels, as (x, y), traced to estimate the cost of the tile.  They are
+        spread evenly over it, at most one per pixel.
+        """
+        xs = sorted(
+            {
+                self.left + (2 * sample + 1) * self.width // (2 * COST_SAMPLES)
+                for sample in range(COST_SAMPLES)
+            }
+        )
+        ys = sorted(
+            {
+                self.top + (2 * sample + 1) * self.height // (2 * COST_SAMPLES)
+                for sample in range(COST_SAMPLES)
+            }
+        )
+        return [(x, y) for y in ys for x in xs]
+
+
+def split_tiles(width: int, height: int, size: int = TILE_SIZE) -> list[Tile]:
+    """
+    Splits an image into tiles, left to right then top to bottom.  Tiles on the
+    right and bottom edges are cut short to fit.
+    """
+    return [
+        Tile(
+            index=index,
+            left=left,
+            top=top,
+            right=min(left + size, width),
+            bottom=min(top + size, height),
+        )
+        for index, (top, left) in enumerate(
+            (top, left)
+            for top in range(0, height, size)
+            for left in range(0, width, size)
+        )
+    ]
+
+
+def schedule(tiles: Sequence[Tile], costs: Sequence[int]) -> list[Tile]:
+    """
+    Orders tiles most expensive first, so the slowest tiles aren't left until the
+    end while the other workers sit idle.  Tiles which cost the same keep their
+    order.
+    """
+    order = sorted(range(len(tiles)), key=lambda position: -costs[position])
+    return [tiles[position] for position in order]
@@ -0,0 +1,780 @@
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from raytracer.core.constants import MAX_COLOUR, MIN_COLOUR
+from raytracer.core.types.bvh import BVH, INFINITE_SLOPE
+from raytracer.core.types.compiled import compile_scene
+from raytracer.core.types.entities import Scene
+from raytracer.core.types.imaging import CHANNELS, Colour
+from raytracer.rendering.antialiasing import EDGE_THRESHOLD, sample_offsets
+from raytracer.rendering.backends import PROCESS
+from raytracer.rendering.constants import REFLECTION_DELTA, SCENE_ABSOLUTE_TOP
+from raytracer.rendering.dependencies import TileDependencies
+from raytracer.rendering.engine import ROULETTE_THRESHOLD, RenderEngine
+from raytracer.rendering.framebuffer import Framebuffer, Hit
+from raytracer.rendering.progressive import pass_spans
+from raytracer.rendering.shading import PHONG_COEFFICENT, Shader
+from raytracer.rendering.tiles import Tile
+
+FloatArray = npt.NDArray[np.float64]
+IntArray = npt.NDArray[np.int64]
+BoolArray = npt.NDArray[np.bool_]
+
+# Number of spheres intersected against a batch of rays at once.  Bounds the size of
+# the (rays x spheres) temporaries for scenes with many objects.
+OBJECT_CHUNK_SIZE = 64
+
+
+@dataclass
+class SceneArrays:
+    """
+    The parts of a scene needed for tracing, laid out as one array per attribute
+    so that a whole batch of rays can be processed at once.
+    """
+
+    camera: FloatArray
+    centres: FloatArray
+    radii_squared: FloatArray
+    colour_1: FloatArray
+    colour_2: FloatArray
+    chequered: BoolArray
+    ambient: FloatArray
+    diffuse: FloatArray
+    specular: FloatArray
+    reflection: FloatArray
+    light_positions: FloatArray
+    light_colours: FloatArray
+    bvh_lower: FloatArray
+    bvh_upper: FloatArray
+    bvh_offsets: IntArray
+    bvh_counts: IntArray
+    bvh_axes: IntArray
+    bvh_indices: IntArray
+    bvh_spans: IntArray
+
+    @classmethod
+    def from_scene(cls, scene: Scene) -> "SceneArrays":
+        compiled = compile_scene(scene)
+        materials = np.asarray(compiled.materials, dtype=np.int64)
+        return cls(
+            camera=np.array(compiled.camera, dtype=np.float64),
+            centres=_triples(compiled.centres),
+            radii_squared=np.asarray(compiled.radii_squared),
+            colour_1=_triples(compiled.colour_1)[materials],
+            colour_2=_triples(compiled.colour_2)[materials],
+            chequered=np.asarray(compiled.chequered, dtype=np.bool_)[materials],
+            ambient=np.asarray(compiled.ambient)[materials],
+            diffuse=np.asarray(compiled.diffuse)[materials],
+            specular=np.asarray(compiled.specular)[materials],
+            reflection=np.asarray(compiled.reflection)[materials],
+            light_positions=_triples(compiled.light_positions),
+            light_colours=_triples(compiled.light_colours),
+            bvh_lower=_triples(compiled.bvh.lower),
+            bvh_upper=_triples(compiled.bvh.upper),
+            bvh_offsets=np.asarray(compiled.bvh.offsets),
+            bvh_counts=np.asarray(compiled.bvh.counts),
+            bvh_axes=np.asarray(compiled.bvh.axes),
+            bvh_indices=np.asarray(compiled.bvh.indices),
+            bvh_spans=_subtree_spans(compiled.bvh),
+        )
+
+
+class WavefrontRenderEngine(RenderEngine):
+    """
+    Traces every ray of a tile at once as NumPy arrays instead of one pixel at a
+    time.
+
+    Each step of `RenderEngine._render_pixel` (intersection, material lookup,
+    shading and reflection) is applied to every ray still in flight at once.  The
+    single precision rounding of vectors and the clamping and truncation done by
+    `Colour` are mirrored, so the image is byte for byte the scalar engine's.
+    Keeping a G-buffer or shading in linear light falls back to the scalar engine.
+    """
+
+    def __init__(
+        self,
+        shader: Shader,
+        max_depth: int = 6,
+        use_bvh: bool = True,
+        russian_roulette: bool = False,
+        collect_stats: bool = False,
+        max_samples: int = 1,
+        edge_threshold: int = EDGE_THRESHOLD,
+        record_dependencies: bool = False,
+        gbuffer: bool = False,
+        start_method: Optional[str] = None,
+        backend: str = PROCESS,
+        linear: bool = False,
+    ) -> None:
+        super().__init__(
+            shader=shader,
+            max_depth=max_depth,
+            use_bvh=use_bvh,
+            russian_roulette=russian_roulette,
+            collect_stats=collect_stats,
+            max_samples=max_samples,
+            edge_threshold=edge_threshold,
+            record_dependencies=record_dependencies,
+            gbuffer=gbuffer,
+            start_method=start_method,
+            backend=backend,
+            linear=linear,
+        )
+        self._arrays: Optional[tuple[Scene, SceneArrays]] = None
+        # Index of the object which most often blocked each light in the last batch
+        # of shadow rays, by index of the light
+        self._occluders: dict[int, int] = {}
+        # Every (ray, sphere) pair intersected, which callers count the change in
+        self._tests = 0
+
+    def __getstate__(self) -> dict:
+        state = super().__getstate__()
+        state["_arrays"] = None
+        state["_occluders"] = {}
+        return state
+
+    def _render_tile(
+        self,
+        scene: Scene,
+        tile: Tile,
+        framebuffer: Framebuffer,
+        spacing: int = 1,
+        first: bool = True,
+    ) -> Optional[TileDependencies]:
+        if self.gbuffer or self.linear:
+            # Rows are traced a pixel at a time to keep the G-buffer, or to shade in
+            # linear light
+            return super()._render_tile(
+                scene=scene,
+                tile=tile,
+                framebuffer=framebuffer,
+                spacing=spacing,
+                first=first,
+            )
+        spans = pass_spans(tile=tile, spacing=spacing, first=first)
+        if not spans:
+            # Every pixel of a small tile may have been traced by earlier passes
+            return None
+        started = time.perf_counter()
+        dependencies = self._record(whole_tile=spacing == 1 and first)
+        ids = np.empty(sum(len(span) for _, span in spans), dtype=np.int64)
+        pixels = self._trace_spans(
+            scene=scene, spans=spans, seed=tile.top * scene.width + tile.left, ids=ids
+        )
+        traced = time.perf_counter()
+        stop = 0
+        for scene_y, span in spans:
+            start, stop = stop, stop + len(span)
+            row = np.frombuffer(framebuffer.row(scene_y), dtype=np.uint8)
+            columns = slice(span.start, span.stop, span.step)
+            row.reshape(-1, CHANNELS)[columns] = pixels[start:stop]
+            if framebuffer.has_ids:
+                framebuffer.set_ids(
+                    index=scene_y,
+                    ids=ids[start:stop].tolist(),
+                    start=span.start,
+                    step=span.step,
+                )
+        self._time_tile(started=started, traced=traced)
+        self._dependencies = self.shader.dependencies = None
+        return dependencies
+
+    def _find_edges(
+        self, framebuffer: Framebuffer, tile: Tile
+    ) -> list[tuple[int, int]]:
+        """
+        Finds the edges of the tile as `find_edges` does, comparing the tile and the
+        pixels around it as arrays.
+        """
+        width, height = framebuffer.width, framebuffer.height
+        # The tile with a border of one pixel, cut short at the edges of the image
+        left, top = max(tile.left - 1, 0), max(tile.top - 1, 0)
+        right, bottom = min(tile.right + 1, width), min(tile.bottom + 1, height)
+        pixels = (
+            np.frombuffer(framebuffer.buffer, dtype=np.uint8)
+            .reshape(height, width, CHANNELS)[top:bottom, left:right]
+            .astype(np.int64)
+        )
+        ids = np.asarray(framebuffer.ids).reshape(height, width)[top:bottom, left:right]
+        edges = np.zeros(ids.shape, dtype=np.bool_)
+        for axis in (0, 1):
+            # Compare each pixel with the next along the axis, marking both
+            first = [slice(None), slice(None)]
+            second = [slice(None), slice(None)]
+            first[axis], second[axis] = slice(None, -1), slice(1, None)
+            differs = (ids[tuple(first)] != ids[tuple(second)]) | (
+                np.abs(pixels[tuple(first)] - pixels[tuple(second)]).max(axis=2)
+                > self.edge_threshold
+            )
+            edges[tuple(first)] |= differs
+            edges[tuple(second)] |= differs
+        inner = (
+            slice(tile.top - top, tile.bottom - top),
+            slice(tile.left - left, tile.right - left),
+        )
+        ys, xs = np.nonzero(edges[inner])
+        return list(zip((xs + tile.left).tolist(), (ys + tile.top).tolist()))
+
+    def _refine_pixels(
+        self, scene: Scene, pixels: list[tuple[int, int]], framebuffer: Framebuffer
+    ) -> None:
+        """
+        Anti-aliases the pixels as `RenderEngine._refine_pixels` does, tracing the
+        samples of every pixel as one batch.
+        """
+        if self.linear:
+            super()._refine_pixels(scene=scene, pixels=pixels, framebuffer=framebuffer)
+            return
+        started = time.perf_counter()
+        _, _, scene_top, vertical_step, horizontal_step = self._row_params(
+            scene=scene, scene_y=0
+        )
+        arrays = self._scene_arrays(scene)
+        offsets = np.array(sample_offsets(self.max_samples)[1:], dtype=np.float64)
+        xs, ys = np.array(pixels, dtype=np.int64).T
+        targets = np.zeros((len(pixels), len(offsets), 3), dtype=np.float64)
+        targets[:, :, 0] = (
+            SCENE_ABSOLUTE_TOP
+            + (xs[:, np.newaxis] + offsets[:, 0] - 0.5) * horizontal_step
+        )
+        targets[:, :, 1] = (
+            scene_top + (ys[:, np.newaxis] + offsets[:, 1] - 0.5) * vertical_step
+        )
+        rays = targets.reshape(-1, 3)
+        colours = self.trace(
+            arrays=arrays,
+            origins=np.broadcast_to(arrays.camera, rays.shape),
+            directions=_vector(_vector(rays) - arrays.camera),
+            seed=ys[0] * scene.width + xs[0],
+        ).reshape(len(pixels), len(offsets), 3)
+        image = np.frombuffer(framebuffer.buffer, dtype=np.uint8).reshape(
+            scene.height, scene.width, CHANNELS
+        )
+        totals = image[ys, xs].astype(np.int64) + colours.sum(axis=1)
+        count = self.max_samples
+        self.trace_stats.refined_pixels += len(pixels)
+        traced = time.perf_counter()
+        image[ys, xs] = (totals + count // 2) // count
+        self._time_tile(started=started, traced=traced)
+
+    def _render_row(
+        self,
+        params: tuple[Scene, int, float, float, float],
+        start: int = 0,
+        stop: Optional[int] = None,
+        step: int = 1,
+        ids: Optional[list[int]] = None,
+        paths: Optional[list[list[Hit]]] = None,
+    ) -> tuple[int, list[Colour]]:
+        if paths is not None or self.linear:
+            # Only the scalar engine keeps the hits along each pixel's reflections,
+            # or shades in linear light
+            return super()._render_row(
+                params, start=start, stop=stop, step=step, ids=ids, paths=paths
+            )
+        scene = params[0]
+        hits = np.empty(
+            len(range(start, scene.width if stop is None else stop, step)),
+            dtype=np.int64,
+        )
+        pixels = self._trace_row(params, start=start, stop=stop, step=step, ids=hits)
+        if ids is not None:
+            ids.extend(hits.tolist())
+        return (params[1], [Colour(r=r, g=g, b=b) for r, g, b in pixels.tolist()])
+
+    def _trace_row(
+        self,
+        params: tuple[Scene, int, float, float, float],
+        start: int = 0,
+        stop: Optional[int] = None,
+        step: int = 1,
+        ids: Optional[IntArray] = None,
+    ) -> IntArray:
+        scene, scene_y = params[:2]
+        columns = range(start, scene.width if stop is None else stop, step)
+        return self._trace_spans(
+            scene=scene,
+            spans=[(scene_y, columns)],
+            seed=scene_y * scene.width + start,
+            ids=ids,
+        )
+
+    def _trace_spans(
+        self,
+        scene: Scene,
+        spans: list[tuple[int, range]],
+        seed: int,
+        ids: Optional[IntArray] = None,
+    ) -> IntArray:
+        """
+        Traces the pixels of each (row, columns) span as a single batch, returning
+        their colours in order.  Russian roulette is seeded by `seed`, the index of
+        the first pixel, so it renders the same whichever worker it's on.  The id
+        of the object each pixel hit is written to `ids` if given.
+        """
+        _, _, scene_top, vertical_step, horizontal_step = self._row_params(
+            scene=scene, scene_y=0
+        )
+        arrays = self._scene_arrays(scene)
+        xs = np.concatenate(
+            [np.arange(span.start, span.stop, span.step) for _, span in spans]
+        )
+        ys = np.concatenate([np.full(len(span), scene_y) for scene_y, span in spans])
+        targets = np.zeros((len(xs), 3), dtype=np.float64)
+        targets[:, 0] = SCENE_ABSOLUTE_TOP + xs * horizontal_step
+        targets[:, 1] = scene_top + ys * vertical_step
+        origins = np.broadcast_to(arrays.camera, targets.shape)
+        return self.trace(
+            arrays=arrays,
+            origins=origins,
+            directions=_vector(_vector(targets) - arrays.camera),
+            seed=seed,
+            ids=ids,
+        )
+
+    def _scene_arrays(self, scene: Scene) -> SceneArrays:
+        """
+        Returns the arrays for the scene, reusing them while rows of the same scene
+        are rendered.
+        """
+        if self._arrays is None or self._arrays[0] is not scene:
+            self._arrays = (scene, SceneArrays.from_scene(scene))
+            self._occluders = {}
+        return self._arrays[1]
+
+    def trace(
+        self,
+        arrays: SceneArrays,
+        origins: FloatArray,
+        directions: FloatArray,
+        seed: int = 0,
+        ids: Optional[IntArray] = None,
+    ) -> IntArray:
+        """
+        Returns the colour of each ray as an (N, 3) array of ints.
+
+        Rays are followed bounce by bounce, keeping the shaded colour and reflection
+        weight of every hit, then the bounces are folded back into the primary rays
+        in the same order as the recursion in `RenderEngine._render_pixel`.  As
+        there, a ray stops bouncing once its reflection can't change its pixel, and
+        with Russian roulette `seed` decides which low weight reflections are
+        traced.  The index of the object each ray hit first, or -1, is written to
+        `ids` if given.
+        """
+        count = len(origins)
+        indexes = np.arange(count)
+        directions = _normalize(directions)
+        throughput = np.ones(count)
+        # The colour and reflection of each surface so far along the rays in flight
+        path: list[tuple[FloatArray, FloatArray]] = []
+        bounces: list[tuple[IntArray, FloatArray, FloatArray]] = []
+        generator = np.random.default_rng(seed)
+        self.trace_stats.primary_rays += count
+        # Stages are only timed with `collect_stats`
+        timings = self.timings
+        reflect_started: Optional[float] = None
+        for depth in range(self.max_depth + 2):
+            if timings is not None:
+                started = time.perf_counter()
+                if depth == 1:
+                    reflect_started = started
+            tests = self._tests
+            distances, hits = self._find_nearest_batch(
+                arrays=arrays, origins=origins, directions=directions
+            )
+            self.trace_stats.intersection_tests += self._tests - tests
+            if timings is not None:
+                timings.intersect += time.perf_counter() - started
+            if ids is not None and not depth:
+                # Misses are -1, the same as `NO_OBJECT`
+                ids[:] = hits
+            dependencies = self._dependencies
+            if dependencies is not None:
+                dependencies.add_segments(
+                    origins=origins, directions=directions, lengths=distances
+                )
+                dependencies.objects.update(np.unique(hits[hits >= 0]).tolist())
+                dependencies.shaded |= bool((hits >= 0).any())
+            keep = hits >= 0
+            if not keep.all():
+                indexes = indexes[keep]
+                origins = origins[keep]
+                directions = directions[keep]
+                distances = distances[keep]
+                hits = hits[keep]
+                throughput = throughput[keep]
+                path = [(colours[keep], scales[keep]) for colours, scales in path]
+            if not len(indexes):
+                break
+            positions = _vector(origins + _vector(directions * distances[:, None]))
+            normals = _normalize(_vector(positions - arrays.centres[hits]))
+            if timings is not None:
+                started = time.perf_counter()
+            colours = self._shade_batch(
+                arrays=arrays, hits=hits, positions=positions, normals=normals
+            )
+            self.trace_stats.shades += len(hits)
+            if timings is not None:
+                timings.shade += time.perf_counter() - started
+            scales = arrays.reflection[hits]
+            bounces.append((indexes, colours, scales))
+            if depth > self.max_depth:
+                break
+
+            path.append((colours, scales))
+            bouncing = ~_settled_batch(path)
+            self.trace_stats.terminated += int(np.count_nonzero(~bouncing))
+            throughput = throughput * scales
+            if self.russian_roulette:
+                gambles = np.flatnonzero(bouncing & (throughput < ROULETTE_THRESHOLD))
+                survival = throughput[gambles] / ROULETTE_THRESHOLD
+                lost = generator.random(len(gambles)) >= survival
+                bouncing[gambles[lost]] = False
+                self.trace_stats.roulette_terminated += int(np.count_nonzero(lost))
+                # Scales are shared with `bounces` and `path`, so this also weights
+                # the reflections that won when they are folded back in
+                scales[gambles[~lost]] /= survival[~lost]
+                throughput[gambles[~lost]] = ROULETTE_THRESHOLD
+            self.trace_stats.reflection_rays += int(np.count_nonzero(bouncing))
+            indexes = indexes[bouncing]
+            positions = positions[bouncing]
+            normals = normals[bouncing]
+            directions = directions[bouncing]
+            throughput = throughput[bouncing]
+            path = [(colours[bouncing], scales[bouncing]) for colours, scales in path]
+
+            # Calculate reflections
+            origins = _vector(positions + _vector(normals * REFLECTION_DELTA))
+            directions = _normalize(
+                _vector(
+                    directions
+                    - _vector(2 * _dot(directions, normals)[:, None] * normals)
+                )
+            )
+
+        reflected = np.zeros((count, 3), dtype=np.float64)
+        for indexes, colours, reflection in reversed(bounces):
+            colours = _clamp(colours + _scale(reflected[indexes], reflection[:, None]))
+            reflected = np.zeros((count, 3), dtype=np.float64)
+            reflected[indexes] = colours
+        if timings is not None and reflect_started is not None:
+            timings.reflect += time.perf_counter() - reflect_started
+        return reflected.astype(np.int64)
+
+    def _find_nearest_batch(
+        self,
+        arrays: SceneArrays,
+        origins: FloatArray,
+        directions: FloatArray,
+        limits: Optional[FloatArray] = None,
+        any_hit: bool = False,
+    ) -> tuple[FloatArray, IntArray]:
+        """
+        Returns the distance to, and index of, the nearest object for each ray.
+
+        Rays which miss every object have an infinite distance, or their limit if
+        given, and an index of -1.  With `any_hit` a ray stops at the first object
+        found within its limit rather than searching for the nearest.
+        """
+        count = len(origins)
+        nearest = np.full(count, np.inf) if limits is None else limits.copy()
+        hits = np.full(count, -1, dtype=np.int64)
+        if self.use_bvh:
+            self._traverse_batch(
+                arrays=arrays,
+                origins=origins,
+                directions=directions,
+                nearest=nearest,
+                hits=hits,
+                any_hit=any_hit,
+            )
+            return nearest, hits
+        rays = np.arange(count)
+        for start in range(0, len(arrays.centres), OBJECT_CHUNK_SIZE):
+            stop = min(start + OBJECT_CHUNK_SIZE, len(arrays.centres))
+            if any_hit:
+                rays = rays[hits[rays] < 0]
+            self._intersect_batch(
+                arrays=arrays,
+                origins=origins,
+                directions=directions,
+                rays=rays,
+                spheres=np.arange(start, stop),
+                nearest=nearest,
+                hits=hits,
+            )
+        return nearest, hits
+
+    def _traverse_batch(
+        self,
+        arrays: SceneArrays,
+        origins: FloatArray,
+        directions: FloatArray,
+        nearest: FloatArray,
+        hits: IntArray,
+        any_hit: bool = False,
+    ) -> None:
+        """
+        Walks the scene's bounding volume hierarchy with the whole batch of rays,
+        narrowing it down at each node to the rays which pass the slab test, and
+        with `any_hit` to the rays which haven't hit anything yet.
+        """
+        with np.errstate(divide="ignore"):
+            inverse = np.where(directions != 0, 1 / directions, INFINITE_SLOPE)
+        stack = [(0, np.arange(len(origins)))] if len(arrays.bvh_counts) else []
+        while stack:
+            node, rays = stack.pop()
+            t_1 = (arrays.bvh_lower[node] - origins[rays]) * inverse[rays]
+            t_2 = (arrays.bvh_upper[node] - origins[rays]) * inverse[rays]
+            t_near = np.maximum(np.minimum(t_1, t_2).max(axis=1), 0)
+            t_far = np.minimum(np.maximum(t_1, t_2).min(axis=1), nearest[rays])
+            rays = rays[t_near <= t_far]
+            if any_hit:
+                rays = rays[hits[rays] < 0]
+            if not len(rays):
+                continue
+
+            first, last = arrays.bvh_spans[node]
+            if last - first <= OBJECT_CHUNK_SIZE:
+                # Testing every sphere below a small subtree at once is cheaper than
+                # walking it a node at a time.
+                self._intersect_batch(
+                    arrays=arrays,
+                    origins=origins,
+                    directions=directions,
+                    rays=rays,
+                    spheres=arrays.bvh_indices[first:last],
+                    nearest=nearest,
+                    hits=hits,
+                )
+                continue
+            left, right = node + 1, int(arrays.bvh_offsets[node])
+            if directions[rays, arrays.bvh_axes[node]].sum() < 0:
+                left, right = right, left
+            stack.append((right, rays))
+            stack.append((left, rays))
+
+    def _intersect_batch(
+        self,
+        arrays: SceneArrays,
+        origins: FloatArray,
+        directions: FloatArray,
+        rays: IntArray,
+        spheres: IntArray,
+        nearest: FloatArray,
+        hits: IntArray,
+    ) -> None:
+        """
+        Intersects `rays` with `spheres`, updating `nearest` and `hits` in place
+        wherever one is closer than the nearest hit so far.
+        """
+        self._tests += len(rays) * len(spheres)
+        sphere_to_ray = _vector(
+            origins[rays][:, None, :] - arrays.centres[spheres][None, :, :]
+        )
+        b = 2 * np.einsum("nk,nmk->nm", directions[rays], sphere_to_ray)
+        c = (
+            np.einsum("nmk,nmk->nm", sphere_to_ray, sphere_to_ray)
+            - arrays.radii_squared[spheres]
+        )
+        discriminent = b * b - 4 * c
+        with np.errstate(invalid="ignore"):
+            distances = (-b - np.sqrt(discriminent)) / 2
+        distances = np.where((discriminent >= 0) & (distances > 0), distances, np.inf)
+        closest = np.argmin(distances, axis=1)
+        closest_distances = distances[np.arange(len(rays)), closest]
+        candidates = spheres[closest]
+        # Match the linear scan, which keeps the first of equal hits
+        closer = (closest_distances < nearest[rays]) | (
+            (closest_distances == nearest[rays]) & (candidates < hits[rays])
+        )
+        nearest[rays[closer]] = closest_distances[closer]
+        hits[rays[closer]] = candidates[closer]
+
+    def _shade_batch(
+        self,
+        arrays: SceneArrays,
+        hits: IntArray,
+        positions: FloatArray,
+        normals: FloatArray,
+    ) -> FloatArray:
+        """
+        Batched equivalent of `Shader.shade`: Lambert diffuse and Blinn-Phong
+        specular for every light.
+        """
+        colour_at = self._colour_at_batch(arrays=arrays, hits=hits, positions=positions)
+        diffuse = _scale(colour_at, arrays.diffuse[hits][:, None])
+        specular = arrays.specular[hits][:, None]
+        to_cam = _vector(arrays.camera - positions)
+        colours = np.zeros_like(positions)
+        for light_index, (light_position, light_colour) in enumerate(
+            zip(arrays.light_positions, arrays.light_colours)
+        ):
+            to_light = _normalize(_vector(light_position - positions))
+            lit = self._lit_batch(
+                arrays=arrays,
+                light_index=light_index,
+                positions=positions,
+                normals=normals,
+                facing=_dot(normals, to_light) > 0,
+            )
+            # Adding nothing to a colour leaves it as it was, just as skipping a
+            # blocked light does in `Shader.shade`
+            lambert = np.where(lit, np.maximum(_dot(normals, to_light), 0), 0)
+            colours = _clamp(colours + _scale(diffuse, lambert[:, None]))
+            half_vector = _normalize(_vector(to_light + to_cam))
+            phong = np.where(
+                lit, np.maximum(_dot(normals, half_vector), 0) ** PHONG_COEFFICENT, 0
+            )
+            colours = _clamp(
+                colours + _scale(_scale(light_colour, specular), phong[:, None])
+            )
+        return colours
+
+    def _lit_batch(
+        self,
+        arrays: SceneArrays,
+        light_index: int,
+        positions: FloatArray,
+        normals: FloatArray,
+        facing: BoolArray,
+    ) -> BoolArray:
+        """
+        Batched equivalent of `Shader._in_shadow`, returning whether the light
+        reaches each position.
+
+        Shadow rays are first tested against the object which most often blocked
+        this light in the last batch, and only those it doesn't block search the
+        scene, stopping at the first object they find.
+        """
+        stats = self.shader.shadow_stats
+        stats.back_facing += int(np.count_nonzero(~facing))
+        rays = np.flatnonzero(facing)
+        lit = np.zeros(len(positions), dtype=np.bool_)
+        if not len(rays):
+            return lit
+        origins = _vector(positions[rays] + _vector(normals[rays] * REFLECTION_DELTA))
+        offsets = _vector(arrays.light_positions[light_index] - origins)
+        limits = np.sqrt(_dot(offsets, offsets))
+        directions = _normalize(offsets)
+        stats.rays += len(rays)
+
+        occluders = np.full(len(rays), -1, dtype=np.int64)
+        tests = self._tests
+        cached = self._occluders.get(light_index)
+        if cached is not None:
+            self._intersect_batch(
+                arrays=arrays,
+                origins=origins,
+                directions=directions,
+                rays=np.arange(len(rays)),
+                spheres=np.array([cached]),
+                nearest=limits.copy(),
+                hits=occluders,
+            )
+            stats.cache_hits += int(np.count_nonzero(occluders >= 0))
+        uncached = np.flatnonzero(occluders < 0)
+        _, found = self._find_nearest_batch(
+            arrays=arrays,
+            origins=origins[uncached],
+            directions=directions[uncached],
+            limits=limits[uncached],
+            any_hit=True,
+        )
+        occluders[uncached] = found
+        stats.tests += self._tests - tests
+        if (found >= 0).any():
+            self._occluders[light_index] = int(np.bincount(found[found >= 0]).argmax())
+        stats.occluded += int(np.count_nonzero(occluders >= 0))
+        lit[rays] = occluders < 0
+        dependencies = self._dependencies
+        if dependencies is not None:
+            unblocked = occluders < 0
+            dependencies.add_segments(
+                origins=origins[unblocked],
+                directions=directions[unblocked],
+                lengths=limits[unblocked],
+            )
+            dependencies.objects.update(np.unique(occluders[~unblocked]).tolist())
+        return lit
+
+    def _colour_at_batch(
+        self, arrays: SceneArrays, hits: IntArray, positions: FloatArray
+    ) -> FloatArray:
+        """
+        Batched equivalent of `BaseMaterial.colour_at` for solid and chequered
+        materials.
+        """
+        size = 1.0
+        delta = 5.0
+        x = np.trunc((positions[:, 0] + delta) * size).astype(np.int64)
+        z = np.trunc(positions[:, 2] * size).astype(np.int64)
+        second = arrays.chequered[hits] & (x % 2 == z % 2)
+        return np.where(second[:, None], arrays.colour_2[hits], arrays.colour_1[hits])
+
+
+def _settled_batch(path: list[tuple[FloatArray, FloatArray]]) -> BoolArray:
+    """
+    Batched equivalent of `engine._is_settled`, returning whether each ray's pixel
+    is the same however bright its next reflection is.
+    """
+    darkest = np.full_like(path[-1][0], MIN_COLOUR)
+    brightest = np.full_like(path[-1][0], MAX_COLOUR)
+    for colours, scales in reversed(path):
+        darkest = _clamp(colours + _scale(darkest, scales[:, None]))
+        brightest = _clamp(colours + _scale(brightest, scales[:, None]))
+    settled: BoolArray = (darkest == brightest).all(axis=1)
+    return settled
+
+
+def _subtree_spans(bvh: BVH) -> IntArray:
+    """
+    Returns the range of `bvh.indices` holding the primitives below each node.
+
+    Leaves are laid out depth first, so every subtree's primitives are contiguous.
+    """
+    spans = np.zeros((len(bvh), 2), dtype=np.int64)
+    for node in reversed(range(len(bvh))):
+        if bvh.counts[node]:
+            spans[node] = (bvh.offsets[node], bvh.offsets[node] + bvh.counts[node])
+        else:
+            spans[node] = (spans[node + 1][0], spans[bvh.offsets[node]][1])
+    return spans
+
+
+def _triples(values: array) -> FloatArray:
+    """Views a flat array of vectors or colours as an (N, 3) array"""
+    return np.asarray(values, dtype=np.float64).reshape(-1, 3)
+
+
+def _dot(a: FloatArray, b: FloatArray) -> FloatArray:
+    products: FloatArray = np.einsum("nk,nk->n", a, b)
+    return products
+
+
+def _normalize(vectors: FloatArray) -> FloatArray:
+    return _vector(vectors / np.sqrt(_dot(vectors, vectors))[:, None])
+
+
+def _vector(values: FloatArray) -> FloatArray:
+    """
+    Rounds to single precision, mirroring the storage of `BaseVector`, so that
+    hits near the edge of an object land on the same side as the scalar engine.
+    """
+    return values.astype(np.float32).astype(np.float64)
+
+
+def _clamp(colours: FloatArray) -> FloatArray:
+    return np.clip(colours, MIN_COLOUR, MAX_COLOUR)
+
+
+def _scale(colours: FloatArray, factor: FloatArray) -> FloatArray:
+    """
+    Mirrors `Colour.__mul__`, which truncates each channel before clamping it.
+    """
+    return _clamp(np.trunc(colours * factor))
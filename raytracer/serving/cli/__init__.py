@@ -0,0 +1,3 @@
+from raytracer.serving.cli.serve import serve
+
+__all__ = ["serve"]
@@ -0,0 +1,89 @@
+import asyncio
+
+import click
+
+from raytracer.rendering.cli.render_scene import (
+    ENGINES,
+    RenderOptions,
+    _create_engine,
+)
+from raytracer.serving.server import RenderServer
+
+
+@click.command
+@click.option(
+    "--host",
+    default="127.0.0.1",
+    help="The address to listen on, only this machine by default.",
+)
+@click.option("--port", default=8000, type=int, help="The port to listen on.")
+@click.option(
+    "-p",
+    "--processes",
+    default=4,
+    type=int,
+    help="The number of worker processes each render uses.",
+)
+@click.option(
+    "-e",
+    "--engine",
+    default="scalar",
+    type=click.Choice(ENGINES),
+    help="The render engine to use, tracing one pixel or a whole tile at a time.",
+)
+@click.option(
+    "--bvh/--no-bvh",
+    default=True,
+    help="Find the nearest object using the scene's BVH rather than a linear scan.",
+)
+@click.option(
+    "--concurrency",
+    default=1,
+    type=click.IntRange(min=1),
+    help=(
+        "How many scenes are rendered at once, each by its own engine and pool of "
+        "workers."
+    ),
+)
+@click.option(
+    "--max-queue",
+    default=16,
+    type=click.IntRange(min=0),
+    help="How many requests may wait for an engine before more are turned away.",
+)
+def serve(
+    host: str,
+    port: int,
+    processes: int,
+    engine: str,
+    bvh: bool,
+    concurrency: int,
+    max_queue: int,
+) -> None:
+    """
+    Renders scenes posted over HTTP, keeping the workers running between requests.
+    """
+    server = RenderServer(
+        engines=[
+            # Forked workers would hold the connections open when a pool restarts
+            _create_engine(
+                RenderOptions(engine=engine, bvh=bvh), start_method="forkserver"
+            )
+            for _ in range(concurrency)
+        ],
+        processes=processes,
+        max_queue=max_queue,
+    )
+    try:
+        asyncio.run(_serve(server=server, host=host, port=port))
+    except KeyboardInterrupt:
+        click.echo("Stopped serving")
+    finally:
+        server.close()
+
+
+async def _serve(server: RenderServer, host: str, port: int) -> None:
+    listener = await server.start(host=host, port=port)
+    click.echo(f"Serving on http://{host}:{port}, press Ctrl+C to stop")
+    async with listener:
+        await listener.serve_forever()
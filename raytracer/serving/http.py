@@ -0,0 +1,95 @@
+import asyncio
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+# The most bytes read for the request line and headers, and for the body
+MAX_HEAD_SIZE = 16 * 1024
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+
+class HTTPError(Exception):
+    """A request which can't be answered, to be sent back with its status"""
+
+    def __init__(self, status: HTTPStatus, message: str = "") -> None:
+        super().__init__(message or status.phrase)
+        self.status = status
+        self.message = message or status.phrase
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: dict[str, str] = field(default_factory=dict)
+    headers: dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+
+
+async def read_request(reader: asyncio.StreamReader) -> Request:
+    """
+    Reads an HTTP/1.1 request, with header names lower cased and a body of
+    `Content-Length` bytes.  Raises an HTTPError for requests which can't be read.
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.LimitOverrunError:
+        raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE) from None
+    except asyncio.IncompleteReadError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Incomplete request") from None
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")[:-2]
+    try:
+        method, target, _ = request_line.split(" ")
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line") from None
+    headers = {}
+    for line in header_lines:
+        name, separator, value = line.partition(":")
+        if not separator:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed header")
+        headers[name.strip().lower()] = value.strip()
+
+    length = headers.get("content-length", "0")
+    if not length.isdigit():
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed Content-Length")
+    if int(length) > MAX_BODY_SIZE:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    try:
+        body = await reader.readexactly(int(length))
+    except asyncio.IncompleteReadError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Incomplete body") from None
+    url = urlsplit(target)
+    return Request(
+        method=method.upper(),
+        path=url.path,
+        query=dict(parse_qsl(url.query)),
+        headers=headers,
+        body=body,
+    )
+
+
+def response_head(status: HTTPStatus, headers: dict[str, str]) -> bytes:
+    """The status line and headers of a response, closing the connection after it"""
+    lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    lines.append("Connection: close")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def response(
+    status: HTTPStatus, body: bytes, content_type: str = "text/plain; charset=utf-8"
+) -> bytes:
+    """A whole response with a body"""
+    head = response_head(
+        status, {"Content-Type": content_type, "Content-Length": str(len(body))}
+    )
+    return head + body
+
+
+def chunk(data: bytes) -> bytes:
+    """A chunk of a response sent with `Transfer-Encoding: chunked`"""
+    return f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n"
+
+
+# Ends a chunked response
+LAST_CHUNK = chunk(b"")
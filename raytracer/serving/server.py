@@ -0,0 +1,365 @@
+import asyncio
+import json
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import Any, BinaryIO, Optional, Sequence, cast
+from uuid import uuid4
+
+from raytracer.core.types.entities import Scene
+from raytracer.core.types.imaging import ImageFormat
+from raytracer.imaging.service import ImageService
+from raytracer.rendering.constants import MIN_RESOLUTION
+from raytracer.rendering.engine import RenderEngine
+from raytracer.rendering.framebuffer import Framebuffer
+from raytracer.serving.http import (
+    LAST_CHUNK,
+    MAX_HEAD_SIZE,
+    HTTPError,
+    Request,
+    chunk,
+    read_request,
+    response,
+    response_head,
+)
+
+# The formats images can be streamed back in, with their content types
+FORMATS = {
+    "png": (ImageFormat.PNG, "image/png"),
+    "ppm": (ImageFormat.PPM, "image/x-portable-pixmap"),
+}
+# The largest width or height of an image which can be requested
+MAX_RESOLUTION = 8192
+# Chunks of an image held for a slow client before the render waits for it
+CHUNK_QUEUE_SIZE = 16
+# Recent renders whose latencies are kept for the percentiles in the metrics
+LATENCY_WINDOW = 1000
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values: Sequence[float], percent: float) -> float:
+    """The nearest-rank percentile of the values, or zero if there are none"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+
+@dataclass
+class ServerMetrics:
+    """Counts of the renders a server has handled, and how long they took"""
+
+    # Renders waiting for an engine to be free
+    queued: int = 0
+    # Renders being traced and sent
+    rendering: int = 0
+    completed: int = 0
+    # Renders cancelled or whose client went away before they were sent
+    cancelled: int = 0
+    failed: int = 0
+    # Renders turned away because the queue was full
+    rejected: int = 0
+    # Seconds from receiving each recent render to sending its last byte
+    latencies: deque[float] = field(
+        default_factory=lambda: deque(maxlen=LATENCY_WINDOW)
+    )
+    # Seconds each recent render spent queued
+    waits: deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+
+    def to_object(self) -> dict:
+        return {
+            "queue_depth": self.queued,
+            "rendering": self.rendering,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "latency": _percentiles(self.latencies),
+            "queue_wait": _percentiles(self.waits),
+        }
+
+
+@dataclass
+class _RenderJob:
+    """A render requested of the server"""
+
+    scene: Scene
+    image_format: ImageFormat
+    content_type: str
+    id: str = field(default_factory=lambda: uuid4().hex)
+    received: float = field(default_factory=time.perf_counter)
+    # Set to stop the engine rendering the job
+    stop: threading.Event = field(default_factory=threading.Event)
+    task: Optional["asyncio.Task[None]"] = None
+
+
+class _Stopped(Exception):
+    """Raised in the render thread when its job is cancelled"""
+
+
+class _ChunkWriter:
+    """
+    A file for a render thread to stream an image into, handing each write to the
+    event loop to be sent as a chunk of the response.  Blocks while the queue of
+    chunks is full, so a slow client holds up the render rather than it being
+    buffered in memory.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        chunks: "asyncio.Queue[Optional[bytes]]",
+    ) -> None:
+        self._loop = loop
+        self._chunks = chunks
+
+    def write(self, data: bytes) -> int:
+        if data:
+            self._put(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        """Marks the end of the image"""
+        self._put(None)
+
+    def _put(self, data: Optional[bytes]) -> None:
+        asyncio.run_coroutine_threadsafe(self._chunks.put(data), self._loop).result()
+
+
+class RenderServer:
+    """
+    Renders scenes posted to it over HTTP, streaming back each image as its rows are
+    finished.
+
+    `POST /render?width=W&height=H&format=png` renders the scene JSON in the body,
+    answering with the image in chunks and its id in the `X-Render-Id` header.  Each
+    engine renders one scene at a time and keeps its pool of workers between them,
+    so requests beyond the number of engines wait in a queue, and those beyond
+    `max_queue` are turned away.  `DELETE /renders/ID` cancels a render, as does
+    the client closing the connection, and `GET /metrics` gives the depth of the
+    queue and percentiles of recent latencies as JSON.
+    """
+
+    def __init__(
+        self, engines: Sequence[RenderEngine], processes: int = 4, max_queue: int = 16
+    ) -> None:
+        self.processes = processes
+        self.max_queue = max_queue
+        self.metrics = ServerMetrics()
+        self._idle = list(engines)
+        self._engines = list(engines)
+        self._slots = asyncio.Semaphore(len(engines))
+        # Engines render in their own threads, as rendering blocks
+        self._threads = ThreadPoolExecutor(max_workers=len(engines))
+        self._jobs: dict[str, _RenderJob] = {}
+
+    async def start(self, host: str, port: int) -> asyncio.Server:
+        """Starts listening for requests, returning the server accepting them"""
+        return await asyncio.start_server(
+            self.handle, host=host, port=port, limit=MAX_HEAD_SIZE
+        )
+
+    def close(self) -> None:
+        """Stops the engines' workers"""
+        self._threads.shutdown(wait=True)
+        for engine in self._engines:
+            engine.close()
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Answers a request on a connection, then closes it"""
+        try:
+            request = await read_request(reader)
+            if request.path == "/render":
+                _check_method(request, "POST")
+                await self._render(request=request, reader=reader, writer=writer)
+            elif request.path == "/metrics":
+                _check_method(request, "GET")
+                body = json.dumps(self.metrics.to_object()).encode()
+                writer.write(response(HTTPStatus.OK, body, "application/json"))
+            elif request.path.startswith("/renders/"):
+                _check_method(request, "DELETE")
+                self._cancel(request.path.removeprefix("/renders/"))
+                writer.write(response_head(HTTPStatus.NO_CONTENT, {}))
+            else:
+                raise HTTPError(HTTPStatus.NOT_FOUND)
+        except HTTPError as e:
+            writer.write(response(e.status, f"{e.message}\n".encode()))
+        finally:
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+
+    async def _render(
+        self,
+        request: Request,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        job = _parse_render(request)
+        if self.metrics.queued >= self.max_queue:
+            self.metrics.rejected += 1
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "The render queue is full")
+
+        writer.write(
+            response_head(
+                HTTPStatus.OK,
+                {
+                    "Content-Type": job.content_type,
+                    "Transfer-Encoding": "chunked",
+                    "X-Render-Id": job.id,
+                },
+            )
+        )
+        task = job.task = asyncio.create_task(self._stream(job=job, writer=writer))
+        self._jobs[job.id] = job
+        # The client closing the connection cancels the render
+        closed = asyncio.create_task(reader.read(1))
+        closed.add_done_callback(lambda _: task.cancel())
+        try:
+            await task
+        except asyncio.CancelledError:
+            self.metrics.cancelled += 1
+            if cast(asyncio.Task, asyncio.current_task()).cancelling():
+                raise
+        except ConnectionError:
+            # The client went away while the image was being sent
+            self.metrics.cancelled += 1
+        except Exception:
+            # The image is already being sent, so the connection is closed before
+            # the last chunk to show it is incomplete
+            self.metrics.failed += 1
+        else:
+            self.metrics.completed += 1
+            self.metrics.latencies.append(time.perf_counter() - job.received)
+        finally:
+            closed.cancel()
+            del self._jobs[job.id]
+
+    def _cancel(self, render_id: str) -> None:
+        job = self._jobs.get(render_id)
+        if job is None or job.task is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"No render {render_id}")
+        job.task.cancel()
+
+    async def _stream(self, job: _RenderJob, writer: asyncio.StreamWriter) -> None:
+        """Waits for an engine to be free, then streams the image from it"""
+        self.metrics.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.metrics.queued -= 1
+        engine = self._idle.pop()
+        self.metrics.waits.append(time.perf_counter() - job.received)
+        self.metrics.rendering += 1
+        try:
+            await self._stream_image(job=job, engine=engine, writer=writer)
+        finally:
+            self.metrics.rendering -= 1
+            self._idle.append(engine)
+            self._slots.release()
+
+    async def _stream_image(
+        self, job: _RenderJob, engine: RenderEngine, writer: asyncio.StreamWriter
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue[Optional[bytes]] = asyncio.Queue(maxsize=CHUNK_QUEUE_SIZE)
+        output = _ChunkWriter(loop=loop, chunks=chunks)
+        rendered = loop.run_in_executor(
+            self._threads, self._render_image, job, engine, output
+        )
+        try:
+            while (data := await chunks.get()) is not None:
+                writer.write(chunk(data))
+                await writer.drain()
+            await rendered
+            writer.write(LAST_CHUNK)
+        except BaseException:
+            # The engine can't be used again until its thread lets go of it, which
+            # it can't while waiting for room in the queue
+            job.stop.set()
+            discarding = asyncio.create_task(_discard(chunks))
+            await asyncio.wait([rendered])
+            discarding.cancel()
+            raise
+
+    def _render_image(
+        self, job: _RenderJob, engine: RenderEngine, output: _ChunkWriter
+    ) -> None:
+        """Renders a job, writing the image to `output`.  Runs in a thread."""
+        scene = job.scene
+        try:
+            with (
+                Framebuffer(
+                    width=scene.width, height=scene.height, ids=engine.anti_aliasing
+                ) as framebuffer,
+                ImageService().stream(
+                    image_file=cast(BinaryIO, output),
+                    image_format=job.image_format,
+                    width=scene.width,
+                    height=scene.height,
+                ) as image,
+            ):
+                for index in engine.render(
+                    scene=scene, framebuffer=framebuffer, processes=self.processes
+                ):
+                    if job.stop.is_set():
+                        # Stop the workers too, rather than have the tiles already
+                        # handed out hold up the next render
+                        engine.close()
+                        raise _Stopped()
+                    image.add_row(index=index, canvas=framebuffer.canvas)
+        finally:
+            output.close()
+
+
+def _parse_render(request: Request) -> _RenderJob:
+    """The job a request to render asks for, raising an HTTPError if it is invalid"""
+    format_name = request.query.get("format", "png")
+    if format_name not in FORMATS:
+        raise HTTPError(
+            HTTPStatus.BAD_REQUEST, f"format must be one of {', '.join(FORMATS)}"
+        )
+    resolution = []
+    for name in ("width", "height"):
+        value = request.query.get(name, "")
+        if not (value.isdigit() and MIN_RESOLUTION <= int(value) <= MAX_RESOLUTION):
+            raise HTTPError(
+                HTTPStatus.BAD_REQUEST,
+                f"{name} must be a whole number from {MIN_RESOLUTION} to "
+                f"{MAX_RESOLUTION}",
+            )
+        resolution.append(int(value))
+    try:
+        scene = Scene.from_object(
+            data=json.loads(request.body), width=resolution[0], height=resolution[1]
+        )
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"Invalid scene: {e!r}") from None
+    image_format, content_type = FORMATS[format_name]
+    return _RenderJob(scene=scene, image_format=image_format, content_type=content_type)
+
+
+async def _discard(chunks: "asyncio.Queue[Optional[bytes]]") -> None:
+    while True:
+        await chunks.get()
+
+
+def _check_method(request: Request, method: str) -> None:
+    if request.method != method:
+        raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+
+
+def _percentiles(values: Sequence[float]) -> dict[str, Any]:
+    return {f"p{percent}": percentile(values, percent) for percent in PERCENTILES}
@@ -0,0 +1,147 @@
+import os
+from typing import Iterator
+from unittest.mock import Mock, patch
+
+import pytest
+from click.testing import CliRunner
+
+from raytracer.benchmarking.cli.compare import compare_results
+from raytracer.benchmarking.cli.run import run
+from raytracer.benchmarking.runner import (
+    BenchmarkCase,
+    BenchmarkResult,
+    load_results,
+    save_results,
+)
+
+
+@pytest.fixture
+def cli_runner() -> CliRunner:
+    return CliRunner()
+
+
+@pytest.fixture(autouse=True)
+def config(temp_directory: str) -> Iterator[Mock]:
+    with patch("raytracer.benchmarking.cli.run.config") as mock_config:
+        mock_config.OUT_DIR = temp_directory
+        yield mock_config
+
+
+def _result(case: BenchmarkCase, wall_time: float = 1.0) -> BenchmarkResult:
+    return BenchmarkResult(
+        case=case,
+        wall_time=wall_time,
+        first_wall_time=wall_time,
+        rays=case.width * case.height,
+        peak_rss_mb=50.0,
+        peak_worker_rss_mb=40.0,
+    )
+
+
+def _save(temp_directory: str, name: str, wall_time: float) -> str:
+    filepath = os.path.join(temp_directory, name)
+    case = BenchmarkCase(workload="scene_1", width=4, height=2, engine="scalar")
+    save_results(filepath=filepath, results=[_result(case, wall_time=wall_time)])
+    return filepath
+
+
+class TestRun:
+    def test_run(self, cli_runner: CliRunner, temp_directory: str) -> None:
+        """
+        GIVEN a workload, resolutions, process counts and an engine
+        WHEN running the benchmarks
+        THEN run each case in its own process
+        AND report and save every result
+        """
+        # WHEN
+        with patch(
+            "raytracer.benchmarking.cli.run.run_isolated",
+            side_effect=lambda case, repeat: _result(case),
+        ) as run_isolated:
+            result = cli_runner.invoke(
+                run,
+                ["--workload", "scene_1", "-r", "4x2", "-r", "8X4"]
+                + ["-p", "1", "-p", "2", "-e", "wavefront", "--repeat", "3"],
+            )
+
+        # THEN
+        assert result.exit_code == 0, result.output
+        assert run_isolated.call_count == 4
+        assert all(call.kwargs["repeat"] == 3 for call in run_isolated.mock_calls)
+        assert "scene_1/wavefront/8x4/2: 1.000s, 32 rays/sec" in result.output
+        (filename,) = os.listdir(temp_directory)
+        assert f"Saved results: {os.path.join(temp_directory, filename)}" in (
+            result.output
+        )
+        results = load_results(os.path.join(temp_directory, filename))
+        assert [result.case.key for result in results] == [
+            "scene_1/wavefront/4x2/1",
+            "scene_1/wavefront/4x2/2",
+            "scene_1/wavefront/8x4/1",
+            "scene_1/wavefront/8x4/2",
+        ]
+
+    def test_run_output(self, cli_runner: CliRunner, temp_directory: str) -> None:
+        output = os.path.join(temp_directory, "baseline.json")
+        with patch(
+            "raytracer.benchmarking.cli.run.run_isolated",
+            side_effect=lambda case, repeat: _result(case),
+        ):
+            result = cli_runner.invoke(
+                run, ["--workload", "image_save", "-r", "4x2", "--output", output]
+            )
+
+        assert result.exit_code == 0, result.output
+        assert [result.case.key for result in load_results(output)] == [
+            "image_save/-/4x2/1"
+        ]
+
+    def test_run_bad_resolution(self, cli_runner: CliRunner) -> None:
+        result = cli_runner.invoke(run, ["--resolution", "large"])
+
+        assert result.exit_code == 2
+        assert "'large' is not WIDTHxHEIGHT" in result.output
+
+
+class TestCompare:
+    def test_no_regressions(self, cli_runner: CliRunner, temp_directory: str) -> None:
+        baseline = _save(temp_directory, "baseline.json", wall_time=1.0)
+        current = _save(temp_directory, "current.json", wall_time=0.95)
+
+        result = cli_runner.invoke(compare_results, [baseline, current])
+
+        assert result.exit_code == 0
+        assert "scene_1/scalar/4x2/1 wall_time: 1.000 -> 0.950 (-5.0%) ok" in (
+            result.output
+        )
+        assert "No regressions" in result.output
+
+    def test_regressions(self, cli_runner: CliRunner, temp_directory: str) -> None:
+        """
+        GIVEN results slower than the baseline beyond the threshold
+        WHEN comparing them
+        THEN flag the regressions
+        AND exit with an error
+        """
+        baseline = _save(temp_directory, "baseline.json", wall_time=1.0)
+        current = _save(temp_directory, "current.json", wall_time=1.1)
+
+        result = cli_runner.invoke(
+            compare_results, [baseline, current, "--threshold", "0.05"]
+        )
+
+        assert result.exit_code == 1
+        assert "wall_time: 1.000 -> 1.100 (+10.0%) REGRESSION" in result.output
+        assert "3 regression(s) beyond 5%" in result.output
+
+    def test_different_cases(self, cli_runner: CliRunner, temp_directory: str) -> None:
+        baseline = _save(temp_directory, "baseline.json", wall_time=1.0)
+        current = os.path.join(temp_directory, "current.json")
+        case = BenchmarkCase(workload="image_save", width=4, height=2)
+        save_results(filepath=current, results=[_result(case)])
+
+        result = cli_runner.invoke(compare_results, [baseline, current])
+
+        assert result.exit_code == 0
+        assert "scene_1/scalar/4x2/1: not in the current results" in result.output
+        assert "image_save/-/4x2/1: not in the baseline" in result.output
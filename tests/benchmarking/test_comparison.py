@@ -0,0 +1,89 @@
+from raytracer.benchmarking.comparison import compare
+from raytracer.benchmarking.runner import BenchmarkCase, BenchmarkResult
+
+
+def _result(
+    workload: str = "scene_1",
+    wall_time: float = 1.0,
+    rays: int = 100,
+    peak_rss_mb: float = 50.0,
+) -> BenchmarkResult:
+    return BenchmarkResult(
+        case=BenchmarkCase(workload=workload, width=10, height=10, engine="scalar"),
+        wall_time=wall_time,
+        first_wall_time=wall_time,
+        rays=rays,
+        peak_rss_mb=peak_rss_mb,
+        peak_worker_rss_mb=40.0,
+    )
+
+
+class TestCompare:
+    def test_no_change(self) -> None:
+        actual = compare(baseline=[_result()], current=[_result()])
+
+        assert len(actual.changes) == 5
+        assert actual.regressions == []
+        assert (actual.missing, actual.added) == ([], [])
+
+    def test_slower(self) -> None:
+        """
+        GIVEN a case which takes longer than the baseline beyond the threshold
+        WHEN comparing them
+        THEN flag the wall time and the throughputs as regressions
+        """
+        actual = compare(
+            baseline=[_result(wall_time=1.0)],
+            current=[_result(wall_time=1.2)],
+            threshold=0.1,
+        )
+
+        assert [change.metric for change in actual.regressions] == [
+            "wall_time",
+            "rays_per_sec",
+            "pixels_per_sec",
+        ]
+        assert round(actual.regressions[0].relative, 6) == 0.2
+
+    def test_within_threshold(self) -> None:
+        actual = compare(
+            baseline=[_result(wall_time=1.0, peak_rss_mb=50)],
+            current=[_result(wall_time=1.05, peak_rss_mb=54)],
+            threshold=0.1,
+        )
+
+        assert actual.regressions == []
+
+    def test_faster_and_more_memory(self) -> None:
+        """
+        GIVEN a case which is faster but uses more memory than the baseline
+        WHEN comparing them
+        THEN only flag the memory
+        """
+        actual = compare(
+            baseline=[_result(wall_time=1.0, peak_rss_mb=50)],
+            current=[_result(wall_time=0.5, peak_rss_mb=80)],
+        )
+
+        assert [change.metric for change in actual.regressions] == ["peak_rss_mb"]
+
+    def test_zero_baseline_is_skipped(self) -> None:
+        actual = compare(baseline=[_result(rays=0)], current=[_result(rays=10)])
+
+        assert "rays_per_sec" not in [change.metric for change in actual.changes]
+
+    def test_different_cases(self) -> None:
+        """
+        GIVEN runs which share some cases but not others
+        WHEN comparing them
+        THEN only compare the shared cases
+        AND list the cases found in only one of them
+        """
+        actual = compare(
+            baseline=[_result(workload="scene_1"), _result(workload="old")],
+            current=[_result(workload="scene_1"), _result(workload="new")],
+        )
+
+        assert {change.key for change in actual.changes} == {"scene_1/scalar/10x10/1"}
+        assert actual.missing == ["old/scalar/10x10/1"]
+        assert actual.added == ["new/scalar/10x10/1"]
@@ -0,0 +1,203 @@
+import json
+import multiprocessing as mp
+import os
+
+import pytest
+
+from raytracer.benchmarking.runner import (
+    BenchmarkCase,
+    BenchmarkResult,
+    _run_isolated_case,
+    build_cases,
+    load_results,
+    run_case,
+    run_isolated,
+    save_results,
+)
+from raytracer.benchmarking.workloads import (
+    DEEP_REFLECTION,
+    IMAGE_SAVE,
+    SCENE_1,
+    SCENES,
+)
+from raytracer.rendering.engine import RenderEngine
+from raytracer.rendering.framebuffer import Framebuffer
+from raytracer.rendering.shading import Shader
+
+
+class TestBenchmarkCase:
+    def test_key(self) -> None:
+        case = BenchmarkCase(
+            workload=SCENE_1, width=16, height=10, processes=2, engine="scalar"
+        )
+        assert case.key == "scene_1/scalar/16x10/2"
+
+    def test_key_without_engine(self) -> None:
+        case = BenchmarkCase(workload=IMAGE_SAVE, width=16, height=10)
+        assert case.key == "image_save/-/16x10/1"
+
+
+class TestBenchmarkResult:
+    def test_round_trip(self) -> None:
+        """
+        GIVEN a result
+        WHEN converting it to an object and back
+        THEN get the same result
+        AND include the throughputs in the object
+        """
+        result = BenchmarkResult(
+            case=BenchmarkCase(workload=SCENE_1, width=4, height=5, engine="scalar"),
+            wall_time=2.0,
+            first_wall_time=3.0,
+            rays=40,
+            peak_rss_mb=30.0,
+            peak_worker_rss_mb=20.0,
+        )
+
+        actual = result.to_object()
+
+        assert actual["pixels"] == 20
+        assert actual["rays_per_sec"] == 20
+        assert actual["pixels_per_sec"] == 10
+        assert BenchmarkResult.from_object(json.loads(json.dumps(actual))) == result
+
+    def test_no_time(self) -> None:
+        result = BenchmarkResult(
+            case=BenchmarkCase(workload=IMAGE_SAVE, width=4, height=5),
+            wall_time=0.0,
+            first_wall_time=0.0,
+            rays=0,
+            peak_rss_mb=30.0,
+            peak_worker_rss_mb=0.0,
+        )
+
+        assert (result.rays_per_sec, result.pixels_per_sec) == (0, 0)
+
+
+def test_build_cases() -> None:
+    """
+    GIVEN a render workload and the image save workload
+    WHEN building cases for two resolutions, engines and process counts
+    THEN render every combination
+    AND only save at each resolution
+    """
+    actual = build_cases(
+        workloads=[SCENE_1, IMAGE_SAVE],
+        resolutions=[(4, 2), (8, 4)],
+        processes=[1, 2],
+        engines=["scalar", "wavefront"],
+    )
+
+    assert [case.key for case in actual] == [
+        "scene_1/scalar/4x2/1",
+        "scene_1/scalar/4x2/2",
+        "scene_1/wavefront/4x2/1",
+        "scene_1/wavefront/4x2/2",
+        "scene_1/scalar/8x4/1",
+        "scene_1/scalar/8x4/2",
+        "scene_1/wavefront/8x4/1",
+        "scene_1/wavefront/8x4/2",
+        "image_save/-/4x2/1",
+        "image_save/-/8x4/1",
+    ]
+
+
+class TestRunCase:
+    @pytest.mark.parametrize("engine", ["scalar", "wavefront"])
+    def test_render(self, engine: str) -> None:
+        """
+        GIVEN a render workload of mirrors
+        WHEN running it more than once
+        THEN keep the fastest run
+        AND count the camera, reflection and shadow rays the engine traced
+        """
+        # GIVEN
+        case = BenchmarkCase(
+            workload=DEEP_REFLECTION, width=6, height=4, processes=2, engine=engine
+        )
+        scene = SCENES[DEEP_REFLECTION](6, 4)
+        with (
+            Framebuffer(width=6, height=4) as framebuffer,
+            RenderEngine(shader=Shader(), collect_stats=True) as counted,
+        ):
+            list(counted.render(scene=scene, framebuffer=framebuffer, processes=1))
+
+        # WHEN
+        actual = run_case(case=case, repeat=2)
+
+        # THEN
+        assert actual.case == case
+        assert 0 < actual.wall_time <= actual.first_wall_time
+        stats = counted.stats
+        assert actual.rays == (
+            stats.trace.primary_rays + stats.trace.reflection_rays + stats.shadows.rays
+        )
+        assert actual.rays > actual.pixels
+        assert actual.rays_per_sec > actual.pixels_per_sec
+        assert actual.peak_rss_mb > 0
+        assert actual.peak_worker_rss_mb > 0
+
+    def test_image_save(self) -> None:
+        case = BenchmarkCase(workload=IMAGE_SAVE, width=6, height=4)
+
+        actual = run_case(case=case)
+
+        assert actual.wall_time == actual.first_wall_time > 0
+        assert actual.rays == 0
+
+    def test_unknown_workload(self) -> None:
+        case = BenchmarkCase(workload="teapot", width=6, height=4, engine="scalar")
+        with pytest.raises(ValueError, match="Unknown workload 'teapot'"):
+            run_case(case=case)
+
+    def test_unknown_engine(self) -> None:
+        case = BenchmarkCase(workload=SCENE_1, width=6, height=4)
+        with pytest.raises(ValueError, match="Unknown engine 'None'"):
+            run_case(case=case)
+
+
+class TestRunIsolated:
+    def test_run_isolated(self) -> None:
+        case = BenchmarkCase(workload=SCENE_1, width=4, height=2, engine="scalar")
+
+        actual = run_isolated(case=case)
+
+        assert actual.case == case
+        assert actual.wall_time > 0
+
+    def test_run_isolated_error(self) -> None:
+        case = BenchmarkCase(workload="teapot", width=4, height=2)
+        with pytest.raises(ValueError, match="Unknown workload 'teapot'"):
+            run_isolated(case=case)
+
+    @pytest.mark.parametrize("workload", [IMAGE_SAVE, "teapot"])
+    def test_run_isolated_case(self, workload: str) -> None:
+        """
+        GIVEN a case
+        WHEN running it as the isolated process would
+        THEN send back its result, or the error it raised
+        """
+        receiver, sender = mp.Pipe(duplex=False)
+        case = BenchmarkCase(workload=workload, width=4, height=2)
+
+        _run_isolated_case(case=case, repeat=1, sender=sender)
+
+        actual = receiver.recv()
+        if workload == IMAGE_SAVE:
+            assert BenchmarkResult.from_object(actual).case == case
+        else:
+            assert isinstance(actual, ValueError)
+
+
+def test_save_and_load_results(temp_directory: str) -> None:
+    results = [
+        run_case(BenchmarkCase(workload=IMAGE_SAVE, width=4, height=2)),
+        run_case(BenchmarkCase(workload=IMAGE_SAVE, width=8, height=2)),
+    ]
+    filepath = os.path.join(temp_directory, "bench.json")
+
+    save_results(filepath=filepath, results=results)
+
+    assert load_results(filepath) == results
+    with open(filepath) as f:
+        assert json.load(f)["machine"]["cpu_count"] == os.cpu_count()
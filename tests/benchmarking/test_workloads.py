@@ -0,0 +1,47 @@
+import pytest
+
+from raytracer.benchmarking.workloads import (
+    DEEP_REFLECTION,
+    MANY_SPHERES,
+    MANY_SPHERES_COUNT,
+    SCENE_1,
+    SCENES,
+    image,
+)
+from raytracer.core.types.entities import Sphere
+
+
+class TestWorkloads:
+    @pytest.mark.parametrize("workload", [SCENE_1, MANY_SPHERES, DEEP_REFLECTION])
+    def test_scenes(self, workload: str) -> None:
+        scene = SCENES[workload](8, 5)
+
+        assert (scene.width, scene.height) == (8, 5)
+        assert scene.objects
+        assert scene.lights
+
+    def test_many_spheres_is_the_same_every_time(self) -> None:
+        """
+        GIVEN the many sphere scene
+        WHEN building it twice
+        THEN place the same spheres each time
+        """
+        first = SCENES[MANY_SPHERES](8, 5)
+        second = SCENES[MANY_SPHERES](8, 5)
+
+        assert len(first.objects) == MANY_SPHERES_COUNT + 1
+        assert first.objects == second.objects
+
+    def test_deep_reflection_is_mostly_mirrors(self) -> None:
+        scene = SCENES[DEEP_REFLECTION](8, 5)
+
+        mirrors = [obj for obj in scene.objects if obj.name.startswith("Mirror")]
+        assert len(mirrors) == 32
+        assert all(isinstance(obj, Sphere) for obj in mirrors)
+        assert all(obj.material.reflection > 0.9 for obj in mirrors)
+
+    def test_image(self) -> None:
+        actual = image(width=7, height=3)
+
+        assert (actual.width, actual.height) == (7, 3)
+        assert len(set(actual.data)) > 1
@@ -0,0 +1,380 @@
+import hashlib
+import os
+import pickle
+import random
+import struct
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from raytracer.core.types.binary import (
+    HEADER,
+    MAGIC,
+    MappedScene,
+    _layout,
+    _padding,
+    load_scene,
+    load_spheres,
+    save_scene,
+)
+from raytracer.core.types.entities import (
+    ChequeredMaterial,
+    Light,
+    Material,
+    Scene,
+    Sphere,
+)
+from raytracer.core.types.geometry import Point
+from raytracer.core.types.imaging import Colour
+from raytracer.rendering.engine import RenderEngine
+from raytracer.rendering.framebuffer import Framebuffer
+from raytracer.rendering.shading import Shader
+
+
+@pytest.fixture
+def scene() -> Scene:
+    rnd = random.Random(1)
+    solid = Material(colour=Colour(0, 0, 255), diffuse=0.8, specular=0.5)
+    spheres = [
+        Sphere(
+            name=f"Sphere {index}",
+            centre=Point(rnd.uniform(-3, 3), rnd.uniform(-2, 0), rnd.uniform(1, 8)),
+            radius=rnd.uniform(0.05, 0.6),
+            material=solid,
+        )
+        for index in range(20)
+    ]
+    ground = Sphere(
+        name="Ground",
+        centre=Point(0, 10000.5, 1),
+        radius=10000.0,
+        material=ChequeredMaterial(
+            colour_1=Colour(66, 5, 0),
+            colour_2=Colour(230, 184, 125),
+            ambient=0.2,
+            reflection=0.2,
+        ),
+    )
+    return Scene(
+        camera=Point(0, -0.35, -1),
+        objects=[*spheres, ground],
+        lights=[
+            Light(position=Point(1.5, -0.5, -10), colour=Colour(255, 255, 255)),
+            Light(position=Point(-0.5, -10.5, 0), colour=Colour(230, 230, 230)),
+        ],
+        width=16,
+        height=10,
+    )
+
+
+@pytest.fixture
+def path(temp_directory: str) -> str:
+    return os.path.join(temp_directory, "test.scene")
+
+
+def _render(scene: Scene, processes: int = 1) -> bytes:
+    with (
+        Framebuffer(width=scene.width, height=scene.height) as framebuffer,
+        RenderEngine(shader=Shader()) as engine,
+    ):
+        list(engine.render(scene=scene, framebuffer=framebuffer, processes=processes))
+        return bytes(framebuffer.buffer)
+
+
+def _overwrite(path: str, section: str, index: int, value: int) -> None:
+    """
+    Overwrites an entry of a section of a binary scene, then the digest to match,
+    as a file made to read out of bounds would
+    """
+    with open(path, "rb") as f:
+        data = bytearray(f.read())
+    header = list(HEADER.unpack_from(data))
+    lights, spheres, materials, nodes, strings = header[2:7]
+    start = offset = HEADER.size
+    for name, typecode, count in _layout(
+        spheres=spheres,
+        materials=materials,
+        lights=lights,
+        nodes=nodes,
+        strings=strings,
+    ):
+        size = struct.calcsize(f"<{typecode}")
+        if name == section:
+            position = offset + index % count * size
+            struct.pack_into(f"<{typecode}", data, position, value)
+        end = offset + count * size
+        offset = end + _padding(end)
+    header[-1] = hashlib.sha256(data[start:offset]).digest()
+    HEADER.pack_into(data, 0, *header)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+class TestBinaryScene:
+    def test_save_and_load(self, scene: Scene, path: str) -> None:
+        """
+        GIVEN a scene saved to a binary file
+        WHEN loading it
+        THEN give the same camera, spheres and lights
+        AND the hierarchy saved with it rather than building another
+        AND let spheres sharing a material share it again
+        """
+        # GIVEN
+        count = save_scene(path=path, scene=scene)
+
+        # WHEN
+        actual = load_scene(path=path, width=16, height=10)
+
+        # THEN
+        assert count == 21
+        assert isinstance(actual, MappedScene)
+        assert actual.camera == scene.camera
+        assert list(actual.objects) == scene.objects
+        assert actual.lights == scene.lights
+        assert actual.bvh == scene.bvh
+        assert actual.compiled is not None
+        assert actual.bvh is actual.compiled.bvh
+        assert actual.objects[0].material is actual.objects[1].material
+
+    def test_spheres_sequence(self, scene: Scene, path: str) -> None:
+        # GIVEN
+        save_scene(path=path, scene=scene)
+
+        # WHEN
+        spheres = load_scene(path=path, width=16, height=10).objects
+
+        # THEN
+        assert len(spheres) == 21
+        assert spheres[-1] == scene.objects[-1]
+        assert spheres[2:5] == scene.objects[2:5]
+        with pytest.raises(IndexError):
+            spheres[21]
+
+    def test_render(self, scene: Scene, path: str) -> None:
+        """
+        GIVEN a scene saved to a binary file
+        WHEN rendering the loaded scene across processes
+        THEN each worker maps the file, rather than being sent the scene
+        AND renders the same image as the original scene
+        """
+        # GIVEN
+        save_scene(path=path, scene=scene)
+        loaded = load_scene(path=path, width=16, height=10)
+
+        # WHEN
+        actual = _render(loaded, processes=2)
+
+        # THEN
+        assert len(pickle.dumps(loaded)) < 1024
+        assert actual == _render(scene)
+
+    def test_pickle_changed_file(self, scene: Scene, path: str) -> None:
+        """
+        GIVEN a pickled scene loaded from a binary file
+        WHEN the file is saved again with another scene
+        THEN refuse to unpickle it as the scene it no longer is
+        """
+        # GIVEN
+        save_scene(path=path, scene=scene)
+        payload = pickle.dumps(load_scene(path=path, width=16, height=10))
+        assert pickle.loads(payload).objects[0] == scene.objects[0]
+
+        # WHEN
+        save_scene(path=path, scene=replace(scene, objects=scene.objects[1:]))
+
+        # THEN
+        with pytest.raises(ValueError, match="has changed since the scene was loaded"):
+            pickle.loads(payload)
+
+    def test_detach(self, scene: Scene, path: str) -> None:
+        """
+        GIVEN a detached scene loaded from a binary file
+        WHEN unpickling it where the file doesn't exist
+        THEN read the contents it was pickled with
+        AND render the same image as the original scene
+        """
+        # GIVEN
+        save_scene(path=path, scene=scene)
+        payload = pickle.dumps(load_scene(path=path, width=16, height=10).detach())
+        os.remove(path)
+
+        # WHEN
+        actual = pickle.loads(payload)
+
+        # THEN
+        assert actual.path == path
+        assert list(actual.objects) == scene.objects
+        assert _render(actual, processes=2) == _render(scene)
+
+    def test_import_spheres(self, scene: Scene, path: str) -> None:
+        """
+        GIVEN arrays of spheres with and without colours
+        WHEN saving them with a scene
+        THEN add them after the scene's own spheres, unnamed
+        AND give all those of each colour one default material
+        AND render them as if they were part of the scene
+        """
+        # GIVEN
+        rnd = np.random.default_rng(1)
+        coloured = np.column_stack(
+            [
+                rnd.uniform(-3, 3, 10),
+                rnd.uniform(-2, 0, 10),
+                rnd.uniform(1, 8, 10),
+                rnd.uniform(0.05, 0.2, 10),
+                np.repeat([[255, 0, 0], [0, 255, 0]], 5, axis=0),
+            ]
+        )
+        plain = np.array([[0.1, -0.2, 3.0, 0.25]], dtype=np.float32)
+
+        # WHEN
+        count = save_scene(path=path, scene=scene, spheres=[coloured, plain])
+        actual = load_scene(path=path, width=16, height=10)
+
+        # THEN
+        assert count == 32
+        objects = list(actual.objects)
+        assert objects[:21] == scene.objects
+        imported = objects[21:]
+        assert {sphere.name for sphere in imported} == {""}
+        assert imported[0].centre == Point(*coloured[0, :3])
+        assert imported[0].radius == coloured[0, 3]
+        assert imported[-1].radius == 0.25
+        assert [sphere.material.colour_at(Point(0, 0, 0)) for sphere in imported] == [
+            Colour(255, 0, 0)
+        ] * 5 + [Colour(0, 255, 0)] * 5 + [Colour(255, 255, 255)]
+        assert imported[0].material is imported[4].material
+        assert imported[0].material == Material(colour=Colour(255, 0, 0))
+        expected = Scene(
+            camera=scene.camera,
+            objects=objects,
+            lights=scene.lights,
+            width=16,
+            height=10,
+        )
+        assert _render(actual) == _render(expected)
+
+    @pytest.mark.parametrize(
+        "spheres, match",
+        [
+            (np.zeros((3, 5)), "must have a row for each sphere"),
+            (np.zeros(4), "must have a row for each sphere"),
+            (np.array([["a", "b", "c", "d"]]), "must be numbers"),
+        ],
+        ids=["columns", "one dimension", "strings"],
+    )
+    def test_import_invalid_spheres(
+        self, scene: Scene, path: str, spheres: np.ndarray, match: str
+    ) -> None:
+        with pytest.raises(ValueError, match=match):
+            save_scene(path=path, scene=scene, spheres=[spheres])
+        assert not os.path.exists(path)
+
+    def test_load_spheres(self, temp_directory: str) -> None:
+        # GIVEN
+        spheres = np.arange(12, dtype=np.float64).reshape(3, 4)
+        path = os.path.join(temp_directory, "spheres.npy")
+        np.save(path, spheres)
+
+        # WHEN
+        actual = load_spheres(path)
+
+        # THEN
+        assert np.array_equal(actual, spheres)
+        with pytest.raises(ValueError, match="spheres.npy' must have a row"):
+            np.save(path, spheres.T)
+            load_spheres(path)
+
+    @pytest.mark.parametrize(
+        "contents, match",
+        [
+            (b"", "is not a binary scene"),
+            (b"{" * HEADER.size, "is not a binary scene"),
+            (
+                HEADER.pack(MAGIC, 2, 0, 0, 0, 0, 0, 0, 0, 0, bytes(32)),
+                "is version 2 of the binary scene format, expected 1",
+            ),
+            (
+                HEADER.pack(MAGIC, 1, 0, 2, 0, 0, 0, 0, 0, 0, bytes(32))
+                + struct.pack("<3d", 0, 0, 1),
+                "is truncated",
+            ),
+        ],
+        ids=["empty", "JSON", "version", "truncated"],
+    )
+    def test_load_invalid(self, path: str, contents: bytes, match: str) -> None:
+        with open(path, "wb") as f:
+            f.write(contents)
+
+        with pytest.raises(ValueError, match=match):
+            load_scene(path=path, width=16, height=10)
+
+    def test_load_changed_contents(self, scene: Scene, path: str) -> None:
+        """
+        GIVEN a binary scene whose contents were changed after it was saved
+        WHEN loading it
+        THEN raise a ValueError as they don't match its digest
+        """
+        # GIVEN
+        save_scene(path=path, scene=scene)
+        with open(path, "r+b") as f:
+            f.seek(HEADER.size)
+            f.write(b"\xff")
+
+        # WHEN
+        with pytest.raises(ValueError, match="is corrupt, it doesn't match its digest"):
+            load_scene(path=path, width=16, height=10)
+
+    @pytest.mark.parametrize(
+        "section, index, value, match",
+        [
+            ("materials", 0, 2, "a sphere's material"),
+            ("materials", 0, -1, "a sphere's material"),
+            ("names", 21, 1000, "a sphere's name"),
+            ("names", 2, 0, "a sphere's name"),
+            ("indices", 0, 21, "a sphere in the hierarchy"),
+            ("offsets", -1, 1000, "the spheres of a leaf"),
+            ("counts", -1, -1, "the spheres of a leaf"),
+            ("offsets", 0, 0, "a child of a node"),
+            ("offsets", 0, 1000, "a child of a node"),
+            ("axes", 0, 3, "the axis of a node"),
+        ],
+        ids=[
+            "material",
+            "negative material",
+            "name",
+            "name before the one before",
+            "sphere",
+            "leaf",
+            "negative count",
+            "child before its node",
+            "child",
+            "axis",
+        ],
+    )
+    def test_load_out_of_range(
+        self,
+        scene: Scene,
+        path: str,
+        section: str,
+        index: int,
+        value: int,
+        match: str,
+    ) -> None:
+        """
+        GIVEN a binary scene with an index out of the range of what it indexes
+        AND a digest which matches
+        WHEN loading it, or unpickling a scene loaded from it before
+        THEN raise a ValueError rather than reading out of bounds
+        """
+        # GIVEN
+        save_scene(path=path, scene=scene)
+        payload = pickle.dumps(load_scene(path=path, width=16, height=10))
+        _overwrite(path=path, section=section, index=index, value=value)
+
+        # WHEN
+        with pytest.raises(ValueError, match=f"is corrupt, {match} is out of range"):
+            load_scene(path=path, width=16, height=10)
+        with pytest.raises(ValueError, match=f"is corrupt, {match} is out of range"):
+            pickle.loads(payload)
@@ -0,0 +1,293 @@
+import pickle
+import random
+import threading
+from dataclasses import replace
+from typing import Any
+
+import pytest
+
+from raytracer.core.types.bvh import BVH, MAX_LEAF_SIZE, BoundingBox
+from raytracer.core.types.entities import Material, Ray, Sphere
+from raytracer.core.types.geometry import Point
+from raytracer.core.types.imaging import Colour
+
+
+def _spheres(count: int, seed: int = 1) -> list[Sphere]:
+    rnd = random.Random(seed)
+    return [
+        Sphere(
+            name=f"Sphere {index}",
+            centre=Point(rnd.uniform(-3, 3), rnd.uniform(-2, 2), rnd.uniform(1, 8)),
+            radius=rnd.uniform(0.05, 0.3),
+            material=Material(colour=Colour(255, 0, 0)),
+        )
+        for index in range(count)
+    ]
+
+
+def _linear_scan(ray: Ray, objects: list[Sphere]) -> tuple:
+    dist_min, index_hit = None, None
+    for index, obj in enumerate(objects):
+        dist = obj.intersects(ray)
+        if dist is not None and (dist_min is None or dist < dist_min):
+            dist_min, index_hit = dist, index
+    return dist_min, index_hit
+
+
+def _search(ray: Ray, objects: list[Sphere]) -> dict[str, Any]:
+    """The arguments searching the hierarchy for the objects hit by the ray"""
+    return {
+        "origin": (ray.origin.x, ray.origin.y, ray.origin.z),
+        "direction": (ray.direction.x, ray.direction.y, ray.direction.z),
+        "intersect": lambda index: objects[index].intersects(ray),
+    }
+
+
+def _any_hits(ray: Ray, objects: list[Sphere], max_distance: float) -> set[int]:
+    return {
+        index
+        for index, obj in enumerate(objects)
+        if (dist := obj.intersects(ray)) is not None and dist < max_distance
+    }
+
+
+class TestBoundingBox:
+    def test_centroid(self) -> None:
+        box = BoundingBox(lower=(0, -2, 1), upper=(2, 2, 2))
+        assert box.centroid == (1, 0, 1.5)
+
+    def test_surface_area(self) -> None:
+        box = BoundingBox(lower=(0, 0, 0), upper=(1, 2, 3))
+        assert box.surface_area == 22
+
+    def test_union(self) -> None:
+        box_1 = BoundingBox(lower=(0, 0, 0), upper=(1, 1, 1))
+        box_2 = BoundingBox(lower=(-1, 0.5, 0), upper=(0.5, 2, 1))
+        expected = BoundingBox(lower=(-1, 0, 0), upper=(1, 2, 1))
+        assert box_1.union(box_2) == expected
+
+    def test_enclosing(self) -> None:
+        boxes = [
+            BoundingBox(lower=(0, 0, 0), upper=(1, 1, 1)),
+            BoundingBox(lower=(-1, 0.5, 0), upper=(0.5, 2, 1)),
+            BoundingBox(lower=(0, 0, -3), upper=(0, 0, 0)),
+        ]
+        expected = BoundingBox(lower=(-1, 0, -3), upper=(1, 2, 1))
+        assert BoundingBox.enclosing(boxes) == expected
+
+
+class TestBVH:
+    def test_build_empty(self) -> None:
+        bvh = BVH.build([])
+        assert len(bvh) == 0
+
+    def test_build_overlapping_primitives_is_a_leaf(self) -> None:
+        """
+        GIVEN primitives which overlap so much that splitting them saves nothing
+        WHEN building the hierarchy
+        THEN keep them all in a single leaf
+        """
+        bounds = [
+            BoundingBox(lower=(0, 0, 0), upper=(10, 10, 10)),
+            BoundingBox(lower=(0.1, 0.1, 0.1), upper=(10.1, 10.1, 10.1)),
+        ]
+
+        bvh = BVH.build(bounds)
+
+        assert len(bvh) == 1
+        assert list(bvh.counts) == [2]
+        assert list(bvh.indices) == [0, 1]
+
+    def test_build_splits_large_scenes(self) -> None:
+        """
+        GIVEN many primitives
+        WHEN building the hierarchy
+        THEN every primitive is in exactly one leaf
+        AND no leaf holds more than the maximum
+        AND every node encloses its children
+        """
+        bounds = [obj.bounds() for obj in _spheres(200)]
+
+        bvh = BVH.build(bounds)
+
+        assert sorted(bvh.indices) == list(range(200))
+        leaves = [node for node in range(len(bvh)) if bvh.counts[node]]
+        assert max(bvh.counts[node] for node in leaves) <= MAX_LEAF_SIZE
+        for node in range(len(bvh)):
+            if bvh.counts[node]:
+                continue
+            for child in (node + 1, bvh.offsets[node]):
+                for axis in range(3):
+                    assert bvh.lower[node * 3 + axis] <= bvh.lower[child * 3 + axis]
+                    assert bvh.upper[node * 3 + axis] >= bvh.upper[child * 3 + axis]
+
+    def test_build_coincident_primitives(self) -> None:
+        """
+        GIVEN more primitives than fit in a leaf all in the same place
+        WHEN building the hierarchy
+        THEN split them evenly
+        """
+        box = BoundingBox(lower=(0, 0, 0), upper=(1, 1, 1))
+
+        bvh = BVH.build([box] * (MAX_LEAF_SIZE + 2))
+
+        assert len(bvh) == 3
+        assert list(bvh.counts) == [0, 3, 3]
+
+    def test_build_flat_primitives(self) -> None:
+        """
+        GIVEN primitives with no surface area
+        WHEN building the hierarchy
+        THEN keep them in a leaf
+        """
+        bounds = [BoundingBox(lower=(x, 0, 0), upper=(x, 0, 0)) for x in range(3)]
+
+        bvh = BVH.build(bounds)
+
+        assert list(bvh.counts) == [3]
+
+    def test_pickle(self) -> None:
+        bvh = BVH.build([obj.bounds() for obj in _spheres(50)])
+        assert pickle.loads(pickle.dumps(bvh)) == bvh
+
+    def test_pickle_drops_tests(self) -> None:
+        bvh = BVH.build([obj.bounds() for obj in _spheres(50)])
+        payload = pickle.dumps(bvh)
+
+        bvh.tests = 10
+
+        assert pickle.dumps(bvh) == payload
+        assert pickle.loads(payload).tests == 0
+
+    @pytest.mark.parametrize("count", [0, 3, 300])
+    def test_find_nearest_matches_linear_scan(self, count: int) -> None:
+        """
+        GIVEN a number of spheres
+        AND rays in random directions
+        WHEN finding the nearest sphere using the hierarchy
+        THEN find the same sphere and distance as a linear scan
+        """
+        # GIVEN
+        objects = _spheres(count)
+        bvh = BVH.build([obj.bounds() for obj in objects])
+        rnd = random.Random(2)
+        rays = [
+            Ray(
+                origin=Point(0, 0, -1),
+                direction=Point(rnd.uniform(-1, 1), rnd.uniform(-1, 1), 1),
+            )
+            for _ in range(200)
+        ] + [
+            Ray(origin=Point(0, 0, -1), direction=Point(0, 0, 1)),
+            Ray(origin=Point(0, 0, 20), direction=Point(0, 0, -1)),
+        ]
+
+        for ray in rays:
+            # WHEN
+            actual = bvh.find_nearest(**_search(ray, objects))
+
+            # THEN
+            assert actual == _linear_scan(ray, objects)
+
+    def test_find_nearest_equal_hits(self) -> None:
+        """
+        GIVEN identical spheres split across two leaves
+        AND a ray which visits the leaf with the later spheres first
+        WHEN finding the nearest sphere
+        THEN return the first one, as a linear scan would
+        """
+        sphere = _spheres(1)[0]
+        objects = [
+            replace(sphere, name=f"Copy {index}") for index in range(MAX_LEAF_SIZE + 2)
+        ]
+        bvh = BVH.build([obj.bounds() for obj in objects])
+        centre = objects[0].centre
+        ray = Ray(
+            origin=Point(centre.x + 1, centre.y, centre.z - 1),
+            direction=Point(-1, 0, 1),
+        )
+
+        actual_distance, actual_index = bvh.find_nearest(**_search(ray, objects))
+
+        assert actual_index == 0
+        assert actual_distance is not None
+        assert actual_distance == objects[0].intersects(ray)
+
+    @pytest.mark.parametrize("count", [0, 3, 300])
+    def test_find_any(self, count: int) -> None:
+        """
+        GIVEN a number of spheres
+        AND rays in random directions with random lengths
+        WHEN finding any sphere within the length of each ray
+        THEN find one of the spheres a linear scan finds
+        AND only find nothing when a linear scan finds nothing
+        """
+        # GIVEN
+        objects = _spheres(count)
+        bvh = BVH.build([obj.bounds() for obj in objects])
+        rnd = random.Random(3)
+        rays = [
+            (
+                Ray(
+                    origin=Point(0, 0, -1),
+                    direction=Point(rnd.uniform(-1, 1), rnd.uniform(-1, 1), 1),
+                ),
+                rnd.uniform(1, 10),
+            )
+            for _ in range(200)
+        ]
+
+        for ray, max_distance in rays:
+            # WHEN
+            actual = bvh.find_any(**_search(ray, objects), max_distance=max_distance)
+
+            # THEN
+            expected = _any_hits(ray, objects, max_distance)
+            if expected:
+                assert actual in expected
+            else:
+                assert actual is None
+
+    def test_counts_tests(self) -> None:
+        """
+        GIVEN a hierarchy over many spheres
+        WHEN finding the nearest and any sphere hit by a ray
+        THEN count the intersection tests made
+        AND test fewer spheres than a linear scan
+        """
+        objects = _spheres(300)
+        bvh = BVH.build([obj.bounds() for obj in objects])
+        ray = Ray(origin=Point(0, 0, -1), direction=Point(0.1, 0.1, 1))
+
+        bvh.find_nearest(**_search(ray, objects))
+        nearest = bvh.tests
+        bvh.find_any(**_search(ray, objects), max_distance=10)
+
+        assert 0 < nearest < len(objects)
+        assert nearest < bvh.tests < nearest + len(objects)
+
+    def test_counts_tests_per_thread(self) -> None:
+        """
+        GIVEN a hierarchy over many spheres
+        WHEN finding the nearest sphere hit by a ray in another thread
+        THEN count the tests made there apart from those made in this thread
+        """
+        # GIVEN
+        objects = _spheres(300)
+        bvh = BVH.build([obj.bounds() for obj in objects])
+        ray = Ray(origin=Point(0, 0, -1), direction=Point(0.1, 0.1, 1))
+        bvh.tests = 10
+        counted = []
+
+        def search() -> None:
+            bvh.find_nearest(**_search(ray, objects))
+            counted.append(bvh.tests)
+
+        # WHEN
+        thread = threading.Thread(target=search)
+        thread.start()
+        thread.join()
+
+        # THEN
+        assert bvh.tests == 10
+        assert 0 < counted[0] < len(objects)
@@ -0,0 +1,272 @@
+import pickle
+import random
+from dataclasses import replace
+
+import pytest
+
+from raytracer.core.types.compiled import CompiledScene, compile_scene, vector
+from raytracer.core.types.entities import (
+    BaseMaterial,
+    ChequeredMaterial,
+    Light,
+    Material,
+    Primitive,
+    Ray,
+    Scene,
+    Sphere,
+)
+from raytracer.core.types.geometry import Point
+from raytracer.core.types.imaging import Colour
+
+
+@pytest.fixture
+def chequered() -> ChequeredMaterial:
+    return ChequeredMaterial(
+        colour_1=Colour(66, 5, 0),
+        colour_2=Colour(230, 184, 125),
+        ambient=0.2,
+        reflection=0.2,
+    )
+
+
+@pytest.fixture
+def scene(chequered: ChequeredMaterial) -> Scene:
+    rnd = random.Random(1)
+    solid = Material(colour=Colour(0, 0, 255), diffuse=0.8, specular=0.5)
+    spheres = [
+        Sphere(
+            name=f"Sphere {index}",
+            centre=Point(rnd.uniform(-3, 3), rnd.uniform(-2, 2), rnd.uniform(1, 8)),
+            radius=rnd.uniform(0.05, 0.6),
+            material=solid,
+        )
+        for index in range(30)
+    ]
+    ground = Sphere(
+        name="Ground",
+        centre=Point(0, 10000.5, 1),
+        radius=10000.0,
+        material=chequered,
+    )
+    return Scene(
+        camera=Point(0, -0.35, -1),
+        objects=[*spheres, ground],
+        lights=[
+            Light(position=Point(1.5, -0.5, -10), colour=Colour(255, 255, 255)),
+            Light(position=Point(-0.5, -10.5, 0), colour=Colour(230, 230, 230)),
+        ],
+        width=16,
+        height=10,
+    )
+
+
+def _rays(count: int, seed: int = 2) -> list[Ray]:
+    rnd = random.Random(seed)
+    return [
+        Ray(
+            origin=Point(0, -0.35, -1),
+            direction=Point(rnd.uniform(-1, 1), rnd.uniform(-0.5, 1), 1),
+        )
+        for _ in range(count)
+    ]
+
+
+def _colour(colour: Colour) -> tuple[int, int, int]:
+    return (colour.r, colour.g, colour.b)
+
+
+class TestCompiledScene:
+    def test_from_scene(self, scene: Scene) -> None:
+        """
+        GIVEN a scene whose spheres share a solid material
+        AND a chequered ground
+        WHEN compiling it
+        THEN store each material once
+        AND the geometry and lights in flat arrays
+        """
+        # WHEN
+        actual = CompiledScene.from_scene(scene)
+
+        # THEN
+        assert len(actual) == len(scene.objects)
+        assert actual.light_count == 2
+        assert actual.camera == vector(scene.camera)
+        assert list(actual.materials) == [0] * 30 + [1]
+        assert list(actual.centres[-3:]) == [0, 10000.5, 1]
+        assert actual.radii_squared[-1] == 1e8
+        assert list(actual.chequered) == [False, True]
+        assert list(actual.colour_1) == [0, 0, 255, 66, 5, 0]
+        assert list(actual.colour_2) == [0, 0, 255, 230, 184, 125]
+        assert list(actual.diffuse) == [0.8, 1.0]
+        assert list(actual.specular) == [0.5, 1.0]
+        assert list(actual.reflection) == [0.5, 0.2]
+        assert list(actual.light_positions) == [1.5, -0.5, -10, -0.5, -10.5, 0]
+        assert list(actual.light_colours) == [255, 255, 255, 230, 230, 230]
+        assert actual.bvh is scene.bvh
+
+    def test_from_scene_unsupported_primitive(self, scene: Scene) -> None:
+        class Sidebar(Primitive):
+            pass
+
+        scene.objects = [
+            Sidebar(
+                name="Sidebar",
+                centre=Point(0, 0, 0),
+                material=Material(colour=Colour(0, 0, 0)),
+            )
+        ]
+
+        with pytest.raises(ValueError, match="'Sidebar' is not supported"):
+            CompiledScene.from_scene(scene)
+
+    def test_from_scene_unsupported_material(self, scene: Scene) -> None:
+        scene.objects = [
+            Sphere(
+                name="Sphere", centre=Point(0, 0, 0), material=BaseMaterial(), radius=1
+            )
+        ]
+
+        with pytest.raises(ValueError, match="'BaseMaterial' is not supported"):
+            CompiledScene.from_scene(scene)
+
+    def test_pickle(self, scene: Scene) -> None:
+        compiled = CompiledScene.from_scene(scene)
+
+        assert pickle.loads(pickle.dumps(compiled)) == compiled
+
+    def test_intersect_matches_sphere(self, scene: Scene) -> None:
+        """
+        GIVEN a compiled scene
+        AND rays in random directions
+        WHEN intersecting each ray with each sphere
+        THEN find exactly the distances the spheres do
+        """
+        # GIVEN
+        compiled = CompiledScene.from_scene(scene)
+
+        for ray in _rays(50):
+            for index, obj in enumerate(scene.objects):
+                # WHEN
+                actual = compiled.intersect(
+                    index=index,
+                    origin=vector(ray.origin),
+                    direction=vector(ray.direction),
+                )
+
+                # THEN
+                assert actual == obj.intersects(ray)
+
+    @pytest.mark.parametrize("use_bvh", [True, False], ids=["BVH", "linear scan"])
+    def test_find_nearest(self, scene: Scene, use_bvh: bool) -> None:
+        """
+        GIVEN a compiled scene
+        AND rays in random directions
+        WHEN finding the nearest sphere each ray hits
+        THEN find the sphere and distance a scan of the spheres finds
+        """
+        # GIVEN
+        compiled = CompiledScene.from_scene(scene)
+
+        for ray in _rays(200):
+            hits = [
+                (dist, index)
+                for index, obj in enumerate(scene.objects)
+                if (dist := obj.intersects(ray)) is not None
+            ]
+            expected = min(hits) if hits else (None, None)
+
+            # WHEN
+            actual = compiled.find_nearest(
+                origin=vector(ray.origin),
+                direction=vector(ray.direction),
+                use_bvh=use_bvh,
+            )
+
+            # THEN
+            assert actual == expected
+
+    def test_find_any(self, scene: Scene) -> None:
+        """
+        GIVEN a compiled scene
+        AND rays in random directions
+        WHEN finding any sphere within a short distance of each ray
+        THEN find one the ray hits that close, or nothing if there isn't one
+        """
+        # GIVEN
+        compiled = CompiledScene.from_scene(scene)
+
+        for ray in _rays(200):
+            expected = {
+                index
+                for index, obj in enumerate(scene.objects)
+                if (dist := obj.intersects(ray)) is not None and dist < 5
+            }
+
+            # WHEN
+            actual = compiled.find_any(
+                origin=vector(ray.origin),
+                direction=vector(ray.direction),
+                max_distance=5,
+            )
+
+            # THEN
+            if expected:
+                assert actual in expected
+            else:
+                assert actual is None
+
+    def test_normal_matches_sphere(self, scene: Scene) -> None:
+        compiled = CompiledScene.from_scene(scene)
+        position = Point(0.3, -0.2, 0.1)
+
+        for index, obj in enumerate(scene.objects):
+            actual = compiled.normal(index=index, position=vector(position))
+
+            assert actual == vector(obj.normal(position))
+
+    def test_colour_at_matches_material(
+        self, scene: Scene, chequered: ChequeredMaterial
+    ) -> None:
+        """
+        GIVEN a compiled scene with a solid and a chequered material
+        WHEN finding their colours across the ground
+        THEN give the colours the materials do
+        """
+        # GIVEN
+        compiled = CompiledScene.from_scene(scene)
+        solid = scene.objects[0].material
+
+        for x in range(-4, 4):
+            for z in range(-4, 4):
+                position = Point(x + 0.5, 0.5, z + 0.5)
+
+                # WHEN
+                actual = [
+                    compiled.colour_at(material=material, position=vector(position))
+                    for material in (0, 1)
+                ]
+
+                # THEN
+                assert actual == [
+                    _colour(solid.colour_at(position)),
+                    _colour(chequered.colour_at(position)),
+                ]
+
+
+def test_compile_scene(scene: Scene) -> None:
+    """
+    GIVEN a scene
+    WHEN compiling it twice
+    AND compiling a copy with different objects
+    THEN compile the scene only once
+    AND compile the copy afresh
+    """
+    # WHEN
+    first = compile_scene(scene)
+    second = compile_scene(scene)
+    other = compile_scene(replace(scene, objects=scene.objects[:1]))
+
+    # THEN
+    assert second is first
+    assert len(first) == len(scene.objects)
+    assert len(other) == 1
@@ -2,6 +2,7 @@ from typing import Optional
 
 import pytest
 
+from raytracer.core.types.bvh import BoundingBox
 from raytracer.core.types.entities import (
     ChequeredMaterial,
     Light,
@@ -255,3 +256,21 @@ class TestScene:
         )
         actual = Scene.from_object(data=scene_data, width=640, height=480)
         assert actual == expected
+
+
+class TestSphereBounds:
+    def test_bounds(self) -> None:
+        sphere = Sphere(
+            name="Sphere",
+            centre=Point(1, -2, 3),
+            material=Material(colour=Colour(255, 0, 0)),
+            radius=0.5,
+        )
+
+        actual = sphere.bounds()
+
+        assert actual == BoundingBox(lower=(0.5, -2.5, 2.5), upper=(1.5, -1.5, 3.5))
+
+    def test_scene_builds_bvh(self, scene_data: dict) -> None:
+        scene = Scene.from_object(data=scene_data, width=640, height=480)
+        assert list(scene.bvh.indices) == [0]
@@ -1,4 +1,6 @@
-from raytracer.core.types.imaging import Canvas, Colour
+import pytest
+
+from raytracer.core.types.imaging import CHANNELS, Canvas, Colour, quantize
 
 
 class TestColour:
@@ -65,3 +67,171 @@ class TestCanvas:
         pixel = Colour(33, 12, 111)
         canvas.paint(x=1, y=1, pixel=pixel)
         assert canvas.pixels[1][1] == pixel
+
+    def test_defaults_to_black(self) -> None:
+        """
+        GIVEN no buffer
+        WHEN creating a canvas
+        THEN it allocates three bytes for each pixel
+        AND every pixel is black
+        """
+        # WHEN
+        canvas = Canvas(width=2, height=3)
+
+        # THEN
+        assert bytes(canvas.data) == bytes(2 * 3 * CHANNELS)
+        assert canvas.pixels == [[Colour(0, 0, 0)] * 2] * 3
+
+    def test_paint_writes_bytes(self) -> None:
+        """
+        GIVEN a canvas
+        WHEN painting a pixel
+        THEN its red, green and blue are written to its three bytes
+        """
+        # GIVEN
+        canvas = Canvas(width=2, height=2)
+
+        # WHEN
+        canvas.paint(x=0, y=1, pixel=Colour(1, 2, 3))
+
+        # THEN
+        assert bytes(canvas.data) == bytes(6) + bytes([1, 2, 3, 0, 0, 0])
+
+    def test_set_row(self) -> None:
+        """
+        GIVEN a canvas
+        WHEN setting a row
+        THEN only the bytes of that row change
+        """
+        # GIVEN
+        canvas = Canvas(width=2, height=3)
+
+        # WHEN
+        canvas.set_row(index=1, row=[Colour(1, 2, 3), Colour(4, 5, 6)])
+
+        # THEN
+        assert bytes(canvas.row(1)) == bytes([1, 2, 3, 4, 5, 6])
+        assert canvas.pixels[1] == [Colour(1, 2, 3), Colour(4, 5, 6)]
+        assert bytes(canvas.row(0)) == bytes(canvas.row(2)) == bytes(6)
+
+    def test_set_row_from_column(self) -> None:
+        """
+        GIVEN a canvas
+        WHEN setting part of a row from a column
+        THEN only the pixels from that column are written
+        """
+        # GIVEN
+        canvas = Canvas(width=3, height=1)
+
+        # WHEN
+        canvas.set_row(index=0, row=[Colour(1, 2, 3)], start=1)
+
+        # THEN
+        assert bytes(canvas.row(0)) == bytes(3) + bytes([1, 2, 3]) + bytes(3)
+
+    def test_set_row_every_other_column(self) -> None:
+        """
+        GIVEN a canvas
+        WHEN setting a row with a step of two
+        THEN the pixels are written to every other column
+        AND the columns between are left alone
+        """
+        # GIVEN
+        canvas = Canvas(width=4, height=1)
+
+        # WHEN
+        canvas.set_row(index=0, row=[Colour(1, 2, 3), Colour(4, 5, 6)], start=1, step=2)
+
+        # THEN
+        assert canvas.pixels[0] == [
+            Colour(0, 0, 0),
+            Colour(1, 2, 3),
+            Colour(0, 0, 0),
+            Colour(4, 5, 6),
+        ]
+
+    def test_rows(self) -> None:
+        """
+        GIVEN a canvas over a buffer
+        WHEN taking a range of rows
+        THEN give the bytes of those rows
+        """
+        # GIVEN
+        canvas = Canvas(width=1, height=3, buffer=bytearray(range(9)))
+
+        # WHEN
+        actual = canvas.rows(start=1, stop=3)
+
+        # THEN
+        assert bytes(actual) == bytes(range(3, 9))
+
+    def test_wraps_buffer(self) -> None:
+        """
+        GIVEN an existing buffer
+        WHEN creating a canvas over it
+        THEN painting the canvas writes to the buffer
+        """
+        # GIVEN
+        buffer = bytearray(2 * 1 * CHANNELS)
+        canvas = Canvas(width=2, height=1, buffer=buffer)
+
+        # WHEN
+        canvas.paint(x=1, y=0, pixel=Colour(7, 8, 9))
+
+        # THEN
+        assert buffer == bytearray([0, 0, 0, 7, 8, 9])
+
+    def test_wrong_buffer_size(self) -> None:
+        """
+        GIVEN a buffer too small for the canvas
+        WHEN creating a canvas over it
+        THEN raise a ValueError giving the size needed
+        """
+        # GIVEN
+        buffer = bytearray(11)
+
+        # WHEN
+        with pytest.raises(ValueError, match="A 2x2 canvas needs 12 bytes, not 11"):
+            Canvas(width=2, height=2, buffer=buffer)
+
+    def test_copy(self) -> None:
+        """
+        GIVEN a canvas
+        WHEN copying it
+        THEN the copy has the same pixels
+        AND painting the copy leaves the original alone
+        """
+        # GIVEN
+        canvas = Canvas(width=2, height=2)
+        canvas.paint(x=1, y=1, pixel=Colour(1, 2, 3))
+
+        # WHEN
+        actual = canvas.copy()
+        actual.paint(x=0, y=0, pixel=Colour(4, 5, 6))
+
+        # THEN
+        assert actual.pixels[1][1] == Colour(1, 2, 3)
+        assert canvas.pixels[0][0] == Colour(0, 0, 0)
+        assert actual != canvas
+
+
+@pytest.mark.parametrize(
+    "radiance, expected",
+    [
+        ((0.0, 0.0, 0.0), Colour(0, 0, 0)),
+        ((12.4, 12.6, 254.7), Colour(12, 13, 255)),
+        ((-3.0, 300.5, 1000.0), Colour(0, 255, 255)),
+    ],
+)
+def test_quantize(radiance: tuple[float, float, float], expected: Colour) -> None:
+    """
+    GIVEN light which is neither rounded nor clamped
+    WHEN quantizing it
+    THEN round each channel to the nearest level
+    AND clamp it to the range of a colour
+    """
+    # WHEN
+    actual = quantize(radiance)
+
+    # THEN
+    assert actual == expected
@@ -0,0 +1,269 @@
+import random
+from array import array
+from dataclasses import replace
+
+import pytest
+
+from raytracer.core.types import kernels  # type: ignore
+from raytracer.core.types.compiled import CompiledScene, vector
+from raytracer.core.types.entities import (
+    ChequeredMaterial,
+    Light,
+    Material,
+    Ray,
+    Scene,
+    Sphere,
+)
+from raytracer.core.types.geometry import Point
+from raytracer.core.types.imaging import Colour
+from raytracer.rendering import engine as engine_module
+from raytracer.rendering.constants import REFLECTION_DELTA, SCENE_ABSOLUTE_TOP
+from raytracer.rendering.dependencies import TileDependencies
+from raytracer.rendering.engine import RenderEngine, TraceStats
+from raytracer.rendering.shading import (
+    NO_OCCLUDER,
+    PHONG_COEFFICENT,
+    Shader,
+    ShadowStats,
+)
+
+
+@pytest.fixture
+def scene() -> Scene:
+    rnd = random.Random(1)
+    solid = Material(colour=Colour(0, 0, 255), diffuse=0.8, specular=0.5)
+    mirror = Material(colour=Colour(40, 40, 40), reflection=0.9)
+    spheres = [
+        Sphere(
+            name=f"Sphere {index}",
+            centre=Point(rnd.uniform(-3, 3), rnd.uniform(-2, 0), rnd.uniform(1, 8)),
+            radius=rnd.uniform(0.05, 0.6),
+            material=mirror if index % 3 else solid,
+        )
+        for index in range(30)
+    ]
+    ground = Sphere(
+        name="Ground",
+        centre=Point(0, 10000.5, 1),
+        radius=10000.0,
+        material=ChequeredMaterial(
+            colour_1=Colour(66, 5, 0),
+            colour_2=Colour(230, 184, 125),
+            ambient=0.2,
+            reflection=0.2,
+        ),
+    )
+    return Scene(
+        camera=Point(0, -0.35, -1),
+        objects=[*spheres, ground],
+        lights=[
+            Light(position=Point(1.5, -0.5, -10), colour=Colour(255, 255, 255)),
+            Light(position=Point(-0.5, -10.5, 0), colour=Colour(230, 230, 230)),
+        ],
+        width=48,
+        height=30,
+    )
+
+
+def _rays(count: int) -> list[tuple[tuple[float, ...], tuple[float, ...]]]:
+    rnd = random.Random(2)
+    rays = [
+        Ray(
+            origin=Point(0, -0.35, -1),
+            direction=Point(rnd.uniform(-1, 1), rnd.uniform(-0.5, 1), 1),
+        )
+        for _ in range(count)
+    ]
+    return [(vector(ray.origin), vector(ray.direction)) for ray in rays]
+
+
+class TestSceneKernels:
+    def test_intersect(self, scene: Scene) -> None:
+        """
+        GIVEN the kernels over a compiled scene
+        AND rays in random directions
+        WHEN intersecting each ray with each sphere
+        THEN find exactly the distances the compiled scene does
+        """
+        # GIVEN
+        compiled = CompiledScene.from_scene(scene)
+        scene_kernels = kernels.SceneKernels(compiled)
+
+        for origin, direction in _rays(50):
+            for index in range(len(compiled)):
+                # WHEN
+                actual = scene_kernels.intersect(index, origin, direction)
+
+                # THEN
+                assert actual == compiled.intersect(
+                    index=index, origin=origin, direction=direction
+                )
+
+    @pytest.mark.parametrize("use_bvh", [True, False], ids=["BVH", "linear scan"])
+    def test_find_nearest(self, scene: Scene, use_bvh: bool) -> None:
+        """
+        GIVEN the kernels over a compiled scene
+        AND rays in random directions
+        WHEN finding the nearest sphere each ray hits
+        THEN find the same sphere and distance as the compiled scene
+        AND make as many intersection tests
+        """
+        # GIVEN
+        compiled = CompiledScene.from_scene(scene)
+        scene_kernels = kernels.SceneKernels(compiled)
+
+        for origin, direction in _rays(200):
+            tests = compiled.bvh.tests
+            distance, index = compiled.find_nearest(
+                origin=origin, direction=direction, use_bvh=use_bvh
+            )
+            expected_tests = compiled.bvh.tests - tests if use_bvh else len(compiled)
+
+            # WHEN
+            actual = scene_kernels.find_nearest(origin, direction, use_bvh)
+
+            # THEN
+            assert actual == (distance, index, expected_tests)
+
+    def test_find_any(self, scene: Scene) -> None:
+        """
+        GIVEN the kernels over a compiled scene
+        AND rays in random directions
+        WHEN finding any sphere within a short distance of each ray
+        THEN find the same sphere as the compiled scene
+        AND make as many intersection tests
+        """
+        # GIVEN
+        compiled = CompiledScene.from_scene(scene)
+        scene_kernels = kernels.SceneKernels(compiled)
+
+        for origin, direction in _rays(200):
+            tests = compiled.bvh.tests
+            expected = compiled.find_any(
+                origin=origin, direction=direction, max_distance=5
+            )
+
+            # WHEN
+            actual = scene_kernels.find_any(origin, direction, 5)
+
+            # THEN
+            assert actual == (expected, compiled.bvh.tests - tests)
+
+    def test_empty_scene(self, scene: Scene) -> None:
+        scene_kernels = kernels.SceneKernels(
+            CompiledScene.from_scene(replace(scene, objects=[]))
+        )
+        origin, direction = _rays(1)[0]
+
+        assert scene_kernels.find_nearest(origin, direction) == (None, None, 0)
+        assert scene_kernels.find_any(origin, direction, 5) == (None, 0)
+
+    @pytest.mark.parametrize("use_bvh", [True, False], ids=["BVH", "linear scan"])
+    def test_render_row(
+        self, scene: Scene, use_bvh: bool, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """
+        GIVEN the kernels over a compiled scene of mirrors
+        WHEN rendering every other pixel of each row
+        THEN render the colours and objects the engine does in Python
+        AND count the same rays and tests
+        AND leave the last occluder of each light in the cache
+        """
+        # GIVEN
+        monkeypatch.setattr(engine_module, "kernels", None)
+        engine = RenderEngine(shader=Shader(), use_bvh=use_bvh)
+        scene_kernels = kernels.SceneKernels(CompiledScene.from_scene(scene))
+        occluders = array("l", [NO_OCCLUDER]) * len(scene.lights)
+        scene_top, _ = scene.get_aspect_boundries()
+        horizontal_step, vertical_step = scene.get_horizontal_and_vertical_steps()
+
+        for scene_y in range(scene.height):
+            expected_ids: list[int] = []
+            _, expected_row = engine._render_row(
+                engine._row_params(scene, scene_y),
+                start=1,
+                step=2,
+                ids=expected_ids,
+            )
+            expected_trace = engine.trace_stats
+            expected_shadows = engine.shader.shadow_stats
+            engine.trace_stats = TraceStats()
+            engine.shader.shadow_stats = ShadowStats()
+
+            # WHEN
+            pixels, ids, trace, shadows = scene_kernels.render_row(
+                y=scene_top + scene_y * vertical_step,
+                left=SCENE_ABSOLUTE_TOP,
+                step=horizontal_step,
+                start=1,
+                stop=scene.width,
+                stride=2,
+                max_depth=engine.max_depth,
+                use_bvh=use_bvh,
+                occluders=occluders,
+                reflection_delta=REFLECTION_DELTA,
+                phong_coefficient=PHONG_COEFFICENT,
+            )
+
+            # THEN
+            assert list(pixels) == [
+                channel
+                for colour in expected_row
+                for channel in (colour.r, colour.g, colour.b)
+            ]
+            assert ids == expected_ids
+            assert trace == {
+                "intersection_tests": expected_trace.intersection_tests,
+                "reflection_rays": expected_trace.reflection_rays,
+                "terminated": expected_trace.terminated,
+                "shades": expected_trace.shades,
+            }
+            assert shadows == {
+                "rays": expected_shadows.rays,
+                "occluded": expected_shadows.occluded,
+                "cache_hits": expected_shadows.cache_hits,
+                "back_facing": expected_shadows.back_facing,
+                "tests": expected_shadows.tests,
+            }
+            assert occluders == engine.shader._occluders
+
+    def test_render_row_records_dependencies(
+        self, scene: Scene, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """
+        GIVEN the kernels over a compiled scene of mirrors
+        WHEN rendering each row recording what it depends on
+        THEN record the objects, segments and shading the engine does in Python
+        """
+        # GIVEN
+        monkeypatch.setattr(engine_module, "kernels", None)
+        engine = RenderEngine(shader=Shader())
+        scene_kernels = kernels.SceneKernels(CompiledScene.from_scene(scene))
+        occluders = array("l", [NO_OCCLUDER]) * len(scene.lights)
+        scene_top, _ = scene.get_aspect_boundries()
+        horizontal_step, vertical_step = scene.get_horizontal_and_vertical_steps()
+
+        for scene_y in range(scene.height):
+            expected = TileDependencies()
+            engine._dependencies = engine.shader.dependencies = expected
+            engine._render_row(engine._row_params(scene, scene_y))
+            actual = TileDependencies()
+
+            # WHEN
+            scene_kernels.render_row(
+                y=scene_top + scene_y * vertical_step,
+                left=SCENE_ABSOLUTE_TOP,
+                step=horizontal_step,
+                start=0,
+                stop=scene.width,
+                stride=1,
+                max_depth=engine.max_depth,
+                use_bvh=True,
+                occluders=occluders,
+                reflection_delta=REFLECTION_DELTA,
+                phong_coefficient=PHONG_COEFFICENT,
+                dependencies=actual,
+            )
+
+            # THEN
+            assert actual == expected
@@ -1,12 +1,15 @@
 import io
 import os
+from typing import Type
 from unittest.mock import Mock, call
 
 import pytest
+from PIL import Image
 from pytest_mock import MockerFixture
 
-from raytracer.core.types.imaging import Canvas
+from raytracer.core.types.imaging import Canvas, Colour, ImageFormat
 from raytracer.imaging.service import ImageService
+from raytracer.imaging.stream import PNGStreamWriter, PPMStreamWriter, StreamWriter
 
 
 @pytest.fixture
@@ -20,20 +23,15 @@ class TestImageService:
         GIVEN a canvas
         AND an image file stream
         WHEN calling render
-        THEN render the image to the file stream
+        THEN render the image to the file stream as a binary PPM
         """
         image_service = ImageService()
+        canvas.paint(x=1, y=2, pixel=Colour(1, 2, 3))
 
-        img_file = io.StringIO()
+        img_file = io.BytesIO()
         image_service._render(canvas=canvas, image_file=img_file)
         actual = img_file.getvalue()
-        expected = (
-            "P3 3 3\n"
-            "255\n"
-            "0 0  0 0 0  0 0 0  0\n"
-            "0 0  0 0 0  0 0 0  0\n"
-            "0 0  0 0 0  0 0 0  0\n"
-        )
+        expected = b"P6 3 3\n255\n" + bytes(21) + bytes([1, 2, 3, 0, 0, 0])
         assert actual == expected
 
     def test_render_updates_progress(self, canvas: Canvas) -> None:
@@ -47,7 +45,7 @@ class TestImageService:
         # GIVEN
         image_service = ImageService()
         update_func = Mock()
-        img_file = io.StringIO()
+        img_file = io.BytesIO()
 
         # WHEN
         image_service._render(
@@ -57,7 +55,33 @@ class TestImageService:
         # THEN
         update_func.assert_has_calls([call(1), call(1), call(1)])
 
-    def test_save_and_convert(self, canvas: Canvas, temp_directory: str) -> None:
+    @pytest.mark.parametrize("extension", [".bmp", ".png"])
+    def test_save_and_convert(
+        self, canvas: Canvas, temp_directory: str, extension: str
+    ) -> None:
+        """
+        GIVEN a canvas
+        AND a filepath
+        AND the filepath is not a PPM file
+        WHEN calling save
+        THEN convert the image to that format
+        """
+        # GIVEN
+        image_service = ImageService()
+        canvas.paint(x=0, y=1, pixel=Colour(255, 255, 255))
+
+        # WHEN
+        filepath = os.path.join(temp_directory, f"testing{extension}")
+        actual = image_service.save(canvas=canvas, filepath=filepath)
+
+        # THEN
+        assert actual == filepath
+        with Image.open(filepath) as image:
+            assert image.size == (3, 3)
+            assert image.convert("RGB").getpixel((0, 1)) == (255, 255, 255)
+            assert image.convert("RGB").getpixel((1, 1)) == (0, 0, 0)
+
+    def test_save_and_convert_lossy(self, canvas: Canvas, temp_directory: str) -> None:
         """
         GIVEN a canvas
         AND a filepath
@@ -73,8 +97,30 @@ class TestImageService:
         actual = image_service.save(canvas=canvas, filepath=filepath)
 
         # THEN
-        assert os.path.exists(filepath)
         assert actual == filepath
+        with Image.open(filepath) as image:
+            assert image.format == "JPEG"
+            assert image.size == (3, 3)
+
+    def test_save_and_convert_updates_progress(
+        self, canvas: Canvas, temp_directory: str
+    ) -> None:
+        """
+        GIVEN a canvas
+        AND an update function
+        WHEN saving a PNG
+        THEN call the update function for every row once the image is written
+        """
+        # GIVEN
+        image_service = ImageService()
+        update_func = Mock()
+
+        # WHEN
+        filepath = os.path.join(temp_directory, "testing.png")
+        image_service.save(canvas=canvas, filepath=filepath, update_func=update_func)
+
+        # THEN
+        update_func.assert_called_once_with(3)
 
     def test_save_no_convert(
         self, canvas: Canvas, temp_directory: str, mocker: MockerFixture
@@ -95,9 +141,10 @@ class TestImageService:
         actual = image_service.save(canvas=canvas, filepath=filepath)
 
         # THEN
-        assert os.path.exists(filepath)
         assert actual == filepath
         assert mock_image.mock_calls == []
+        with open(filepath, "rb") as image_file:
+            assert image_file.read() == b"P6 3 3\n255\n" + bytes(27)
 
     def test_save_invalid_format(self, canvas: Canvas, temp_directory: str) -> None:
         """
@@ -114,3 +161,63 @@ class TestImageService:
         # WHEN
         with pytest.raises(ValueError, match="'.wtf' is not a valid ImageFormat"):
             image_service.save(canvas=canvas, filepath=filepath)
+
+    @pytest.mark.parametrize(
+        "image_format, writer_cls",
+        [(ImageFormat.PPM, PPMStreamWriter), (ImageFormat.PNG, PNGStreamWriter)],
+    )
+    def test_stream(
+        self, image_format: ImageFormat, writer_cls: Type[StreamWriter]
+    ) -> None:
+        image_file = io.BytesIO()
+
+        actual = ImageService().stream(
+            image_file=image_file, image_format=image_format, width=3, height=2
+        )
+
+        assert isinstance(actual, writer_cls)
+        assert actual.image_file is image_file
+        assert (actual.width, actual.height) == (3, 2)
+
+    @pytest.mark.parametrize("extension", [".png", ".ppm"])
+    def test_save_counts_stats(
+        self, canvas: Canvas, temp_directory: str, extension: str
+    ) -> None:
+        """
+        GIVEN an image service
+        WHEN saving a canvas twice
+        THEN count both images and their rows
+        AND the time spent encoding them
+        """
+        image_service = ImageService()
+        filepath = os.path.join(temp_directory, f"image{extension}")
+
+        for _ in range(2):
+            image_service.save(canvas=canvas, filepath=filepath)
+
+        actual = image_service.stats
+        assert (actual.images, actual.rows) == (2, 6)
+        assert actual.encode_time > 0
+
+    def test_stream_counts_stats(self, canvas: Canvas) -> None:
+        image_service = ImageService()
+
+        with image_service.stream(
+            image_file=io.BytesIO(), image_format=ImageFormat.PNG, width=3, height=3
+        ) as writer:
+            for index in range(3):
+                writer.add_row(index=index, canvas=canvas)
+
+        assert writer.stats is image_service.stats
+        assert image_service.stats.images == 1
+        assert image_service.stats.rows == 3
+        assert image_service.stats.encode_time > 0
+
+    def test_stream_unsupported_format(self) -> None:
+        with pytest.raises(ValueError, match="'.jpeg' images can't be streamed"):
+            ImageService().stream(
+                image_file=io.BytesIO(),
+                image_format=ImageFormat.JPEG,
+                width=3,
+                height=2,
+            )
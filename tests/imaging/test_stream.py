@@ -0,0 +1,121 @@
+import io
+import random
+from typing import Type
+
+import pytest
+from PIL import Image
+
+from raytracer.core.types.imaging import Canvas, Colour
+from raytracer.imaging.stream import PNGStreamWriter, PPMStreamWriter, StreamWriter
+
+
+@pytest.fixture
+def canvas() -> Canvas:
+    canvas = Canvas(width=3, height=4)
+    for y in range(canvas.height):
+        for x in range(canvas.width):
+            canvas.paint(x=x, y=y, pixel=Colour(x * 80, y * 60, 255))
+    return canvas
+
+
+class TestStreamWriter:
+    def test_add_row_waits_for_rows_above(self, canvas: Canvas) -> None:
+        """
+        GIVEN a stream
+        WHEN rows are finished out of order
+        THEN only write rows once every row above them is finished
+        """
+        # GIVEN
+        image_file = io.BytesIO()
+        with PPMStreamWriter(image_file=image_file, width=3, height=4) as writer:
+            header = len(image_file.getvalue())
+
+            # WHEN
+            writer.add_row(index=2, canvas=canvas)
+            writer.add_row(index=1, canvas=canvas)
+
+            # THEN
+            assert writer.rows_written == 0
+            assert len(image_file.getvalue()) == header
+
+            # WHEN
+            writer.add_row(index=0, canvas=canvas)
+
+            # THEN
+            assert writer.rows_written == 3
+            assert image_file.getvalue()[header:] == bytes(canvas.rows(0, 3))
+
+            writer.add_row(index=3, canvas=canvas)
+
+    def test_finish_missing_rows(self, canvas: Canvas) -> None:
+        with pytest.raises(ValueError, match="Only 1 of 4 rows have been written"):
+            with PPMStreamWriter(image_file=io.BytesIO(), width=3, height=4) as writer:
+                writer.add_row(index=0, canvas=canvas)
+
+    def test_error_while_rendering(self) -> None:
+        """
+        GIVEN a stream
+        WHEN rendering fails
+        THEN raise the original error rather than complaining about missing rows
+        """
+        with pytest.raises(KeyError):
+            with PPMStreamWriter(image_file=io.BytesIO(), width=3, height=4):
+                raise KeyError()
+
+
+class TestPPMStreamWriter:
+    def test_stream(self, canvas: Canvas) -> None:
+        image_file = io.BytesIO()
+
+        with PPMStreamWriter(image_file=image_file, width=3, height=4) as writer:
+            for index in (3, 0, 2, 1):
+                writer.add_row(index=index, canvas=canvas)
+
+        assert image_file.getvalue() == b"P6 3 4\n255\n" + bytes(canvas.data)
+
+
+class TestPNGStreamWriter:
+    @pytest.mark.parametrize("width, height", [(3, 4), (300, 200)])
+    def test_stream(self, width: int, height: int) -> None:
+        """
+        GIVEN a canvas
+        WHEN streaming its rows to a PNG
+        THEN the PNG decodes to the same pixels
+        """
+        # GIVEN
+        rnd = random.Random(1)
+        canvas = Canvas(
+            width=width,
+            height=height,
+            buffer=bytearray(rnd.getrandbits(8) for _ in range(width * height * 3)),
+        )
+        image_file = io.BytesIO()
+
+        # WHEN
+        with PNGStreamWriter(
+            image_file=image_file, width=width, height=height
+        ) as writer:
+            for index in reversed(range(height)):
+                writer.add_row(index=index, canvas=canvas)
+
+        # THEN
+        image_file.seek(0)
+        with Image.open(image_file) as image:
+            assert image.format == "PNG"
+            assert image.mode == "RGB"
+            assert image.tobytes() == bytes(canvas.data)
+
+    @pytest.mark.parametrize("writer_cls", [PPMStreamWriter, PNGStreamWriter])
+    def test_writes_before_finishing(
+        self, writer_cls: Type[StreamWriter], canvas: Canvas
+    ) -> None:
+        image_file = io.BytesIO()
+        writer = writer_cls(image_file=image_file, width=3, height=4)
+
+        with writer:
+            before = len(image_file.getvalue())
+            for index in range(canvas.height):
+                writer.add_row(index=index, canvas=canvas)
+
+        assert before > 0
+        assert len(image_file.getvalue()) > before
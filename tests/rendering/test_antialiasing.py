@@ -0,0 +1,86 @@
+from typing import Iterator
+
+import pytest
+
+from raytracer.core.types.imaging import Colour
+from raytracer.rendering.antialiasing import NO_OBJECT, find_edges, sample_offsets
+from raytracer.rendering.framebuffer import Framebuffer
+from raytracer.rendering.tiles import Tile
+
+
+def test_sample_offsets() -> None:
+    """
+    GIVEN a number of samples
+    WHEN getting the points to trace within a pixel
+    THEN start with the centre
+    AND spread the rest over the pixel
+    """
+    actual = sample_offsets(4)
+
+    assert actual[0] == (0.5, 0.5)
+    assert actual[1:] == [
+        pytest.approx((0.0, 5 / 6)),
+        pytest.approx((0.75, 1 / 6)),
+        pytest.approx((0.25, 11 / 18)),
+    ]
+
+
+@pytest.fixture
+def framebuffer() -> Iterator[Framebuffer]:
+    with Framebuffer(width=4, height=3, ids=True) as framebuffer:
+        yield framebuffer
+
+
+class TestFindEdges:
+    def test_colour(self, framebuffer: Framebuffer) -> None:
+        """
+        GIVEN a pixel brighter than those around it by more than the threshold
+        WHEN finding edges
+        THEN refine it and the pixels beside it
+        """
+        framebuffer.set_row(index=1, row=[Colour(20, 0, 0)], start=1)
+
+        actual = find_edges(
+            framebuffer=framebuffer,
+            tile=Tile(index=0, left=0, top=0, right=4, bottom=3),
+            threshold=10,
+        )
+
+        assert sorted(actual) == [(0, 1), (1, 0), (1, 1), (1, 2), (2, 1)]
+
+    def test_below_threshold(self, framebuffer: Framebuffer) -> None:
+        framebuffer.set_row(index=1, row=[Colour(10, 10, 10)], start=1)
+
+        actual = find_edges(
+            framebuffer=framebuffer,
+            tile=Tile(index=0, left=0, top=0, right=4, bottom=3),
+            threshold=10,
+        )
+
+        assert actual == []
+
+    def test_object(self, framebuffer: Framebuffer) -> None:
+        """
+        GIVEN pixels of the same colour which hit different objects
+        WHEN finding the edges of part of the image
+        THEN refine the pixels where the object changes, within that part
+        """
+        for index in range(3):
+            framebuffer.set_ids(index=index, ids=[NO_OBJECT] * 2 + [0] * 2)
+
+        actual = find_edges(
+            framebuffer=framebuffer,
+            tile=Tile(index=0, left=2, top=1, right=4, bottom=3),
+            threshold=10,
+        )
+
+        assert actual == [(2, 1), (2, 2)]
+
+    def test_without_ids(self) -> None:
+        with Framebuffer(width=2, height=2) as framebuffer:
+            with pytest.raises(ValueError):
+                find_edges(
+                    framebuffer=framebuffer,
+                    tile=Tile(index=0, left=0, top=0, right=2, bottom=2),
+                    threshold=10,
+                )
@@ -0,0 +1,126 @@
+from multiprocessing.pool import Pool, ThreadPool
+from unittest.mock import Mock
+
+import pytest
+
+from raytracer.rendering.backends import (
+    PROCESS,
+    SERIAL,
+    THREAD,
+    SerialPool,
+    start_pool,
+)
+
+
+def _double(value: int) -> int:
+    return value * 2
+
+
+def _fail(value: int) -> int:
+    raise ValueError(f"Failed on {value}")
+
+
+class TestSerialPool:
+    def test_imap_unordered(self) -> None:
+        """
+        GIVEN a serial pool
+        WHEN mapping work over some values
+        THEN give the results in the order of the values
+        """
+        # GIVEN
+        pool = SerialPool()
+
+        # WHEN
+        actual = list(pool.imap_unordered(_double, [1, 2, 3]))
+
+        # THEN
+        assert actual == [2, 4, 6]
+
+    def test_apply_async(self) -> None:
+        """
+        GIVEN a serial pool
+        WHEN applying work which succeeds and work which fails
+        THEN give the result or the error to the callbacks before returning
+        """
+        # GIVEN
+        pool = SerialPool()
+        callback = Mock()
+        error_callback = Mock()
+
+        # WHEN
+        for work, value in [(_double, 2), (_fail, 3)]:
+            pool.apply_async(
+                work, (value,), callback=callback, error_callback=error_callback
+            )
+
+        # THEN
+        callback.assert_called_once_with(4)
+        (error,), _ = error_callback.call_args
+        assert str(error) == "Failed on 3"
+
+    def test_apply_async_without_callbacks(self) -> None:
+        """
+        GIVEN a serial pool
+        WHEN applying work without callbacks
+        THEN drop the result of work which succeeds
+        AND raise the error of work which fails
+        """
+        # GIVEN
+        pool = SerialPool()
+
+        # WHEN
+        pool.apply_async(_double, (2,))
+
+        # THEN
+        with pytest.raises(ValueError, match="Failed on 3"):
+            pool.apply_async(_fail, (3,))
+
+    def test_terminate(self) -> None:
+        """
+        GIVEN a serial pool
+        WHEN terminating and joining it
+        THEN it can still run work, having no workers to stop
+        """
+        # GIVEN
+        pool = SerialPool()
+
+        # WHEN
+        pool.terminate()
+        pool.join()
+
+        # THEN
+        assert list(pool.imap_unordered(_double, [1])) == [2]
+
+
+@pytest.mark.parametrize(
+    "backend, expected",
+    [(SERIAL, SerialPool), (THREAD, ThreadPool), (PROCESS, Pool)],
+)
+def test_start_pool(backend: str, expected: type) -> None:
+    """
+    GIVEN a backend
+    WHEN starting a pool for it
+    THEN give the pool of that backend
+    AND it runs work
+    """
+    # WHEN
+    pool = start_pool(backend=backend, workers=2)
+
+    # THEN
+    try:
+        assert isinstance(pool, expected)
+        assert sorted(pool.imap_unordered(_double, [1, 2, 3])) == [2, 4, 6]
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def test_start_pool_unknown_backend() -> None:
+    """
+    GIVEN a backend which does not exist
+    WHEN starting a pool for it
+    THEN raise a ValueError naming the backend
+    """
+    # WHEN
+    with pytest.raises(ValueError, match="Unknown backend 'fibres'"):
+        start_pool(backend="fibres", workers=2)
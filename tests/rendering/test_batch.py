@@ -0,0 +1,181 @@
+import json
+
+import pytest
+
+from raytracer.rendering.batch import BatchJob, apply_overrides, read_manifest
+
+
+class TestReadManifest:
+    def test_read_manifest(self) -> None:
+        """
+        GIVEN a manifest with a plain job, a blank line and a job with a sweep
+        WHEN reading it
+        THEN give the plain job as it is
+        AND a job for every combination of the sweep's values, numbered in order
+        """
+        # GIVEN
+        lines = [
+            '{"scene": "scene_1", "width": 32, "height": 20, "output": "plain.ppm"}\n',
+            "\n",
+            json.dumps(
+                {
+                    "scene": "scene_2",
+                    "width": 8,
+                    "height": 4,
+                    "output": "swept.png",
+                    "sweep": {
+                        "lights.0.colour": ["#FF0000", "#00FF00"],
+                        "camera.z": [-1, -2],
+                    },
+                }
+            ),
+        ]
+
+        # WHEN
+        actual = read_manifest(lines)
+
+        # THEN
+        assert actual == [
+            BatchJob(scene="scene_1", width=32, height=20, output="plain.ppm"),
+            BatchJob(
+                scene="scene_2",
+                width=8,
+                height=4,
+                output="swept_1.png",
+                overrides={"lights.0.colour": "#FF0000", "camera.z": -1},
+            ),
+            BatchJob(
+                scene="scene_2",
+                width=8,
+                height=4,
+                output="swept_2.png",
+                overrides={"lights.0.colour": "#FF0000", "camera.z": -2},
+            ),
+            BatchJob(
+                scene="scene_2",
+                width=8,
+                height=4,
+                output="swept_3.png",
+                overrides={"lights.0.colour": "#00FF00", "camera.z": -1},
+            ),
+            BatchJob(
+                scene="scene_2",
+                width=8,
+                height=4,
+                output="swept_4.png",
+                overrides={"lights.0.colour": "#00FF00", "camera.z": -2},
+            ),
+        ]
+
+    def test_read_manifest_pads_numbers(self) -> None:
+        line = json.dumps(
+            {
+                "scene": "scene_1",
+                "width": 2,
+                "height": 2,
+                "output": "radius",
+                "sweep": {"objects.0.attributes.radius": list(range(10))},
+            }
+        )
+
+        actual = read_manifest([line])
+
+        assert [job.output for job in actual] == [
+            f"radius_{number:02d}" for number in range(1, 11)
+        ]
+
+    @pytest.mark.parametrize(
+        "line, message",
+        [
+            ("{", "Line 2 of the manifest: Expecting property name"),
+            ("[]", "Line 2 of the manifest: expected an object"),
+            ('{"scene": "scene_1", "width": 1}', "missing height, output"),
+            (
+                '{"scene": "scene_1", "width": "wide", "height": 2, "output": "x"}',
+                "width must be a whole number of at least 2",
+            ),
+            (
+                '{"scene": "scene_1", "width": null, "height": 2, "output": "x"}',
+                "width must be a whole number of at least 2",
+            ),
+            (
+                '{"scene": "scene_1", "width": 2.5, "height": 2, "output": "x"}',
+                "width must be a whole number of at least 2",
+            ),
+            (
+                '{"scene": "scene_1", "width": 2, "height": 1, "output": "x"}',
+                "height must be a whole number of at least 2",
+            ),
+            (
+                '{"scene": "s", "width": 2, "height": 2, "output": "x", "sweep": {}}',
+                "a sweep must map paths to lists of values",
+            ),
+            (
+                '{"scene": "s", "width": 2, "height": 2, "output": "x", '
+                '"sweep": {"camera.z": []}}',
+                "a sweep must map paths to lists of values",
+            ),
+        ],
+        ids=[
+            "not JSON",
+            "not an object",
+            "missing keys",
+            "bad width",
+            "no width",
+            "fractional width",
+            "single row",
+            "empty sweep",
+            "no values",
+        ],
+    )
+    def test_read_manifest_invalid(self, line: str, message: str) -> None:
+        """
+        GIVEN a manifest with a line which can't be read after a valid one
+        WHEN reading it
+        THEN raise a ValueError naming the line
+        """
+        valid = '{"scene": "scene_1", "width": 2, "height": 2, "output": "x.ppm"}'
+
+        with pytest.raises(ValueError, match="Line 2 of the manifest") as error:
+            read_manifest([valid, line])
+
+        assert message in str(error.value)
+
+
+class TestApplyOverrides:
+    def test_apply_overrides(self, scene_data: dict) -> None:
+        """
+        GIVEN a scene's JSON
+        WHEN replacing values by their paths, through lists and objects
+        THEN give a copy with those values replaced
+        AND leave the scene's JSON as it was
+        """
+        # GIVEN
+        expected = json.loads(json.dumps(scene_data))
+        overrides = {
+            "objects.0.attributes.radius": 0.3,
+            "lights.0.position": {"x": 1, "y": 2, "z": 3},
+        }
+
+        # WHEN
+        actual = apply_overrides(data=scene_data, overrides=overrides)
+
+        # THEN
+        assert actual["objects"][0]["attributes"]["radius"] == 0.3
+        assert actual["lights"][0]["position"] == {"x": 1, "y": 2, "z": 3}
+        assert actual["camera"] == scene_data["camera"]
+        assert scene_data == expected
+
+    @pytest.mark.parametrize(
+        "path",
+        [
+            "objects.1.attributes.radius",
+            "objects.first",
+            "camera.w",
+            "camera.x.y",
+            "lights.0.colour.0.x",
+        ],
+    )
+    def test_apply_overrides_missing(self, scene_data: dict, path: str) -> None:
+        with pytest.raises(ValueError, match=f"The scene has no {path}"):
+            apply_overrides(data=scene_data, overrides={path: 1})
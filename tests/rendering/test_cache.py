@@ -0,0 +1,249 @@
+import os
+from dataclasses import replace
+
+import pytest
+from pytest_mock import MockerFixture
+
+from raytracer.core.types.binary import MappedSpheres, load_scene, save_scene
+from raytracer.core.types.entities import Scene
+from raytracer.core.types.geometry import Point
+from raytracer.core.types.imaging import Canvas
+from raytracer.rendering import cache
+from raytracer.rendering.cache import (
+    ENTRY_EXTENSION,
+    HEADER,
+    RenderCache,
+    code_version,
+    geometry_key,
+    render_key,
+)
+from raytracer.rendering.engine import RenderEngine
+from raytracer.rendering.shading import Shader
+
+
+@pytest.fixture
+def scene(scene_data: dict) -> Scene:
+    return Scene.from_object(data=scene_data, width=4, height=2)
+
+
+@pytest.fixture
+def render_cache(temp_directory: str) -> RenderCache:
+    return RenderCache(directory=os.path.join(temp_directory, "cache"), max_size=100)
+
+
+def _canvas(fill: int) -> Canvas:
+    return Canvas(width=4, height=2, buffer=bytearray([fill] * 24))
+
+
+class TestRenderKey:
+    def test_same_scene(self, scene: Scene, scene_data: dict) -> None:
+        """
+        GIVEN two scenes parsed from the same data
+        WHEN keying them with the same settings
+        THEN they share a key
+        """
+        # GIVEN
+        other = Scene.from_object(
+            data=dict(reversed(scene_data.items())), width=4, height=2
+        )
+        settings = RenderEngine(shader=Shader()).settings
+
+        # WHEN
+        actual = render_key(scene=other, settings=settings)
+
+        # THEN
+        assert actual == render_key(scene=scene, settings=settings)
+
+    def test_differences(self, scene: Scene) -> None:
+        """
+        GIVEN scenes and settings which each differ in one way
+        WHEN keying them
+        THEN each has its own key
+        """
+        # GIVEN
+        settings = RenderEngine(shader=Shader()).settings
+        moved = replace(scene.objects[0], centre=scene.objects[0].centre * 2)
+
+        # WHEN
+        actual = {
+            render_key(scene=scene, settings=settings),
+            render_key(scene=replace(scene, width=8), settings=settings),
+            render_key(scene=replace(scene, objects=[moved]), settings=settings),
+            render_key(
+                scene=scene, settings=RenderEngine(Shader(), max_depth=2).settings
+            ),
+        }
+
+        # THEN
+        assert len(actual) == 4
+
+    def test_binary_scene(
+        self, scene: Scene, temp_directory: str, mocker: MockerFixture
+    ) -> None:
+        """
+        GIVEN a scene loaded from a binary file
+        WHEN keying it
+        THEN key it by the digest of the file without making its spheres
+        AND by the view it is rendered with
+        """
+        # GIVEN
+        path = os.path.join(temp_directory, "test.scene")
+        save_scene(path=path, scene=scene)
+        loaded = load_scene(path=path, width=4, height=2)
+        mocker.patch.object(MappedSpheres, "__getitem__", side_effect=AssertionError)
+
+        # WHEN
+        actual = render_key(scene=loaded, settings={})
+
+        # THEN
+        assert actual == render_key(scene=load_scene(path, 4, 2), settings={})
+        assert actual != render_key(scene=load_scene(path, 8, 2), settings={})
+        # The camera is kept in the header rather than the digested sections
+        save_scene(path=path, scene=replace(scene, camera=Point(0, 0, -2)))
+        moved = load_scene(path, 4, 2)
+        assert moved.digest == loaded.digest
+        assert actual != render_key(scene=moved, settings={})
+        save_scene(path=path, scene=replace(scene, objects=[]))
+        assert actual != render_key(scene=load_scene(path, 4, 2), settings={})
+
+    def test_code_version(self, scene: Scene, mocker: MockerFixture) -> None:
+        # GIVEN
+        expected = render_key(scene=scene, settings={})
+        mocker.patch.object(cache, "code_version", return_value="changed")
+
+        # WHEN
+        actual = render_key(scene=scene, settings={})
+
+        # THEN
+        assert actual != expected
+
+
+class TestGeometryKey:
+    def test_lights_and_materials(self, scene: Scene) -> None:
+        """
+        GIVEN a scene with its lights and the material of its object changed
+        WHEN keying its geometry
+        THEN it shares a key with the scene before
+        """
+        # GIVEN
+        obj = scene.objects[0]
+        relit = replace(
+            scene,
+            lights=[],
+            objects=[replace(obj, material=replace(obj.material, reflection=0.1))],
+        )
+
+        # WHEN
+        actual = geometry_key(scene=relit, max_depth=6)
+
+        # THEN
+        assert actual == geometry_key(scene=scene, max_depth=6)
+
+    def test_binary_scene(self, scene: Scene, temp_directory: str) -> None:
+        """
+        GIVEN a scene loaded from a binary file
+        WHEN keying its geometry
+        THEN key it by the digest of the file, which changes with its lights
+        """
+        # GIVEN
+        path = os.path.join(temp_directory, "test.scene")
+        save_scene(path=path, scene=scene)
+
+        # WHEN
+        actual = geometry_key(scene=load_scene(path, 4, 2), max_depth=6)
+
+        # THEN
+        assert actual == geometry_key(scene=load_scene(path, 4, 2), max_depth=6)
+        save_scene(path=path, scene=replace(scene, lights=[]))
+        assert actual != geometry_key(scene=load_scene(path, 4, 2), max_depth=6)
+
+    def test_differences(self, scene: Scene) -> None:
+        moved = replace(scene.objects[0], centre=scene.objects[0].centre * 2)
+
+        actual = {
+            geometry_key(scene=scene, max_depth=6),
+            geometry_key(scene=replace(scene, objects=[moved]), max_depth=6),
+            geometry_key(scene=replace(scene, camera=moved.centre), max_depth=6),
+            geometry_key(scene=replace(scene, height=4), max_depth=6),
+            geometry_key(scene=scene, max_depth=2),
+        }
+
+        assert len(actual) == 5
+
+
+def test_code_version() -> None:
+    assert len(code_version()) == 64
+    assert code_version() == code_version()
+
+
+class TestRenderCache:
+    def test_get_missing(self, render_cache: RenderCache) -> None:
+        assert render_cache.get("missing") is None
+
+    def test_put_and_get(self, render_cache: RenderCache) -> None:
+        """
+        GIVEN an image put in the cache
+        WHEN getting it by its key
+        THEN return a copy of the image
+        """
+        # GIVEN
+        render_cache.put(key="key", canvas=_canvas(fill=7))
+
+        # WHEN
+        actual = render_cache.get("key")
+
+        # THEN
+        assert actual is not None
+        assert (actual.width, actual.height) == (4, 2)
+        assert bytes(actual.data) == bytes([7] * 24)
+        assert os.listdir(render_cache.directory) == [f"key{ENTRY_EXTENSION}"]
+
+    def test_evicts_least_recently_used(self, render_cache: RenderCache) -> None:
+        """
+        GIVEN a cache with room for three images, holding three
+        WHEN one is read and then another is put
+        THEN remove the image used least recently to make room
+        """
+        # GIVEN
+        for number, key in enumerate(["first", "second", "third"]):
+            render_cache.put(key=key, canvas=_canvas(fill=number))
+            _age(render_cache, key=key, seconds=10 - number)
+
+        # WHEN
+        render_cache.get("first")
+        render_cache.put(key="fourth", canvas=_canvas(fill=4))
+
+        # THEN
+        assert render_cache.get("second") is None
+        assert render_cache.get("first") is not None
+        assert render_cache.get("third") is not None
+        assert render_cache.get("fourth") is not None
+
+    @pytest.mark.parametrize(
+        "data", [b"", HEADER.pack(4, 2), HEADER.pack(4, 2) + bytes(3)]
+    )
+    def test_get_damaged(self, render_cache: RenderCache, data: bytes) -> None:
+        """
+        GIVEN an entry which was cut short
+        WHEN getting it
+        THEN treat it as missing
+        AND remove it
+        """
+        # GIVEN
+        os.makedirs(render_cache.directory)
+        path = os.path.join(render_cache.directory, f"key{ENTRY_EXTENSION}")
+        with open(path, "wb") as f:
+            f.write(data)
+
+        # WHEN
+        actual = render_cache.get("key")
+
+        # THEN
+        assert actual is None
+        assert not os.path.exists(path)
+
+
+def _age(render_cache: RenderCache, key: str, seconds: int) -> None:
+    path = os.path.join(render_cache.directory, f"{key}{ENTRY_EXTENSION}")
+    used = os.stat(path).st_mtime - seconds
+    os.utime(path, (used, used))
@@ -1,16 +1,32 @@
+import copy
 import json
 import os
-from typing import Iterator
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Iterator, Optional
 from unittest import mock
-from unittest.mock import Mock, call, patch
+from unittest.mock import MagicMock, Mock, call, patch
 from uuid import uuid4
 
+import numpy as np
 import pytest
 from click.testing import CliRunner
+from PIL import Image
 
+from raytracer.core.types.binary import MappedScene, load_scene
 from raytracer.core.types.entities import Scene
-from raytracer.core.types.imaging import Canvas, Colour
-from raytracer.rendering.cli.render_scene import render_scene
+from raytracer.core.types.geometry import Point
+from raytracer.core.types.imaging import Canvas
+from raytracer.imaging.service import ImageService
+from raytracer.rendering.antialiasing import EDGE_THRESHOLD
+from raytracer.rendering.cli.convert_scene import convert_scene
+from raytracer.rendering.cli.render_batch import render_batch as render_batch_command
+from raytracer.rendering.cli.render_scene import (
+    RenderOptions,
+    _stream_to_file,
+    render_scene,
+)
+from raytracer.rendering.cli.render_worker import _run_worker, render_worker
+from raytracer.rendering.engine import RenderEngine, RenderStats
 
 
 @pytest.fixture
@@ -37,14 +53,13 @@ def scene_file(temp_directory: str, scene_data: dict) -> str:
 
 @pytest.fixture
 def canvas() -> Canvas:
-    canvas = Canvas(width=1, height=1)
-    canvas._pixels = [Colour(255, 255, 255)]
-    return canvas
+    return Canvas(width=1, height=1)
 
 
 @pytest.fixture(autouse=True)
 def render_engine(canvas: Canvas) -> Iterator[Mock]:
-    mock_engine = Mock(render=Mock(return_value=iter([(0, Colour(255, 255, 255))])))
+    mock_engine = MagicMock(render=Mock(return_value=iter([0])), gbuffer_depth=0)
+    mock_engine.__enter__.return_value = mock_engine
     with patch(
         "raytracer.rendering.cli.render_scene.RenderEngine", return_value=mock_engine
     ):
@@ -95,7 +110,10 @@ class TestRenderScene:
         assert result.exit_code == 0
         manager.assert_has_calls(
             [
-                call.render_engine.render(scene=scene, processes=4),
+                call.render_engine.render(
+                    scene=scene, framebuffer=mock.ANY, processes=4
+                ),
+                call.render_engine.__exit__(None, None, None),
                 call.image_service.save(
                     canvas=canvas,
                     filepath=os.path.join(config.OUT_DIR, "testing.ppm"),
@@ -103,3 +121,1021 @@ class TestRenderScene:
                 ),
             ]
         )
+
+    def test_render_scene_binary(
+        self,
+        cli_runner: CliRunner,
+        scene_file: str,
+        render_engine: Mock,
+        temp_directory: str,
+        scene_data: dict,
+    ) -> None:
+        """
+        GIVEN a scene with only a binary file
+        WHEN rendering it
+        THEN render the scene mapped from the binary file
+        """
+        # GIVEN
+        result = cli_runner.invoke(convert_scene, [scene_file, "binary"])
+        assert result.exit_code == 0, result.output
+
+        # WHEN
+        result = cli_runner.invoke(
+            render_scene, ["--scene", "binary", "--width", "1", "--height", "1"]
+        )
+
+        # THEN
+        assert result.exit_code == 0, result.output
+        scene = render_engine.render.call_args.kwargs["scene"]
+        assert isinstance(scene, MappedScene)
+        assert scene.path == os.path.join(temp_directory, "binary.scene")
+        assert (
+            list(scene.objects)
+            == Scene.from_object(data=scene_data, width=1, height=1).objects
+        )
+
+    def test_render_scene_wavefront_engine(
+        self, cli_runner: CliRunner, scene_file: str, render_engine: Mock
+    ) -> None:
+        with patch(
+            "raytracer.rendering.cli.render_scene.WavefrontRenderEngine",
+            return_value=render_engine,
+        ) as wavefront_engine:
+            result = cli_runner.invoke(
+                render_scene,
+                ["--scene", scene_file, "--width", "1", "--height", "1"]
+                + ["--engine", "wavefront"],
+            )
+
+        assert result.exit_code == 0
+        wavefront_engine.assert_called_once()
+        assert "with the wavefront engine and BVH" in result.output
+        assert "rays/sec" in result.output
+
+    def test_render_scene_linear_scan(
+        self, cli_runner: CliRunner, scene_file: str
+    ) -> None:
+        with patch(
+            "raytracer.rendering.cli.render_scene.RenderEngine"
+        ) as render_engine:
+            mock_engine = render_engine.return_value.__enter__.return_value
+            mock_engine.render.return_value = iter([])
+            mock_engine.gbuffer_depth = 0
+            result = cli_runner.invoke(
+                render_scene,
+                ["--scene", scene_file, "--width", "1", "--height", "1", "--no-bvh"],
+            )
+
+        assert result.exit_code == 0
+        render_engine.assert_called_once_with(
+            mock.ANY,
+            use_bvh=False,
+            russian_roulette=False,
+            max_samples=1,
+            edge_threshold=EDGE_THRESHOLD,
+            collect_stats=False,
+            record_dependencies=False,
+            gbuffer=False,
+            start_method=None,
+            backend="process",
+            linear=False,
+        )
+        assert "with the scalar engine and linear scan" in result.output
+
+    def test_render_scene_russian_roulette(
+        self, cli_runner: CliRunner, scene_file: str
+    ) -> None:
+        with patch(
+            "raytracer.rendering.cli.render_scene.RenderEngine"
+        ) as render_engine:
+            mock_engine = render_engine.return_value.__enter__.return_value
+            mock_engine.render.return_value = iter([])
+            mock_engine.gbuffer_depth = 0
+            result = cli_runner.invoke(
+                render_scene,
+                ["--scene", scene_file, "--width", "1", "--height", "1"]
+                + ["--russian-roulette"],
+            )
+
+        assert result.exit_code == 0
+        render_engine.assert_called_once_with(
+            mock.ANY,
+            use_bvh=True,
+            russian_roulette=True,
+            max_samples=1,
+            edge_threshold=EDGE_THRESHOLD,
+            collect_stats=False,
+            record_dependencies=False,
+            gbuffer=False,
+            start_method=None,
+            backend="process",
+            linear=False,
+        )
+
+    def test_render_scene_linear(self, cli_runner: CliRunner, scene_file: str) -> None:
+        """
+        GIVEN the linear flag
+        WHEN rendering a scene
+        THEN create an engine which shades in linear light
+        """
+        with patch(
+            "raytracer.rendering.cli.render_scene.RenderEngine"
+        ) as render_engine:
+            mock_engine = render_engine.return_value.__enter__.return_value
+            mock_engine.render.return_value = iter([])
+            mock_engine.gbuffer_depth = 0
+            result = cli_runner.invoke(
+                render_scene,
+                ["--scene", scene_file, "--width", "1", "--height", "1", "--linear"],
+            )
+
+        assert result.exit_code == 0
+        assert render_engine.call_args.kwargs["linear"] is True
+
+    def test_render_scene_thread_backend(
+        self, cli_runner: CliRunner, scene_file: str, render_engine: Mock
+    ) -> None:
+        """
+        GIVEN the thread backend and a number of workers
+        WHEN rendering a scene
+        THEN create an engine on the thread backend
+        AND render with that many workers
+        """
+        # GIVEN
+        with patch(
+            "raytracer.rendering.cli.render_scene.RenderEngine",
+            return_value=render_engine,
+        ) as engine_cls:
+            # WHEN
+            result = cli_runner.invoke(
+                render_scene,
+                ["--scene", scene_file, "--width", "1", "--height", "1"]
+                + ["--backend", "thread", "--workers", "8"],
+            )
+
+        # THEN
+        assert result.exit_code == 0, result.output
+        assert engine_cls.call_args.kwargs["backend"] == "thread"
+        render_engine.render.assert_called_once_with(
+            scene=mock.ANY, framebuffer=mock.ANY, processes=8
+        )
+
+    def test_render_scene_anti_aliasing(
+        self, cli_runner: CliRunner, scene_file: str, temp_directory: str
+    ) -> None:
+        """
+        GIVEN the anti-aliasing options
+        WHEN rendering a scene
+        THEN refine the edges with more rays
+        AND report how many pixels were refined
+        """
+        # WHEN
+        with (
+            patch("raytracer.rendering.cli.render_scene.RenderEngine", RenderEngine),
+            patch(
+                "raytracer.rendering.cli.render_scene.ImageService",
+                wraps=ImageService,
+            ),
+        ):
+            result = cli_runner.invoke(
+                render_scene,
+                ["--scene", scene_file, "--width", "8", "--height", "6"]
+                + ["--processes", "1", "--max-samples", "4", "--edge-threshold", "8"]
+                + ["--filename", "smooth.ppm", "--stats"],
+            )
+
+        # THEN
+        assert result.exit_code == 0, result.output
+        assert "Anti-aliased pixels: 0" not in result.output
+        assert "Anti-aliased pixels:" in result.output
+        assert os.path.exists(os.path.join(temp_directory, "smooth.ppm"))
+
+    @pytest.mark.parametrize("filename", ["streamed.ppm", "streamed.png"])
+    def test_render_scene_stream(
+        self,
+        cli_runner: CliRunner,
+        scene_file: str,
+        temp_directory: str,
+        image_service: Mock,
+        filename: str,
+    ) -> None:
+        """
+        GIVEN the stream option
+        WHEN rendering a scene
+        THEN write the image while rendering rather than saving it afterwards
+        """
+        # WHEN
+        with patch(
+            "raytracer.rendering.cli.render_scene.ImageService",
+            wraps=ImageService,
+        ):
+            result = cli_runner.invoke(
+                render_scene,
+                ["--scene", scene_file, "--width", "1", "--height", "1"]
+                + ["--filename", filename, "--stream"],
+            )
+
+        # THEN
+        assert result.exit_code == 0, result.output
+        filepath = os.path.join(temp_directory, filename)
+        assert f"Generated file: {filepath}" in result.output
+        with Image.open(filepath) as image:
+            assert image.size == (1, 1)
+            assert image.convert("RGB").getpixel((0, 0)) == (0, 0, 0)
+        image_service.save.assert_not_called()
+
+    def test_render_scene_stream_to_stdout(
+        self, scene_file: str, capsysbinary: pytest.CaptureFixture[bytes]
+    ) -> None:
+        """
+        GIVEN a filename of '-'
+        WHEN streaming a scene
+        THEN write a PPM to standard output
+        AND write messages to standard error
+        """
+        # WHEN
+        with patch(
+            "raytracer.rendering.cli.render_scene.ImageService",
+            wraps=ImageService,
+        ):
+            _stream_to_file(
+                filename="-",
+                options=RenderOptions(
+                    scene_name=scene_file, width=1, height=1, processes=1
+                ),
+            )
+
+        # THEN
+        actual = capsysbinary.readouterr()
+        assert actual.out == b"P6 1 1\n255\n" + bytes(3)
+        assert b"rays/sec" in actual.err
+
+    def test_render_scene_stats(
+        self, cli_runner: CliRunner, scene_file: str, temp_directory: str
+    ) -> None:
+        """
+        GIVEN the stats options
+        WHEN rendering a scene
+        THEN print the stats gathered from the workers
+        AND write them to a JSON file
+        """
+        # GIVEN
+        stats_file = os.path.join(temp_directory, "stats.json")
+
+        # WHEN
+        with (
+            patch("raytracer.rendering.cli.render_scene.RenderEngine", RenderEngine),
+            patch(
+                "raytracer.rendering.cli.render_scene.ImageService",
+                wraps=ImageService,
+            ),
+        ):
+            result = cli_runner.invoke(
+                render_scene,
+                ["--scene", scene_file, "--width", "3", "--height", "2"]
+                + ["--processes", "1", "--stats", "--stats-json", stats_file],
+            )
+
+        # THEN
+        assert result.exit_code == 0, result.output
+        assert "Primary rays: 6" in result.output
+        assert "Shade calls:" in result.output
+        assert "  encode" in result.output
+        assert f"Saved stats: {stats_file}" in result.output
+        with open(stats_file) as f:
+            actual = json.load(f)
+        assert actual["trace"]["primary_rays"] == 6
+        assert actual["image"]["images"] == 1
+        assert len(actual["workers"]) == 1
+        assert f"  {actual['workers'][0]['pid']}: busy" in result.output
+        assert "Scheduling efficiency:" in result.output
+        assert 0 < actual["efficiency"] <= 1
+
+    def test_render_scene_stream_stats_to_stderr(
+        self, scene_file: str, capsysbinary: pytest.CaptureFixture[bytes]
+    ) -> None:
+        with (
+            patch("raytracer.rendering.cli.render_scene.RenderEngine", RenderEngine),
+            patch(
+                "raytracer.rendering.cli.render_scene.ImageService",
+                wraps=ImageService,
+            ),
+        ):
+            _stream_to_file(
+                filename="-",
+                options=RenderOptions(
+                    scene_name=scene_file, width=2, height=2, processes=1, stats=True
+                ),
+            )
+
+        actual = capsysbinary.readouterr()
+        assert actual.out.startswith(b"P6 2 2\n")
+        assert b"Primary rays: 4" in actual.err
+
+    def test_render_scene_stream_unsupported_format(
+        self, cli_runner: CliRunner, scene_file: str, render_engine: Mock
+    ) -> None:
+        result = cli_runner.invoke(
+            render_scene,
+            ["--scene", scene_file, "--filename", "image.jpeg", "--stream"],
+        )
+
+        assert result.exit_code == 2
+        assert "'.jpeg' images can't be streamed" in result.output
+        render_engine.render.assert_not_called()
+
+    def test_render_scene_progressive(
+        self,
+        cli_runner: CliRunner,
+        scene_file: str,
+        temp_directory: str,
+        render_engine: Mock,
+        image_service: Mock,
+    ) -> None:
+        """
+        GIVEN the progressive option
+        WHEN rendering a scene
+        THEN save a preview of the image after each pass
+        """
+        # GIVEN
+        render_engine.render_progressive.return_value = iter([8, 4, 2, 1])
+
+        # WHEN
+        result = cli_runner.invoke(
+            render_scene,
+            ["--scene", scene_file, "--width", "2", "--height", "2"]
+            + ["--filename", "preview.ppm", "--progressive"],
+        )
+
+        # THEN
+        assert result.exit_code == 0, result.output
+        filepath = os.path.join(temp_directory, "preview.ppm")
+        assert (
+            image_service.save.call_args_list
+            == [call(canvas=mock.ANY, filepath=filepath)] * 4
+        )
+        assert "Pass 1 of 4, 1/64 of pixels traced: testing.ppm" in result.output
+        assert "Pass 4 of 4, all pixels traced: testing.ppm" in result.output
+        assert "Generated file: testing.ppm" in result.output
+        render_engine.render.assert_not_called()
+
+    def test_render_scene_progressive_stream(
+        self, cli_runner: CliRunner, scene_file: str, render_engine: Mock
+    ) -> None:
+        result = cli_runner.invoke(
+            render_scene,
+            ["--scene", scene_file, "--progressive", "--stream"],
+        )
+
+        assert result.exit_code == 2
+        assert "--progressive can't be combined with --stream" in result.output
+        render_engine.render_progressive.assert_not_called()
+
+    def test_render_scene_cache(
+        self,
+        config: Mock,
+        cli_runner: CliRunner,
+        scene_file: str,
+        temp_directory: str,
+        render_engine: Mock,
+        image_service: Mock,
+    ) -> None:
+        """
+        GIVEN the cache option
+        WHEN rendering the same scene twice
+        THEN render it the first time and cache the image
+        AND save the cached image the second time without rendering
+        """
+        # GIVEN
+        config.CACHE_DIR = os.path.join(temp_directory, "cache")
+        config.CACHE_SIZE = 1024
+        render_engine.settings = {"max_depth": 6}
+        args = ["--scene", scene_file, "--width", "1", "--height", "1", "--cache"]
+
+        # WHEN
+        results = [
+            cli_runner.invoke(render_scene, args + ["--filename", filename])
+            for filename in ("first.ppm", "second.png")
+        ]
+
+        # THEN
+        assert [result.exit_code for result in results] == [0, 0]
+        render_engine.render.assert_called_once()
+        assert len(os.listdir(config.CACHE_DIR)) == 1
+        assert "Found the image in the cache" not in results[0].output
+        assert "Found the image in the cache" in results[1].output
+        assert image_service.save.call_args == call(
+            canvas=Canvas(width=1, height=1),
+            filepath=os.path.join(temp_directory, "second.png"),
+        )
+
+    def test_render_scene_cache_to_stdout(
+        self,
+        config: Mock,
+        cli_runner: CliRunner,
+        scene_file: str,
+        temp_directory: str,
+        render_engine: Mock,
+    ) -> None:
+        """
+        GIVEN an image in the cache
+        WHEN streaming the same scene to standard output
+        THEN write the cached image as a PPM
+        """
+        # GIVEN
+        config.CACHE_DIR = os.path.join(temp_directory, "cache")
+        config.CACHE_SIZE = 1024
+        render_engine.settings = {}
+        args = ["--scene", scene_file, "--width", "1", "--height", "1", "--cache"]
+        cli_runner.invoke(render_scene, args)
+
+        # WHEN
+        with patch(
+            "raytracer.rendering.cli.render_scene.ImageService",
+            wraps=ImageService,
+        ):
+            result = cli_runner.invoke(
+                render_scene, args + ["--stream", "--filename", "-"]
+            )
+
+        # THEN
+        assert result.exit_code == 0, result.stderr
+        assert result.stdout_bytes == b"P6 1 1\n255\n" + bytes(3)
+        assert "Found the image in the cache" in result.stderr
+        render_engine.render.assert_called_once()
+
+    def test_render_scene_watch(
+        self,
+        cli_runner: CliRunner,
+        scene_file: str,
+        temp_directory: str,
+        scene_data: dict,
+        render_engine: Mock,
+        image_service: Mock,
+    ) -> None:
+        """
+        GIVEN the watch option
+        WHEN the scene file is removed, replaced by a directory, saved half written,
+        then saved again, then the command is interrupted
+        THEN render the scene once at first
+        AND keep waiting while there is no file
+        AND report each file that couldn't be loaded and keep waiting
+        AND render only the tiles the second save changed
+        AND stop watching when interrupted
+        """
+        # GIVEN
+        filepath = os.path.join(temp_directory, f"{scene_file}.json")
+        modified = os.stat(filepath).st_mtime_ns
+        render_engine.changed_tiles.return_value = []
+
+        def save(content: str) -> None:
+            nonlocal modified
+            with open(filepath, mode="w") as f:
+                f.write(content)
+            modified += 1_000_000_000
+            os.utime(filepath, ns=(modified, modified))
+
+        def save_over_directory(content: str) -> None:
+            os.rmdir(filepath)
+            save(content)
+
+        sleeps = [
+            None,
+            lambda: os.remove(filepath),
+            lambda: os.mkdir(filepath),
+            lambda: save_over_directory("{"),
+            lambda: save(json.dumps(scene_data)),
+            None,
+            KeyboardInterrupt,
+        ]
+
+        def sleep(seconds: float) -> None:
+            effect = sleeps.pop(0)
+            if effect is KeyboardInterrupt:
+                raise KeyboardInterrupt
+            if effect is not None:
+                effect()
+
+        # WHEN
+        with patch(
+            "raytracer.rendering.cli.render_scene.time.sleep", side_effect=sleep
+        ):
+            result = cli_runner.invoke(
+                render_scene,
+                ["--scene", scene_file, "--width", "2", "--height", "2", "--watch"],
+            )
+
+        # THEN
+        assert result.exit_code == 0, result.output
+        assert sleeps == []
+        assert render_engine.render.call_count == 2
+        assert render_engine.render.call_args.kwargs["tiles"] == []
+        assert render_engine.changed_tiles.call_count == 1
+        assert image_service.save.call_count == 2
+        lines = result.output.splitlines()
+        assert lines[0].startswith(f"Watching {filepath} for changes")
+        assert lines[1].startswith("Traced 1 of 1 tiles in ")
+        assert lines[2].startswith(f"Couldn't load {filepath}: IsADirectoryError")
+        assert lines[3].startswith(f"Couldn't load {filepath}: JSONDecodeError")
+        assert lines[4].startswith("Traced 0 of 1 tiles in ")
+        assert lines[5] == "Stopped watching"
+
+    @pytest.mark.parametrize(
+        "field, value",
+        [("radius", "0.6"), ("objects", 5), ("camera", None)],
+        ids=["string radius", "number of objects", "no camera"],
+    )
+    def test_render_scene_watch_wrong_type(
+        self,
+        cli_runner: CliRunner,
+        scene_file: str,
+        temp_directory: str,
+        scene_data: dict,
+        render_engine: Mock,
+        image_service: Mock,
+        field: str,
+        value: Any,
+    ) -> None:
+        """
+        GIVEN the watch option
+        WHEN the scene file is saved with a field of the wrong type, then saved
+        again as it was
+        THEN report the file couldn't be loaded and keep waiting
+        AND render the scene once it is saved again
+        """
+        # GIVEN
+        filepath = os.path.join(temp_directory, f"{scene_file}.json")
+        modified = os.stat(filepath).st_mtime_ns
+        render_engine.changed_tiles.return_value = []
+        invalid = copy.deepcopy(scene_data)
+        if field == "radius":
+            invalid["objects"][0]["attributes"][field] = value
+        else:
+            invalid[field] = value
+
+        def save(data: dict) -> None:
+            nonlocal modified
+            with open(filepath, mode="w") as f:
+                json.dump(data, f)
+            modified += 1_000_000_000
+            os.utime(filepath, ns=(modified, modified))
+
+        sleeps = [
+            None,
+            lambda: save(invalid),
+            lambda: save(scene_data),
+            KeyboardInterrupt,
+        ]
+
+        def sleep(seconds: float) -> None:
+            effect = sleeps.pop(0)
+            if effect is KeyboardInterrupt:
+                raise KeyboardInterrupt
+            if effect is not None:
+                effect()
+
+        # WHEN
+        with patch(
+            "raytracer.rendering.cli.render_scene.time.sleep", side_effect=sleep
+        ):
+            result = cli_runner.invoke(
+                render_scene,
+                ["--scene", scene_file, "--width", "2", "--height", "2", "--watch"],
+            )
+
+        # THEN
+        assert result.exit_code == 0, result.output
+        assert sleeps == []
+        assert render_engine.render.call_count == 2
+        lines = result.output.splitlines()
+        assert lines[2].startswith(f"Couldn't load {filepath}: TypeError")
+        assert lines[3].startswith("Traced 0 of 1 tiles in ")
+        assert lines[4] == "Stopped watching"
+
+    @pytest.mark.parametrize("option", ["--stream", "--progressive", "--cache"])
+    def test_render_scene_watch_combined(
+        self,
+        cli_runner: CliRunner,
+        scene_file: str,
+        render_engine: Mock,
+        option: str,
+    ) -> None:
+        result = cli_runner.invoke(
+            render_scene, ["--scene", scene_file, "--watch", option]
+        )
+
+        assert result.exit_code == 2
+        assert "--watch can't be combined with" in result.output
+        render_engine.render.assert_not_called()
+
+    def test_render_scene_gbuffer(
+        self,
+        cli_runner: CliRunner,
+        scene_file: str,
+        temp_directory: str,
+        render_engine: Mock,
+    ) -> None:
+        """
+        GIVEN a G-buffer file which doesn't exist yet
+        WHEN rendering the scene with it twice
+        THEN render the scene the first time and save its G-buffer
+        AND relight the saved G-buffer the second time, reusing its shadows
+        """
+        # GIVEN
+        render_engine.gbuffer_depth = 2
+        render_engine.max_depth = 0
+        render_engine.relight.return_value = iter([0])
+        path = os.path.join(temp_directory, "scene.gbuffer")
+        args = ["--scene", scene_file, "--width", "1", "--height", "1"]
+
+        # WHEN
+        results = [
+            cli_runner.invoke(render_scene, args + ["--gbuffer", path])
+            for _ in range(2)
+        ]
+
+        # THEN
+        assert [result.exit_code for result in results] == [0, 0]
+        render_engine.render.assert_called_once()
+        render_engine.relight.assert_called_once()
+        assert render_engine.relight.call_args.kwargs["reuse_shadows"] is True
+        assert f"Saved the G-buffer: {path}" in results[0].output
+        assert "Relighting the G-buffer in" not in results[0].output
+        assert f"Relighting the G-buffer in {path}" in results[1].output
+        assert os.path.exists(path)
+
+    @pytest.mark.parametrize(
+        "option",
+        [
+            ["--stream"],
+            ["--progressive"],
+            ["--watch"],
+            ["--linear"],
+            ["--max-samples", "2"],
+        ],
+        ids=["stream", "progressive", "watch", "linear", "anti-aliasing"],
+    )
+    def test_render_scene_gbuffer_combined(
+        self,
+        cli_runner: CliRunner,
+        scene_file: str,
+        render_engine: Mock,
+        option: list[str],
+    ) -> None:
+        result = cli_runner.invoke(
+            render_scene, ["--scene", scene_file, "--gbuffer", "scene.gbuffer", *option]
+        )
+
+        assert result.exit_code == 2
+        assert "--gbuffer can't be combined with" in result.output
+        render_engine.render.assert_not_called()
+
+    def test_render_scene_distributed(
+        self,
+        cli_runner: CliRunner,
+        scene_file: str,
+        render_engine: Mock,
+        scene_data: dict,
+    ) -> None:
+        """
+        GIVEN the distributed option
+        WHEN rendering a scene
+        THEN render it across the workers which connect to the address listened on
+        """
+        # WHEN
+        with patch(
+            "raytracer.rendering.cli.render_scene.Coordinator"
+        ) as coordinator_class:
+            coordinator = coordinator_class.return_value.__enter__.return_value
+            coordinator.render.return_value = iter([0])
+            result = cli_runner.invoke(
+                render_scene,
+                ["--scene", scene_file, "--width", "1", "--height", "1"]
+                + ["--distributed", "--listen", "127.0.0.1:7000"],
+            )
+
+        # THEN
+        assert result.exit_code == 0, result.output
+        assert "Listening for workers on 127.0.0.1:7000" in result.output
+        coordinator_class.assert_called_once_with(
+            engine=render_engine, host="127.0.0.1", port=7000
+        )
+        coordinator.render.assert_called_once_with(
+            scene=Scene.from_object(data=scene_data, width=1, height=1),
+            framebuffer=mock.ANY,
+        )
+        render_engine.render.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "option, message",
+        [
+            (["--progressive"], "--distributed can't be combined with"),
+            (["--watch"], "--distributed can't be combined with"),
+            (["--gbuffer", "scene.gbuffer"], "--distributed can't be combined with"),
+            (["--max-samples", "2"], "--distributed can't be combined with"),
+            (["--listen", "localhost"], "isn't a host and port"),
+        ],
+        ids=["progressive", "watch", "gbuffer", "anti-aliasing", "invalid address"],
+    )
+    def test_render_scene_distributed_invalid(
+        self,
+        cli_runner: CliRunner,
+        scene_file: str,
+        render_engine: Mock,
+        option: list[str],
+        message: str,
+    ) -> None:
+        result = cli_runner.invoke(
+            render_scene, ["--scene", scene_file, "--distributed", *option]
+        )
+
+        assert result.exit_code == 2
+        assert message in result.output
+        render_engine.render.assert_not_called()
+
+
+class TestRenderBatch:
+    @pytest.fixture(autouse=True)
+    def batch_config(self, temp_directory: str) -> Iterator[Mock]:
+        with patch("raytracer.rendering.cli.render_batch.config") as mock_config:
+            mock_config.OUT_DIR = temp_directory
+            yield mock_config
+
+    @pytest.fixture
+    def manifest(self, temp_directory: str, scene_file: str) -> str:
+        filepath = os.path.join(temp_directory, "manifest.jsonl")
+        jobs = [
+            {"scene": scene_file, "width": 3, "height": 2, "output": "plain.ppm"},
+            {
+                "scene": scene_file,
+                "width": 2,
+                "height": 3,
+                "output": "swept.png",
+                "sweep": {"objects.0.attributes.radius": [0.1, 0.2]},
+            },
+        ]
+        with open(filepath, mode="w") as f:
+            f.write("\n".join(json.dumps(job) for job in jobs))
+        return filepath
+
+    def test_render_batch(
+        self,
+        cli_runner: CliRunner,
+        manifest: str,
+        temp_directory: str,
+        render_engine: Mock,
+    ) -> None:
+        """
+        GIVEN a manifest with a plain job and a job sweeping over two values
+        WHEN rendering the batch
+        THEN render every job across the same engine, with the values swept
+        AND save each image as its job finishes
+        """
+        # GIVEN
+        scenes: list[Scene] = []
+
+        def render_batch(jobs: Iterator, processes: int) -> Iterator[int]:
+            for index, (scene, _) in enumerate(jobs):
+                scenes.append(scene)
+                yield index
+
+        render_engine.render_batch.side_effect = render_batch
+        render_engine.stats = RenderStats()
+
+        # WHEN
+        result = cli_runner.invoke(
+            render_batch_command, [manifest, "--processes", "2", "--stats"]
+        )
+
+        # THEN
+        assert result.exit_code == 0, result.output
+        assert render_engine.render_batch.call_args.kwargs["processes"] == 2
+        assert [(scene.width, scene.height) for scene in scenes] == [
+            (3, 2),
+            (2, 3),
+            (2, 3),
+        ]
+        assert [scene.objects[0].radius for scene in scenes] == pytest.approx(
+            [0.6, 0.1, 0.2]
+        )
+        lines = result.output.splitlines()
+        assert lines[:3] == [
+            f"Generated file: {os.path.join(temp_directory, 'plain.ppm')}",
+            f"Generated file: {os.path.join(temp_directory, 'swept_1.png')} "
+            "(objects.0.attributes.radius=0.1)",
+            f"Generated file: {os.path.join(temp_directory, 'swept_2.png')} "
+            "(objects.0.attributes.radius=0.2)",
+        ]
+        assert lines[3].startswith("Rendered 3 jobs, 18 primary rays")
+        assert "Primary rays: " in result.output
+        for filename in ("plain.ppm", "swept_1.png", "swept_2.png"):
+            assert os.path.exists(os.path.join(temp_directory, filename))
+
+    def test_render_batch_closes_framebuffers(
+        self, cli_runner: CliRunner, manifest: str, render_engine: Mock
+    ) -> None:
+        """
+        GIVEN a batch which fails part way through
+        WHEN rendering it
+        THEN close the framebuffers of the jobs which were started
+        """
+        # GIVEN
+        names = []
+
+        def render_batch(jobs: Iterator, processes: int) -> Iterator[int]:
+            for _, framebuffer in jobs:
+                names.append(framebuffer.name)
+                raise RuntimeError("Worker failed")
+            yield 0  # pragma: nocover
+
+        render_engine.render_batch.side_effect = render_batch
+
+        # WHEN
+        result = cli_runner.invoke(render_batch_command, [manifest])
+
+        # THEN
+        assert isinstance(result.exception, RuntimeError)
+        assert len(names) == 1
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=names[0])
+
+    @pytest.mark.parametrize(
+        "job, message",
+        [
+            ({"width": 2}, "Line 2 of the manifest: missing height, output"),
+            (
+                {"scene": "missing", "width": 2, "height": 2, "output": "x.ppm"},
+                "Couldn't read the scene missing",
+            ),
+            (
+                {
+                    "scene": None,
+                    "width": 2,
+                    "height": 2,
+                    "output": "x.ppm",
+                    "sweep": {"camera.w": [1]},
+                },
+                "The scene has no camera.w",
+            ),
+            (
+                {"width": None, "height": 2, "output": "x.ppm"},
+                "Line 2 of the manifest: width must be a whole number of at least 2",
+            ),
+            (
+                {"width": 2, "height": 1, "output": "x.ppm"},
+                "Line 2 of the manifest: height must be a whole number of at least 2",
+            ),
+            (
+                {
+                    "scene": None,
+                    "width": 2,
+                    "height": 2,
+                    "output": "x.ppm",
+                    "sweep": {"objects.0.attributes.radius": [0.1, "0.2"]},
+                },
+                "The scene of x_2.ppm (objects.0.attributes.radius='0.2') is "
+                "invalid: TypeError",
+            ),
+        ],
+        ids=[
+            "missing keys",
+            "missing scene",
+            "missing path",
+            "no width",
+            "single row",
+            "invalid value swept",
+        ],
+    )
+    def test_render_batch_invalid(
+        self,
+        cli_runner: CliRunner,
+        temp_directory: str,
+        scene_file: str,
+        render_engine: Mock,
+        job: dict,
+        message: str,
+    ) -> None:
+        """
+        GIVEN a manifest with a job which can't be rendered
+        WHEN rendering the batch
+        THEN report what is wrong with it
+        AND render nothing, even the job before it
+        """
+        # GIVEN
+        filepath = os.path.join(temp_directory, "manifest.jsonl")
+        valid = {"scene": scene_file, "width": 2, "height": 2, "output": "first.ppm"}
+        with open(filepath, mode="w") as f:
+            f.write(json.dumps(valid) + "\n")
+            json.dump({**job, "scene": job.get("scene") or scene_file}, f)
+
+        # WHEN
+        result = cli_runner.invoke(render_batch_command, [filepath])
+
+        # THEN
+        assert result.exit_code == 2
+        assert message in result.output
+        render_engine.render_batch.assert_not_called()
+
+
+class TestRenderWorker:
+    @pytest.mark.parametrize(
+        "side_effect", [None, KeyboardInterrupt], ids=["once", "interrupted"]
+    )
+    def test_render_worker(
+        self, cli_runner: CliRunner, side_effect: Optional[type[BaseException]]
+    ) -> None:
+        """
+        GIVEN the address of a coordinator
+        WHEN starting a worker
+        THEN render tiles for the coordinator until it finishes or is interrupted
+        """
+        with patch(
+            "raytracer.rendering.cli.render_worker.run_worker",
+            side_effect=side_effect,
+        ) as run_worker:
+            result = cli_runner.invoke(render_worker, ["10.0.0.1:7000", "--once"])
+
+        assert result.exit_code == 0, result.output
+        run_worker.assert_called_once_with(host="10.0.0.1", port=7000, once=True)
+        assert "Rendering tiles for 10.0.0.1:7000" in result.output
+        assert "Stopped rendering" in result.output
+
+    def test_render_worker_processes(self, cli_runner: CliRunner) -> None:
+        """
+        GIVEN more than one process
+        WHEN starting workers
+        THEN start a worker in each process and wait for them all
+        """
+        with patch("raytracer.rendering.cli.render_worker.mp.Process") as process:
+            result = cli_runner.invoke(render_worker, ["10.0.0.1:7000", "-p", "3"])
+
+        assert result.exit_code == 0, result.output
+        assert (
+            process.call_args_list
+            == [call(target=_run_worker, args=("10.0.0.1", 7000, False))] * 3
+        )
+        assert process.return_value.start.call_count == 3
+        assert process.return_value.join.call_count == 3
+
+    def test_render_worker_invalid_address(self, cli_runner: CliRunner) -> None:
+        result = cli_runner.invoke(render_worker, ["10.0.0.1"])
+
+        assert result.exit_code == 2
+        assert "isn't a host and port" in result.output
+
+
+class TestConvertScene:
+    def test_convert_scene(
+        self,
+        cli_runner: CliRunner,
+        scene_file: str,
+        temp_directory: str,
+        scene_data: dict,
+    ) -> None:
+        """
+        GIVEN a JSON scene
+        AND an array of spheres
+        WHEN converting the scene with the spheres added
+        THEN save a binary scene with the scene's spheres followed by the array's
+        """
+        # GIVEN
+        spheres_file = os.path.join(temp_directory, "spheres.npy")
+        np.save(spheres_file, np.array([[0.5, -0.5, 2.0, 0.1]]))
+
+        # WHEN
+        result = cli_runner.invoke(
+            convert_scene, [scene_file, "cloud", "--spheres", spheres_file]
+        )
+
+        # THEN
+        assert result.exit_code == 0, result.output
+        path = os.path.join(temp_directory, "cloud.scene")
+        assert "Converted 2 spheres in" in result.output
+        assert path in result.output
+        scene = load_scene(path=path, width=1, height=1)
+        assert (
+            scene.objects[0]
+            == Scene.from_object(data=scene_data, width=1, height=1).objects[0]
+        )
+        assert scene.objects[1].centre == Point(0.5, -0.5, 2.0)
+
+    def test_convert_scene_hidden_by_json(
+        self, cli_runner: CliRunner, scene_file: str
+    ) -> None:
+        result = cli_runner.invoke(convert_scene, [scene_file, scene_file])
+
+        assert result.exit_code == 2
+        assert "would be loaded in its place" in result.output
+
+    def test_convert_scene_invalid_spheres(
+        self, cli_runner: CliRunner, scene_file: str, temp_directory: str
+    ) -> None:
+        spheres_file = os.path.join(temp_directory, "spheres.npy")
+        np.save(spheres_file, np.zeros((2, 3)))
+
+        result = cli_runner.invoke(
+            convert_scene, [scene_file, "cloud", "--spheres", spheres_file]
+        )
+
+        assert result.exit_code == 2
+        assert "must have a row for each sphere" in result.output
@@ -0,0 +1,243 @@
+import math
+import os
+from dataclasses import replace
+
+import numpy as np
+import pytest
+from pytest_mock import MockerFixture
+
+from raytracer.core.types.binary import MappedSpheres, load_scene, save_scene
+from raytracer.core.types.bvh import BoundingBox
+from raytracer.core.types.entities import Scene, Sphere
+from raytracer.core.types.geometry import Point
+from raytracer.rendering.dependencies import SceneChanges, TileDependencies
+
+
+@pytest.fixture
+def scene(scene_data: dict) -> Scene:
+    return Scene.from_object(data=scene_data, width=4, height=2)
+
+
+def _box(x: float) -> BoundingBox:
+    return BoundingBox(lower=(x - 0.5, -0.5, 4.5), upper=(x + 0.5, 0.5, 5.5))
+
+
+class TestTileDependencies:
+    @pytest.mark.parametrize(
+        "length, bounds, expected",
+        [
+            (math.inf, _box(0), True),
+            (10.0, _box(0), True),
+            (4.0, _box(0), False),
+            (math.inf, _box(2), False),
+        ],
+        ids=["escaped", "through", "short", "beside"],
+    )
+    def test_crosses(self, length: float, bounds: BoundingBox, expected: bool) -> None:
+        """
+        GIVEN a segment along the z axis
+        WHEN testing whether it passes through a box
+        THEN it does if the box is across it and the segment reaches the box
+        """
+        # GIVEN
+        dependencies = TileDependencies()
+        dependencies.add_segment(origin=(0, 0, 0), direction=(0, 0, 1), length=length)
+
+        # WHEN
+        actual = dependencies.crosses(bounds)
+
+        # THEN
+        assert actual is expected
+
+    def test_add_segments(self) -> None:
+        """
+        GIVEN segments added as arrays
+        WHEN testing whether they pass through boxes
+        THEN they are kept the same as segments added one at a time
+        """
+        # GIVEN
+        expected = TileDependencies()
+        expected.add_segment(origin=(0, 0, 0), direction=(0, 0, 1), length=4)
+        expected.add_segment(origin=(2, 0, 0), direction=(0, 0, 1), length=math.inf)
+        actual = TileDependencies()
+
+        # WHEN
+        actual.add_segments(
+            origins=np.array([[0.0, 0.0, 0.0], [2.0, 0.0, 0.0]]),
+            directions=np.array([[0.0, 0.0, 1.0], [0.0, 0.0, 1.0]]),
+            lengths=np.array([4.0, math.inf]),
+        )
+
+        # THEN
+        assert actual.segments == expected.segments
+        assert not actual.crosses(_box(0))
+        assert actual.crosses(_box(2))
+
+    def test_crosses_nothing_recorded(self) -> None:
+        assert TileDependencies().crosses(_box(0)) is False
+
+
+class TestSceneChanges:
+    def test_unchanged(self, scene: Scene, scene_data: dict) -> None:
+        # GIVEN
+        other = Scene.from_object(data=scene_data, width=4, height=2)
+
+        # WHEN
+        actual = SceneChanges.between(old=scene, new=other)
+
+        # THEN
+        assert actual == SceneChanges()
+
+    def test_objects(self, scene: Scene) -> None:
+        """
+        GIVEN a scene with its object moved and a new object added after it
+        WHEN comparing it with the scene before
+        THEN the old object is removed
+        AND the bounds of both objects in the new scene are added, padded
+        """
+        # GIVEN
+        moved = replace(scene.objects[0], centre=Point(5, 0, 5))
+        added = Sphere(
+            name="Added",
+            centre=Point(-5, 0, 5),
+            material=scene.objects[0].material,
+            radius=1,
+        )
+        new = replace(scene, objects=[moved, added])
+
+        # WHEN
+        actual = SceneChanges.between(old=scene, new=new)
+
+        # THEN
+        assert actual.removed == {0}
+        assert [bounds.centroid for bounds in actual.added] == [
+            pytest.approx(moved.bounds().centroid, rel=1e-3),
+            pytest.approx(added.bounds().centroid, rel=1e-3),
+        ]
+        assert all(
+            lower < expected
+            for lower, expected in zip(actual.added[0].lower, moved.bounds().lower)
+        )
+        assert all(
+            upper > expected
+            for upper, expected in zip(actual.added[0].upper, moved.bounds().upper)
+        )
+        assert not actual.lights and not actual.view
+
+    def test_binary_scenes(
+        self, scene: Scene, temp_directory: str, mocker: MockerFixture
+    ) -> None:
+        """
+        GIVEN a binary scene saved again with one sphere renamed, one moved, the
+        material of one changed and one added
+        WHEN comparing it with the scene before
+        THEN only the moved, changed and added spheres are changed
+        AND a binary scene saved the same is compared without making its spheres
+        """
+        # GIVEN
+        sphere = scene.objects[0]
+        material = replace(sphere.material, reflection=0.1)
+        old = replace(
+            scene,
+            objects=[
+                replace(sphere, name=f"Sphere {index}", centre=Point(index, 0, 5))
+                for index in range(3)
+            ],
+        )
+        renamed, moved, changed = old.objects
+        new = replace(
+            old,
+            objects=[
+                replace(renamed, name="Renamed"),
+                replace(moved, centre=Point(1, 1, 5)),
+                replace(changed, material=material),
+                replace(changed, centre=Point(3, 0, 5)),
+            ],
+        )
+        old_path = os.path.join(temp_directory, "old.scene")
+        new_path = os.path.join(temp_directory, "new.scene")
+        save_scene(path=old_path, scene=old)
+        save_scene(path=new_path, scene=new)
+        old_scene = load_scene(path=old_path, width=4, height=2)
+
+        # WHEN
+        actual = SceneChanges.between(
+            old=old_scene, new=load_scene(path=new_path, width=4, height=2)
+        )
+
+        # THEN
+        assert actual.removed == {1, 2}
+        assert [bounds.centroid for bounds in actual.added] == [
+            pytest.approx(sphere.bounds().centroid, rel=1e-3)
+            for sphere in new.objects[1:]
+        ]
+        mocker.patch.object(MappedSpheres, "__getitem__", side_effect=AssertionError)
+        assert (
+            SceneChanges.between(
+                old=old_scene, new=load_scene(path=old_path, width=4, height=2)
+            )
+            == SceneChanges()
+        )
+
+    def test_objects_removed(self, scene: Scene) -> None:
+        actual = SceneChanges.between(old=scene, new=replace(scene, objects=[]))
+
+        assert actual == SceneChanges(removed={0})
+
+    @pytest.mark.parametrize(
+        "change, lights, view",
+        [
+            ({"lights": []}, True, False),
+            ({"camera": Point(0, 0, -2)}, False, True),
+            ({"width": 8}, False, True),
+        ],
+        ids=["lights", "camera", "resolution"],
+    )
+    def test_lights_and_view(
+        self, scene: Scene, change: dict, lights: bool, view: bool
+    ) -> None:
+        actual = SceneChanges.between(old=scene, new=replace(scene, **change))
+
+        assert (actual.lights, actual.view) == (lights, view)
+        assert actual.removed == set()
+
+    @pytest.mark.parametrize(
+        "changes, expected",
+        [
+            (SceneChanges(), False),
+            (SceneChanges(view=True), True),
+            (SceneChanges(lights=True), True),
+            (SceneChanges(removed={2}), True),
+            (SceneChanges(removed={3}), False),
+            (SceneChanges(added=[_box(0)]), True),
+            (SceneChanges(added=[_box(2)]), False),
+        ],
+        ids=[
+            "nothing",
+            "view",
+            "lights",
+            "object depended on",
+            "other object",
+            "object across a ray",
+            "object beside the rays",
+        ],
+    )
+    def test_affects(self, changes: SceneChanges, expected: bool) -> None:
+        """
+        GIVEN a tile which shaded a hit on object 2
+        AND traced a ray along the z axis
+        WHEN checking whether changes to the scene affect it
+        THEN only the changes to what it depended on do
+        """
+        # GIVEN
+        dependencies = TileDependencies(objects={2}, shaded=True)
+        dependencies.add_segment(origin=(0, 0, 0), direction=(0, 0, 1), length=math.inf)
+
+        # WHEN
+        actual = changes.affects(dependencies)
+
+        # THEN
+        assert actual is expected
+
+    def test_lights_unshaded(self) -> None:
+        assert not SceneChanges(lights=True).affects(TileDependencies())
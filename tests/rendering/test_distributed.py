@@ -0,0 +1,547 @@
+import multiprocessing as mp
+import os
+import socket
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator
+from unittest.mock import patch
+
+import pytest
+
+from raytracer.core.types.binary import load_scene, save_scene
+from raytracer.core.types.entities import Scene
+from raytracer.rendering.distributed import (
+    _HEADER,
+    _INDEX,
+    _TILE,
+    MAX_MESSAGE_SIZE,
+    TILES_IN_FLIGHT,
+    Coordinator,
+    MessageKind,
+    ProtocolError,
+    TileQueue,
+    WorkerError,
+    _render_job,
+    parse_address,
+    receive_message,
+    run_worker,
+    send_message,
+)
+from raytracer.rendering.engine import RenderEngine
+from raytracer.rendering.framebuffer import Framebuffer
+from raytracer.rendering.shading import Shader
+from raytracer.rendering.tiles import Tile, split_tiles
+
+Render = tuple[list[int], bytes]
+
+
+@pytest.fixture
+def scene(scene_data: dict) -> Scene:
+    # Six tiles, cut short on the right and bottom
+    return Scene.from_object(data=scene_data, width=70, height=40)
+
+
+@pytest.fixture
+def expected(scene: Scene) -> bytes:
+    with (
+        RenderEngine(shader=Shader()) as engine,
+        Framebuffer(width=scene.width, height=scene.height) as framebuffer,
+    ):
+        list(engine.render(scene=scene, framebuffer=framebuffer, processes=1))
+        return bytes(framebuffer.buffer)
+
+
+@pytest.fixture
+def coordinator() -> Iterator[Coordinator]:
+    with Coordinator(
+        engine=RenderEngine(shader=Shader()), host="127.0.0.1", port=0
+    ) as coordinator:
+        yield coordinator
+
+
+@pytest.fixture
+def threads() -> Iterator[ThreadPoolExecutor]:
+    with ThreadPoolExecutor() as executor:
+        yield executor
+
+
+def _render(coordinator: Coordinator, scene: Scene) -> Render:
+    with Framebuffer(width=scene.width, height=scene.height) as framebuffer:
+        rows = list(coordinator.render(scene=scene, framebuffer=framebuffer))
+        return rows, bytes(framebuffer.buffer)
+
+
+def _start_worker(threads: ThreadPoolExecutor, coordinator: Coordinator) -> Future:
+    host, port = coordinator.address
+    return threads.submit(run_worker, host=host, port=port, once=True)
+
+
+def _connect(coordinator: Coordinator) -> socket.socket:
+    """Connects as a worker which the test speaks for"""
+    connection = socket.create_connection(coordinator.address)
+    connection.settimeout(10)
+    return connection
+
+
+def _take_tiles(connection: socket.socket) -> list[Tile]:
+    """Takes the job and the first tiles handed to a worker"""
+    assert receive_message(connection)[0] == MessageKind.JOB
+    tiles = []
+    for _ in range(TILES_IN_FLIGHT):
+        kind, payload = receive_message(connection)
+        assert kind == MessageKind.TILE
+        tiles.append(Tile(*_TILE.unpack(payload)))
+    return tiles
+
+
+def _until(condition: Callable[[], object]) -> None:
+    for _ in range(1000):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("Timed out")  # pragma: nocover
+
+
+def _message(kind: int, payload: bytes = b"") -> bytes:
+    return _HEADER.pack(kind, len(payload)) + payload
+
+
+class TestParseAddress:
+    @pytest.mark.parametrize(
+        "address, expected",
+        [("0.0.0.0:7070", ("0.0.0.0", 7070)), ("[::1]:80", ("[::1]", 80))],
+    )
+    def test_parse_address(self, address: str, expected: tuple[str, int]) -> None:
+        assert parse_address(address) == expected
+
+    @pytest.mark.parametrize("address", ["localhost", ":7070", "host:port", "a:65536"])
+    def test_parse_address_invalid(self, address: str) -> None:
+        with pytest.raises(ValueError, match="isn't a host and port"):
+            parse_address(address)
+
+
+class TestMessages:
+    def test_send_and_receive(self) -> None:
+        first, second = socket.socketpair()
+        with first, second:
+            send_message(first, MessageKind.RESULT, b"pixels")
+            send_message(first, MessageKind.DONE)
+
+            assert receive_message(second) == (MessageKind.RESULT, b"pixels")
+            assert receive_message(second) == (MessageKind.DONE, b"")
+
+    @pytest.mark.parametrize(
+        "data, error",
+        [
+            (_message(99), ProtocolError),
+            (_HEADER.pack(MessageKind.JOB, MAX_MESSAGE_SIZE + 1), ProtocolError),
+            (_HEADER.pack(MessageKind.JOB, 10) + b"short", ConnectionError),
+            (b"", ConnectionError),
+        ],
+        ids=["unknown kind", "too large", "cut short", "closed"],
+    )
+    def test_receive_invalid(self, data: bytes, error: type[Exception]) -> None:
+        first, second = socket.socketpair()
+        with first, second:
+            first.sendall(data)
+            first.close()
+
+            with pytest.raises(error):
+                receive_message(second)
+
+
+class TestTileQueue:
+    def test_take(self) -> None:
+        """
+        GIVEN a queue of tiles
+        WHEN workers take tiles after every tile is handed out
+        THEN steal tiles being rendered by only one other worker
+        AND nothing once each tile is rendered by two workers
+        """
+        # GIVEN
+        first, second = split_tiles(width=64, height=32)
+        tiles = TileQueue([second, first])
+
+        # WHEN
+        taken = [tiles.take(held=()), tiles.take(held=())]
+        stolen = [
+            tiles.take(held={second.index}),
+            tiles.take(held={first.index}),
+            tiles.take(held=()),
+        ]
+
+        # THEN
+        assert taken == [second, first]
+        assert stolen == [first, second, None]
+
+    def test_finish(self) -> None:
+        """
+        GIVEN a tile rendered by two workers
+        WHEN both send it back
+        THEN only keep the first
+        AND finish the queue once every tile is rendered
+        """
+        tiles = TileQueue(split_tiles(width=32, height=32))
+        tile = tiles.take(held=())
+        assert tile is not None
+        assert tiles.take(held=()) == tile
+
+        assert tiles.finish(tile.index)
+        assert not tiles.finish(tile.index)
+        assert tiles.done
+        assert tiles.take(held=()) is None
+        assert not tiles.wait()
+
+    def test_release(self) -> None:
+        """
+        GIVEN tiles handed to workers
+        WHEN a worker goes away
+        THEN put the tiles only it was rendering back at the front of the queue
+        """
+        # GIVEN
+        first, second, third = split_tiles(width=96, height=32)
+        tiles = TileQueue([first, second, third])
+        tiles.take(held=())
+        tiles.take(held=())
+        tiles.take(held=())
+        tiles.take(held={first.index, third.index})
+        tiles.finish(third.index)
+
+        # WHEN
+        tiles.release([first.index, second.index, third.index])
+
+        # THEN
+        assert tiles.wait()
+        assert tiles.take(held=()) == first
+        assert tiles.take(held=()) == second
+        assert tiles.take(held={first.index}) is None
+
+    def test_cancel(self) -> None:
+        tiles = TileQueue(split_tiles(width=64, height=32))
+        tile = tiles.take(held=())
+        assert tile is not None
+
+        tiles.cancel()
+
+        assert tiles.done
+        assert tiles.take(held=()) is None
+        assert not tiles.finish(tile.index)
+
+
+class TestCoordinator:
+    def test_render(
+        self,
+        coordinator: Coordinator,
+        threads: ThreadPoolExecutor,
+        scene: Scene,
+        expected: bytes,
+    ) -> None:
+        """
+        GIVEN two workers connected to a coordinator
+        WHEN rendering scenes across them, one after another
+        THEN render the same images as rendering locally
+        AND yield every row once
+        """
+        # GIVEN
+        workers = [_start_worker(threads, coordinator) for _ in range(2)]
+
+        # WHEN
+        rows, pixels = _render(coordinator=coordinator, scene=scene)
+        for worker in workers:
+            worker.result(timeout=30)
+        workers = [_start_worker(threads, coordinator) for _ in range(2)]
+        again = _render(coordinator=coordinator, scene=scene)
+
+        # THEN
+        assert sorted(rows) == list(range(scene.height))
+        assert pixels == expected
+        assert again[1] == expected
+        for worker in workers:
+            worker.result(timeout=30)
+
+    def test_render_binary_scene(
+        self,
+        coordinator: Coordinator,
+        threads: ThreadPoolExecutor,
+        scene: Scene,
+        expected: bytes,
+        temp_directory: str,
+    ) -> None:
+        """
+        GIVEN a scene loaded from a binary file which workers can't open
+        WHEN rendering it across them
+        THEN send them the contents of the file with the scene
+        AND render the same image as rendering locally
+        """
+        # GIVEN
+        path = os.path.join(temp_directory, "test.scene")
+        save_scene(path=path, scene=scene)
+        loaded = load_scene(path=path, width=scene.width, height=scene.height)
+        os.remove(path)
+        worker = _start_worker(threads, coordinator)
+
+        # WHEN
+        rows, pixels = _render(coordinator=coordinator, scene=loaded)
+
+        # THEN
+        assert sorted(rows) == list(range(scene.height))
+        assert pixels == expected
+        worker.result(timeout=30)
+
+    def test_render_worker_processes(
+        self, coordinator: Coordinator, scene: Scene, expected: bytes
+    ) -> None:
+        """
+        GIVEN worker processes connected to a coordinator
+        WHEN rendering a scene across them
+        THEN render the same image as rendering locally
+        """
+        # GIVEN
+        host, port = coordinator.address
+        workers = [
+            mp.Process(
+                target=run_worker, kwargs={"host": host, "port": port, "once": True}
+            )
+            for _ in range(2)
+        ]
+        for worker in workers:
+            worker.start()
+
+        # WHEN
+        _, pixels = _render(coordinator=coordinator, scene=scene)
+
+        # THEN
+        assert pixels == expected
+        for worker in workers:
+            worker.join(timeout=30)
+            assert worker.exitcode == 0
+
+    def test_worker_disappears(
+        self,
+        coordinator: Coordinator,
+        threads: ThreadPoolExecutor,
+        scene: Scene,
+        expected: bytes,
+    ) -> None:
+        """
+        GIVEN a worker which disconnects after taking tiles
+        WHEN rendering a scene
+        THEN hand its tiles to another worker
+        """
+        # GIVEN
+        lost = _connect(coordinator)
+        rendering = threads.submit(_render, coordinator=coordinator, scene=scene)
+        _take_tiles(lost)
+        lost.close()
+
+        # WHEN
+        worker = _start_worker(threads, coordinator)
+        _, pixels = rendering.result(timeout=30)
+
+        # THEN
+        assert pixels == expected
+        worker.result(timeout=30)
+
+    def test_worker_stalls(
+        self,
+        coordinator: Coordinator,
+        threads: ThreadPoolExecutor,
+        scene: Scene,
+        expected: bytes,
+    ) -> None:
+        """
+        GIVEN a worker which never sends back the tiles it takes
+        WHEN rendering a scene
+        THEN another worker steals its tiles once the rest are rendered
+        AND disconnect the stalled worker once the coordinator closes
+        """
+        # GIVEN
+        stalled = _connect(coordinator)
+        rendering = threads.submit(_render, coordinator=coordinator, scene=scene)
+        _take_tiles(stalled)
+
+        # WHEN
+        worker = _start_worker(threads, coordinator)
+        _, pixels = rendering.result(timeout=30)
+        worker.result(timeout=30)
+        coordinator.close()
+
+        # THEN
+        assert pixels == expected
+        with stalled, pytest.raises(ConnectionError):
+            receive_message(stalled)
+
+    def test_worker_waits_for_tile(
+        self, coordinator: Coordinator, threads: ThreadPoolExecutor, scene_data: dict
+    ) -> None:
+        """
+        GIVEN a single tile, held by two stalled workers
+        WHEN a third worker joins and then one of the stalled workers goes away
+        THEN the third worker waits and then renders the tile
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=32, height=32)
+        stalled = [_connect(coordinator) for _ in range(2)]
+        rendering = threads.submit(_render, coordinator=coordinator, scene=scene)
+        for connection in stalled:
+            assert receive_message(connection)[0] == MessageKind.JOB
+            assert receive_message(connection)[0] == MessageKind.TILE
+
+        # WHEN
+        worker = _start_worker(threads, coordinator)
+        _until(lambda: len(coordinator._connections) == 3)
+        time.sleep(0.1)
+        stalled[0].close()
+        rows, _ = rendering.result(timeout=30)
+
+        # THEN
+        assert sorted(rows) == list(range(32))
+        worker.result(timeout=30)
+        stalled[1].close()
+
+    @pytest.mark.parametrize(
+        "message",
+        [
+            lambda index: _message(MessageKind.TILE),
+            lambda index: _message(MessageKind.RESULT, b"\x00"),
+            lambda index: _message(
+                MessageKind.RESULT, _INDEX.pack(999) + zlib.compress(b"")
+            ),
+            lambda index: _message(MessageKind.RESULT, _INDEX.pack(index) + b"junk"),
+            lambda index: _message(
+                MessageKind.RESULT, _INDEX.pack(index) + zlib.compress(b"\x00")
+            ),
+        ],
+        ids=[
+            "not a result",
+            "no index",
+            "tile not handed out",
+            "corrupt",
+            "wrong size",
+        ],
+    )
+    def test_invalid_result(
+        self,
+        coordinator: Coordinator,
+        threads: ThreadPoolExecutor,
+        scene: Scene,
+        expected: bytes,
+        message: Callable[[int], bytes],
+    ) -> None:
+        """
+        GIVEN a worker which sends back an invalid result
+        WHEN rendering a scene
+        THEN drop the worker and hand its tiles to another
+        """
+        # GIVEN
+        broken = _connect(coordinator)
+        rendering = threads.submit(_render, coordinator=coordinator, scene=scene)
+        tiles = _take_tiles(broken)
+
+        # WHEN
+        with broken:
+            broken.sendall(message(tiles[0].index))
+            worker = _start_worker(threads, coordinator)
+            _, pixels = rendering.result(timeout=30)
+            with pytest.raises(ConnectionError):
+                receive_message(broken)
+
+        # THEN
+        assert pixels == expected
+        worker.result(timeout=30)
+
+    def test_worker_fails(
+        self, coordinator: Coordinator, threads: ThreadPoolExecutor, scene: Scene
+    ) -> None:
+        """
+        GIVEN a worker which can't render tiles
+        WHEN rendering a scene
+        THEN raise the error it sends back
+        """
+        with patch.object(
+            RenderEngine, "_render_tile", side_effect=RuntimeError("Out of rays")
+        ):
+            worker = _start_worker(threads, coordinator)
+            with pytest.raises(WorkerError, match="Out of rays"):
+                _render(coordinator=coordinator, scene=scene)
+            worker.result(timeout=30)
+
+    def test_close_before_render(self, threads: ThreadPoolExecutor) -> None:
+        """
+        GIVEN a worker waiting for a render
+        WHEN the coordinator closes
+        THEN the worker stops
+        """
+        coordinator = Coordinator(
+            engine=RenderEngine(shader=Shader()), host="127.0.0.1", port=0
+        )
+        worker = _start_worker(threads, coordinator)
+        _until(lambda: coordinator._connections)
+
+        coordinator.close()
+
+        assert worker.result(timeout=30) is None
+
+    def test_anti_aliasing(self) -> None:
+        with pytest.raises(ValueError, match="can't anti-alias"):
+            Coordinator(engine=RenderEngine(shader=Shader(), max_samples=4), port=0)
+
+
+class TestWorker:
+    def test_waits_for_coordinator(
+        self, threads: ThreadPoolExecutor, scene: Scene, expected: bytes
+    ) -> None:
+        """
+        GIVEN a worker started before its coordinator
+        WHEN the coordinator starts
+        THEN connect to it and render its scene
+        """
+        # GIVEN
+        with socket.create_server(("127.0.0.1", 0)) as listener:
+            port = listener.getsockname()[1]
+        worker = threads.submit(
+            run_worker, host="127.0.0.1", port=port, once=True, connect_timeout=30
+        )
+        time.sleep(0.1)
+
+        # WHEN
+        with Coordinator(
+            engine=RenderEngine(shader=Shader()), host="127.0.0.1", port=port
+        ) as coordinator:
+            _, pixels = _render(coordinator=coordinator, scene=scene)
+
+        # THEN
+        assert pixels == expected
+        worker.result(timeout=30)
+
+    def test_no_coordinator(self) -> None:
+        with socket.create_server(("127.0.0.1", 0)) as listener:
+            port = listener.getsockname()[1]
+
+        with pytest.raises(ConnectionError):
+            run_worker(host="127.0.0.1", port=port, connect_timeout=0)
+
+    def test_render_job_invalid(self) -> None:
+        """
+        GIVEN a job which can't be unpickled
+        WHEN rendering it
+        THEN send back the error
+        """
+        coordinator, worker = socket.socketpair()
+        with coordinator, worker:
+            send_message(coordinator, MessageKind.JOB, zlib.compress(b"junk"))
+
+            _render_job(worker)
+
+            kind, payload = receive_message(coordinator)
+            assert kind == MessageKind.ERROR
+            assert b"UnpicklingError" in payload
+
+    def test_render_job_not_a_job(self) -> None:
+        coordinator, worker = socket.socketpair()
+        with coordinator, worker:
+            send_message(coordinator, MessageKind.TILE, _TILE.pack(0, 0, 0, 1, 1))
+
+            with pytest.raises(ProtocolError, match="Expected a job"):
+                _render_job(worker)
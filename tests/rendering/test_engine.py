@@ -1,14 +1,43 @@
-from typing import Optional
+import contextlib
+import os
+import pickle
+from dataclasses import replace
+from multiprocessing.shared_memory import SharedMemory
+from typing import Iterator, Optional
 from unittest.mock import Mock
 
 import pytest
 from pytest_mock import MockerFixture
 
-from raytracer.core.types.entities import Light, Material, Primitive, Ray, Scene, Sphere
+from raytracer.core.types.entities import Light, Material, Ray, Scene, Sphere
 from raytracer.core.types.geometry import Point
 from raytracer.core.types.imaging import Colour
-from raytracer.rendering.engine import RenderEngine
-from raytracer.rendering.shading import Shader
+from raytracer.rendering import engine as engine_module
+from raytracer.rendering.antialiasing import NO_OBJECT
+from raytracer.rendering.backends import BACKENDS, SERIAL, THREAD
+from raytracer.rendering.constants import SCENE_ABSOLUTE_TOP
+from raytracer.rendering.dependencies import SEGMENT_SIZE, TileDependencies
+from raytracer.rendering.engine import (
+    MAX_PUBLISHED_SCENES,
+    ROULETTE_THRESHOLD,
+    RenderEngine,
+    RenderStats,
+    StageTimings,
+    TraceStats,
+    _average,
+    _edges_task,
+    _is_settled,
+    _load_job,
+    _refine_task,
+    _relight_task,
+    _render_task,
+    _shared_scenes,
+    _worker_jobs,
+)
+from raytracer.rendering.framebuffer import GBUFFER_LIGHTS, Framebuffer
+from raytracer.rendering.progressive import PASSES
+from raytracer.rendering.shading import Shader, ShadowStats
+from raytracer.rendering.tiles import Tile, split_tiles
 
 
 class FakeShader(Shader):
@@ -39,30 +68,1272 @@ def scene() -> Scene:
     )
 
 
+@pytest.fixture
+def framebuffer(scene: Scene) -> Iterator[Framebuffer]:
+    with Framebuffer(width=scene.width, height=scene.height) as framebuffer:
+        yield framebuffer
+
+
+class TestIsSettled:
+    @pytest.mark.parametrize(
+        "path,expected",
+        [
+            pytest.param([(Colour(10, 20, 30), 0.5)], False, id="Reflective"),
+            pytest.param([(Colour(10, 20, 30), 0.0)], True, id="Not reflective"),
+            pytest.param([(Colour(255, 255, 255), 0.9)], True, id="Already saturated"),
+            pytest.param(
+                [(Colour(255, 255, 0), 0.9)], False, id="Saturated in some channels"
+            ),
+            pytest.param(
+                [(Colour(10, 20, 30), 0.5), (Colour(10, 20, 30), 0.003)],
+                True,
+                id="Reflection truncated away",
+            ),
+            pytest.param(
+                [(Colour(10, 20, 30), 0.02)] * 2,
+                True,
+                id="Reflection of reflection too faint",
+            ),
+            pytest.param(
+                [(Colour(10, 20, 30), 0.2), (Colour(10, 20, 30), 3)],
+                False,
+                id="Scaled up by Russian roulette",
+            ),
+        ],
+    )
+    def test_is_settled(self, path: list[tuple[Colour, float]], expected: bool) -> None:
+        assert _is_settled(path) is expected
+
+
+class TestTraceStats:
+    def test_average_depth(self) -> None:
+        assert TraceStats(primary_rays=4, reflection_rays=6).average_depth == 1.5
+        assert TraceStats().average_depth == 0.0
+
+
+class TestRenderStats:
+    def test_add(self) -> None:
+        """
+        GIVEN stats gathered so far
+        WHEN adding the stats of another row
+        THEN sum every counter and timing
+        AND the time each worker was busy
+        """
+        total = RenderStats(
+            trace=TraceStats(primary_rays=2, shades=3),
+            timings=StageTimings(trace=1.0),
+            busy={10: 1.0},
+        )
+
+        total.add(
+            RenderStats(
+                trace=TraceStats(primary_rays=2, reflection_rays=1),
+                shadows=ShadowStats(rays=4),
+                timings=StageTimings(trace=0.5, write=0.25),
+                busy={10: 0.5, 11: 2.0},
+            )
+        )
+
+        assert total.trace == TraceStats(primary_rays=4, reflection_rays=1, shades=3)
+        assert total.shadows == ShadowStats(rays=4)
+        assert total.timings == StageTimings(trace=1.5, write=0.25)
+        assert total.busy == {10: 1.5, 11: 2.0}
+
+    def test_idle(self) -> None:
+        stats = RenderStats(busy={10: 1.5, 11: 3.5}, wall_time=3.0)
+        assert stats.idle == {10: 1.5, 11: 0.0}
+
+    def test_efficiency(self) -> None:
+        stats = RenderStats(busy={10: 1.5, 11: 3.0}, wall_time=3.0, workers=2)
+        assert stats.efficiency == 0.75
+        assert RenderStats().efficiency == 0.0
+
+    def test_to_object(self) -> None:
+        stats = RenderStats(
+            trace=TraceStats(primary_rays=2, reflection_rays=1),
+            shadows=ShadowStats(rays=4, occluded=1),
+            busy={11: 1.0, 10: 2.0},
+            wall_time=2.5,
+            workers=2,
+        )
+
+        actual = stats.to_object()
+
+        assert actual["wall_time"] == 2.5
+        assert actual["trace"]["primary_rays"] == 2
+        assert actual["trace"]["average_depth"] == 0.5
+        assert actual["shadows"]["hit_rate"] == 0.25
+        assert actual["timings"]["trace"] == 0.0
+        assert actual["efficiency"] == 0.6
+        assert actual["workers"] == [
+            {"pid": 10, "busy": 2.0, "idle": 0.5},
+            {"pid": 11, "busy": 1.0, "idle": 1.5},
+        ]
+
+
 class TestRenderEngine:
     @pytest.fixture
-    def engine(self, shader: FakeShader) -> RenderEngine:
-        return RenderEngine(shader=shader)
+    def engine(self, shader: FakeShader) -> Iterator[RenderEngine]:
+        with RenderEngine(shader=shader) as engine:
+            yield engine
+
+    def test_render(
+        self, scene: Scene, engine: RenderEngine, framebuffer: Framebuffer
+    ) -> None:
+        """
+        GIVEN a scene
+        WHEN calling render
+        THEN render each row into the framebuffer
+        AND yield the index of each row
+        """
+        # GIVEN
+        framebuffer.buffer[:] = b"\xff" * len(framebuffer.buffer)
+        expected = [
+            [Colour(0, 0, 0), Colour(0, 0, 0)],
+            [Colour(0, 0, 0), Colour(0, 0, 0)],
+        ]
+
+        # WHEN
+        actual = list(engine.render(scene=scene, framebuffer=framebuffer))
+
+        # THEN
+        assert actual == [0, 1]
+        assert framebuffer.to_canvas().pixels == expected
+
+    def test_render_tiles(self, scene_data: dict) -> None:
+        """
+        GIVEN a scene split into tiles of varying cost
+        WHEN rendering it across several workers
+        THEN yield every row once, as soon as all of its tiles are written
+        AND render the same image as a single worker
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=70, height=40)
+        with (
+            RenderEngine(shader=Shader()) as engine,
+            Framebuffer(width=scene.width, height=scene.height) as expected,
+            Framebuffer(width=scene.width, height=scene.height) as actual,
+        ):
+            list(engine.render(scene=scene, framebuffer=expected, processes=1))
+
+            # WHEN
+            rows = list(engine.render(scene=scene, framebuffer=actual, processes=3))
+
+            # THEN
+            assert sorted(rows) == list(range(scene.height))
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+
+    @pytest.mark.parametrize("backend", [SERIAL, THREAD])
+    def test_render_in_process(self, scene_data: dict, backend: str) -> None:
+        """
+        GIVEN an engine rendering tiles in this process, which collects stats
+        WHEN rendering a scene across several workers
+        THEN render the same image as worker processes
+        AND count every primary ray once
+        AND share the scene with the workers rather than a copy
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=70, height=40)
+        with (
+            RenderEngine(shader=Shader()) as processes,
+            RenderEngine(
+                shader=Shader(), collect_stats=True, backend=backend
+            ) as engine,
+            Framebuffer(width=scene.width, height=scene.height) as expected,
+            Framebuffer(width=scene.width, height=scene.height) as actual,
+        ):
+            list(processes.render(scene=scene, framebuffer=expected, processes=2))
+
+            # WHEN
+            rows = list(engine.render(scene=scene, framebuffer=actual, processes=3))
+
+            # THEN
+            assert sorted(rows) == list(range(scene.height))
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+            assert engine.stats.trace.primary_rays == scene.width * scene.height
+            assert engine.stats.workers == (1 if backend == SERIAL else 3)
+            (key,) = [block.name for block in engine._published.values()]
+            assert _load_job(key)[1] is scene
+        assert key not in _shared_scenes
+
+    def test_render_linear(self, scene_data: dict) -> None:
+        """
+        GIVEN an engine shading in linear light
+        WHEN rendering a scene
+        THEN render every pixel at least as bright as rounding every step does
+        AND brighter where rounding lost light
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=40, height=24)
+        with (
+            RenderEngine(shader=Shader()) as rounded,
+            RenderEngine(shader=Shader(), linear=True) as engine,
+            Framebuffer(width=scene.width, height=scene.height) as expected,
+            Framebuffer(width=scene.width, height=scene.height) as actual,
+        ):
+            list(rounded.render(scene=scene, framebuffer=expected, processes=2))
+
+            # WHEN
+            rows = list(engine.render(scene=scene, framebuffer=actual, processes=2))
+
+            # THEN
+            assert sorted(rows) == list(range(scene.height))
+            pairs = list(zip(bytes(actual.buffer), bytes(expected.buffer)))
+            assert all(linear >= channel for linear, channel in pairs)
+            assert any(linear > channel for linear, channel in pairs)
+
+    def test_unknown_backend(self, shader: FakeShader) -> None:
+        with pytest.raises(ValueError, match="Unknown backend 'fibres'"):
+            RenderEngine(shader=shader, backend="fibres")
+
+    @pytest.mark.parametrize("max_samples", [1, 4], ids=["", "anti-aliasing"])
+    def test_render_batch(self, scene_data: dict, max_samples: int) -> None:
+        """
+        GIVEN more distinct scenes than an engine keeps published, as a batch
+        WHEN rendering the batch across several workers
+        THEN yield each job once it is finished
+        AND take jobs only as their tiles are needed
+        AND render the same image for each as rendering it alone
+        """
+        # GIVEN
+        scenes = [
+            Scene.from_object(data=scene_data, width=width, height=6)
+            for width in range(6, 6 + MAX_PUBLISHED_SCENES + 2)
+        ] + [Scene.from_object(data=scene_data, width=40, height=40)]
+        started = []
+        with contextlib.ExitStack() as stack:
+            engine = stack.enter_context(
+                RenderEngine(shader=Shader(), max_samples=max_samples)
+            )
+            framebuffers = [
+                stack.enter_context(
+                    Framebuffer(scene.width, scene.height, ids=max_samples > 1)
+                )
+                for scene in scenes
+            ]
+
+            def jobs() -> Iterator[tuple[Scene, Framebuffer]]:
+                for index, job in enumerate(zip(scenes, framebuffers)):
+                    started.append(index)
+                    yield job
+
+            # WHEN
+            finished = []
+            for index in engine.render_batch(jobs=jobs(), processes=3):
+                finished.append((index, list(started)))
+
+            # THEN
+            assert sorted(index for index, _ in finished) == list(range(len(scenes)))
+            _, started_by_first = finished[0]
+            assert len(started_by_first) < len(scenes)
+            for scene, actual in zip(scenes, framebuffers):
+                with Framebuffer(
+                    scene.width, scene.height, ids=max_samples > 1
+                ) as expected:
+                    list(engine.render(scene=scene, framebuffer=expected, processes=1))
+                    assert bytes(actual.buffer) == bytes(expected.buffer)
+
+    @pytest.mark.parametrize("backend", BACKENDS)
+    def test_render_batch_errors(
+        self, scene: Scene, shader: FakeShader, backend: str
+    ) -> None:
+        """
+        GIVEN a batch job whose framebuffer the workers can't attach to
+        WHEN rendering the batch
+        THEN raise the error the worker did
+        """
+        framebuffer = Mock(spec=Framebuffer, has_ids=False, gbuffer_depth=0)
+        framebuffer.name = "missing"
+
+        with RenderEngine(shader=shader, backend=backend) as engine:
+            with pytest.raises(FileNotFoundError):
+                list(engine.render_batch(jobs=[(scene, framebuffer)], processes=1))
+
+    def test_render_progressive(self, scene_data: dict) -> None:
+        """
+        GIVEN a scene
+        WHEN rendering it progressively
+        THEN yield the spacing of each pass, coarse to fine
+        AND fill the gaps between the pixels traced so far after each pass
+        AND trace each pixel once, leaving the same image as rendering it at once
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=40, height=24)
+        with (
+            RenderEngine(shader=Shader(), collect_stats=True) as engine,
+            Framebuffer(width=scene.width, height=scene.height) as expected,
+            Framebuffer(width=scene.width, height=scene.height) as actual,
+        ):
+            list(engine.render(scene=scene, framebuffer=expected, processes=2))
+
+            # WHEN
+            passes = []
+            previews = []
+            for spacing in engine.render_progressive(
+                scene=scene, framebuffer=actual, processes=2
+            ):
+                passes.append(spacing)
+                previews.append(actual.to_canvas())
+
+            # THEN
+            assert passes == list(PASSES)
+            assert engine.stats.trace.primary_rays == scene.width * scene.height
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+        first = previews[0].pixels
+        assert first[7][7] == first[0][0]
+        assert first[0][15] == first[0][8]
+
+    def test_render_tile_in_passes(self, scene_data: dict) -> None:
+        """
+        GIVEN a tile
+        WHEN rendering each pass of it in turn
+        THEN leave the same pixels as rendering it at once
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=20, height=12)
+        tile = Tile(index=0, left=0, top=0, right=20, bottom=12)
+        engine = RenderEngine(shader=Shader())
+        with (
+            Framebuffer(width=scene.width, height=scene.height) as expected,
+            Framebuffer(width=scene.width, height=scene.height) as actual,
+        ):
+            engine._render_tile(scene=scene, tile=tile, framebuffer=expected)
+
+            # WHEN
+            for number, spacing in enumerate(PASSES):
+                engine._render_tile(
+                    scene=scene,
+                    tile=tile,
+                    framebuffer=actual,
+                    spacing=spacing,
+                    first=number == 0,
+                )
+
+            # THEN
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+        assert engine.trace_stats.primary_rays == 2 * scene.width * scene.height
+
+    @pytest.mark.parametrize("linear", [False, True], ids=["", "linear light"])
+    def test_render_anti_aliasing(self, scene_data: dict, linear: bool) -> None:
+        """
+        GIVEN an engine which anti-aliases with four samples
+        WHEN rendering a scene across several workers
+        THEN yield every row once
+        AND refine only the pixels on edges, each with three more rays, or four in
+        linear light
+        AND leave the same image as refining the edges of a single tile
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=40, height=24)
+        tile = Tile(index=0, left=0, top=0, right=scene.width, bottom=scene.height)
+        expected_engine = RenderEngine(shader=Shader(), max_samples=4, linear=linear)
+        with (
+            RenderEngine(
+                shader=Shader(), max_samples=4, collect_stats=True, linear=linear
+            ) as engine,
+            Framebuffer(width=scene.width, height=scene.height, ids=True) as expected,
+            Framebuffer(width=scene.width, height=scene.height, ids=True) as actual,
+        ):
+            expected_engine._render_tile(scene=scene, tile=tile, framebuffer=expected)
+            edges = expected_engine._find_edges(framebuffer=expected, tile=tile)
+            unrefined = bytes(expected.buffer)
+            expected_engine._refine_pixels(
+                scene=scene, pixels=edges, framebuffer=expected
+            )
+
+            # WHEN
+            rows = list(engine.render(scene=scene, framebuffer=actual, processes=2))
+
+            # THEN
+            assert sorted(rows) == list(range(scene.height))
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+            assert bytes(actual.buffer) != unrefined
+        assert 0 < engine.stats.trace.refined_pixels == len(edges)
+        assert engine.stats.trace.primary_rays == (
+            scene.width * scene.height + (4 if linear else 3) * len(edges)
+        )
+
+    def test_refine_pixels_linear(self, scene: Scene, mocker: MockerFixture) -> None:
+        """
+        GIVEN an engine which anti-aliases with four samples in linear light
+        AND a pixel already in the framebuffer
+        WHEN refining it
+        THEN trace its centre again rather than using its quantized colour
+        AND quantize only the average radiance of the four samples
+        """
+        # GIVEN
+        engine = RenderEngine(shader=Shader(), max_samples=4, linear=True)
+        render_radiance = mocker.patch.object(
+            engine,
+            "_render_radiance",
+            side_effect=[(10.25, 20, 30), (10.5, 20, 30), (10.5, 20, 30), (10, 20, 30)],
+        )
+        with Framebuffer(width=scene.width, height=scene.height) as framebuffer:
+            framebuffer.set_row(index=0, row=[Colour(255, 255, 255)], start=0)
+
+            # WHEN
+            engine._refine_pixels(scene=scene, pixels=[(0, 0)], framebuffer=framebuffer)
+
+            # THEN
+            assert bytes(framebuffer.buffer[:3]) == bytes([10, 20, 30])
+        scene_top, _ = scene.get_aspect_boundries()
+        ray = render_radiance.call_args_list[0].kwargs["ray"]
+        centre = Point(x=SCENE_ABSOLUTE_TOP, y=scene_top, z=0)
+        assert ray == Ray(scene.camera, centre - scene.camera)
+        assert render_radiance.call_count == 4
+        assert engine.trace_stats.primary_rays == 4
+
+    def test_render_anti_aliasing_tiles_without_edges(
+        self, scene: Scene, shader: FakeShader
+    ) -> None:
+        """
+        GIVEN a scene whose edges are all within a few tiles
+        WHEN rendering it with anti-aliasing
+        THEN yield every row once
+        AND refine only the tiles with edges
+        """
+        # GIVEN
+        scene = replace(
+            scene,
+            width=96,
+            height=64,
+            objects=[replace(scene.objects[0], radius=0.1)],
+        )
+        with (
+            RenderEngine(shader=shader, max_samples=2, collect_stats=True) as engine,
+            Framebuffer(width=scene.width, height=scene.height, ids=True) as image,
+        ):
+            # WHEN
+            rows = list(engine.render(scene=scene, framebuffer=image, processes=2))
+
+        # THEN
+        assert sorted(rows) == list(range(scene.height))
+        assert 0 < engine.stats.trace.refined_pixels < scene.width * scene.height
+
+    def test_render_progressive_anti_aliasing(self, scene_data: dict) -> None:
+        """
+        GIVEN an engine which anti-aliases
+        WHEN rendering a scene progressively
+        THEN leave the same image as rendering it at once
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=40, height=24)
+        with (
+            RenderEngine(shader=Shader(), max_samples=4) as engine,
+            Framebuffer(width=scene.width, height=scene.height, ids=True) as expected,
+            Framebuffer(width=scene.width, height=scene.height, ids=True) as actual,
+        ):
+            list(engine.render(scene=scene, framebuffer=expected, processes=2))
+
+            # WHEN
+            passes = list(
+                engine.render_progressive(scene=scene, framebuffer=actual, processes=2)
+            )
+
+            # THEN
+            assert passes == list(PASSES)
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+
+    def test_render_anti_aliasing_without_ids(
+        self, scene: Scene, shader: FakeShader, framebuffer: Framebuffer
+    ) -> None:
+        engine = RenderEngine(shader=shader, max_samples=4)
+
+        with pytest.raises(ValueError):
+            list(engine.render(scene=scene, framebuffer=framebuffer))
+        with pytest.raises(ValueError):
+            list(engine.render_progressive(scene=scene, framebuffer=framebuffer))
+
+    def test_anti_alias_tasks(self, scene_data: dict) -> None:
+        """
+        GIVEN a published scene rendered with object ids
+        WHEN a worker finds the edges of a tile, then refines them
+        THEN send back the edges of the tile
+        AND refine them in the framebuffer
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=20, height=12)
+        tile = Tile(index=0, left=0, top=0, right=scene.width, bottom=scene.height)
+        with (
+            RenderEngine(shader=Shader(), max_samples=4, collect_stats=True) as engine,
+            Framebuffer(width=scene.width, height=scene.height, ids=True) as expected,
+            Framebuffer(width=scene.width, height=scene.height, ids=True) as actual,
+        ):
+            key = engine._publish(scene)
+            _worker_jobs.jobs.clear()
+            for framebuffer in (expected, actual):
+                engine._render_tile(scene=scene, tile=tile, framebuffer=framebuffer)
+            edges = engine._find_edges(framebuffer=expected, tile=tile)
+            engine._refine_pixels(scene=scene, pixels=edges, framebuffer=expected)
+
+            # WHEN
+            _, found, found_stats = _edges_task((key, actual.name, tile))
+            _, refine_stats = _refine_task((key, actual.name, tile, found))
+
+            # THEN
+            assert found == edges
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+        assert found_stats is not None and refine_stats is not None
+        assert found_stats.trace.primary_rays == 0
+        assert refine_stats.trace.refined_pixels == len(edges)
+
+    def test_render_tile_object_ids(self, scene: Scene, shader: FakeShader) -> None:
+        """
+        GIVEN a framebuffer which keeps object ids
+        WHEN rendering a tile into it
+        THEN record the object each pixel's primary ray hit
+        """
+        # GIVEN
+        scene = replace(scene, width=4, height=4)
+        engine = RenderEngine(shader=shader)
+        tile = Tile(index=0, left=0, top=0, right=4, bottom=4)
+
+        # WHEN
+        with Framebuffer(width=4, height=4, ids=True) as framebuffer:
+            engine._render_tile(scene=scene, tile=tile, framebuffer=framebuffer)
+            actual = list(framebuffer.ids or [])
+
+        # THEN
+        assert actual[0] == NO_OBJECT
+        assert actual[2 * 4 + 2] == 0
+
+    def test_render_changed_tiles(self, scene_data: dict) -> None:
+        """
+        GIVEN a scene rendered by an engine recording dependencies
+        AND the scene with its object moved
+        WHEN rendering only the tiles the move changed into the same framebuffer
+        THEN render fewer tiles than the whole scene
+        AND leave the same image as rendering the moved scene at once
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=64, height=40)
+        obj = scene.objects[0]
+        moved = replace(
+            scene, objects=[replace(obj, centre=obj.centre + Point(0.2, 0, 0))]
+        )
+        with (
+            RenderEngine(shader=Shader(), record_dependencies=True) as engine,
+            Framebuffer(width=scene.width, height=scene.height) as expected,
+            Framebuffer(width=scene.width, height=scene.height) as actual,
+        ):
+            list(engine.render(scene=moved, framebuffer=expected, processes=1))
+            list(engine.render(scene=scene, framebuffer=actual, processes=1))
+
+            # WHEN
+            tiles = engine.changed_tiles(moved)
+            rows = list(
+                engine.render(scene=moved, framebuffer=actual, processes=1, tiles=tiles)
+            )
+
+            # THEN
+            all_tiles = split_tiles(width=scene.width, height=scene.height)
+            assert 0 < len(tiles) < len(all_tiles)
+            assert sorted(rows) == sorted({y for tile in tiles for y in tile.rows})
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+            assert len(engine.dependencies) == len(all_tiles)
+            assert engine.changed_tiles(moved) == []
+
+    def test_changed_tiles_without_dependencies(
+        self, scene_data: dict, shader: FakeShader
+    ) -> None:
+        """
+        GIVEN engines which didn't record dependencies for the last render
+        WHEN asking which tiles a scene changed
+        THEN return every tile
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=40, height=24)
+        expected = split_tiles(width=scene.width, height=scene.height)
+        with (
+            RenderEngine(shader=shader) as plain,
+            RenderEngine(shader=shader, record_dependencies=True) as progressive,
+            RenderEngine(
+                shader=shader, record_dependencies=True, max_samples=2
+            ) as anti_aliased,
+            Framebuffer(width=scene.width, height=scene.height, ids=True) as image,
+        ):
+            for engine in (plain, anti_aliased):
+                list(engine.render(scene=scene, framebuffer=image, processes=1))
+            list(progressive.render(scene=scene, framebuffer=image, processes=1))
+            list(
+                progressive.render_progressive(
+                    scene=scene, framebuffer=image, processes=1
+                )
+            )
+
+            # WHEN
+            actual = [
+                engine.changed_tiles(scene)
+                for engine in (plain, progressive, anti_aliased)
+            ]
+
+        # THEN
+        assert actual == [expected] * 3
+
+    def test_render_tile_records_dependencies(self, scene: Scene) -> None:
+        """
+        GIVEN an engine recording dependencies
+        WHEN rendering a whole tile, then part of one in a pass
+        THEN return the object hit, the rays and that it was shaded for the whole
+        tile
+        AND nothing for the pass
+        """
+        # GIVEN
+        scene = replace(scene, width=4, height=4)
+        engine = RenderEngine(shader=Shader(), record_dependencies=True)
+        tile = Tile(index=0, left=0, top=0, right=4, bottom=4)
+
+        # WHEN
+        with Framebuffer(width=4, height=4) as framebuffer:
+            actual = engine._render_tile(
+                scene=scene, tile=tile, framebuffer=framebuffer
+            )
+            passed = engine._render_tile(
+                scene=scene, tile=tile, framebuffer=framebuffer, spacing=2
+            )
+
+        # THEN
+        assert actual is not None
+        assert actual.objects == {0}
+        assert actual.shaded
+        assert len(actual.segments) > 16 * SEGMENT_SIZE
+        assert passed is None
+        assert engine._dependencies is None and engine.shader.dependencies is None
+
+    def test_render_tile_records_dependencies_with_kernels(
+        self, scene_data: dict, mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """
+        GIVEN an engine recording dependencies, as when watching a scene
+        WHEN rendering a tile with the compiled kernels and without them
+        THEN trace it with the kernels
+        AND record the same dependencies and image
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=16, height=16)
+        tile = Tile(index=0, left=0, top=0, right=16, bottom=16)
+
+        def render() -> tuple[Optional[TileDependencies], bytes]:
+            engine = RenderEngine(shader=Shader(), record_dependencies=True)
+            with Framebuffer(width=16, height=16) as framebuffer:
+                dependencies = engine._render_tile(
+                    scene=scene, tile=tile, framebuffer=framebuffer
+                )
+                return dependencies, bytes(framebuffer.buffer)
+
+        # WHEN
+        compiled = mocker.spy(RenderEngine, "_render_row_compiled")
+        actual = render()
+        monkeypatch.setattr(engine_module, "kernels", None)
+        expected = render()
+
+        # THEN
+        assert compiled.call_count == 16
+        assert actual == expected
+        assert actual[0] is not None
+        assert actual[0].objects == {0}
+        assert actual[0].shaded
+
+    def test_render_gbuffer_and_relight(self, scene_data: dict) -> None:
+        """
+        GIVEN an engine keeping a G-buffer
+        WHEN rendering a scene, then relighting it with the colour of its object
+        changed, then with its light moved
+        THEN leave the same image each time as rendering that scene at once
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=40, height=24)
+        obj, light = scene.objects[0], scene.lights[0]
+        recoloured = replace(
+            scene,
+            objects=[
+                replace(obj, material=replace(obj.material, colour=Colour(255, 0, 0)))
+            ],
+        )
+        moved = replace(
+            recoloured,
+            lights=[replace(light, position=light.position + Point(-3, 0, 0))],
+        )
+        with (
+            RenderEngine(shader=Shader()) as plain,
+            RenderEngine(shader=Shader(), gbuffer=True) as engine,
+            Framebuffer(width=scene.width, height=scene.height) as expected,
+            Framebuffer(
+                width=scene.width,
+                height=scene.height,
+                gbuffer_depth=engine.gbuffer_depth,
+            ) as actual,
+        ):
+            images = []
+            for edited, relight in [
+                (scene, None),
+                (recoloured, True),
+                (moved, False),
+            ]:
+                list(plain.render(scene=edited, framebuffer=expected, processes=2))
+                if relight is None:
+                    rows = engine.render(scene=edited, framebuffer=actual, processes=2)
+                else:
+                    rows = engine.relight(
+                        scene=edited,
+                        framebuffer=actual,
+                        processes=2,
+                        reuse_shadows=relight,
+                    )
+
+                # WHEN
+                finished = list(rows)
+
+                # THEN
+                assert sorted(finished) == list(range(scene.height))
+                assert bytes(actual.buffer) == bytes(expected.buffer)
+                images.append(bytes(actual.buffer))
+        assert len(set(images)) == 3
+
+    @pytest.mark.parametrize("roulette", [False, True], ids=["", "Russian roulette"])
+    def test_relight_tile(self, scene_data: dict, roulette: bool) -> None:
+        """
+        GIVEN a tile rendered by an engine keeping a G-buffer
+        WHEN relighting it for a scene with its material and light changed
+        THEN leave the same pixels as rendering that scene
+        AND trace no rays to find what the pixels see
+        AND update the shadows in the G-buffer unless reusing them
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=40, height=24)
+        obj, light = scene.objects[0], scene.lights[0]
+        edited = replace(
+            scene,
+            objects=[replace(obj, material=replace(obj.material, reflection=0.3))],
+            lights=[replace(light, position=light.position + Point(-3, 0, 0))],
+        )
+        tile = Tile(index=0, left=0, top=0, right=scene.width, bottom=scene.height)
+        plain = RenderEngine(shader=Shader(), russian_roulette=roulette)
+        engine = RenderEngine(
+            shader=Shader(), russian_roulette=roulette, collect_stats=True, gbuffer=True
+        )
+        with (
+            Framebuffer(width=scene.width, height=scene.height) as expected,
+            Framebuffer(
+                width=scene.width,
+                height=scene.height,
+                gbuffer_depth=engine.gbuffer_depth,
+            ) as actual,
+        ):
+            plain._render_tile(scene=scene, tile=tile, framebuffer=expected)
+            engine._render_tile(scene=scene, tile=tile, framebuffer=actual)
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+            before = actual.hits(index=4)
+            plain._render_tile(scene=edited, tile=tile, framebuffer=expected)
+            engine.trace_stats = TraceStats()
+
+            # WHEN
+            engine._relight_tile(
+                scene=edited, tile=tile, framebuffer=actual, reuse_shadows=False
+            )
+
+            # THEN
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+            assert actual.hits(index=4) != before
+        assert engine.trace_stats.primary_rays == 0
+        assert engine.trace_stats.reflection_rays == 0
+        assert engine.trace_stats.intersection_tests == 0
+        assert engine.trace_stats.shades > 0
+        assert engine.timings is not None and engine.timings.shade > 0
+
+    def test_relight_task(self, scene_data: dict) -> None:
+        """
+        GIVEN a published scene whose G-buffer has been rendered
+        WHEN a worker relights a tile of it reusing its shadows
+        THEN shade the tile from the G-buffer without tracing shadow rays
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=20, height=12)
+        tile = Tile(index=0, left=0, top=0, right=scene.width, bottom=scene.height)
+        with (
+            RenderEngine(shader=Shader(), collect_stats=True, gbuffer=True) as engine,
+            Framebuffer(
+                width=scene.width,
+                height=scene.height,
+                gbuffer_depth=engine.gbuffer_depth,
+            ) as framebuffer,
+        ):
+            engine._render_tile(scene=scene, tile=tile, framebuffer=framebuffer)
+            expected = bytes(framebuffer.buffer)
+            framebuffer.buffer[:] = bytes(len(framebuffer.buffer))
+            key = engine._publish(scene)
+            _worker_jobs.jobs.clear()
+
+            # WHEN
+            actual, stats = _relight_task((key, framebuffer.name, tile, True))
+
+            # THEN
+            assert bytes(framebuffer.buffer) == expected
+        assert actual == tile
+        assert stats is not None
+        assert stats.shadows.rays == 0
+        assert stats.trace.shades > 0
+
+    def test_render_gbuffer_records_dependencies(self, scene: Scene) -> None:
+        """
+        GIVEN an engine keeping a G-buffer and recording dependencies
+        WHEN rendering a tile
+        THEN record what it depends on as without the G-buffer
+        """
+        # GIVEN
+        scene = replace(scene, width=4, height=4)
+        tile = Tile(index=0, left=0, top=0, right=4, bottom=4)
+        engine = RenderEngine(shader=Shader(), record_dependencies=True, gbuffer=True)
+        plain = RenderEngine(shader=Shader(), record_dependencies=True)
+        with (
+            Framebuffer(width=4, height=4, gbuffer_depth=engine.gbuffer_depth) as image,
+            Framebuffer(width=4, height=4) as plain_image,
+        ):
+            expected = plain._render_tile(
+                scene=scene, tile=tile, framebuffer=plain_image
+            )
+
+            # WHEN
+            actual = engine._render_tile(scene=scene, tile=tile, framebuffer=image)
+
+        # THEN
+        assert actual is not None and expected is not None
+        assert actual.objects == expected.objects == {0}
+        assert actual.shaded
+
+    def test_gbuffer_errors(self, scene: Scene, framebuffer: Framebuffer) -> None:
+        """
+        GIVEN engines and framebuffers which can't keep a G-buffer together
+        WHEN creating the engine, rendering or relighting
+        THEN raise a ValueError
+        """
+        engine = RenderEngine(shader=Shader(), gbuffer=True)
+        lights = [scene.lights[0]] * (GBUFFER_LIGHTS + 1)
+
+        with pytest.raises(ValueError):
+            RenderEngine(shader=Shader(), max_samples=2, gbuffer=True)
+        with pytest.raises(ValueError, match="linear light"):
+            RenderEngine(shader=Shader(), linear=True, gbuffer=True)
+        with pytest.raises(ValueError):
+            list(engine.render(scene=scene, framebuffer=framebuffer))
+        with Framebuffer(
+            width=scene.width,
+            height=scene.height,
+            gbuffer_depth=engine.gbuffer_depth,
+        ) as gbuffer:
+            with pytest.raises(ValueError):
+                list(
+                    RenderEngine(shader=Shader()).render(
+                        scene=scene, framebuffer=gbuffer
+                    )
+                )
+            with pytest.raises(ValueError):
+                list(
+                    engine.render(
+                        scene=replace(scene, lights=lights), framebuffer=gbuffer
+                    )
+                )
+        with pytest.raises(ValueError):
+            list(
+                RenderEngine(shader=Shader()).relight(
+                    scene=scene, framebuffer=framebuffer
+                )
+            )
+
+    @pytest.mark.parametrize(
+        "totals, count, expected",
+        [
+            ([0, 4, 8], 4, Colour(0, 1, 2)),
+            ([5, 6, 1021], 4, Colour(1, 2, 255)),
+        ],
+    )
+    def test_average(self, totals: list[int], count: int, expected: Colour) -> None:
+        assert _average(totals, count) == expected
+
+    def test_render_schedules_expensive_tiles_first(
+        self, scene: Scene, engine: RenderEngine, mocker: MockerFixture
+    ) -> None:
+        """
+        GIVEN several workers
+        WHEN rendering a scene
+        THEN hand out the tiles estimated to cost the most first
+        """
+        # GIVEN
+        scene = replace(scene, width=40, height=40)
+        tiles = split_tiles(width=40, height=40)
+        mocker.patch.object(RenderEngine, "_estimate_costs", return_value=[1, 5, 2, 5])
+        imap = mocker.patch("multiprocessing.pool.Pool.imap_unordered", return_value=[])
+
+        # WHEN
+        with Framebuffer(width=scene.width, height=scene.height) as framebuffer:
+            list(engine.render(scene=scene, framebuffer=framebuffer, processes=2))
+
+        # THEN
+        order = [tile for _, _, tile, _, _ in imap.call_args.args[1]]
+        assert order == [tiles[1], tiles[3], tiles[2], tiles[0]]
+
+    def test_estimate_costs(self, scene_data: dict, engine: RenderEngine) -> None:
+        """
+        GIVEN a scene with objects in only part of the image
+        WHEN estimating the cost of each tile
+        THEN tiles with more to shade cost more
+        AND leave the engine's own counters alone
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=64, height=64)
+        tiles = split_tiles(width=64, height=64)
+
+        # WHEN
+        actual = engine._estimate_costs(scene=scene, tiles=tiles)
+
+        # THEN
+        assert len(actual) == len(tiles)
+        assert min(actual) < max(actual)
+        assert engine.trace_stats == TraceStats()
+
+    def test_render_reuses_pool(
+        self, scene: Scene, engine: RenderEngine, framebuffer: Framebuffer
+    ) -> None:
+        """
+        GIVEN an engine which has already rendered a scene
+        WHEN rendering again with the same number of processes
+        THEN reuse the same worker pool
+        AND the same published scene
+        """
+        # GIVEN
+        first = list(engine.render(scene=scene, framebuffer=framebuffer, processes=2))
+        pool = engine._pool
+        published = list(engine._published.values())
+
+        # WHEN
+        second = list(engine.render(scene=scene, framebuffer=framebuffer, processes=2))
+
+        # THEN
+        assert second == first
+        assert engine._pool is pool
+        assert list(engine._published.values()) == published
+
+    def test_render_restarts_pool(
+        self, scene: Scene, engine: RenderEngine, framebuffer: Framebuffer
+    ) -> None:
+        """
+        GIVEN an engine which has already rendered a scene
+        WHEN rendering again with a different number of processes
+        THEN start a new worker pool
+        """
+        # GIVEN
+        list(engine.render(scene=scene, framebuffer=framebuffer, processes=1))
+        pool = engine._pool
+
+        # WHEN
+        list(engine.render(scene=scene, framebuffer=framebuffer, processes=2))
+
+        # THEN
+        assert engine._pool is not pool
+
+    def test_render_start_method(
+        self, scene: Scene, shader: FakeShader, framebuffer: Framebuffer
+    ) -> None:
+        """
+        GIVEN an engine whose workers are started by a fork server
+        WHEN rendering a scene
+        THEN render it the same as with forked workers
+        """
+        # GIVEN
+        with RenderEngine(shader=shader) as forking:
+            expected = list(
+                forking.render(scene=scene, framebuffer=framebuffer, processes=2)
+            )
+            pixels = bytes(framebuffer.buffer)
+
+        # WHEN
+        with RenderEngine(shader=shader, start_method="forkserver") as engine:
+            actual = list(
+                engine.render(scene=scene, framebuffer=framebuffer, processes=2)
+            )
+            start_method = engine._pool._ctx.get_start_method()  # type: ignore
+
+        # THEN
+        assert sorted(actual) == sorted(expected)
+        assert bytes(framebuffer.buffer) == pixels
+        assert start_method == "forkserver"
+
+    def test_publish(self, scene: Scene, engine: RenderEngine) -> None:
+        """
+        GIVEN an engine
+        WHEN publishing more distinct scenes than are kept
+        THEN release the least recently used
+        """
+        # GIVEN
+        scenes = [replace(scene, width=width) for width in range(2, 4 + 2)]
+        names = [engine._publish(scene) for scene in scenes]
+
+        # WHEN
+        engine._publish(scenes[0])
+        engine._publish(replace(scene, width=10))
+
+        # THEN
+        assert engine._publish(scenes[0]) == names[0]
+        assert len(engine._published) == MAX_PUBLISHED_SCENES
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=names[1])
+
+    def test_publish_in_use(self, scene: Scene, engine: RenderEngine) -> None:
+        """
+        GIVEN more distinct scenes published than are kept, all in use
+        WHEN publishing another
+        THEN release only the least recently used which isn't in use
+        """
+        # GIVEN
+        scenes = [replace(scene, width=width) for width in range(2, 4 + 3)]
+        names = [engine._publish(scene, in_use=()) for scene in scenes[:-1]]
+
+        # WHEN
+        engine._publish(scenes[-1], in_use=names[:2] + names[3:])
+
+        # THEN
+        assert len(engine._published) == MAX_PUBLISHED_SCENES
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=names[2])
+        assert engine._publish(scenes[0]) == names[0]
+
+    def test_close(
+        self, scene: Scene, engine: RenderEngine, framebuffer: Framebuffer
+    ) -> None:
+        """
+        GIVEN an engine which has rendered a scene
+        WHEN closing it
+        THEN stop the worker pool
+        AND release the published scenes
+        """
+        # GIVEN
+        list(engine.render(scene=scene, framebuffer=framebuffer, processes=1))
+        name = engine._publish(scene)
 
-    def test_render(
-        self, scene: Scene, engine: RenderEngine, mocker: MockerFixture
+        # WHEN
+        engine.close()
+
+        # THEN
+        assert engine._pool is None
+        assert engine._published == {}
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=name)
+
+    def test_settings(self, shader: FakeShader) -> None:
+        """
+        GIVEN engines which differ only in how fast they render
+        WHEN getting their settings
+        THEN the settings are the same
+        AND they differ from an engine which renders a different image
+        """
+        # GIVEN
+        engines = [
+            RenderEngine(shader=shader),
+            RenderEngine(shader=shader, use_bvh=False, collect_stats=True),
+            RenderEngine(shader=shader, max_samples=4),
+        ]
+
+        # WHEN
+        actual = [engine.settings for engine in engines]
+
+        # THEN
+        assert actual[0] == actual[1]
+        assert actual[0] != actual[2]
+        assert actual[0]["shader"] == shader.settings
+
+    def test_pickle_drops_stats(self, scene: Scene, engine: RenderEngine) -> None:
+        engine._render_row((scene, 0, 0, 1, 1))
+
+        actual = pickle.loads(pickle.dumps(engine))
+
+        assert actual.trace_stats == TraceStats()
+
+    def test_pickle(
+        self, scene: Scene, engine: RenderEngine, framebuffer: Framebuffer
     ) -> None:
         """
-        GIVEN a scene
-        WHEN calling render
-        THEN yield an iterable containing indexes and row
+        GIVEN an engine with a worker pool
+        WHEN pickling it
+        THEN leave out the pool and published scenes
+        """
+        list(engine.render(scene=scene, framebuffer=framebuffer, processes=1))
+
+        actual = pickle.loads(pickle.dumps(engine))
+
+        assert actual._pool is None
+        assert actual._published == {}
+        assert actual.max_depth == engine.max_depth
+
+    def test_render_task(
+        self, scene: Scene, engine: RenderEngine, framebuffer: Framebuffer
+    ) -> None:
+        """
+        GIVEN a published scene
+        WHEN a worker renders a tile of it
+        THEN load the scene once
+        AND render the tile
         """
         # GIVEN
-        expected = [
-            (0, [Colour(0, 0, 0), Colour(0, 0, 0)]),
-            (1, [Colour(0, 0, 0), Colour(0, 0, 0)]),
+        key = engine._publish(scene)
+        _worker_jobs.jobs.clear()
+        framebuffer.buffer[:] = b"\xff" * len(framebuffer.buffer)
+        tile = Tile(index=1, left=0, top=1, right=2, bottom=2)
+
+        # WHEN
+        actual = [
+            _render_task((key, framebuffer.name, tile, 1, True)),
+            _render_task((key, framebuffer.name, tile, 1, True)),
+        ]
+
+        # THEN
+        assert actual == [(tile, None, None), (tile, None, None)]
+        assert list(_worker_jobs.jobs) == [key]
+        assert bytes(framebuffer.row(0)) == b"\xff" * 6
+        assert bytes(framebuffer.row(1)) == b"\x00" * 6
+
+    def test_render_task_records_dependencies(
+        self, scene: Scene, shader: FakeShader, framebuffer: Framebuffer
+    ) -> None:
+        # GIVEN
+        with RenderEngine(shader=shader, record_dependencies=True) as engine:
+            key = engine._publish(scene)
+            _worker_jobs.jobs.clear()
+            tile = Tile(index=0, left=0, top=0, right=2, bottom=2)
+
+            # WHEN
+            _, actual, _ = _render_task((key, framebuffer.name, tile, 1, True))
+
+        # THEN
+        assert actual is not None
+        assert len(actual.segments) == 4 * SEGMENT_SIZE
+
+    def test_render_task_collects_stats(
+        self, scene: Scene, shader: FakeShader, framebuffer: Framebuffer
+    ) -> None:
+        """
+        GIVEN an engine which collects stats
+        WHEN a worker renders two tiles
+        THEN send back what was measured for each tile alone
+        """
+        # GIVEN
+        with RenderEngine(shader=shader, collect_stats=True) as engine:
+            key = engine._publish(scene)
+            _worker_jobs.jobs.clear()
+
+            # WHEN
+            actual = [
+                _render_task((key, framebuffer.name, tile, 1, True))
+                for tile in split_tiles(width=scene.width, height=scene.height, size=1)
+            ]
+
+        # THEN
+        assert len(actual) == 4
+        for tile, _, stats in actual:
+            assert stats is not None
+            assert stats.trace.primary_rays == 1
+            assert list(stats.busy) == [os.getpid()]
+            assert 0 < stats.timings.trace < stats.busy[os.getpid()]
+        assert actual[0][2].timings.load > 0
+
+    def test_render_collects_stats(
+        self, scene: Scene, shader: FakeShader, framebuffer: Framebuffer
+    ) -> None:
+        """
+        GIVEN an engine which collects stats
+        WHEN rendering a scene twice
+        THEN gather the stats of the last render from every worker
+        """
+        # GIVEN
+        with RenderEngine(shader=shader, collect_stats=True) as engine:
+            list(engine.render(scene=scene, framebuffer=framebuffer, processes=2))
+
+            # WHEN
+            list(engine.render(scene=scene, framebuffer=framebuffer, processes=2))
+
+        # THEN
+        actual = engine.stats
+        assert actual.trace.primary_rays == scene.width * scene.height
+        assert actual.wall_time > 0
+        assert 1 <= len(actual.busy) <= 2
+        assert set(actual.idle) == set(actual.busy)
+
+    def test_render_without_stats(
+        self, scene: Scene, engine: RenderEngine, framebuffer: Framebuffer
+    ) -> None:
+        list(engine.render(scene=scene, framebuffer=framebuffer, processes=1))
+
+        assert engine.timings is None
+        assert engine.stats == RenderStats(workers=1)
+
+    @pytest.mark.parametrize("linear", [False, True], ids=["", "linear light"])
+    def test_render_pixel_times_stages(self, scene: Scene, linear: bool) -> None:
+        """
+        GIVEN an engine which collects stats
+        AND a ray which hits a reflective sphere
+        WHEN rendering the pixel
+        THEN time finding hits, shading them and following reflections
+        """
+        # GIVEN
+        sphere = scene.objects[0]
+        scene = replace(
+            scene,
+            objects=[
+                replace(
+                    sphere,
+                    material=Material(colour=Colour(10, 10, 10), reflection=0.5),
+                ),
+                replace(sphere, name="Behind", centre=Point(0, 0, -4)),
+            ],
+        )
+        engine = RenderEngine(shader=Shader(), collect_stats=True, linear=linear)
+        render = engine._render_radiance if linear else engine._render_pixel
+
+        # WHEN
+        render(ray=Ray(origin=Point(0, 0, -2), direction=Point(0, 0, 1)), scene=scene)
+
+        # THEN
+        assert engine.timings is not None
+        assert engine.timings.intersect > 0
+        assert engine.timings.shade > 0
+        assert engine.timings.reflect > 0
+        assert engine.timings.reflect > 0
+        assert engine.trace_stats.shades > 1
+
+    @pytest.mark.parametrize("use_bvh", [True, False], ids=["BVH", "linear scan"])
+    def test_find_nearest_counts_tests(self, scene: Scene, use_bvh: bool) -> None:
+        engine = RenderEngine(shader=Shader(), use_bvh=use_bvh)
+        ray = Ray(origin=Point(0, 0, -2), direction=Point(0, 0, 1))
+
+        engine._find_nearest(ray=ray, scene=scene)
+
+        assert engine.trace_stats.intersection_tests == 1
+
+    def test_render_task_forgets_old_scenes(
+        self, scene: Scene, engine: RenderEngine
+    ) -> None:
+        """
+        GIVEN more published scenes than are kept
+        WHEN a worker renders a tile of each
+        THEN only keep the most recent scenes
+        """
+        # GIVEN
+        scenes = [
+            replace(scene, height=height)
+            for height in range(2, MAX_PUBLISHED_SCENES + 3)
         ]
+        _worker_jobs.jobs.clear()
 
         # WHEN
-        actual = list(engine.render(scene=scene))
+        keys = []
+        for scene in scenes:
+            keys.append(engine._publish(scene))
+            with Framebuffer(width=scene.width, height=scene.height) as framebuffer:
+                _render_task(
+                    (keys[-1], framebuffer.name, split_tiles(2, 1)[0], 1, True)
+                )
 
         # THEN
-        assert actual == expected
+        assert list(_worker_jobs.jobs) == keys[-MAX_PUBLISHED_SCENES:]
 
     def test_render_row(self, scene: Scene, engine: RenderEngine) -> None:
         """
@@ -91,20 +1362,7 @@ class TestRenderEngine:
         "find_nearest,expected",
         [
             pytest.param(
-                Mock(
-                    side_effect=[
-                        (
-                            1.0,
-                            Sphere(
-                                name="Sphere 1",
-                                centre=Point(0, 0, 0),
-                                material=Material(colour=Colour(0, 0, 0)),
-                                radius=0.5,
-                            ),
-                        ),
-                        (None, None),
-                    ],
-                ),
+                Mock(side_effect=[(1.0, 0), (None, None)]),
                 Colour(255, 255, 255),
                 id="Ray hits an object",
             ),
@@ -141,23 +1399,438 @@ class TestRenderEngine:
         assert actual == expected
 
     @pytest.mark.parametrize(
-        "ray,expected_distance,expected_object",
+        "reflection,expected_calls,expected_stats",
         [
             pytest.param(
-                Ray(origin=Point(0, 0, -1), direction=Point(0, 0, 1)),
                 0.5,
+                2,
+                TraceStats(reflection_rays=1, shades=1),
+                id="Reflection is traced",
+            ),
+            pytest.param(
+                0.0,
+                1,
+                TraceStats(terminated=1, shades=1),
+                id="Surface doesn't reflect",
+            ),
+            pytest.param(
+                0.001,
+                1,
+                TraceStats(terminated=1, shades=1),
+                id="Reflection too faint to change the pixel",
+            ),
+        ],
+    )
+    def test_render_pixel_stops_reflecting(
+        self,
+        scene: Scene,
+        mocker: MockerFixture,
+        reflection: float,
+        expected_calls: int,
+        expected_stats: TraceStats,
+    ) -> None:
+        """
+        GIVEN a ray which hits a surface
+        WHEN calling _render_pixel
+        THEN only trace the reflection if it could change the pixel
+        """
+        # GIVEN
+        engine = RenderEngine(shader=Mock(shade=Mock(return_value=Colour(9, 9, 9))))
+        sphere = Sphere(
+            name="Sphere 1",
+            centre=Point(0, 0, 0),
+            material=Material(colour=Colour(0, 0, 0), reflection=reflection),
+            radius=0.5,
+        )
+        scene = replace(scene, objects=[sphere])
+        find_nearest = mocker.patch.object(
+            engine, "_find_nearest", side_effect=[(1.0, 0), (None, None)]
+        )
+
+        # WHEN
+        actual = engine._render_pixel(
+            ray=Ray(origin=Point(0, 0, -2), direction=Point(0, 0, 1)), scene=scene
+        )
+
+        # THEN
+        assert actual == Colour(9, 9, 9)
+        assert find_nearest.call_count == expected_calls
+        assert engine.trace_stats == expected_stats
+
+    @pytest.mark.parametrize(
+        "draw,expected,expected_stats",
+        [
+            pytest.param(
+                0.99,
+                Colour(200, 0, 0),
+                TraceStats(roulette_terminated=1, shades=1),
+                id="Reflection loses",
+            ),
+            pytest.param(
+                0.0,
+                Colour(200, 25, 0),
+                TraceStats(reflection_rays=1, shades=2),
+                id="Reflection wins and is scaled up",
+            ),
+        ],
+    )
+    def test_render_pixel_russian_roulette(
+        self,
+        scene: Scene,
+        mocker: MockerFixture,
+        draw: float,
+        expected: Colour,
+        expected_stats: TraceStats,
+    ) -> None:
+        """
+        GIVEN Russian roulette
+        AND a ray which hits a faintly reflective surface
+        WHEN calling _render_pixel
+        THEN trace the reflection at random
+        AND scale it by the chance it had of being traced
+        """
+        # GIVEN
+        engine = RenderEngine(
+            shader=Mock(shade=Mock(side_effect=[Colour(200, 0, 0), Colour(0, 250, 0)])),
+            russian_roulette=True,
+        )
+        reflection = ROULETTE_THRESHOLD / 2
+        sphere = Sphere(
+            name="Sphere 1",
+            centre=Point(0, 0, 0),
+            material=Material(colour=Colour(0, 0, 0), reflection=reflection),
+            radius=0.5,
+        )
+        scene = replace(
+            scene,
+            objects=[
+                sphere,
+                replace(sphere, material=Material(colour=Colour(0, 0, 0))),
+            ],
+        )
+        mocker.patch.object(engine, "_find_nearest", side_effect=[(1.0, 0), (1.0, 1)])
+        mocker.patch.object(engine._random, "random", return_value=draw)
+
+        # WHEN
+        actual = engine._render_pixel(
+            ray=Ray(origin=Point(0, 0, -2), direction=Point(0, 0, 1)),
+            scene=scene,
+            depth=engine.max_depth,
+        )
+
+        # THEN
+        assert actual == expected
+        assert engine.trace_stats == expected_stats
+
+    @pytest.mark.parametrize(
+        "reflection,throughput,draw,expected,expected_stats",
+        [
+            pytest.param(
+                0.5,
+                1.0,
+                0.0,
+                (100.25, 25.25, 0.0),
+                TraceStats(reflection_rays=1, shades=2),
+                id="Reflection is traced",
+            ),
+            pytest.param(
+                0.0,
+                1.0,
+                0.0,
+                (100.25, 0.0, 0.0),
+                TraceStats(terminated=1, shades=1),
+                id="Surface doesn't reflect",
+            ),
+            pytest.param(
+                0.5,
+                0.002,
+                0.0,
+                (100.25, 0.0, 0.0),
+                TraceStats(terminated=1, shades=1),
+                id="Reflection too faint to change the pixel",
+            ),
+            pytest.param(
+                0.5,
+                0.1,
+                0.99,
+                (100.25, 0.0, 0.0),
+                TraceStats(roulette_terminated=1, shades=1),
+                id="Reflection loses Russian roulette",
+            ),
+        ],
+    )
+    def test_render_radiance(
+        self,
+        scene: Scene,
+        mocker: MockerFixture,
+        reflection: float,
+        throughput: float,
+        draw: float,
+        expected: tuple[float, float, float],
+        expected_stats: TraceStats,
+    ) -> None:
+        """
+        GIVEN an engine shading in linear light
+        AND a ray which hits a reflective surface
+        WHEN calling _render_radiance
+        THEN add up the light along the ray's reflections without rounding it
+        AND stop following them once they can add too little to the pixel
+        """
+        # GIVEN
+        engine = RenderEngine(
+            shader=Mock(radiance=Mock(side_effect=[(100.25, 0, 0), (0, 50.5, 0)])),
+            russian_roulette=True,
+            linear=True,
+        )
+        sphere = Sphere(
+            name="Sphere 1",
+            centre=Point(0, 0, 0),
+            material=Material(colour=Colour(0, 0, 0), reflection=reflection),
+            radius=0.5,
+        )
+        scene = replace(
+            scene,
+            objects=[
+                sphere,
+                replace(sphere, material=Material(colour=Colour(0, 0, 0))),
+            ],
+        )
+        mocker.patch.object(engine, "_find_nearest", side_effect=[(1.0, 0), (1.0, 1)])
+        mocker.patch.object(engine._random, "random", return_value=draw)
+
+        # WHEN
+        actual = engine._render_radiance(
+            ray=Ray(origin=Point(0, 0, -2), direction=Point(0, 0, 1)),
+            scene=scene,
+            depth=engine.max_depth,
+            throughput=throughput,
+        )
+
+        # THEN
+        assert actual == expected
+        assert engine.trace_stats == expected_stats
+
+    def test_render_radiance_misses(self, scene: Scene, mocker: MockerFixture) -> None:
+        engine = RenderEngine(shader=Shader(), linear=True)
+        mocker.patch.object(engine, "_find_nearest", return_value=(None, None))
+
+        actual = engine._render_radiance(
+            ray=Ray(origin=Point(0, 0, -2), direction=Point(0, 0, 1)), scene=scene
+        )
+
+        assert actual == (0, 0, 0)
+
+    def test_trace_path(self, scene: Scene, mocker: MockerFixture) -> None:
+        """
+        GIVEN an engine keeping a G-buffer
+        AND a ray which reflects forever
+        WHEN calling _trace_path
+        THEN follow it as deep as the G-buffer goes, whatever the materials
+        AND keep the lights shadowed at each hit
+        """
+        # GIVEN
+        engine = RenderEngine(
+            shader=Mock(shadow_mask=Mock(return_value=0b1)), max_depth=1, gbuffer=True
+        )
+        mocker.patch.object(engine, "_find_nearest", return_value=(1.0, 0))
+
+        # WHEN
+        actual = engine._trace_path(
+            ray=Ray(origin=Point(0, 0, -2), direction=Point(0, 0, 1)), scene=scene
+        )
+
+        # THEN
+        assert len(actual) == engine.gbuffer_depth == 3
+        assert [(hit[0], hit[3]) for hit in actual] == [(0, 0b1)] * 3
+        assert actual[0][1] == Point(0, 0, -1)
+        assert engine.trace_stats.reflection_rays == 2
+
+    @pytest.mark.parametrize(
+        "reflection,roulette,draw,expected_stats",
+        [
+            pytest.param(
+                0.5, False, 0.0, TraceStats(shades=2), id="Stops at the maximum depth"
+            ),
+            pytest.param(
+                0.0,
+                False,
+                0.0,
+                TraceStats(terminated=1, shades=1),
+                id="Surface doesn't reflect",
+            ),
+            pytest.param(
+                ROULETTE_THRESHOLD / 2,
+                True,
+                0.99,
+                TraceStats(roulette_terminated=1, shades=1),
+                id="Reflection loses Russian roulette",
+            ),
+            pytest.param(
+                ROULETTE_THRESHOLD / 2,
+                True,
+                0.0,
+                TraceStats(shades=2),
+                id="Reflection wins Russian roulette",
+            ),
+        ],
+    )
+    def test_shade_path(
+        self,
+        scene: Scene,
+        mocker: MockerFixture,
+        reflection: float,
+        roulette: bool,
+        draw: float,
+        expected_stats: TraceStats,
+    ) -> None:
+        """
+        GIVEN the hits along a pixel's reflections
+        WHEN calling _shade_path
+        THEN shade them with their shadows, stopping where _render_pixel would
+        """
+        # GIVEN
+        shader = Mock(shade=Mock(return_value=Colour(9, 9, 9)))
+        engine = RenderEngine(
+            shader=shader, max_depth=0, russian_roulette=roulette, gbuffer=True
+        )
+        mocker.patch.object(engine._random, "random", return_value=draw)
+        obj = scene.objects[0]
+        scene = replace(
+            scene,
+            objects=[
+                replace(obj, material=replace(obj.material, reflection=reflection))
+            ],
+        )
+        hit = (0, Point(0, 0, -0.5), Point(0, 0, -1), 0b1)
+
+        # WHEN
+        engine._shade_path(scene=scene, path=[hit] * 3)
+
+        # THEN
+        assert engine.trace_stats == expected_stats
+        assert shader.shade.call_args.kwargs["shadowed"] == 0b1
+        assert shader.shade.call_args.kwargs["normal"] == Point(0, 0, -1)
+
+    def test_render_row_counts_primary_rays(
+        self, scene: Scene, engine: RenderEngine
+    ) -> None:
+        engine._render_row((scene, 0, 0, 1, 1))
+        assert engine.trace_stats.primary_rays == scene.width
+
+    def test_render_row_with_kernels(
+        self, scene: Scene, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """
+        GIVEN an engine with the default shader
+        AND a lit scene
+        WHEN rendering a row with the compiled kernels and without them
+        THEN render the same colours and objects
+        AND count the same rays
+        """
+        # GIVEN
+        scene = replace(
+            scene,
+            width=8,
+            objects=[
                 Sphere(
-                    name="Sphere 1",
+                    name="Sphere",
                     centre=Point(0, 0, 0),
-                    material=Material(
-                        colour=Colour(0, 0, 0),
-                        ambient=0.05,
-                        diffuse=1.0,
-                        specular=1.0,
-                        reflection=0.5,
-                    ),
+                    material=Material(colour=Colour(0, 0, 255), reflection=0.5),
                     radius=0.5,
-                ),
+                )
+            ],
+            lights=[Light(position=Point(1, -1, -2), colour=Colour(255, 255, 255))],
+        )
+
+        def render() -> tuple:
+            engine = RenderEngine(shader=Shader())
+            ids: list[int] = []
+            row = engine._render_row((scene, 1, -0.5, 0.5, 0.25), ids=ids)
+            return (row, ids, engine.trace_stats, engine.shader.shadow_stats)
+
+        # WHEN
+        actual = render()
+        monkeypatch.setattr(engine_module, "kernels", None)
+        expected = render()
+
+        # THEN
+        assert actual == expected
+        assert NO_OBJECT in actual[1]
+        assert 0 in actual[1]
+        assert actual[2].primary_rays == scene.width
+        assert actual[2].reflection_rays
+        assert actual[3].rays
+
+    @pytest.mark.parametrize(
+        "engine,expected",
+        [
+            pytest.param(RenderEngine(shader=Shader()), True, id="Default"),
+            pytest.param(RenderEngine(shader=FakeShader()), False, id="Other shader"),
+            pytest.param(
+                RenderEngine(shader=Shader(), russian_roulette=True),
+                False,
+                id="Russian roulette",
+            ),
+            pytest.param(
+                RenderEngine(shader=Shader(), linear=True),
+                False,
+                id="Linear light",
+            ),
+            pytest.param(
+                RenderEngine(shader=Shader(), collect_stats=True),
+                False,
+                id="Timing stages",
+            ),
+            pytest.param(
+                RenderEngine(shader=Shader(), record_dependencies=True),
+                True,
+                id="Recording dependencies",
+            ),
+        ],
+    )
+    def test_uses_kernels(self, engine: RenderEngine, expected: bool) -> None:
+        # Dependencies are recorded a tile at a time
+        engine._record(whole_tile=True)
+
+        assert engine._uses_kernels() is expected
+
+    def test_uses_kernels_unless_built(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(engine_module, "kernels", None)
+
+        assert RenderEngine(shader=Shader())._uses_kernels() is False
+
+    def test_render_row_reuses_kernels(self, scene: Scene) -> None:
+        """
+        GIVEN an engine with the default shader
+        WHEN rendering two rows of a scene and then a row of another
+        THEN compile the kernels once for each scene
+        AND leave them out when pickled for a worker
+        """
+        # GIVEN
+        engine = RenderEngine(shader=Shader())
+        other = replace(scene, objects=[])
+
+        # WHEN
+        engine._render_row((scene, 0, 0, 1, 1))
+        first = engine._kernels
+        engine._render_row((scene, 1, 0, 1, 1))
+        second = engine._kernels
+        engine._render_row((other, 0, 0, 1, 1))
+
+        # THEN
+        assert first is not None
+        assert second is first
+        assert engine._kernels is not None
+        assert engine._kernels[0] is other.compiled
+        assert pickle.loads(pickle.dumps(engine))._kernels is None
+
+    @pytest.mark.parametrize(
+        "ray,expected_distance,expected_index",
+        [
+            pytest.param(
+                Ray(origin=Point(0, 0, -1), direction=Point(0, 0, 1)),
+                0.5,
+                0,
                 id="Hits object",
             ),
             pytest.param(
@@ -168,17 +1841,22 @@ class TestRenderEngine:
             ),
         ],
     )
+    @pytest.mark.parametrize("use_bvh", [True, False], ids=["BVH", "linear scan"])
     def test_find_nearest(
         self,
         scene: Scene,
         engine: RenderEngine,
         ray: Ray,
         expected_distance: Optional[float],
-        expected_object: Optional[Primitive],
+        expected_index: Optional[int],
+        use_bvh: bool,
     ) -> None:
+        # GIVEN
+        engine.use_bvh = use_bvh
+
         # WHEN
-        actual_distance, actual_object = engine._find_nearest(scene=scene, ray=ray)
+        actual_distance, actual_index = engine._find_nearest(scene=scene, ray=ray)
 
         # THEN
         assert actual_distance == expected_distance
-        assert actual_object == expected_object
+        assert actual_index == expected_index
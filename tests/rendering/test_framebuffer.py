@@ -0,0 +1,117 @@
+from multiprocessing.shared_memory import SharedMemory
+
+import pytest
+
+from raytracer.core.types.geometry import Point
+from raytracer.core.types.imaging import CHANNELS, Colour
+from raytracer.rendering.framebuffer import NO_HIT, Framebuffer
+
+
+class TestFramebuffer:
+    def test_create(self) -> None:
+        with Framebuffer(width=3, height=2) as framebuffer:
+            assert len(framebuffer.buffer) == 3 * 2 * CHANNELS
+            assert bytes(framebuffer.buffer) == bytes(3 * 2 * CHANNELS)
+
+    def test_set_row(self) -> None:
+        """
+        GIVEN a framebuffer
+        WHEN setting a row
+        THEN only the bytes of that row change
+        """
+        with Framebuffer(width=2, height=3) as framebuffer:
+            framebuffer.set_row(index=1, row=[Colour(1, 2, 3), Colour(4, 5, 6)])
+
+            assert bytes(framebuffer.row(1)) == bytes([1, 2, 3, 4, 5, 6])
+            assert bytes(framebuffer.buffer) == bytes(6) + bytes(range(1, 7)) + bytes(6)
+
+    def test_ids(self) -> None:
+        """
+        GIVEN a framebuffer which keeps object ids
+        WHEN setting the ids of every other pixel of a row
+        THEN only those ids change
+        AND the pixels are left alone
+        """
+        with Framebuffer(width=4, height=2, ids=True) as framebuffer:
+            framebuffer.set_ids(index=1, ids=[3, -1], start=1, step=2)
+
+            assert list(framebuffer.ids or []) == [0, 0, 0, 0, 0, 3, 0, -1]
+            assert bytes(framebuffer.buffer) == bytes(24)
+
+    def test_without_ids(self) -> None:
+        with Framebuffer(width=2, height=2) as framebuffer:
+            assert framebuffer.ids is None
+
+    def test_hits(self) -> None:
+        """
+        GIVEN a framebuffer which keeps object ids and a G-buffer three hits deep
+        WHEN setting the hits of every other pixel of a row
+        THEN the hits of those pixels are read back, ending where their paths do
+        AND the pixels and ids are left alone
+        """
+        hit = (1, Point(0.5, -0.25, 3), Point(0, 0, -1), 0b10)
+        with Framebuffer(width=4, height=2, ids=True, gbuffer_depth=3) as framebuffer:
+            framebuffer.set_hits(index=1, paths=[[hit, hit], []], start=1, step=2)
+
+            actual = [
+                framebuffer.hits(index=1, start=column, stop=column + 1)
+                for column in (1, 3)
+            ]
+            gbuffer = framebuffer.gbuffer
+            assert gbuffer is not None
+            assert gbuffer.shape == (2, 4, 3)
+            assert gbuffer["object"][1].tolist() == [
+                [0, 0, 0],
+                [1, 1, NO_HIT],
+                [0, 0, 0],
+                [NO_HIT] * 3,
+            ]
+            del gbuffer
+            assert bytes(framebuffer.buffer) == bytes(24)
+            assert list(framebuffer.ids or []) == [0] * 8
+
+        assert actual == [[[hit, hit]], [[]]]
+
+    def test_without_gbuffer(self) -> None:
+        with Framebuffer(width=2, height=2) as framebuffer:
+            assert framebuffer.gbuffer is None
+
+    def test_attach(self) -> None:
+        """
+        GIVEN a framebuffer
+        WHEN attaching to it by name and writing a row
+        THEN the row is visible through the original framebuffer
+        """
+        with Framebuffer(width=2, height=2) as framebuffer:
+            with Framebuffer(width=2, height=2, name=framebuffer.name) as attached:
+                attached.set_row(index=0, row=[Colour(9, 8, 7), Colour(6, 5, 4)])
+
+            assert bytes(framebuffer.row(0)) == bytes([9, 8, 7, 6, 5, 4])
+
+    def test_close_releases_owned_memory(self) -> None:
+        """
+        GIVEN a framebuffer which created its shared memory
+        WHEN closing it
+        THEN the shared memory is released
+        """
+        framebuffer = Framebuffer(width=2, height=2)
+        name = framebuffer.name
+
+        framebuffer.close()
+
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=name)
+
+    def test_to_canvas(self) -> None:
+        with Framebuffer(width=2, height=2) as framebuffer:
+            framebuffer.set_row(index=0, row=[Colour(1, 2, 3), Colour(4, 5, 6)])
+            framebuffer.set_row(index=1, row=[Colour(7, 8, 9), Colour(10, 11, 12)])
+
+            actual = framebuffer.to_canvas()
+
+        assert actual.width == 2
+        assert actual.height == 2
+        assert actual.pixels == [
+            [Colour(1, 2, 3), Colour(4, 5, 6)],
+            [Colour(7, 8, 9), Colour(10, 11, 12)],
+        ]
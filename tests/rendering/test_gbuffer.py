@@ -0,0 +1,91 @@
+import os
+from typing import Callable, Iterator
+
+import pytest
+
+from raytracer.core.types.geometry import Point
+from raytracer.rendering.framebuffer import Framebuffer
+from raytracer.rendering.gbuffer import HEADER, load_gbuffer, save_gbuffer
+
+LIGHTS = [Point(1.5, -0.5, -10), Point(-0.5, -10.5, 0)]
+HIT = (1, Point(0.5, -0.25, 3), Point(0, 0, -1), 0b10)
+
+
+@pytest.fixture
+def framebuffer() -> Iterator[Framebuffer]:
+    with Framebuffer(width=2, height=2, gbuffer_depth=2) as framebuffer:
+        yield framebuffer
+
+
+@pytest.fixture
+def path(temp_directory: str, framebuffer: Framebuffer) -> str:
+    framebuffer.set_hits(index=1, paths=[[HIT, HIT], [HIT]])
+    path = os.path.join(temp_directory, "scene.gbuf")
+    save_gbuffer(path=path, framebuffer=framebuffer, geometry="key", lights=LIGHTS)
+    return path
+
+
+def test_save_and_load(path: str) -> None:
+    """
+    GIVEN a saved G-buffer
+    WHEN loading it into another framebuffer with the key it was saved with
+    THEN copy its hits into the framebuffer
+    AND return the lights its shadows were found for
+    """
+    # GIVEN
+    with Framebuffer(width=2, height=2, gbuffer_depth=2) as framebuffer:
+        # WHEN
+        actual = load_gbuffer(path=path, framebuffer=framebuffer, geometry="key")
+
+        # THEN
+        assert actual == LIGHTS
+        assert framebuffer.hits(index=1) == [[HIT, HIT], [HIT]]
+
+
+@pytest.mark.parametrize(
+    "geometry, depth",
+    [("other", 2), ("key", 3)],
+    ids=["other geometry", "other depth"],
+)
+def test_load_other(path: str, geometry: str, depth: int) -> None:
+    with Framebuffer(width=2, height=2, gbuffer_depth=depth) as framebuffer:
+        actual = load_gbuffer(path=path, framebuffer=framebuffer, geometry=geometry)
+
+    assert actual is None
+
+
+def test_load_missing(temp_directory: str, framebuffer: Framebuffer) -> None:
+    path = os.path.join(temp_directory, "missing.gbuf")
+
+    assert load_gbuffer(path=path, framebuffer=framebuffer, geometry="key") is None
+
+
+@pytest.mark.parametrize(
+    "damage",
+    [
+        lambda data: data[:2],
+        lambda data: HEADER.pack(2) + b"{]" + data,
+        lambda data: data[:-1],
+        lambda data: data + b"\0",
+    ],
+    ids=["header cut short", "description damaged", "hits cut short", "extra bytes"],
+)
+def test_load_damaged(
+    path: str, framebuffer: Framebuffer, damage: Callable[[bytes], bytes]
+) -> None:
+    """
+    GIVEN a saved G-buffer which was damaged
+    WHEN loading it
+    THEN treat it as missing
+    """
+    # GIVEN
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(damage(data))
+
+    # WHEN
+    actual = load_gbuffer(path=path, framebuffer=framebuffer, geometry="key")
+
+    # THEN
+    assert actual is None
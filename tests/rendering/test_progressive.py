@@ -0,0 +1,77 @@
+import pytest
+
+from raytracer.core.types.imaging import Canvas, Colour
+from raytracer.rendering.progressive import PASSES, fill_gaps, pass_spans
+from raytracer.rendering.tiles import Tile, split_tiles
+
+
+def test_pass_spans_first() -> None:
+    """
+    GIVEN a tile
+    WHEN getting the pixels traced by the first pass
+    THEN trace one pixel in every square of the spacing
+    """
+    tile = Tile(index=0, left=8, top=0, right=24, bottom=12)
+
+    actual = pass_spans(tile=tile, spacing=8, first=True)
+
+    assert actual == [(0, range(8, 24, 8)), (8, range(8, 24, 8))]
+
+
+def test_pass_spans_refines() -> None:
+    """
+    GIVEN a tile
+    WHEN getting the pixels traced by a later pass
+    THEN skip the pixels traced by the pass before it
+    """
+    tile = Tile(index=0, left=0, top=0, right=8, bottom=8)
+
+    actual = pass_spans(tile=tile, spacing=4, first=False)
+
+    assert actual == [(0, range(4, 8, 8)), (4, range(0, 8, 4))]
+
+
+def test_pass_spans_nothing_left() -> None:
+    tile = Tile(index=0, left=32, top=32, right=33, bottom=33)
+    assert pass_spans(tile=tile, spacing=4, first=False) == []
+
+
+@pytest.mark.parametrize("width, height", [(64, 64), (37, 21)])
+def test_passes_trace_each_pixel_once(width: int, height: int) -> None:
+    """
+    GIVEN an image split into tiles
+    WHEN getting the pixels traced by every pass
+    THEN trace every pixel exactly once
+    """
+    traced = [
+        (scene_x, scene_y)
+        for number, spacing in enumerate(PASSES)
+        for tile in split_tiles(width=width, height=height)
+        for scene_y, span in pass_spans(tile=tile, spacing=spacing, first=number == 0)
+        for scene_x in span
+    ]
+
+    assert len(traced) == width * height
+    assert set(traced) == {(x, y) for y in range(height) for x in range(width)}
+
+
+def test_fill_gaps() -> None:
+    """
+    GIVEN a canvas with pixels traced at a spacing of two
+    WHEN filling the gaps
+    THEN copy each traced pixel over its square
+    AND cut the squares on the edges short
+    """
+    canvas = Canvas(width=3, height=3)
+    canvas.paint(x=0, y=0, pixel=Colour(1, 1, 1))
+    canvas.paint(x=2, y=0, pixel=Colour(2, 2, 2))
+    canvas.paint(x=0, y=2, pixel=Colour(3, 3, 3))
+    canvas.paint(x=2, y=2, pixel=Colour(4, 4, 4))
+
+    fill_gaps(canvas=canvas, spacing=2)
+
+    assert canvas.pixels == [
+        [Colour(1, 1, 1), Colour(1, 1, 1), Colour(2, 2, 2)],
+        [Colour(1, 1, 1), Colour(1, 1, 1), Colour(2, 2, 2)],
+        [Colour(3, 3, 3), Colour(3, 3, 3), Colour(4, 4, 4)],
+    ]
@@ -1,12 +1,25 @@
+import pickle
+from dataclasses import replace
 from unittest.mock import Mock, call
 
 import pytest
 from pytest_mock import MockerFixture
 
+from raytracer.core.types.compiled import compile_scene, vector
 from raytracer.core.types.entities import Light, Material, Scene, Sphere
 from raytracer.core.types.geometry import Point
-from raytracer.core.types.imaging import Colour
-from raytracer.rendering.shading import Shader
+from raytracer.core.types.imaging import Colour, quantize
+from raytracer.rendering.dependencies import SEGMENT_SIZE, TileDependencies
+from raytracer.rendering.shading import (
+    NO_OCCLUDER,
+    PHONG_COEFFICENT,
+    Shader,
+    ShadowStats,
+    _dot,
+    _half_vector,
+    _scale,
+    _to_light,
+)
 
 
 @pytest.fixture
@@ -47,13 +60,7 @@ def scene(camera: Point, sphere: Sphere, light: Light) -> Scene:
 
 class TestShader:
     def test_shade(
-        self,
-        scene: Scene,
-        sphere: Sphere,
-        mocker: MockerFixture,
-        light: Point,
-        material: Material,
-        camera: Point,
+        self, scene: Scene, sphere: Sphere, mocker: MockerFixture, camera: Point
     ) -> None:
         """
         GIVEN a scene
@@ -64,8 +71,8 @@ class TestShader:
         """
         # GIVEN
         shader = Shader()
-        diffuse = Mock(return_value=Colour(1, 0, 0))
-        specular = Mock(return_value=Colour(1, 3, 0))
+        diffuse = Mock(return_value=(1, 0, 0))
+        specular = Mock(return_value=(1, 3, 0))
         mocker.patch.object(shader, "_diffuse", diffuse)
         mocker.patch.object(shader, "_specular", specular)
         manager = Mock()
@@ -73,59 +80,386 @@ class TestShader:
         manager.attach_mock(specular, "specular")
         expected = Colour(2, 3, 0)
 
+        hit_pos = Point(0, 0, -0.5)
+        compiled = compile_scene(scene)
+        normal = vector(sphere.normal(hit_pos))
+        to_light = _to_light(compiled, 0, vector(hit_pos))
+
         # WHEN
-        actual = shader.shade(scene=scene, obj_hit=sphere, hit_pos=Point(0, 0, 1))
+        actual = shader.shade(scene=scene, index=0, hit_pos=hit_pos)
         assert actual == expected
         manager.assert_has_calls(
             [
                 call.diffuse(
-                    light=light,
-                    material=material,
-                    hit_pos=Point(0, 0, 1),
-                    normal=sphere.normal(Point(0, 0, 1)),
+                    compiled=compiled,
+                    material=0,
+                    position=vector(hit_pos),
+                    normal=normal,
+                    to_light=to_light,
                 ),
                 call.specular(
-                    light=light,
-                    material=material,
-                    normal=sphere.normal(Point(0, 0, 1)),
-                    hit_pos=Point(0, 0, 1),
-                    to_cam=camera - Point(0, 0, 1),
+                    compiled=compiled,
+                    light_index=0,
+                    material=0,
+                    normal=normal,
+                    to_light=to_light,
+                    to_cam=vector(camera - hit_pos),
                 ),
             ]
         )
 
-    def test_diffuse(self, light: Light, material: Material, sphere: Sphere) -> None:
+    def test_shade_in_shadow(
+        self, scene: Scene, sphere: Sphere, mocker: MockerFixture
+    ) -> None:
+        """
+        GIVEN a scene
+        AND a point the light doesn't reach
+        WHEN calling shade
+        THEN skip diffuse and specular shading for that light
+        """
         # GIVEN
         shader = Shader()
-        hit_pos = Point(0.5, 0.5, -0.5)
+        diffuse = mocker.patch.object(shader, "_diffuse")
+        specular = mocker.patch.object(shader, "_specular")
+
+        # WHEN
+        actual = shader.shade(scene=scene, index=0, hit_pos=Point(0, 0, 0.5))
+
+        # THEN
+        assert actual == Colour(0, 0, 0)
+        diffuse.assert_not_called()
+        specular.assert_not_called()
+
+    def test_shade_with_shadows(self, scene: Scene, sphere: Sphere) -> None:
+        """
+        GIVEN a hit and the lights shadowed there
+        WHEN calling shade with them
+        THEN give the same colour as finding the shadows
+        AND trace no shadow rays
+        """
+        # GIVEN
+        hit_pos = Point(0, 0, -0.5)
+        normal = sphere.normal(hit_pos)
+        expected = Shader().shade(scene=scene, index=0, hit_pos=hit_pos)
+        shader = Shader()
+
+        # WHEN
+        actual = [
+            shader.shade(
+                scene=scene,
+                index=0,
+                hit_pos=hit_pos,
+                normal=normal,
+                shadowed=shadowed,
+            )
+            for shadowed in (0, 1)
+        ]
+
+        # THEN
+        assert actual == [expected, Colour(0, 0, 0)]
+        assert expected != Colour(0, 0, 0)
+        assert shader.shadow_stats == ShadowStats()
+
+    def test_radiance(self, scene: Scene, sphere: Sphere, camera: Point) -> None:
+        """
+        GIVEN a scene
+        AND an object hit by a ray
+        WHEN calling radiance
+        THEN add the diffuse and specular light without truncating either
+        AND quantize to at least the colour shade gives
+        """
+        # GIVEN
+        hit_pos = Point(0, 0, -0.5)
+        compiled = compile_scene(scene)
+        normal = vector(sphere.normal(hit_pos))
+        to_light = _to_light(compiled, 0, vector(hit_pos))
+        lambert = _dot(normal, to_light)
+        phong = (
+            _dot(normal, _half_vector(to_light, vector(camera - hit_pos)))
+            ** PHONG_COEFFICENT
+        )
+        shader = Shader()
+
+        # WHEN
+        actual = shader.radiance(scene=scene, index=0, hit_pos=hit_pos)
+
+        # THEN
+        assert actual == (255 * lambert + 255 * phong, 255 * phong, 255 * phong)
+        assert actual[1] % 1 != 0
+        shaded = shader.shade(scene=scene, index=0, hit_pos=hit_pos)
+        quantized = quantize(actual)
+        assert shaded.r <= quantized.r and shaded.g <= quantized.g
+        assert shaded.b <= quantized.b
+
+    def test_radiance_with_shadows(self, scene: Scene, sphere: Sphere) -> None:
+        hit_pos = Point(0, 0, -0.5)
         normal = sphere.normal(hit_pos)
-        expected = Colour(145, 0, 0)
+        shader = Shader()
+
+        actual = [
+            shader.radiance(
+                scene=scene,
+                index=0,
+                hit_pos=hit_pos,
+                normal=normal,
+                shadowed=shadowed,
+            )
+            for shadowed in (0, 1)
+        ]
+
+        assert actual == [
+            shader.radiance(scene=scene, index=0, hit_pos=hit_pos),
+            (0, 0, 0),
+        ]
+        assert shader.shadow_stats.rays == 1
+
+    def test_diffuse(self, scene: Scene, sphere: Sphere) -> None:
+        # GIVEN
+        shader = Shader()
+        compiled = compile_scene(scene)
+        hit_pos = Point(0.5, 0.5, -0.5)
+        normal = vector(sphere.normal(hit_pos))
+        expected = (145, 0, 0)
 
         # WHEN
         actual = shader._diffuse(
-            light=light, material=material, hit_pos=hit_pos, normal=normal
+            compiled=compiled,
+            material=0,
+            position=vector(hit_pos),
+            normal=normal,
+            to_light=_to_light(compiled, 0, vector(hit_pos)),
         )
 
         # THEN
         assert actual == expected
 
-    def test_specular(
-        self, light: Light, material: Material, sphere: Sphere, camera: Point
-    ) -> None:
+    def test_specular(self, scene: Scene, sphere: Sphere, camera: Point) -> None:
         # GIVEN
         shader = Shader()
+        compiled = compile_scene(scene)
         hit_pos = Point(0, 0, -0.5)
-        normal = sphere.normal(hit_pos)
-        expected = Colour(188, 188, 188)
+        normal = vector(sphere.normal(hit_pos))
+        expected = (188, 188, 188)
 
         # WHEN
         actual = shader._specular(
-            light=light,
-            material=material,
-            hit_pos=hit_pos,
+            compiled=compiled,
+            light_index=0,
+            material=0,
             normal=normal,
-            to_cam=camera - hit_pos,
+            to_light=_to_light(compiled, 0, vector(hit_pos)),
+            to_cam=vector(camera - hit_pos),
         )
 
         # THEN
         assert actual == expected
+
+
+@pytest.mark.parametrize(
+    "colour,factor",
+    [
+        pytest.param((200, 100, 3), 0.55, id="Truncated"),
+        pytest.param((200, 100, 3), 1.5, id="Clamped to white"),
+        pytest.param((200, 100, 3), -0.5, id="Clamped to black"),
+    ],
+)
+def test_scale_matches_colour(colour: tuple[int, int, int], factor: float) -> None:
+    expected = Colour(*colour) * factor
+
+    actual = _scale(colour, factor)
+
+    assert actual == (expected.r, expected.g, expected.b)
+
+
+class TestShadows:
+    @pytest.fixture
+    def blocker(self, material: Material) -> Sphere:
+        return Sphere(
+            name="Blocker", centre=Point(0.39, -0.13, -3), material=material, radius=0.2
+        )
+
+    @pytest.fixture
+    def shadowed_scene(self, scene: Scene, sphere: Sphere, blocker: Sphere) -> Scene:
+        return replace(scene, objects=[blocker, sphere])
+
+    def test_lit(self, scene: Scene, sphere: Sphere) -> None:
+        """
+        GIVEN a point facing the light
+        AND nothing between it and the light
+        WHEN checking for shadow
+        THEN it is lit
+        """
+        shader = Shader()
+        hit_pos = Point(0, 0, -0.5)
+
+        actual = shader._in_shadow(
+            scene=scene, light_index=0, hit_pos=hit_pos, normal=sphere.normal(hit_pos)
+        )
+
+        assert actual is False
+        assert shader.shadow_stats == ShadowStats(rays=1)
+
+    def test_back_facing(self, scene: Scene, sphere: Sphere) -> None:
+        """
+        GIVEN a point facing away from the light
+        WHEN checking for shadow
+        THEN it is in shadow without tracing a ray
+        """
+        shader = Shader()
+        hit_pos = Point(0, 0, 0.5)
+
+        actual = shader._in_shadow(
+            scene=scene, light_index=0, hit_pos=hit_pos, normal=sphere.normal(hit_pos)
+        )
+
+        assert actual is True
+        assert shader.shadow_stats == ShadowStats(back_facing=1)
+
+    def test_occluded(self, shadowed_scene: Scene, sphere: Sphere) -> None:
+        """
+        GIVEN an object between a point and the light
+        WHEN checking for shadow twice
+        THEN it is in shadow
+        AND the second check is answered by the occluder cache
+        """
+        shader = Shader()
+        hit_pos = Point(0, 0, -0.5)
+        normal = sphere.normal(hit_pos)
+
+        actual = [
+            shader._in_shadow(
+                scene=shadowed_scene, light_index=0, hit_pos=hit_pos, normal=normal
+            )
+            for _ in range(2)
+        ]
+
+        assert actual == [True, True]
+        assert shader.shadow_stats == ShadowStats(
+            rays=2, occluded=2, cache_hits=1, tests=2
+        )
+        assert shader.shadow_stats.hit_rate == 1.0
+        assert shader.shadow_stats.cache_hit_rate == 0.5
+
+    def test_shadow_mask(
+        self, shadowed_scene: Scene, sphere: Sphere, light: Light
+    ) -> None:
+        """
+        GIVEN a point shadowed from the first light but not the second
+        WHEN finding its shadow mask
+        THEN set the bit of the first light only
+        """
+        scene = replace(
+            shadowed_scene,
+            lights=[light, replace(light, position=Point(-1.5, -0.5, -10))],
+        )
+        hit_pos = Point(0, 0, -0.5)
+
+        actual = Shader().shadow_mask(
+            scene=scene, hit_pos=hit_pos, normal=sphere.normal(hit_pos)
+        )
+
+        assert actual == 0b01
+
+    def test_cache_miss(
+        self, shadowed_scene: Scene, sphere: Sphere, blocker: Sphere
+    ) -> None:
+        """
+        GIVEN a cached occluder
+        AND a point it doesn't shadow
+        WHEN checking for shadow
+        THEN search the scene
+        """
+        shader = Shader()
+        shaded_pos = Point(0, 0, -0.5)
+        lit_pos = Point(0.4, 0.3, 0)
+        for hit_pos in (shaded_pos, lit_pos):
+            shader._in_shadow(
+                scene=shadowed_scene,
+                light_index=0,
+                hit_pos=hit_pos,
+                normal=sphere.normal(hit_pos),
+            )
+
+        assert shader.shadow_stats == ShadowStats(rays=2, occluded=1, tests=3)
+        assert list(shader._occluders) == [0]
+
+    def test_records_dependencies(
+        self, shadowed_scene: Scene, sphere: Sphere, blocker: Sphere
+    ) -> None:
+        """
+        GIVEN a shader recording dependencies
+        WHEN checking for shadow at points the blocker shadows, found by searching
+        and then from the cache, and at a point it doesn't
+        THEN record the blocker for the points in shadow
+        AND the segment towards the light for the lit point
+        """
+        # GIVEN
+        shader = Shader()
+        shader.dependencies = TileDependencies()
+        shaded_pos = Point(0, 0, -0.5)
+        lit_pos = Point(0.4, 0.3, 0)
+
+        # WHEN
+        for hit_pos in (shaded_pos, shaded_pos, lit_pos):
+            shader._in_shadow(
+                scene=shadowed_scene,
+                light_index=0,
+                hit_pos=hit_pos,
+                normal=sphere.normal(hit_pos),
+            )
+
+        # THEN
+        assert shader.shadow_stats.cache_hits == 1
+        assert shader.dependencies.objects == {0}
+        assert len(shader.dependencies.segments) == SEGMENT_SIZE
+        assert shader.dependencies.segments[-1] == pytest.approx(
+            (shadowed_scene.lights[0].position - lit_pos).magnitude, abs=1e-3
+        )
+
+    def test_cache_is_per_scene(self, shadowed_scene: Scene, sphere: Sphere) -> None:
+        """
+        GIVEN a cached occluder
+        WHEN checking for shadow in another scene
+        THEN forget the cached occluder
+        """
+        shader = Shader()
+        hit_pos = Point(0, 0, -0.5)
+        normal = sphere.normal(hit_pos)
+        shader._in_shadow(
+            scene=shadowed_scene, light_index=0, hit_pos=hit_pos, normal=normal
+        )
+        other_scene = replace(shadowed_scene, objects=[sphere])
+
+        actual = shader._in_shadow(
+            scene=other_scene, light_index=0, hit_pos=hit_pos, normal=normal
+        )
+
+        assert actual is False
+        assert list(shader._occluders) == [NO_OCCLUDER]
+
+    def test_pickle(self, shadowed_scene: Scene, sphere: Sphere) -> None:
+        """
+        GIVEN a shader which has traced shadow rays
+        WHEN pickling it for a worker process
+        THEN leave out its counters and cache
+        """
+        shader = Shader()
+        shader.dependencies = TileDependencies()
+        hit_pos = Point(0, 0, -0.5)
+        shader._in_shadow(
+            scene=shadowed_scene,
+            light_index=0,
+            hit_pos=hit_pos,
+            normal=sphere.normal(hit_pos),
+        )
+
+        actual = pickle.loads(pickle.dumps(shader))
+
+        assert actual.shadow_stats == ShadowStats()
+        assert list(actual._occluders) == []
+        assert actual.dependencies is None
+        assert list(shader._occluders) == [0]
+
+    def test_rates_without_rays(self) -> None:
+        assert ShadowStats().hit_rate == 0.0
+        assert ShadowStats().cache_hit_rate == 0.0
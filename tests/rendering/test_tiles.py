@@ -0,0 +1,57 @@
+from raytracer.rendering.tiles import Tile, schedule, split_tiles
+
+
+class TestTile:
+    def test_size(self) -> None:
+        tile = Tile(index=0, left=32, top=8, right=40, bottom=24)
+
+        assert (tile.width, tile.height) == (8, 16)
+        assert tile.rows == range(8, 24)
+
+    def test_samples(self) -> None:
+        """
+        GIVEN a tile
+        WHEN getting the pixels sampled to estimate its cost
+        THEN spread them evenly over the tile
+        """
+        tile = Tile(index=0, left=32, top=0, right=64, bottom=32)
+
+        assert tile.samples == [(40, 8), (56, 8), (40, 24), (56, 24)]
+
+    def test_samples_small_tile(self) -> None:
+        tile = Tile(index=0, left=4, top=2, right=5, bottom=3)
+        assert tile.samples == [(4, 2)]
+
+
+def test_split_tiles() -> None:
+    """
+    GIVEN an image which is not a whole number of tiles
+    WHEN splitting it into tiles
+    THEN cover every pixel once, left to right then top to bottom
+    AND cut the tiles on the edges short
+    """
+    actual = split_tiles(width=5, height=3, size=2)
+
+    assert [tile.index for tile in actual] == list(range(6))
+    assert [(tile.left, tile.top, tile.right, tile.bottom) for tile in actual] == [
+        (0, 0, 2, 2),
+        (2, 0, 4, 2),
+        (4, 0, 5, 2),
+        (0, 2, 2, 3),
+        (2, 2, 4, 3),
+        (4, 2, 5, 3),
+    ]
+
+
+def test_schedule() -> None:
+    """
+    GIVEN tiles and their estimated costs
+    WHEN scheduling them
+    THEN order them most expensive first
+    AND keep the order of tiles which cost the same
+    """
+    tiles = split_tiles(width=4, height=1, size=1)
+
+    actual = schedule(tiles=tiles, costs=[3, 7, 3, 9])
+
+    assert [tile.index for tile in actual] == [3, 1, 0, 2]
@@ -0,0 +1,623 @@
+import pickle
+import random
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from raytracer.core.types.entities import (
+    BaseMaterial,
+    Light,
+    Material,
+    Primitive,
+    Scene,
+    Sphere,
+)
+from raytracer.core.types.geometry import Point
+from raytracer.core.types.imaging import Colour
+from raytracer.rendering.engine import RenderEngine, _is_settled
+from raytracer.rendering.framebuffer import Framebuffer
+from raytracer.rendering.progressive import PASSES
+from raytracer.rendering.shading import Shader
+from raytracer.rendering.tiles import Tile
+from raytracer.rendering.wavefront import (
+    OBJECT_CHUNK_SIZE,
+    SceneArrays,
+    WavefrontRenderEngine,
+    _settled_batch,
+)
+
+
+@pytest.fixture
+def scene(scene_data: dict) -> Scene:
+    scene_data["objects"].append(
+        {
+            "type": "Sphere",
+            "attributes": {
+                "name": "Ground",
+                "centre": {"x": 0, "y": 10000.5, "z": 1},
+                "radius": 10000.0,
+                "material": {
+                    "type": "ChequeredMaterial",
+                    "attributes": {
+                        "colour_1": "#420500",
+                        "colour_2": "#e6b87d",
+                        "ambient": 0.2,
+                        "diffuse": 1.0,
+                        "specular": 1.0,
+                        "reflection": 0.2,
+                    },
+                },
+            },
+        }
+    )
+    scene_data["lights"].append(
+        {"position": {"x": -0.5, "y": -10.5, "z": 0.0}, "colour": "#E6E6E6"}
+    )
+    return Scene.from_object(data=scene_data, width=16, height=10)
+
+
+def _row_params(scene: Scene, scene_y: int) -> tuple[Scene, int, float, float, float]:
+    scene_top, _ = scene.get_aspect_boundries()
+    horizontal_step, vertical_step = scene.get_horizontal_and_vertical_steps()
+    return (scene, scene_y, scene_top, vertical_step, horizontal_step)
+
+
+def _colour(colour: Colour) -> tuple[int, int, int]:
+    return (colour.r, colour.g, colour.b)
+
+
+class TestSceneArrays:
+    def test_from_scene(self, scene: Scene) -> None:
+        actual = SceneArrays.from_scene(scene)
+
+        np.testing.assert_allclose(actual.camera, [0, -0.35, -1], rtol=1e-6)
+        assert actual.centres.shape == (2, 3)
+        np.testing.assert_allclose(actual.radii_squared, [0.36, 1e8], rtol=1e-6)
+        assert actual.chequered.tolist() == [False, True]
+        assert actual.colour_1.tolist() == [[0, 0, 255], [66, 5, 0]]
+        assert actual.colour_2.tolist() == [[0, 0, 255], [230, 184, 125]]
+        assert actual.light_colours.tolist() == [[255, 255, 255], [230, 230, 230]]
+
+    def test_from_scene_unsupported_primitive(self, scene: Scene) -> None:
+        class Sidebar(Primitive):
+            pass
+
+        scene.objects = [
+            Sidebar(
+                name="Sidebar",
+                centre=Point(0, 0, 0),
+                material=Material(colour=Colour(0, 0, 0)),
+            )
+        ]
+
+        with pytest.raises(ValueError, match="'Sidebar' is not supported"):
+            SceneArrays.from_scene(scene)
+
+    def test_from_scene_unsupported_material(self, scene: Scene) -> None:
+        scene.objects = [
+            Sphere(
+                name="Sphere", centre=Point(0, 0, 0), material=BaseMaterial(), radius=1
+            )
+        ]
+
+        with pytest.raises(ValueError, match="'BaseMaterial' is not supported"):
+            SceneArrays.from_scene(scene)
+
+
+class TestWavefrontRenderEngine:
+    @pytest.mark.parametrize("max_depth", [0, 6])
+    def test_render_row_matches_scalar_engine(
+        self, scene: Scene, max_depth: int
+    ) -> None:
+        """
+        GIVEN a scene with solid and chequered materials
+        WHEN rendering each row with the wavefront and the scalar engines
+        THEN the rows match
+        """
+        # GIVEN
+        scalar = RenderEngine(shader=Shader(), max_depth=max_depth)
+        wavefront = WavefrontRenderEngine(shader=Shader(), max_depth=max_depth)
+
+        for scene_y in range(scene.height):
+            # WHEN
+            expected = scalar._render_row(_row_params(scene, scene_y))
+            actual = wavefront._render_row(_row_params(scene, scene_y))
+
+            # THEN
+            assert actual == expected
+
+    @pytest.mark.parametrize("use_bvh", [True, False], ids=["BVH", "linear scan"])
+    def test_shadow_stats_match_scalar_engine(
+        self, scene: Scene, use_bvh: bool
+    ) -> None:
+        """
+        GIVEN a scene where objects shadow each other
+        WHEN rendering it with the wavefront and the scalar engines
+        THEN trace the same shadow rays
+        AND find the same rays occluded
+        AND answer some from the occluder cache
+        """
+        # GIVEN
+        scalar = RenderEngine(shader=Shader())
+        wavefront = WavefrontRenderEngine(shader=Shader(), use_bvh=use_bvh)
+
+        # WHEN
+        for scene_y in range(scene.height):
+            scalar._render_row(_row_params(scene, scene_y))
+            wavefront._render_row(_row_params(scene, scene_y))
+
+        # THEN
+        expected = scalar.shader.shadow_stats
+        actual = wavefront.shader.shadow_stats
+        assert actual.occluded > 0
+        assert actual.cache_hits > 0
+        assert (actual.rays, actual.occluded, actual.back_facing) == (
+            expected.rays,
+            expected.occluded,
+            expected.back_facing,
+        )
+
+    def test_trace_stats_match_scalar_engine(self, scene: Scene) -> None:
+        """
+        GIVEN a scene with faint and strong reflections
+        WHEN rendering it with the wavefront and the scalar engines
+        THEN trace and stop the same reflections
+        """
+        # GIVEN
+        matt = Sphere(
+            name="Matt",
+            centre=Point(-0.75, -0.1, 2.25),
+            radius=0.6,
+            material=Material(colour=Colour(255, 0, 0), reflection=0.0),
+        )
+        scene = replace(scene, objects=[*scene.objects, matt])
+        scalar = RenderEngine(shader=Shader())
+        wavefront = WavefrontRenderEngine(shader=Shader())
+
+        # WHEN
+        for scene_y in range(scene.height):
+            scalar._render_row(_row_params(scene, scene_y))
+            wavefront._render_row(_row_params(scene, scene_y))
+
+        # THEN
+        assert wavefront.trace_stats.terminated > 0
+        # Batches test more objects per ray than the scalar engine's search
+        assert wavefront.trace_stats.intersection_tests > 0
+        assert replace(wavefront.trace_stats, intersection_tests=0) == replace(
+            scalar.trace_stats, intersection_tests=0
+        )
+
+    def test_render_tile_times_stages(self, scene: Scene) -> None:
+        """
+        GIVEN an engine which collects stats
+        WHEN rendering a tile of a reflective scene into a framebuffer
+        THEN time each stage
+        AND count the intersection tests of every kind of ray
+        """
+        # GIVEN
+        engine = WavefrontRenderEngine(shader=Shader(), collect_stats=True)
+        tile = Tile(index=0, left=0, top=6, right=scene.width, bottom=7)
+        with Framebuffer(width=scene.width, height=scene.height) as framebuffer:
+            # WHEN
+            engine._render_tile(scene=scene, tile=tile, framebuffer=framebuffer)
+
+        # THEN
+        assert engine.timings is not None
+        assert engine.timings.trace > engine.timings.intersect > 0
+        assert engine.timings.shade > 0
+        assert engine.timings.reflect > 0
+        assert engine.timings.write > 0
+        assert engine.trace_stats.intersection_tests > 0
+        assert engine.trace_stats.shades > scene.width
+        assert engine.shader.shadow_stats.tests > 0
+
+    def test_russian_roulette(self, scene: Scene) -> None:
+        """
+        GIVEN Russian roulette
+        WHEN rendering the same row twice
+        THEN stop some faint reflections at random
+        AND render the same pixels each time
+        AND stay close to rendering without it
+        """
+        # GIVEN
+        engine = WavefrontRenderEngine(shader=Shader(), russian_roulette=True)
+        exact = WavefrontRenderEngine(shader=Shader())
+
+        # WHEN
+        actual = [engine._trace_row(_row_params(scene, 7)) for _ in range(2)]
+
+        # THEN
+        expected = exact._trace_row(_row_params(scene, 7))
+        assert engine.trace_stats.roulette_terminated > 0
+        assert (
+            engine.trace_stats.reflection_rays < 2 * exact.trace_stats.reflection_rays
+        )
+        np.testing.assert_array_equal(actual[0], actual[1])
+        assert np.abs(actual[0] - expected).mean() < 10
+
+    @pytest.mark.parametrize("depth", [1, 2, 4])
+    def test_settled_batch_matches_is_settled(self, depth: int) -> None:
+        """
+        GIVEN random paths of surfaces
+        WHEN checking whether they are settled one at a time and as a batch
+        THEN the answers match
+        """
+        # GIVEN
+        rnd = random.Random(depth)
+        paths = [
+            [
+                (
+                    Colour(rnd.randint(0, 255), rnd.randint(0, 255), 255),
+                    rnd.choice([0.0, 0.001, 0.02, 0.2, 0.6, 2.0]),
+                )
+                for _ in range(depth)
+            ]
+            for _ in range(200)
+        ]
+
+        # WHEN
+        actual = _settled_batch(
+            [
+                (
+                    np.array([_colour(path[level][0]) for path in paths], dtype=float),
+                    np.array([path[level][1] for path in paths]),
+                )
+                for level in range(depth)
+            ]
+        )
+
+        # THEN
+        assert actual.tolist() == [_is_settled(path) for path in paths]
+        assert 0 < actual.sum() < len(paths)
+
+    def test_pickle_drops_occluders(self, scene: Scene) -> None:
+        engine = WavefrontRenderEngine(shader=Shader())
+        for scene_y in range(scene.height):
+            engine._render_row(_row_params(scene, scene_y))
+
+        actual = pickle.loads(pickle.dumps(engine))
+
+        assert engine._occluders
+        assert actual._occluders == {}
+
+    def test_trace_misses(self, scene: Scene) -> None:
+        """
+        GIVEN rays pointing away from every object
+        WHEN tracing them
+        THEN every ray is black
+        """
+        # GIVEN
+        engine = WavefrontRenderEngine(shader=Shader())
+        origins = np.zeros((3, 3))
+        directions = np.array([[0.0, -1.0, 0.0], [0.0, -1.0, -1.0], [1.0, -1.0, 0]])
+
+        # WHEN
+        actual = engine.trace(
+            arrays=SceneArrays.from_scene(scene),
+            origins=origins,
+            directions=directions,
+        )
+
+        # THEN
+        assert actual.tolist() == [[0, 0, 0]] * 3
+
+    def test_render(self, scene: Scene) -> None:
+        """
+        GIVEN a scene
+        WHEN calling render
+        THEN render the same image as the scalar engine
+        """
+        # GIVEN
+        scene = replace(scene, height=3)
+        with (
+            Framebuffer(width=scene.width, height=scene.height) as expected,
+            Framebuffer(width=scene.width, height=scene.height) as actual,
+            RenderEngine(shader=Shader()) as scalar,
+            WavefrontRenderEngine(shader=Shader()) as wavefront,
+        ):
+            # WHEN
+            list(scalar.render(scene=scene, framebuffer=expected, processes=2))
+            rows = list(wavefront.render(scene=scene, framebuffer=actual, processes=2))
+
+            # THEN
+            assert rows == [0, 1, 2]
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+
+    def test_render_changed_tiles(self, scene: Scene) -> None:
+        """
+        GIVEN a scene rendered by an engine recording dependencies
+        AND the scene with its ball moved
+        WHEN rendering only the tiles the move changed into the same framebuffer
+        THEN render fewer tiles than the whole scene
+        AND leave the same image as the scalar engine rendering the moved scene
+        """
+        # GIVEN
+        scene = replace(scene, width=64, height=40)
+        ball, ground = scene.objects
+        moved = replace(
+            scene,
+            objects=[replace(ball, centre=ball.centre + Point(0.2, 0, 0)), ground],
+        )
+        with (
+            Framebuffer(width=scene.width, height=scene.height) as expected,
+            Framebuffer(width=scene.width, height=scene.height) as actual,
+            RenderEngine(shader=Shader()) as scalar,
+            WavefrontRenderEngine(
+                shader=Shader(), record_dependencies=True
+            ) as wavefront,
+        ):
+            list(scalar.render(scene=moved, framebuffer=expected, processes=1))
+            list(wavefront.render(scene=scene, framebuffer=actual, processes=1))
+
+            # WHEN
+            tiles = wavefront.changed_tiles(moved)
+            list(
+                wavefront.render(
+                    scene=moved, framebuffer=actual, processes=1, tiles=tiles
+                )
+            )
+
+            # THEN
+            assert 0 < len(tiles) < len(wavefront.dependencies)
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+
+    def test_render_tile_records_dependencies(self, scene: Scene) -> None:
+        """
+        GIVEN engines recording dependencies
+        WHEN rendering a tile
+        THEN record the same objects as the scalar engine
+        AND record the rays which hit nothing
+        """
+        # GIVEN
+        scalar = RenderEngine(shader=Shader(), record_dependencies=True)
+        wavefront = WavefrontRenderEngine(shader=Shader(), record_dependencies=True)
+        tile = Tile(index=0, left=0, top=0, right=scene.width, bottom=scene.height)
+        with Framebuffer(width=scene.width, height=scene.height) as framebuffer:
+            expected = scalar._render_tile(
+                scene=scene, tile=tile, framebuffer=framebuffer
+            )
+
+            # WHEN
+            actual = wavefront._render_tile(
+                scene=scene, tile=tile, framebuffer=framebuffer
+            )
+
+        # THEN
+        assert actual is not None and expected is not None
+        assert actual.objects == expected.objects == {0, 1}
+        assert actual.shaded and expected.shaded
+        assert len(actual.segments) > 0
+        assert wavefront._dependencies is None and wavefront.shader.dependencies is None
+
+    def test_render_tile(self, scene: Scene) -> None:
+        """
+        GIVEN a framebuffer
+        WHEN rendering a tile into it
+        THEN write the same pixels as the scalar engine
+        AND leave the pixels outside the tile alone
+        """
+        # GIVEN
+        scalar = RenderEngine(shader=Shader())
+        wavefront = WavefrontRenderEngine(shader=Shader())
+        tile = Tile(index=0, left=3, top=5, right=11, bottom=8)
+        with (
+            Framebuffer(width=scene.width, height=scene.height) as expected,
+            Framebuffer(width=scene.width, height=scene.height) as actual,
+        ):
+            # WHEN
+            scalar._render_tile(scene=scene, tile=tile, framebuffer=expected)
+            wavefront._render_tile(scene=scene, tile=tile, framebuffer=actual)
+
+            # THEN
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+            assert bytes(actual.row(6)[9:33]) != bytes(24)
+            assert bytes(actual.row(6)[:9]) == bytes(9)
+            assert bytes(actual.row(4)) == bytes(scene.width * 3)
+
+    def test_render_tile_gbuffer(self, scene: Scene) -> None:
+        """
+        GIVEN engines keeping a G-buffer
+        WHEN rendering a tile
+        THEN write the same pixels and hits as the scalar engine
+        """
+        # GIVEN
+        scalar = RenderEngine(shader=Shader(), gbuffer=True)
+        wavefront = WavefrontRenderEngine(shader=Shader(), gbuffer=True)
+        tile = Tile(index=0, left=0, top=0, right=scene.width, bottom=scene.height)
+        depth = wavefront.gbuffer_depth
+        with (
+            Framebuffer(scene.width, scene.height, gbuffer_depth=depth) as expected,
+            Framebuffer(scene.width, scene.height, gbuffer_depth=depth) as actual,
+        ):
+            # WHEN
+            scalar._render_tile(scene=scene, tile=tile, framebuffer=expected)
+            wavefront._render_tile(scene=scene, tile=tile, framebuffer=actual)
+
+            # THEN
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+            assert actual.hits(index=5) == expected.hits(index=5)
+            assert any(actual.hits(index=5))
+
+    def test_render_tile_in_passes(self, scene: Scene) -> None:
+        """
+        GIVEN a tile
+        WHEN rendering each pass of it in turn
+        THEN write the same pixels as the scalar engine rendering it at once
+        """
+        # GIVEN
+        scalar = RenderEngine(shader=Shader())
+        wavefront = WavefrontRenderEngine(shader=Shader())
+        tile = Tile(index=0, left=0, top=0, right=scene.width, bottom=scene.height)
+        with (
+            Framebuffer(width=scene.width, height=scene.height) as expected,
+            Framebuffer(width=scene.width, height=scene.height) as actual,
+        ):
+            scalar._render_tile(scene=scene, tile=tile, framebuffer=expected)
+
+            # WHEN
+            for number, spacing in enumerate(PASSES):
+                wavefront._render_tile(
+                    scene=scene,
+                    tile=tile,
+                    framebuffer=actual,
+                    spacing=spacing,
+                    first=number == 0,
+                )
+
+            # THEN
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+        assert wavefront.trace_stats.primary_rays == scene.width * scene.height
+
+    @pytest.mark.parametrize("linear", [False, True], ids=["", "linear light"])
+    def test_render_anti_aliasing(self, scene: Scene, linear: bool) -> None:
+        """
+        GIVEN engines which anti-alias with four samples
+        WHEN rendering a scene
+        THEN the wavefront engine records the same object ids as the scalar engine
+        AND refines the same edges into the same image
+        """
+        # GIVEN
+        with (
+            Framebuffer(width=scene.width, height=scene.height, ids=True) as expected,
+            Framebuffer(width=scene.width, height=scene.height, ids=True) as actual,
+            RenderEngine(
+                shader=Shader(), max_samples=4, collect_stats=True, linear=linear
+            ) as scalar,
+            WavefrontRenderEngine(
+                shader=Shader(), max_samples=4, collect_stats=True, linear=linear
+            ) as wavefront,
+        ):
+            # WHEN
+            list(scalar.render(scene=scene, framebuffer=expected, processes=2))
+            list(wavefront.render(scene=scene, framebuffer=actual, processes=2))
+
+            # THEN
+            assert list(actual.ids or []) == list(expected.ids or [])
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+        assert wavefront.stats.trace.refined_pixels > 0
+        assert wavefront.stats.trace.refined_pixels == scalar.stats.trace.refined_pixels
+        assert wavefront.stats.trace.primary_rays == scalar.stats.trace.primary_rays
+
+    @pytest.mark.parametrize(
+        "tile",
+        [
+            Tile(index=0, left=0, top=0, right=16, bottom=10),
+            Tile(index=1, left=4, top=3, right=9, bottom=7),
+            Tile(index=2, left=12, top=8, right=16, bottom=10),
+        ],
+        ids=["whole image", "inside", "corner"],
+    )
+    def test_find_edges_matches_scalar_engine(self, scene: Scene, tile: Tile) -> None:
+        # GIVEN
+        engine = RenderEngine(shader=Shader())
+        whole = Tile(index=0, left=0, top=0, right=scene.width, bottom=scene.height)
+        with Framebuffer(width=scene.width, height=scene.height, ids=True) as image:
+            engine._render_tile(scene=scene, tile=whole, framebuffer=image)
+
+            # WHEN
+            actual = WavefrontRenderEngine(shader=Shader())._find_edges(
+                framebuffer=image, tile=tile
+            )
+
+            # THEN
+            assert sorted(actual) == sorted(
+                engine._find_edges(framebuffer=image, tile=tile)
+            )
+            assert actual
+
+    @pytest.mark.parametrize("linear", [False, True], ids=["", "linear light"])
+    def test_refine_pixels_matches_scalar_engine(
+        self, scene: Scene, linear: bool
+    ) -> None:
+        """
+        GIVEN a tile rendered with object ids
+        WHEN refining its edges with the wavefront and the scalar engines
+        THEN both record the same ids
+        AND refine the same pixels to the same colours
+        """
+        # GIVEN
+        scalar = RenderEngine(shader=Shader(), max_samples=8, linear=linear)
+        wavefront = WavefrontRenderEngine(shader=Shader(), max_samples=8, linear=linear)
+        tile = Tile(index=0, left=0, top=0, right=scene.width, bottom=scene.height)
+        with (
+            Framebuffer(width=scene.width, height=scene.height, ids=True) as expected,
+            Framebuffer(width=scene.width, height=scene.height, ids=True) as actual,
+        ):
+            scalar._render_tile(scene=scene, tile=tile, framebuffer=expected)
+            wavefront._render_tile(scene=scene, tile=tile, framebuffer=actual)
+            edges = scalar._find_edges(framebuffer=expected, tile=tile)
+
+            # WHEN
+            scalar._refine_pixels(scene=scene, pixels=edges, framebuffer=expected)
+            wavefront._refine_pixels(scene=scene, pixels=edges, framebuffer=actual)
+
+            # THEN
+            assert list(actual.ids or []) == list(expected.ids or [])
+            assert bytes(actual.buffer) == bytes(expected.buffer)
+        assert wavefront.trace_stats.refined_pixels == len(edges)
+        assert wavefront.trace_stats.primary_rays == scalar.trace_stats.primary_rays
+
+    def test_render_row_object_ids(self, scene: Scene) -> None:
+        # GIVEN
+        expected: list[int] = []
+        actual: list[int] = []
+
+        # WHEN
+        RenderEngine(shader=Shader())._render_row(_row_params(scene, 4), ids=expected)
+        WavefrontRenderEngine(shader=Shader())._render_row(
+            _row_params(scene, 4), ids=actual
+        )
+
+        # THEN
+        assert actual == expected
+        assert len(set(actual)) > 1
+
+    def test_render_tile_nothing_to_trace(self, scene: Scene) -> None:
+        engine = WavefrontRenderEngine(shader=Shader())
+        tile = Tile(index=0, left=9, top=9, right=10, bottom=10)
+        with Framebuffer(width=scene.width, height=scene.height) as framebuffer:
+            engine._render_tile(
+                scene=scene, tile=tile, framebuffer=framebuffer, spacing=2, first=False
+            )
+
+        assert engine.trace_stats.primary_rays == 0
+
+    @pytest.mark.parametrize("use_bvh", [True, False], ids=["BVH", "linear scan"])
+    def test_render_row_many_spheres(self, use_bvh: bool) -> None:
+        """
+        GIVEN a scene with more spheres than are intersected at once
+        WHEN rendering each row with the wavefront and the scalar engines
+        THEN the rows match
+        """
+        # GIVEN
+        rnd = random.Random(1)
+        scene = Scene(
+            camera=Point(0, 0, -1),
+            objects=[
+                Sphere(
+                    name=f"Sphere {index}",
+                    centre=Point(
+                        rnd.uniform(-3, 3), rnd.uniform(-2, 2), rnd.uniform(1, 8)
+                    ),
+                    radius=rnd.uniform(0.05, 0.3),
+                    material=Material(
+                        colour=Colour(rnd.randint(0, 255), 0, 255), reflection=0.5
+                    ),
+                )
+                for index in range(OBJECT_CHUNK_SIZE * 3)
+            ],
+            lights=[Light(position=Point(1, -5, -5), colour=Colour(255, 255, 255))],
+            width=24,
+            height=4,
+        )
+        scalar = RenderEngine(shader=Shader())
+        wavefront = WavefrontRenderEngine(shader=Shader(), use_bvh=use_bvh)
+
+        for scene_y in range(scene.height):
+            # WHEN
+            expected = scalar._render_row(_row_params(scene, scene_y))
+            actual = wavefront._render_row(_row_params(scene, scene_y))
+
+            # THEN
+            assert actual == expected
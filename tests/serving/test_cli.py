@@ -0,0 +1,44 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from click.testing import CliRunner
+
+from raytracer.rendering.cli.render_scene import RenderOptions
+from raytracer.serving.cli.serve import serve
+
+
+class TestServe:
+    def test_serve(self) -> None:
+        """
+        GIVEN the serve options
+        WHEN serving until interrupted
+        THEN listen on the host and port with an engine for each concurrent render
+        AND stop the engines' workers once stopped
+        """
+        # GIVEN
+        listener = MagicMock(serve_forever=AsyncMock(side_effect=KeyboardInterrupt))
+        with (
+            patch("raytracer.serving.cli.serve.RenderServer") as render_server,
+            patch("raytracer.serving.cli.serve._create_engine") as create_engine,
+        ):
+            server = render_server.return_value
+            server.start = AsyncMock(return_value=listener)
+
+            # WHEN
+            result = CliRunner().invoke(
+                serve,
+                ["--port", "9000", "-p", "2", "--concurrency", "2", "--max-queue", "4"],
+            )
+
+        # THEN
+        assert result.exit_code == 0, result.output
+        assert create_engine.call_count == 2
+        create_engine.assert_called_with(
+            RenderOptions(engine="scalar", bvh=True), start_method="forkserver"
+        )
+        render_server.assert_called_once_with(
+            engines=[create_engine.return_value] * 2, processes=2, max_queue=4
+        )
+        server.start.assert_awaited_once_with(host="127.0.0.1", port=9000)
+        assert "Serving on http://127.0.0.1:9000" in result.output
+        assert "Stopped serving" in result.output
+        server.close.assert_called_once_with()
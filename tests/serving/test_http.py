@@ -0,0 +1,170 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+
+from raytracer.serving.http import (
+    LAST_CHUNK,
+    MAX_BODY_SIZE,
+    MAX_HEAD_SIZE,
+    HTTPError,
+    Request,
+    chunk,
+    read_request,
+    response,
+    response_head,
+)
+
+
+def _read(data: bytes, eof: bool = True) -> Request:
+    async def read() -> Request:
+        reader = asyncio.StreamReader(limit=MAX_HEAD_SIZE)
+        reader.feed_data(data)
+        if eof:
+            reader.feed_eof()
+        return await read_request(reader)
+
+    return asyncio.run(read())
+
+
+class TestReadRequest:
+    def test_read_request(self) -> None:
+        """
+        GIVEN a request with a query, headers and a body
+        WHEN reading it
+        THEN split its target into a path and query
+        AND lower case its header names
+        AND read as much of the body as its Content-Length gives
+        """
+        # GIVEN
+        data = (
+            b"post /render?width=4&height=2 HTTP/1.1\r\n"
+            b"Host: localhost\r\nContent-Length: 2\r\n\r\n{}trailing"
+        )
+
+        # WHEN
+        actual = _read(data)
+
+        # THEN
+        assert actual == Request(
+            method="POST",
+            path="/render",
+            query={"width": "4", "height": "2"},
+            headers={"host": "localhost", "content-length": "2"},
+            body=b"{}",
+        )
+
+    def test_read_request_without_body(self) -> None:
+        """
+        GIVEN a request without a Content-Length
+        WHEN reading it
+        THEN give it no query, headers or body
+        """
+        # WHEN
+        actual = _read(b"GET /metrics HTTP/1.1\r\n\r\n")
+
+        # THEN
+        assert actual == Request(method="GET", path="/metrics")
+
+    @pytest.mark.parametrize(
+        "data, status",
+        [
+            (b"GET /metrics HTTP/1.1\r\n", HTTPStatus.BAD_REQUEST),
+            (b"GET /metrics\r\n\r\n", HTTPStatus.BAD_REQUEST),
+            (b"GET / HTTP/1.1\r\nHost\r\n\r\n", HTTPStatus.BAD_REQUEST),
+            (
+                b"POST / HTTP/1.1\r\nContent-Length: many\r\n\r\n",
+                HTTPStatus.BAD_REQUEST,
+            ),
+            (
+                b"POST / HTTP/1.1\r\n"
+                + f"Content-Length: {MAX_BODY_SIZE + 1}\r\n\r\n".encode(),
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+            ),
+            (b"POST / HTTP/1.1\r\nContent-Length: 4\r\n\r\n{}", HTTPStatus.BAD_REQUEST),
+            (
+                b"GET / HTTP/1.1\r\nCookie: " + b"x" * MAX_HEAD_SIZE,
+                HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE,
+            ),
+        ],
+        ids=[
+            "incomplete head",
+            "malformed request line",
+            "malformed header",
+            "malformed length",
+            "body too large",
+            "incomplete body",
+            "head too large",
+        ],
+    )
+    def test_read_request_invalid(self, data: bytes, status: HTTPStatus) -> None:
+        """
+        GIVEN a request which is incomplete, malformed or too large
+        WHEN reading it
+        THEN raise an HTTPError with the status to respond with
+        """
+        # WHEN
+        with pytest.raises(HTTPError) as error:
+            _read(data)
+
+        # THEN
+        assert error.value.status == status
+
+
+class TestResponses:
+    def test_response(self) -> None:
+        """
+        GIVEN a status and a body
+        WHEN building a response
+        THEN give the status line, the headers for the body and the body
+        """
+        # WHEN
+        actual = response(HTTPStatus.NOT_FOUND, b"Not Found\n")
+
+        # THEN
+        assert actual == (
+            b"HTTP/1.1 404 Not Found\r\n"
+            b"Content-Type: text/plain; charset=utf-8\r\n"
+            b"Content-Length: 10\r\n"
+            b"Connection: close\r\n\r\n"
+            b"Not Found\n"
+        )
+
+    def test_response_head(self) -> None:
+        """
+        GIVEN a status without headers
+        WHEN building the head of a response
+        THEN give the status line and close the connection after it
+        """
+        # WHEN
+        actual = response_head(HTTPStatus.NO_CONTENT, {})
+
+        # THEN
+        assert actual == b"HTTP/1.1 204 No Content\r\nConnection: close\r\n\r\n"
+
+    def test_chunk(self) -> None:
+        """
+        GIVEN some data
+        WHEN framing it as a chunk
+        THEN prefix it with its size in hexadecimal
+        AND end the body with an empty chunk
+        """
+        # WHEN
+        actual = chunk(b"x" * 26)
+
+        # THEN
+        assert actual == b"1a\r\n" + b"x" * 26 + b"\r\n"
+        assert LAST_CHUNK == b"0\r\n\r\n"
+
+    def test_http_error(self) -> None:
+        """
+        GIVEN a status with and without a message
+        WHEN raising an HTTPError for it
+        THEN default its message to the phrase of the status
+        """
+        # WHEN
+        error = HTTPError(HTTPStatus.NOT_FOUND)
+
+        # THEN
+        assert str(error) == "Not Found"
+        assert HTTPError(HTTPStatus.BAD_REQUEST, "No scene").message == "No scene"
@@ -0,0 +1,486 @@
+import asyncio
+import contextlib
+import json
+import threading
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional, cast
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from raytracer.core.types.entities import Scene
+from raytracer.imaging.stream import PNG_SIGNATURE
+from raytracer.rendering.engine import RenderEngine
+from raytracer.rendering.framebuffer import Framebuffer
+from raytracer.rendering.shading import Shader
+from raytracer.serving import server as server_module
+from raytracer.serving.http import LAST_CHUNK
+from raytracer.serving.server import RenderServer, ServerMetrics, percentile
+
+Response = tuple[int, dict[str, str], bytes, bool]
+
+
+class BlockingEngine:
+    """Renders rows of black, one each time it is allowed to"""
+
+    anti_aliasing = False
+
+    def __init__(self, error: Optional[Exception] = None) -> None:
+        self.rows = threading.Semaphore(0)
+        self.rendered = 0
+        self.started = threading.Event()
+        self.closed = False
+        self.error = error
+
+    def render(
+        self, scene: Scene, framebuffer: Framebuffer, processes: int
+    ) -> Iterator[int]:
+        self.started.set()
+        if self.error is not None:
+            raise self.error
+        for index in range(scene.height):
+            assert self.rows.acquire(timeout=10)
+            self.rendered += 1
+            yield index
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def _engine(engine: BlockingEngine) -> RenderEngine:
+    return cast(RenderEngine, engine)
+
+
+@contextlib.asynccontextmanager
+async def _serving(server: RenderServer) -> AsyncIterator[int]:
+    listener = await server.start(host="127.0.0.1", port=0)
+    async with listener:
+        yield listener.sockets[0].getsockname()[1]
+
+
+async def _send(
+    port: int, method: str, target: str, body: bytes = b""
+) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        f"{method} {target} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    return reader, writer
+
+
+async def _request(port: int, method: str, target: str, body: bytes = b"") -> Response:
+    """
+    Sends a request, returning the status, headers and body of the response and
+    whether a chunked body was finished
+    """
+    reader, writer = await _send(port=port, method=method, target=target, body=body)
+    data = await reader.read()
+    writer.close()
+    head, _, body = data.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode().split("\r\n")
+    headers = dict(line.split(": ", 1) for line in header_lines)
+    if headers.get("Transfer-Encoding") != "chunked":
+        return int(status_line.split()[1]), headers, body, True
+    chunks = []
+    while body and not body.startswith(LAST_CHUNK):
+        size, _, body = body.partition(b"\r\n")
+        length = int(size, 16)
+        chunks.append(body[:length])
+        body = body[length:].removeprefix(b"\r\n")
+    return int(status_line.split()[1]), headers, b"".join(chunks), body == LAST_CHUNK
+
+
+async def _until(condition: Callable[[], bool]) -> None:
+    for _ in range(1000):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Timed out")  # pragma: nocover
+
+
+def _serve(server: RenderServer, test: Callable[[int], Awaitable[None]]) -> None:
+    async def serve() -> None:
+        async with _serving(server) as port:
+            await test(port)
+
+    asyncio.run(serve())
+
+
+class TestRenderServer:
+    @pytest.mark.parametrize(
+        "image_format, content_type",
+        [("ppm", "image/x-portable-pixmap"), ("png", "image/png")],
+    )
+    def test_render(
+        self, scene_data: dict, image_format: str, content_type: str
+    ) -> None:
+        """
+        GIVEN a server with a warm engine
+        WHEN requesting two renders of a scene
+        THEN stream back the image the engine renders, in chunks
+        AND count both renders in the metrics
+        """
+        # GIVEN
+        scene = Scene.from_object(data=scene_data, width=4, height=3)
+        with (
+            RenderEngine(shader=Shader()) as engine,
+            Framebuffer(width=4, height=3) as framebuffer,
+        ):
+            list(engine.render(scene=scene, framebuffer=framebuffer, processes=1))
+            pixels = bytes(framebuffer.buffer)
+        engine = RenderEngine(shader=Shader(), start_method="forkserver")
+        server = RenderServer(engines=[engine], processes=1)
+        responses = []
+
+        async def test(port: int) -> None:
+            for _ in range(2):
+                responses.append(
+                    await _request(
+                        port,
+                        "POST",
+                        f"/render?width=4&height=3&format={image_format}",
+                        json.dumps(scene_data).encode(),
+                    )
+                )
+
+        # WHEN
+        try:
+            _serve(server, test)
+        finally:
+            server.close()
+
+        # THEN
+        for status, headers, body, complete in responses:
+            assert (status, complete) == (200, True)
+            assert headers["Content-Type"] == content_type
+            assert len(headers["X-Render-Id"]) == 32
+            if image_format == "ppm":
+                assert body == b"P6 4 3\n255\n" + pixels
+            else:
+                assert body.startswith(PNG_SIGNATURE)
+        assert server.metrics.completed == 2
+        assert len(server.metrics.latencies) == len(server.metrics.waits) == 2
+
+    @pytest.mark.parametrize(
+        "method, target, body, status",
+        [
+            ("POST", "/render?width=4", b"{}", 400),
+            ("POST", "/render?width=4&height=99999", b"{}", 400),
+            ("POST", "/render?width=1&height=2", b"{}", 400),
+            ("POST", "/render?width=4&height=2&format=gif", b"{}", 400),
+            ("POST", "/render?width=4&height=2", b"{", 400),
+            ("POST", "/render?width=4&height=2", b"{}", 400),
+            ("GET", "/render?width=4&height=2", b"", 405),
+            ("POST", "/metrics", b"", 405),
+            ("GET", "/renders/abc", b"", 405),
+            ("DELETE", "/renders/abc", b"", 404),
+            ("GET", "/", b"", 404),
+        ],
+        ids=[
+            "no height",
+            "too tall",
+            "too narrow",
+            "unknown format",
+            "invalid JSON",
+            "invalid scene",
+            "render with GET",
+            "metrics with POST",
+            "renders with GET",
+            "unknown render",
+            "unknown path",
+        ],
+    )
+    def test_invalid(self, method: str, target: str, body: bytes, status: int) -> None:
+        server = RenderServer(engines=[_engine(BlockingEngine())])
+        responses = []
+
+        async def test(port: int) -> None:
+            responses.append(await _request(port, method, target, body))
+
+        _serve(server, test)
+
+        assert responses[0][0] == status
+
+    def test_queue(self, scene_data: dict) -> None:
+        """
+        GIVEN a server with one engine and room for one render in its queue
+        WHEN requesting three renders while the first is rendering
+        THEN queue the second and turn away the third
+        AND render the second once the first is cancelled
+        AND stop the workers of the engine rendering the first
+        """
+        # GIVEN
+        engine = BlockingEngine()
+        server = RenderServer(engines=[_engine(engine)], max_queue=1)
+        body = json.dumps(scene_data).encode()
+        target = "/render?width=2&height=2&format=ppm"
+        results: dict[str, object] = {}
+
+        async def test(port: int) -> None:
+            first = asyncio.create_task(_request(port, "POST", target, body))
+            await asyncio.to_thread(engine.started.wait)
+            render_id = next(iter(server._jobs))
+            second = asyncio.create_task(_request(port, "POST", target, body))
+            await _until(lambda: server.metrics.queued == 1)
+
+            # WHEN
+            results["third"] = await _request(port, "POST", target, body)
+            results["metrics"] = await _request(port, "GET", "/metrics")
+            results["cancel"] = await _request(port, "DELETE", f"/renders/{render_id}")
+            await _until(lambda: server._jobs[render_id].stop.is_set())
+            engine.rows.release(3)
+            results["first"] = await first
+            results["second"] = await second
+
+        _serve(server, test)
+
+        # THEN
+        third = cast(Response, results["third"])
+        assert third[:1] == (503,)
+        assert third[2] == b"The render queue is full\n"
+        metrics = json.loads(cast(Response, results["metrics"])[2])
+        assert (metrics["queue_depth"], metrics["rendering"]) == (1, 1)
+        assert cast(Response, results["cancel"])[0] == 204
+        assert cast(Response, results["first"])[::3] == (200, False)
+        second = cast(Response, results["second"])
+        assert second[::3] == (200, True)
+        assert second[2] == b"P6 2 2\n255\n" + bytes(12)
+        assert engine.closed
+        assert server.metrics.to_object() | {"latency": None, "queue_wait": None} == {
+            "queue_depth": 0,
+            "rendering": 0,
+            "completed": 1,
+            "cancelled": 1,
+            "failed": 0,
+            "rejected": 1,
+            "latency": None,
+            "queue_wait": None,
+        }
+
+    def test_client_disconnects(self, scene_data: dict) -> None:
+        """
+        GIVEN a render in progress
+        WHEN its client closes the connection
+        THEN cancel the render
+        """
+        # GIVEN
+        engine = BlockingEngine()
+        server = RenderServer(engines=[_engine(engine)])
+
+        async def test(port: int) -> None:
+            _, writer = await _send(
+                port,
+                "POST",
+                "/render?width=2&height=2",
+                json.dumps(scene_data).encode(),
+            )
+            await asyncio.to_thread(engine.started.wait)
+            job = next(iter(server._jobs.values()))
+
+            # WHEN
+            writer.close()
+            await _until(job.stop.is_set)
+            engine.rows.release()
+            await _until(lambda: not server._jobs)
+
+        _serve(server, test)
+
+        # THEN
+        assert server.metrics.cancelled == 1
+        assert server.metrics.completed == 0
+        assert engine.closed
+
+    def test_render_fails(self, scene_data: dict) -> None:
+        """
+        GIVEN an engine which fails to render
+        WHEN requesting a render
+        THEN end the response without its last chunk
+        AND count the render as failed
+        """
+        server = RenderServer(engines=[_engine(BlockingEngine(RuntimeError()))])
+        responses = []
+
+        async def test(port: int) -> None:
+            responses.append(
+                await _request(
+                    port,
+                    "POST",
+                    "/render?width=2&height=2",
+                    json.dumps(scene_data).encode(),
+                )
+            )
+
+        _serve(server, test)
+
+        assert responses[0][::3] == (200, False)
+        assert server.metrics.failed == 1
+
+    def test_connection_lost(self, scene_data: dict) -> None:
+        """
+        GIVEN a connection which is lost while the image is being sent
+        WHEN rendering
+        THEN stop the engine
+        AND count the render as cancelled
+        """
+        # GIVEN
+        engine = BlockingEngine()
+        engine.rows.release(2)
+        server = RenderServer(engines=[_engine(engine)])
+        request = Mock(
+            query={"width": "2", "height": "2", "format": "ppm"},
+            body=json.dumps(scene_data).encode(),
+        )
+        writer = Mock(drain=AsyncMock(side_effect=ConnectionResetError()))
+
+        async def render() -> None:
+            await server._render(
+                request=request, reader=asyncio.StreamReader(), writer=writer
+            )
+
+        # WHEN
+        asyncio.run(render())
+
+        # THEN
+        assert server.metrics.cancelled == 1
+        assert server.metrics.failed == 0
+
+    def test_slow_client(
+        self, scene_data: dict, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """
+        GIVEN a client which is slow to take the image
+        AND room for one chunk of it in the queue
+        WHEN rendering
+        THEN hold up the render until the client catches up
+        AND send the whole image once it does
+        """
+        # GIVEN
+        monkeypatch.setattr(server_module, "CHUNK_QUEUE_SIZE", 1)
+        engine = BlockingEngine()
+        engine.rows.release(8)
+        server = RenderServer(engines=[_engine(engine)])
+        request = Mock(
+            query={"width": "2", "height": "8", "format": "ppm"},
+            body=json.dumps(scene_data).encode(),
+        )
+
+        async def render() -> None:
+            caught_up = asyncio.Event()
+            writer = Mock(drain=AsyncMock(side_effect=caught_up.wait))
+            task = asyncio.create_task(
+                server._render(
+                    request=request, reader=asyncio.StreamReader(), writer=writer
+                )
+            )
+
+            # WHEN
+            await asyncio.to_thread(engine.started.wait)
+            await asyncio.sleep(0.1)
+
+            # THEN
+            assert engine.rendered < 8
+            caught_up.set()
+            await task
+            # The head, the PPM header, each row and the last chunk
+            assert writer.write.call_count == 11
+
+        asyncio.run(render())
+
+        assert engine.rendered == 8
+        assert server.metrics.completed == 1
+
+    def test_cancelled_while_queued(self, scene_data: dict) -> None:
+        """
+        GIVEN a render waiting for an engine
+        WHEN the server cancels the request, as it does when shutting down
+        THEN count the render as cancelled
+        AND pass on the cancellation
+        """
+        # GIVEN
+        engine = BlockingEngine()
+        server = RenderServer(engines=[_engine(engine)])
+        request = Mock(
+            query={"width": "2", "height": "2"}, body=json.dumps(scene_data).encode()
+        )
+
+        async def render() -> None:
+            await server._slots.acquire()
+            task = asyncio.create_task(
+                server._render(
+                    request=request, reader=asyncio.StreamReader(), writer=Mock()
+                )
+            )
+            await _until(lambda: server.metrics.queued == 1)
+
+            # WHEN
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(render())
+
+        # THEN
+        assert server.metrics.cancelled == 1
+        assert not engine.started.is_set()
+
+    def test_response_not_sent(self) -> None:
+        """
+        GIVEN a client which goes away before its response is sent
+        WHEN handling its request
+        THEN close the connection quietly
+        """
+        server = RenderServer(engines=[_engine(BlockingEngine())])
+        writer = Mock(drain=AsyncMock(side_effect=ConnectionResetError()))
+
+        async def handle() -> None:
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"GET /metrics HTTP/1.1\r\n\r\n")
+            await server.handle(reader=reader, writer=writer)
+
+        asyncio.run(handle())
+
+        writer.close.assert_called_once_with()
+
+    def test_close(self) -> None:
+        engines = [BlockingEngine(), BlockingEngine()]
+        server = RenderServer(engines=[_engine(engine) for engine in engines])
+
+        server.close()
+
+        assert all(engine.closed for engine in engines)
+
+
+class TestMetrics:
+    @pytest.mark.parametrize(
+        "values, percent, expected",
+        [
+            ([], 50, 0.0),
+            ([3.0], 99, 3.0),
+            ([float(value) for value in range(10, 0, -1)], 50, 5.0),
+            ([float(value) for value in range(1, 11)], 90, 9.0),
+            ([float(value) for value in range(1, 11)], 99, 10.0),
+            ([float(value) for value in range(1, 11)], 0, 1.0),
+        ],
+    )
+    def test_percentile(
+        self, values: list[float], percent: float, expected: float
+    ) -> None:
+        assert percentile(values, percent) == expected
+
+    def test_to_object(self) -> None:
+        metrics = ServerMetrics(queued=2, rendering=1, completed=3)
+        metrics.latencies.extend([1.0, 2.0, 3.0])
+
+        actual = metrics.to_object()
+
+        assert actual == {
+            "queue_depth": 2,
+            "rendering": 1,
+            "completed": 3,
+            "cancelled": 0,
+            "failed": 0,
+            "rejected": 0,
+            "latency": {"p50": 2.0, "p90": 3.0, "p99": 3.0},
+            "queue_wait": {"p50": 0.0, "p90": 0.0, "p99": 0.0},
+        }